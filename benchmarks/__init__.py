@@ -0,0 +1,21 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# VM benchmarks, see benchmarks/runner.py for whole roms,
+# benchmarks/instructions.py for single instructions,
+# benchmarks/dispatch.py for the instruction dispatch tables,
+# benchmarks/startup.py for loading a rom into memory and
+# benchmarks/importtime.py for how long the modules take to import
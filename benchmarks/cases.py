@@ -0,0 +1,83 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# The roms benchmarks/runner.py runs and what they run on, the same
+# runs knighttests/test_hex0tobin.py, test_hex1tobin.py and test_hex2tobin.py
+# check against the sha256 sums published with stage0.
+#
+# Each case is (name, rom, rom decoder, input, whether the input is read
+# from stdin (and the output written to tape_01) like the stage0 monitor
+# does or from tape_01 (with the output on tape_02), end of memory, expected
+# sha256 of the output)
+#
+# The expected sha256 is the name of an entry in stage0's test/SHA256SUMS
+# or None for the tape_hex0_assembler case, that one doesn't need stage0
+# and is checked against hex0tobin instead.
+
+from os.path import dirname, join as path_join
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from stage0dir import get_stage0_file
+from hex0tobin import int_bytes_from_hex0_fd
+from hex1tobin import int_bytes_from_hex1_fd
+
+STACK_START = 0x600
+STACK_SIZE = 8
+STAGE1_HEX2_MEMORY = 0x700+1024*4
+
+TAPE_HEX0_ASSEMBLER = path_join(
+    dirname(dirname(__file__)), 'knighttests', 'tape_hex0_assembler.hex0')
+TAPE_HEX0_ASSEMBLER_MEMORY = 0x240
+
+def get_stack_end(registersize):
+    # the 64 bit registers the stage0 monitor pushes need twice the stack
+    if registersize==64:
+        return STACK_START+STACK_SIZE*2
+    return STACK_START+STACK_SIZE
+
+BENCHMARK_CASES = (
+    ('stage0_monitor',
+     get_stage0_file('stage0/stage0_monitor.hex0'), int_bytes_from_hex0_fd,
+     get_stage0_file('stage0/stage0_monitor.hex0'), COMPAT_TRUE,
+     get_stack_end, 'roms/stage0_monitor'),
+    ('stage1_assembler-0',
+     get_stage0_file('stage1/stage1_assembler-0.hex0'),
+     int_bytes_from_hex0_fd,
+     get_stage0_file('stage1/stage1_assembler-0.hex0'), COMPAT_FALSE,
+     get_stack_end, 'roms/stage1_assembler-0'),
+    ('stage1_assembler-1',
+     get_stage0_file('stage1/stage1_assembler-1.hex0'),
+     int_bytes_from_hex0_fd,
+     get_stage0_file('stage1/stage1_assembler-2.hex1'), COMPAT_FALSE,
+     get_stack_end, 'roms/stage1_assembler-2'),
+    ('stage1_assembler-2_SET',
+     get_stage0_file('stage1/stage1_assembler-2.hex1'),
+     int_bytes_from_hex1_fd,
+     get_stage0_file('stage1/SET.hex2'), COMPAT_FALSE,
+     lambda registersize: STAGE1_HEX2_MEMORY, 'roms/SET'),
+    ('stage1_assembler-2_M0',
+     get_stage0_file('stage1/stage1_assembler-2.hex1'),
+     int_bytes_from_hex1_fd,
+     get_stage0_file('stage1/M0-macro.hex2'), COMPAT_FALSE,
+     lambda registersize: STAGE1_HEX2_MEMORY, 'roms/M0'),
+    ('tape_hex0_assembler',
+     TAPE_HEX0_ASSEMBLER, int_bytes_from_hex0_fd,
+     TAPE_HEX0_ASSEMBLER, COMPAT_FALSE,
+     lambda registersize: TAPE_HEX0_ASSEMBLER_MEMORY, None),
+)
+
+def get_case_names():
+    return [ case[0] for case in BENCHMARK_CASES ]
@@ -0,0 +1,132 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compares the instruction dispatch lists in knightdecode.py with the
+# older dictionary tables by running the benchmarks/cases.py roms with
+# each, one instruction at a time through the eval_instruction that
+# knightdecode.make_eval_instruction_for_registersize builds. Both are
+# checked against the case's known sha256. --generic uses the generic
+# knightinstructions instead of the ones for the register size.
+#
+# to invoke, run
+# $ python3 -m benchmarks.dispatch [--output $ResultsFile] [--repeat N]
+#   [--register-sizes 16,32,64] [--cases ...] [--generic]
+
+from sys import stderr, exit
+from hashlib import sha256
+
+from pythoncompat import print_func, perf_timer, COMPAT_TRUE, COMPAT_FALSE
+from constants import EXIT_SUCCESS, EXIT_FAILURE
+from knightdecode import \
+    read_instruction_fast, make_eval_instruction_for_registersize
+from knightvm_minimal import get_flag_values, get_list_flag
+
+from .cases import get_case_names
+from .runner import \
+    case_available, get_expected_sha256, read_case_files, make_case_vm, \
+    write_results
+
+DISPATCH_VARIANTS = (
+    ('lookup tables', COMPAT_FALSE),
+    ('dispatch lists', COMPAT_TRUE),
+)
+
+def run_dispatch(name, registersize, optimize, dispatch_name,
+                 dispatch_lists, repeat=1):
+    # returns a result dict like benchmarks/runner.py's, with the dispatch
+    # variant in place of the engine
+    if optimize:
+        registersizebits = registersize
+    else:
+        registersizebits = 0 # generic knightinstructions
+    eval_instruction = make_eval_instruction_for_registersize(
+        registersizebits, dispatch_lists=dispatch_lists)
+    rom_bytes, input_bytes = read_case_files(name)
+
+    best_wall_time = None
+    for i in range(repeat):
+        vm, output_tape = make_case_vm(name, registersize,
+                                       rom_bytes, input_bytes)
+        start_time = perf_timer()
+        while not vm.halted:
+            vm = eval_instruction(vm, read_instruction_fast(vm),
+                                  halt_print=COMPAT_FALSE)
+        wall_time = perf_timer() - start_time
+        if best_wall_time==None or wall_time<best_wall_time:
+            best_wall_time = wall_time
+
+    output_sha256 = sha256(output_tape.getvalue()).hexdigest()
+    return {
+        'name': name, 'registersize': registersize,
+        'optimize': bool(optimize), 'dispatch': dispatch_name,
+        'instructions': vm.perf_count,
+        'wall_time': best_wall_time,
+        'instructions_per_second': vm.perf_count/best_wall_time,
+        'sha256': output_sha256,
+        'correct': output_sha256==get_expected_sha256(name),
+    }
+
+def run_dispatch_benchmarks(case_names=None, register_sizes=(32,),
+                            optimize=COMPAT_TRUE, repeat=1):
+    # yields a result for each case, register size and dispatch variant
+    if case_names==None:
+        case_names = get_case_names()
+    for name in case_names:
+        if not case_available(name):
+            continue
+        for registersize in register_sizes:
+            for dispatch_name, dispatch_lists in DISPATCH_VARIANTS:
+                yield run_dispatch(name, registersize, optimize,
+                                   dispatch_name, dispatch_lists, repeat)
+
+def main(args):
+    flags = args[1:]
+    if "--help" in flags:
+        print_func("Usage: %s [--output $ResultsFile] [--repeat N] "
+                   "[--register-sizes 16,32,64] [--cases C,...] "
+                   "[--generic]" % args[0], file=stderr)
+        print_func("Cases are %s" % ",".join(get_case_names()), file=stderr)
+        exit(EXIT_FAILURE)
+    output_path = get_flag_values(flags, "--output", 1)
+
+    results = []
+    for result in run_dispatch_benchmarks(
+            case_names=get_list_flag(flags, "--cases", None),
+            register_sizes=get_list_flag(flags, "--register-sizes", (32,),
+                                         int),
+            optimize="--generic" not in flags,
+            repeat=get_list_flag(flags, "--repeat", [1], int)[0]):
+        results.append(result)
+        if result['correct']:
+            correct = ""
+        else:
+            correct = ", WRONG OUTPUT"
+        print_func("%s %d bit, %s: %d instructions in %.3fs, "
+                   "%.0f per second%s" % (
+                       result['name'], result['registersize'],
+                       result['dispatch'], result['instructions'],
+                       result['wall_time'],
+                       result['instructions_per_second'], correct) )
+
+    if output_path!=None:
+        write_results(results, output_path[0])
+    if len([ result for result in results if not result['correct'] ])>0:
+        exit(EXIT_FAILURE)
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
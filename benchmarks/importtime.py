@@ -0,0 +1,180 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Import time of the modules the commands start with, what every short
+# lived knightvm_minimal.py or hex0tobin.py run pays before doing anything.
+# Each module is imported in a fresh python with -X importtime (python 3.7
+# and later), once untimed first so the .pyc files are written, and the
+# best of --repeat is kept. Along with the module's import time in
+# microseconds the modules it imported that took the longest themselves
+# are reported, and the wall time of the whole python process.
+#
+# --output and --compare work like they do for benchmarks/runner.py, an
+# import more than --threshold slower than the baseline is a regression.
+#
+# to invoke, run
+# $ python3 -m benchmarks.importtime [--output $ResultsFile]
+#   [--compare $BaselineFile] [--threshold F] [--repeat N]
+#   [--modules knightvm_minimal,...]
+
+from sys import stderr, exit, executable
+from os.path import dirname, abspath
+from subprocess import Popen, PIPE
+
+from pythoncompat import print_func, perf_timer
+from constants import EXIT_SUCCESS, EXIT_FAILURE
+from knightvm_minimal import get_flag_values, get_list_flag
+
+from .runner import DEFAULT_THRESHOLD, write_results, read_results
+
+IMPORT_MODULES = ('knightdecode', 'knightvm_minimal', 'knightbatch',
+                  'hex0tobin', 'hex2tobin', 'M1tobin')
+
+# how many of the slowest imported modules a result keeps
+SLOWEST_COUNT = 5
+
+PACKAGE_DIR = dirname(dirname(abspath(__file__)))
+
+def parse_importtime(output):
+    # returns a list of (module, self microseconds, cumulative microseconds,
+    # depth) from what -X importtime wrote to stderr, skipping the header.
+    # A module is listed after the ones it imported, which are one deeper
+    imports = []
+    for line in output.splitlines():
+        fields = line.split('|')
+        if not line.startswith("import time:") or len(fields)!=3:
+            continue
+        self_us = fields[0][len("import time:"):].strip()
+        if not self_us.isdigit():
+            continue
+        name = fields[2].rstrip()
+        imports.append( (name.strip(), int(self_us),
+                         int(fields[1].strip()),
+                         len(name) - len(name.lstrip()) ) )
+    return imports
+
+def get_module_imports(imports, module):
+    # the part of imports for module and the modules it imported, not the
+    # ones python imported at startup, empty if module isn't there
+    for end in range(len(imports)):
+        if imports[end][0]==module:
+            start = end
+            while start>0 and imports[start-1][3]>imports[end][3]:
+                start -= 1
+            return imports[start:end+1]
+    return []
+
+def run_import(module):
+    # returns (wall time, parsed importtime output)
+    start_time = perf_timer()
+    process = Popen([executable, '-X', 'importtime',
+                     '-c', 'import %s' % module],
+                    cwd=PACKAGE_DIR, stdout=PIPE, stderr=PIPE)
+    stdout_output, stderr_output = process.communicate()
+    wall_time = perf_timer() - start_time
+    if process.returncode!=0:
+        raise Exception("importing %s failed\n%s" % (
+            module, stderr_output.decode('utf-8', 'replace')) )
+    return wall_time, parse_importtime(stderr_output.decode('ascii'))
+
+def time_import(module, repeat=5):
+    run_import(module) # writes the .pyc files
+    best = None
+    for i in range(repeat):
+        wall_time, imports = run_import(module)
+        module_imports = get_module_imports(imports, module)
+        if len(module_imports)>0:
+            import_us = module_imports[-1][2]
+        else: # no -X importtime
+            import_us = None
+        if best==None or (import_us!=None and
+                          import_us<best['import_us']):
+            slowest = [ (self_us, name)
+                        for name, self_us, cumulative_us, depth
+                        in module_imports ]
+            slowest.sort()
+            slowest.reverse()
+            best = {'name': module, 'import_us': import_us,
+                    'wall_time': wall_time,
+                    'slowest': [ [name, self_us] for self_us, name in
+                                 slowest[0:SLOWEST_COUNT] ] }
+        if wall_time<best['wall_time']:
+            best['wall_time'] = wall_time
+    return best
+
+def run_import_benchmarks(modules=IMPORT_MODULES, repeat=5):
+    for module in modules:
+        yield time_import(module, repeat)
+
+def compare_import_results(results, baseline_results,
+                           threshold=DEFAULT_THRESHOLD):
+    # returns a list of (result, reason) for every regression, by the
+    # import time or the wall time where there isn't one
+    baseline = dict( (result['name'], result)
+                     for result in baseline_results )
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(result['name'])
+        if baseline_result==None:
+            continue
+        if result['import_us']!=None and baseline_result['import_us']!=None:
+            if result['import_us'] > \
+               baseline_result['import_us']*(1+threshold):
+                regressions.append( (result, "import %d us, was %d us" % (
+                    result['import_us'], baseline_result['import_us']) ) )
+        elif result['wall_time'] > baseline_result['wall_time']*(1+threshold):
+            regressions.append( (result, "wall time %.3fs, was %.3fs" % (
+                result['wall_time'], baseline_result['wall_time']) ) )
+    return regressions
+
+def main(args):
+    flags = args[1:]
+    if "--help" in flags:
+        print_func("Usage: %s [--output $ResultsFile] "
+                   "[--compare $BaselineFile] [--threshold F] [--repeat N] "
+                   "[--modules M,...]" % args[0], file=stderr)
+        print_func("Modules are %s" % ",".join(IMPORT_MODULES), file=stderr)
+        exit(EXIT_FAILURE)
+    output_path = get_flag_values(flags, "--output", 1)
+    compare_path = get_flag_values(flags, "--compare", 1)
+    threshold = get_list_flag(flags, "--threshold", [DEFAULT_THRESHOLD],
+                              float)[0]
+
+    results = []
+    for result in run_import_benchmarks(
+            modules=get_list_flag(flags, "--modules", IMPORT_MODULES),
+            repeat=get_list_flag(flags, "--repeat", [5], int)[0]):
+        results.append(result)
+        slowest = ", ".join( [ "%s %d us" % (name, self_us)
+                               for name, self_us in result['slowest'] ] )
+        print_func("%s: import %s us, process %.3fs; slowest %s" % (
+            result['name'], result['import_us'], result['wall_time'],
+            slowest) )
+
+    if output_path!=None:
+        write_results(results, output_path[0])
+    if compare_path!=None:
+        regressions = compare_import_results(
+            results, read_results(compare_path[0]), threshold)
+        for result, reason in regressions:
+            print_func("REGRESSION %s: %s" % (result['name'], reason) )
+        if len(regressions)>0:
+            exit(EXIT_FAILURE)
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
@@ -0,0 +1,379 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Per instruction micro benchmarks. For every mnemonic in the
+# EVAL_*_INT_TABLE_STRING tables of knightdecode.py a tiny rom is built
+# that runs the instruction COPIES_PER_LOOP times in a row inside a loop,
+#
+#   prologue:  LOADUI the operand registers
+#   loop:      LOADUI R15 (the stack pointer, reset every time around)
+#              the instruction, COPIES_PER_LOOP times
+#              SUBUI R13 R13 1
+#              JUMP.NZ R13 loop
+#              HALT
+#
+# The same rom without the copies is run to measure the loop overhead,
+# which is taken off, so what's left is nanoseconds per instruction.
+# That's done for every register size, engine and optimize on (the
+# knightinstructionsNN module for the register size) and off (the generic
+# knightinstructions), and any mnemonic whose optimized variant is more
+# than --threshold slower than the generic one is flagged.
+#
+# Jumps and skips are given an offset of 0 or a false condition so they
+# carry on to the next copy. Instructions that take the ip from a register
+# or the stack (RET, JSR_COROUTINE..) and the ones that write relative to
+# the ip (STORER..) can't be looped like this and are skipped, as are
+# the ones that aren't implemented yet, found by running their rom once.
+#
+# to invoke, run
+# $ python3 -m benchmarks.instructions [--output $ResultsFile]
+#   [--threshold F] [--repeat N] [--loops N] [--copies N]
+#   [--register-sizes 16,32,64] [--engines interpreter,...]
+#   [--mnemonics ADD,LOAD,...]
+
+from sys import stderr, exit
+from io import BytesIO
+
+from pythoncompat import print_func, perf_timer, COMPAT_TRUE, COMPAT_FALSE
+from constants import ENGINE_INTERPRETER, EXIT_SUCCESS, EXIT_FAILURE
+from knightdecode import \
+    create_vm, InstructionNotImplemented, \
+    EVAL_4OP_INT_TABLE_STRING, EVAL_3OP_INT_TABLE_STRING, \
+    EVAL_2OP_INT_TABLE_STRING, EVAL_1OP_INT_TABLE_STRING, \
+    EVAL_2OPI_INT_TABLE_STRING, EVAL_1OPI_INT_TABLE_STRING
+from knighttape import MemoryTapeBackend
+from knightvm_minimal import \
+    load_rom_bytes, grow_memory, execute_vm, get_flag_values, get_list_flag
+
+from .runner import \
+    REGISTER_SIZES, OPTIMIZE_VARIANTS, DEFAULT_THRESHOLD, write_results
+
+DEFAULT_LOOPS = 200
+DEFAULT_COPIES_PER_LOOP = 64
+
+# opcode (raw byte 0) -> table of xop -> mnemonic
+OPCODE_TABLES = (
+    (0x01, EVAL_4OP_INT_TABLE_STRING),
+    (0x05, EVAL_3OP_INT_TABLE_STRING),
+    (0x09, EVAL_2OP_INT_TABLE_STRING),
+    (0x0D, EVAL_1OP_INT_TABLE_STRING),
+    (0xE1, EVAL_2OPI_INT_TABLE_STRING),
+    (0xE0, EVAL_1OPI_INT_TABLE_STRING),
+    (0x3C, {0x00: "JUMP"}),
+)
+
+def make_instruction_encodings():
+    encodings = {}
+    for opcode, table in OPCODE_TABLES:
+        for xop, mnemonic in table.items():
+            encodings[mnemonic] = (opcode, xop)
+    return encodings
+
+# mnemonic -> (opcode, xop)
+INSTRUCTION_ENCODINGS = make_instruction_encodings()
+
+# registers the prologue loads
+REG_A = 1 # OPERAND_A
+REG_B = 2 # OPERAND_B
+REG_INDEX = 3 # OPERAND_INDEX
+REG_DEST = 4
+REG_DEST2 = 5
+REG_BASE = 8 # the scratch memory
+REG_LOOP = 13
+REG_STACK = 15
+OPERAND_A = 3
+OPERAND_B = 5
+OPERAND_INDEX = 4
+
+# the ip comes from a register or the stack, or memory relative to the ip
+# is written, so the instruction can't be repeated in a straight line
+UNLOOPABLE = {
+    "BRANCH": None, "CALL": None, "JSR_COROUTINE": None, "RET": None,
+    "POPPC": None,
+    "CMPJUMP_G": None, "CMPJUMP_GE": None, "CMPJUMP_E": None,
+    "CMPJUMP_NE": None, "CMPJUMP_LE": None, "CMPJUMP_L": None,
+    "CMPJUMPU_G": None, "CMPJUMPU_GE": None, "CMPJUMPU_LE": None,
+    "CMPJUMPU_L": None,
+    "STORER": None, "STORER8": None, "STORER16": None, "STORER32": None,
+}
+
+def get_benchmark_mnemonics():
+    mnemonics = [ mnemonic for mnemonic in INSTRUCTION_ENCODINGS.keys()
+                  if mnemonic not in UNLOOPABLE ]
+    mnemonics.sort()
+    return mnemonics
+
+def encode_instruction(mnemonic, registers=(), immediate=0):
+    # returns the instruction as a list of byte values
+    opcode, xop = INSTRUCTION_ENCODINGS[mnemonic]
+    immediate_bytes = [(immediate>>8) & 0xFF, immediate & 0xFF]
+    if opcode==0x01: # 4 OP
+        return [opcode, xop,
+                registers[0]*16 + registers[1],
+                registers[2]*16 + registers[3] ]
+    elif opcode==0x05: # 3 OP
+        return [opcode, xop>>4,
+                (xop & 0xF)*16 + registers[0],
+                registers[1]*16 + registers[2] ]
+    elif opcode==0x09: # 2 OP
+        return [opcode, xop>>8, xop & 0xFF,
+                registers[0]*16 + registers[1] ]
+    elif opcode==0x0D: # 1 OP
+        return [opcode, xop>>12, (xop>>4) & 0xFF,
+                (xop & 0xF)*16 + registers[0] ]
+    elif opcode==0xE1: # 2 OP immediate
+        return [opcode, 0, xop,
+                registers[0]*16 + registers[1] ] + immediate_bytes
+    elif opcode==0xE0: # 1 OP immediate
+        return [opcode, 0, xop>>4,
+                (xop & 0xF)*16 + registers[0] ] + immediate_bytes
+    else: # 0 OP immediate
+        return [opcode, xop] + immediate_bytes
+
+def get_benchmark_operands(mnemonic):
+    # (registers, immediate) that let the instruction run over and over
+    # and carry on to the one after it
+    opcode, xop = INSTRUCTION_ENCODINGS[mnemonic]
+    if opcode==0x01:
+        return (REG_DEST, REG_DEST2, REG_A, REG_B), 0
+    elif opcode==0x05:
+        if mnemonic.startswith("LOADX"):
+            return (REG_DEST, REG_BASE, REG_INDEX), 0
+        elif mnemonic.startswith("STOREX"):
+            return (REG_A, REG_BASE, REG_INDEX), 0
+        return (REG_DEST, REG_A, REG_B), 0
+    elif opcode==0x09:
+        if mnemonic.startswith("PUSH"):
+            return (REG_A, REG_STACK), 0
+        elif mnemonic.startswith("POP"):
+            return (REG_DEST, REG_STACK), 0
+        return (REG_DEST, REG_A), 0
+    elif opcode==0x0D:
+        if mnemonic=="PUSHPC":
+            return (REG_STACK,), 0
+        return (REG_DEST,), 0
+    elif opcode==0xE1:
+        if mnemonic.startswith("CMPJUMP"):
+            return (REG_A, REG_B), 0
+        elif mnemonic.startswith("LOAD"):
+            return (REG_DEST, REG_BASE), OPERAND_INDEX
+        elif mnemonic.startswith("STORE"):
+            return (REG_A, REG_BASE), OPERAND_INDEX
+        return (REG_DEST, REG_A), 1
+    elif opcode==0xE0:
+        if mnemonic.startswith("JUMP"):
+            return (REG_A,), 0
+        elif mnemonic=="CALLI":
+            return (REG_STACK,), 0
+        elif mnemonic.startswith("CMPSKIP"):
+            # a skip that's taken lands on the copy after next, which is
+            # why copies_per_loop has to be even
+            return (REG_A,), OPERAND_A
+        elif mnemonic.startswith("LOADR"):
+            return (REG_DEST,), 0
+        return (REG_DEST,), 1
+    return (), 0 # JUMP
+
+def make_loop_rom(mnemonic, loops, copies_per_loop):
+    # returns the rom and how big memory has to be, with mnemonic None
+    # it's the loop without the copies
+    assert copies_per_loop%2==0
+    assert 0<loops<=0xFFFF
+    if mnemonic==None:
+        body = []
+    else:
+        registers, immediate = get_benchmark_operands(mnemonic)
+        body = encode_instruction(mnemonic, registers, immediate)
+        body = body*copies_per_loop
+
+    # the rom is laid out before the addresses it loads are known, so
+    # it's done twice
+    scratch_address = 0
+    stack_address = 0
+    for i in range(2):
+        rom = []
+        for register, value in ( (REG_A, OPERAND_A), (REG_B, OPERAND_B),
+                                 (REG_INDEX, OPERAND_INDEX),
+                                 (REG_BASE, scratch_address),
+                                 (REG_LOOP, loops) ):
+            rom.extend(encode_instruction("LOADUI", (register,), value))
+        loop_address = len(rom)
+        rom.extend(encode_instruction("LOADUI", (REG_STACK,), stack_address))
+        rom.extend(body)
+        rom.extend(encode_instruction("SUBUI", (REG_LOOP, REG_LOOP), 1))
+        jump_offset = loop_address - (len(rom) + 6)
+        rom.extend(encode_instruction("JUMP_NZ", (REG_LOOP,), jump_offset))
+        rom.extend([0xFF, 0xFF, 0xFF, 0xFF]) # HALT
+
+        # 8 bytes of scratch beyond the index for the widest store,
+        # pushes go up from stack_address and pops down from it
+        scratch_address = (len(rom) + 0xFF) & ~0xFF
+        stack_address = scratch_address + 0x100 + copies_per_loop*8
+    end_of_memory = stack_address + copies_per_loop*8
+    assert end_of_memory<=0x10000
+    return bytes(bytearray(rom)), end_of_memory
+
+def run_loop_rom(rom, end_of_memory, registersize, optimize, engine, repeat):
+    # returns (best wall time, instructions run)
+    best_wall_time = None
+    for i in range(repeat):
+        vm = create_vm(size=0, registersize=registersize,
+                       tapefile1=MemoryTapeBackend(),
+                       tapefile2=MemoryTapeBackend(),
+                       stdin=BytesIO(), stdout=BytesIO())
+        load_rom_bytes(vm, rom)
+        grow_memory(vm, end_of_memory)
+        start_time = perf_timer()
+        stop_reason, instructions = execute_vm(
+            vm, optimize=optimize, halt_print=COMPAT_FALSE, engine=engine)
+        wall_time = perf_timer() - start_time
+        if best_wall_time==None or wall_time<best_wall_time:
+            best_wall_time = wall_time
+    return best_wall_time, instructions
+
+def is_implemented(mnemonic, registersize, engine):
+    # runs the rom around the loop once, both variants have to get through
+    rom, end_of_memory = make_loop_rom(mnemonic, 1, 2)
+    for optimize in OPTIMIZE_VARIANTS:
+        try:
+            run_loop_rom(rom, end_of_memory, registersize, optimize,
+                         engine, 1)
+        except InstructionNotImplemented:
+            return COMPAT_FALSE
+    return COMPAT_TRUE
+
+def run_instruction_benchmarks(
+        mnemonics=None, register_sizes=REGISTER_SIZES,
+        engines=(ENGINE_INTERPRETER,), loops=DEFAULT_LOOPS,
+        copies_per_loop=DEFAULT_COPIES_PER_LOOP, repeat=3):
+    # yields a result dict for each mnemonic, register size, engine and
+    # optimize variant, or just one with implemented False for a mnemonic
+    # that isn't implemented
+    if mnemonics==None:
+        mnemonics = get_benchmark_mnemonics()
+    for engine in engines:
+        for registersize in register_sizes:
+            overhead = {}
+            overhead_rom, overhead_end = make_loop_rom(
+                None, loops, copies_per_loop)
+            for optimize in OPTIMIZE_VARIANTS:
+                # once first so importing the instruction module for the
+                # register size isn't timed
+                run_loop_rom(overhead_rom, overhead_end, registersize,
+                             optimize, engine, 1)
+                overhead[optimize] = run_loop_rom(
+                    overhead_rom, overhead_end, registersize, optimize,
+                    engine, repeat)
+            for mnemonic in mnemonics:
+                if not is_implemented(mnemonic, registersize, engine):
+                    yield {'name': mnemonic, 'registersize': registersize,
+                           'engine': engine, 'implemented': False}
+                    continue
+                rom, end_of_memory = make_loop_rom(
+                    mnemonic, loops, copies_per_loop)
+                for optimize in OPTIMIZE_VARIANTS:
+                    wall_time, instructions = run_loop_rom(
+                        rom, end_of_memory, registersize, optimize,
+                        engine, repeat)
+                    overhead_time, overhead_instructions = overhead[optimize]
+                    # instructions rather than loops*copies_per_loop, so
+                    # skipped over copies aren't counted
+                    count = instructions - overhead_instructions
+                    yield {
+                        'name': mnemonic, 'registersize': registersize,
+                        'optimize': bool(optimize), 'engine': engine,
+                        'implemented': True,
+                        'instructions': count,
+                        'ns_per_instruction': max(
+                            wall_time - overhead_time, 0.0)*1e9/count,
+                    }
+
+def find_slower_optimized(results, threshold=DEFAULT_THRESHOLD):
+    # returns (optimized result, generic result) for every mnemonic whose
+    # optimized variant is more than threshold slower than the generic
+    generic = {}
+    for result in results:
+        if result['implemented'] and not result['optimize']:
+            generic[ (result['name'], result['registersize'],
+                      result['engine']) ] = result
+    slower = []
+    for result in results:
+        if not result['implemented'] or not result['optimize']:
+            continue
+        generic_result = generic.get( (result['name'],
+                                       result['registersize'],
+                                       result['engine']) )
+        if ( generic_result!=None and
+             result['ns_per_instruction'] >
+             generic_result['ns_per_instruction']*(1+threshold) ):
+            slower.append( (result, generic_result) )
+    return slower
+
+def main(args):
+    flags = args[1:]
+    if "--help" in flags:
+        print_func("Usage: %s [--output $ResultsFile] [--threshold F] "
+                   "[--repeat N] [--loops N] [--copies N] "
+                   "[--register-sizes 16,32,64] [--engines E,...] "
+                   "[--mnemonics M,...]" % args[0], file=stderr)
+        exit(EXIT_FAILURE)
+    output_path = get_flag_values(flags, "--output", 1)
+    threshold = get_list_flag(flags, "--threshold", [DEFAULT_THRESHOLD],
+                              float)[0]
+
+    results = []
+    not_implemented = []
+    generic_ns = {}
+    for result in run_instruction_benchmarks(
+            mnemonics=get_list_flag(flags, "--mnemonics", None),
+            register_sizes=get_list_flag(flags, "--register-sizes",
+                                         REGISTER_SIZES, int),
+            engines=get_list_flag(flags, "--engines",
+                                  (ENGINE_INTERPRETER,) ),
+            loops=get_list_flag(flags, "--loops", [DEFAULT_LOOPS], int)[0],
+            copies_per_loop=get_list_flag(
+                flags, "--copies", [DEFAULT_COPIES_PER_LOOP], int)[0],
+            repeat=get_list_flag(flags, "--repeat", [3], int)[0]):
+        results.append(result)
+        key = (result['name'], result['registersize'], result['engine'])
+        if not result['implemented']:
+            not_implemented.append(result['name'])
+        elif not result['optimize']:
+            generic_ns[key] = result['ns_per_instruction']
+        else:
+            print_func("%-14s %d bit %s: generic %.0f ns, optimize %.0f ns"
+                       % (result['name'], result['registersize'],
+                          result['engine'], generic_ns[key],
+                          result['ns_per_instruction']) )
+
+    if len(not_implemented)>0:
+        skipped = sorted(dict.fromkeys(not_implemented).keys())
+        print_func("not implemented: %s" % " ".join(skipped))
+    if output_path!=None:
+        write_results(results, output_path[0])
+    slower = find_slower_optimized(results, threshold)
+    for result, generic_result in slower:
+        print_func("SLOWER %s %d bit %s: optimize %.0f ns, generic %.0f ns"
+                   % (result['name'], result['registersize'],
+                      result['engine'], result['ns_per_instruction'],
+                      generic_result['ns_per_instruction']) )
+    if len(slower)>0:
+        exit(EXIT_FAILURE)
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
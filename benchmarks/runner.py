@@ -0,0 +1,270 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs the benchmarks/cases.py roms for every register size (16, 32, 64),
+# optimize on and off and engine asked for, checking each output against
+# its known sha256 and reporting instructions per second, wall time and
+# peak resident memory. Every run is done in a fresh process so the peak
+# memory is that run's alone. Cases whose stage0 files aren't there are
+# skipped.
+#
+# --output writes the results as JSON, --compare checks them against
+# a JSON file written before and flags a run as a regression when it's
+# more than --threshold (default 0.1, 10%) slower or bigger, or no longer
+# gives the right output, exiting with EXIT_FAILURE if there are any.
+#
+# to invoke, run
+# $ python3 -m benchmarks.runner [--output $ResultsFile]
+#   [--compare $BaselineFile] [--threshold F] [--repeat N]
+#   [--register-sizes 16,32,64] [--engines interpreter,...] [--cases ...]
+
+from sys import stderr, exit, platform, version_info
+from io import BytesIO
+from hashlib import sha256
+from os.path import exists
+
+from pythoncompat import print_func, perf_timer, COMPAT_TRUE, COMPAT_FALSE
+from constants import ENGINE_INTERPRETER, EXIT_SUCCESS, EXIT_FAILURE
+from stage0dir import get_stage0_test_sha256sum
+from knightdecode import create_vm
+from knighttape import MemoryTapeBackend
+from knightvm_minimal import \
+    load_rom_bytes, grow_memory, execute_vm, get_flag_values, get_list_flag
+from hex0tobin import write_binary_filefd_from_hex0_filefd
+
+from .cases import BENCHMARK_CASES, get_case_names
+
+REGISTER_SIZES = (16, 32, 64)
+OPTIMIZE_VARIANTS = (COMPAT_FALSE, COMPAT_TRUE)
+DEFAULT_THRESHOLD = 0.1
+
+# the values of a result that identify the run
+RESULT_KEY = ('name', 'registersize', 'optimize', 'engine')
+
+def get_case(name):
+    for case in BENCHMARK_CASES:
+        if case[0]==name:
+            return case
+    raise KeyError(name)
+
+def case_available(name):
+    case = get_case(name)
+    return exists(case[1]) and exists(case[3])
+
+def get_expected_sha256(name):
+    name, rom, rom_decoder, input_path, input_on_stdin, get_end_of_memory, \
+        sha256sum_entry = get_case(name)
+    if sha256sum_entry!=None:
+        return get_stage0_test_sha256sum(sha256sum_entry)
+    input_fd = open(input_path, 'r')
+    output = BytesIO()
+    write_binary_filefd_from_hex0_filefd(input_fd, output)
+    input_fd.close()
+    return sha256(output.getvalue()).hexdigest()
+
+def get_peak_rss_kib():
+    # None where the resource module isn't available (windows)
+    try:
+        from resource import getrusage, RUSAGE_SELF
+    except ImportError:
+        return None
+    peak_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    if platform=='darwin': # bytes there, KiB on linux and the BSDs
+        peak_rss = peak_rss//1024
+    return peak_rss
+
+def read_case_files(name):
+    # returns the case's rom, decoded, and its input as bytes
+    name, rom, rom_decoder, input_path, input_on_stdin, get_end_of_memory, \
+        sha256sum_entry = get_case(name)
+    rom_fd = open(rom, 'r')
+    rom_bytes = bytes(bytearray(rom_decoder(rom_fd)))
+    rom_fd.close()
+    input_fd = open(input_path, 'rb')
+    input_bytes = input_fd.read()
+    input_fd.close()
+    return rom_bytes, input_bytes
+
+def make_case_vm(name, registersize, rom_bytes, input_bytes):
+    # returns a vm ready to run the case on memory tapes and the tape its
+    # output ends up on
+    name, rom, rom_decoder, input_path, input_on_stdin, get_end_of_memory, \
+        sha256sum_entry = get_case(name)
+    tapes = (MemoryTapeBackend(), MemoryTapeBackend())
+    if input_on_stdin:
+        stdin, output_tape = BytesIO(input_bytes), tapes[0]
+    else:
+        tapes = (MemoryTapeBackend(input_bytes), tapes[1])
+        stdin, output_tape = BytesIO(), tapes[1]
+    vm = create_vm(size=0, registersize=registersize,
+                   tapefile1=tapes[0], tapefile2=tapes[1],
+                   stdin=stdin, stdout=BytesIO())
+    load_rom_bytes(vm, rom_bytes)
+    grow_memory(vm, get_end_of_memory(registersize))
+    return vm, output_tape
+
+def run_case(args):
+    # one benchmark run, in its own process, returns a result dict
+    name, registersize, optimize, engine, repeat = args
+    rom_bytes, input_bytes = read_case_files(name)
+
+    best_wall_time = None
+    for i in range(repeat):
+        vm, output_tape = make_case_vm(name, registersize,
+                                       rom_bytes, input_bytes)
+        start_time = perf_timer()
+        stop_reason, instructions = execute_vm(
+            vm, optimize=optimize, halt_print=COMPAT_FALSE, engine=engine)
+        wall_time = perf_timer() - start_time
+        if best_wall_time==None or wall_time<best_wall_time:
+            best_wall_time = wall_time
+
+    output_sha256 = sha256(output_tape.getvalue()).hexdigest()
+    return {
+        'name': name, 'registersize': registersize,
+        'optimize': bool(optimize), 'engine': engine,
+        'instructions': instructions,
+        'wall_time': best_wall_time,
+        'instructions_per_second': instructions/best_wall_time,
+        'peak_rss_kib': get_peak_rss_kib(),
+        'sha256': output_sha256,
+        'correct': output_sha256==get_expected_sha256(name),
+    }
+
+def run_benchmarks(case_names=None, register_sizes=REGISTER_SIZES,
+                   engines=(ENGINE_INTERPRETER,), repeat=1):
+    # yields a result for each run, in order
+    from multiprocessing import Pool
+    if case_names==None:
+        case_names = get_case_names()
+    runs = [ (name, registersize, optimize, engine, repeat)
+             for name in case_names if case_available(name)
+             for engine in engines
+             for registersize in register_sizes
+             for optimize in OPTIMIZE_VARIANTS ]
+    # a new process for every run so peak_rss_kib is just that run's
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        for result in pool.imap(run_case, runs):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def get_result_key(result):
+    return tuple( result[key] for key in RESULT_KEY )
+
+def compare_results(results, baseline_results, threshold=DEFAULT_THRESHOLD):
+    # returns a list of (result, reason) for every regression
+    baseline = dict( (get_result_key(result), result)
+                     for result in baseline_results )
+    regressions = []
+    for result in results:
+        if not result['correct']:
+            regressions.append( (result, "wrong output") )
+        baseline_result = baseline.get(get_result_key(result))
+        if baseline_result==None:
+            continue
+        if ( result['instructions_per_second'] <
+             baseline_result['instructions_per_second']*(1-threshold) ):
+            regressions.append( (result, "%.0f instructions per second, "
+                                 "was %.0f" % (
+                result['instructions_per_second'],
+                baseline_result['instructions_per_second']) ) )
+        if ( result['peak_rss_kib']!=None and
+             baseline_result['peak_rss_kib']!=None and
+             result['peak_rss_kib'] >
+             baseline_result['peak_rss_kib']*(1+threshold) ):
+            regressions.append( (result, "peak rss %d KiB, was %d KiB" % (
+                result['peak_rss_kib'], baseline_result['peak_rss_kib']) ))
+    return regressions
+
+def describe_result(result):
+    if result['optimize']:
+        optimize = "optimize"
+    else:
+        optimize = "generic"
+    return "%s %d bit %s %s" % (result['name'], result['registersize'],
+                                optimize, result['engine'])
+
+def write_results(results, path):
+    from json import dump
+    f = open(path, 'w')
+    dump({'python': "%d.%d.%d" % tuple(version_info[0:3]),
+          'platform': platform,
+          'results': results}, f, indent=1, sort_keys=COMPAT_TRUE)
+    f.close()
+
+def read_results(path):
+    from json import load
+    f = open(path)
+    results = load(f)['results']
+    f.close()
+    return results
+
+def main(args):
+    flags = args[1:]
+    if "--help" in flags:
+        print_func("Usage: %s [--output $ResultsFile] "
+                   "[--compare $BaselineFile] [--threshold F] [--repeat N] "
+                   "[--register-sizes 16,32,64] [--engines E,...] "
+                   "[--cases C,...]" % args[0], file=stderr)
+        print_func("Cases are %s" % ",".join(get_case_names()), file=stderr)
+        exit(EXIT_FAILURE)
+    output_path = get_flag_values(flags, "--output", 1)
+    compare_path = get_flag_values(flags, "--compare", 1)
+    threshold = get_list_flag(flags, "--threshold", [DEFAULT_THRESHOLD],
+                              float)[0]
+    repeat = get_list_flag(flags, "--repeat", [1], int)[0]
+
+    results = []
+    for result in run_benchmarks(
+            case_names=get_list_flag(flags, "--cases", None),
+            register_sizes=get_list_flag(flags, "--register-sizes",
+                                         REGISTER_SIZES, int),
+            engines=get_list_flag(flags, "--engines",
+                                  (ENGINE_INTERPRETER,) ),
+            repeat=repeat):
+        results.append(result)
+        if result['correct']:
+            correct = ""
+        else:
+            correct = ", WRONG OUTPUT"
+        print_func("%s: %d instructions in %.3fs, %.0f per second, "
+                   "peak rss %s KiB%s" % (
+                       describe_result(result), result['instructions'],
+                       result['wall_time'],
+                       result['instructions_per_second'],
+                       result['peak_rss_kib'], correct) )
+
+    if output_path!=None:
+        write_results(results, output_path[0])
+    if compare_path!=None:
+        regressions = compare_results(
+            results, read_results(compare_path[0]), threshold)
+        for result, reason in regressions:
+            print_func("REGRESSION %s: %s" % (describe_result(result),
+                                               reason) )
+        if len(regressions)>0:
+            exit(EXIT_FAILURE)
+    elif len([ result for result in results if not result['correct'] ])>0:
+        exit(EXIT_FAILURE)
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
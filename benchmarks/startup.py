@@ -0,0 +1,143 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Times vm startup, allocating memory and loading a benchmarks/cases.py
+# rom into it (hex and binary) like knightvm_minimal.do_minimal_vm does,
+# for a few memory sizes. Only the hex0 roms are loaded as hex, there's
+# no hex1 loader. The one byte at a time memory growth create_vm used to
+# do is timed too for the sizes where it doesn't take too long. The best
+# of --repeat is kept.
+#
+# to invoke, run
+# $ python3 -m benchmarks.startup [--output $ResultsFile] [--repeat N]
+#   [--cases tape_hex0_assembler,...]
+
+from sys import stderr, exit
+from os import unlink
+from tempfile import NamedTemporaryFile
+
+from pythoncompat import print_func, perf_timer
+from constants import EXIT_SUCCESS, EXIT_FAILURE
+from knightdecode import create_vm
+from knightvm_minimal import \
+    load_program, load_hex_program, get_flag_values, get_list_flag
+from hex0tobin import int_bytes_from_hex0_fd
+
+from .cases import get_case_names
+from .runner import get_case, case_available, read_case_files, write_results
+
+# name, bytes of memory
+MEMORY_SIZES = (
+    ('64KiB', 1<<16),
+    ('2MiB', 1<<21),
+    ('64MiB', 1<<26),
+)
+
+# the largest memory the append loop is timed for
+MAX_APPEND_LOOP_SIZE = 1<<21
+
+DEFAULT_CASES = ('tape_hex0_assembler',)
+
+def write_binary_rom(name):
+    # the case's rom decoded into a temporary file, for load_program
+    rom_bytes, input_bytes = read_case_files(name)
+    binary_rom = NamedTemporaryFile(delete=False)
+    binary_rom.write(rom_bytes)
+    binary_rom.close()
+    return binary_rom.name
+
+def make_hex_startup(hex_rom):
+    def hex_startup(size):
+        vm = create_vm(size=size)
+        load_hex_program(vm, hex_rom)
+        return vm
+    return hex_startup
+
+def make_binary_startup(binary_rom):
+    def binary_startup(size):
+        vm = create_vm(size=size)
+        load_program(vm, binary_rom)
+        return vm
+    return binary_startup
+
+def make_append_loop_startup(binary_rom):
+    def append_loop_startup(size):
+        vm = create_vm(size=0)
+        load_program(vm, binary_rom)
+        mem = vm.mem
+        while len(mem)<size:
+            mem.append(0)
+        return vm
+    return append_loop_startup
+
+def best_time(startup, size, repeat):
+    best = None
+    for i in range(repeat):
+        start_time = perf_timer()
+        startup(size)
+        run_time = perf_timer() - start_time
+        if best==None or run_time<best:
+            best = run_time
+    return best
+
+def run_startup_benchmarks(case_names=DEFAULT_CASES, repeat=5):
+    # yields a result for each case, memory size and way of starting up
+    for name in case_names:
+        if not case_available(name):
+            continue
+        rom, rom_decoder = get_case(name)[1:3]
+        binary_rom = write_binary_rom(name)
+        startups = []
+        if rom_decoder==int_bytes_from_hex0_fd:
+            startups.append( ('hex rom', make_hex_startup(rom)) )
+        startups.append( ('binary rom', make_binary_startup(binary_rom)) )
+        startups.append( ('append loop',
+                          make_append_loop_startup(binary_rom)) )
+        for size_name, size in MEMORY_SIZES:
+            for startup_name, startup in startups:
+                if startup_name=='append loop' and \
+                   size>MAX_APPEND_LOOP_SIZE:
+                    continue
+                yield {'name': name, 'memory': size_name,
+                       'startup': startup_name,
+                       'wall_time': best_time(startup, size, repeat)}
+        unlink(binary_rom)
+
+def main(args):
+    flags = args[1:]
+    if "--help" in flags:
+        print_func("Usage: %s [--output $ResultsFile] [--repeat N] "
+                   "[--cases C,...]" % args[0], file=stderr)
+        print_func("Cases are %s" % ",".join(get_case_names()), file=stderr)
+        exit(EXIT_FAILURE)
+    output_path = get_flag_values(flags, "--output", 1)
+
+    results = []
+    for result in run_startup_benchmarks(
+            case_names=get_list_flag(flags, "--cases", DEFAULT_CASES),
+            repeat=get_list_flag(flags, "--repeat", [5], int)[0]):
+        results.append(result)
+        print_func("%s, %s, %s: %.6fs" % (
+            result['name'], result['memory'], result['startup'],
+            result['wall_time']) )
+
+    if output_path!=None:
+        write_results(results, output_path[0])
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
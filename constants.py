@@ -39,6 +39,21 @@ HAL_IO_DEVICE_STDIO = 0x0
 
 TAPEFD_I_STDIN, TAPEFD_I_STDOUT = 2, 3
 
+# execution engines, see knightdecode.get_read_and_eval_for_register_size
+ENGINE_INTERPRETER = "interpreter"
+ENGINE_DECODE_CACHE = "decodecache"
+ENGINE_BLOCKS = "blocks"
+ENGINE_FUSION = "fusion"
+ENGINE_PROFILE = "profile"
+ENGINE_TRACE = "trace"
+ENGINE_TRUSTED = "trusted"
+
+# why a batch of instructions stopped running,
+# see knightdecode.get_run_for_register_size
+STOP_HALTED = "halted"
+STOP_MAX_STEPS = "max_steps"
+STOP_UNTIL_IP = "until_ip"
+
 ARRAY_TYPE_UNSIGNED_CHAR = 'B'
 ARRAY_TYPE_UNSIGNED_SHORT = 'H'
 ARRAY_TYPE_UNSIGNED_INT = 'I'
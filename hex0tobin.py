@@ -19,9 +19,16 @@
 from __future__ import generators # for yield keyword in python 2.2
 
 from string import hexdigits
+from re import compile as re_compile
+from binascii import unhexlify
 
 from pythoncompat import write_byte, open_ascii, COMPAT_FALSE, COMPAT_TRUE
 
+# .encode gives bytes on python 3 and str on python 2
+HEX0_COMMENT_BYTES = re_compile("[;#][^\r\n]*".encode('ascii'))
+HEX0_NOT_HEXDIGIT_BYTES = re_compile("[^0-9A-Fa-f]".encode('ascii'))
+NO_BYTES = "".encode('ascii')
+
 def int_bytes_from_hex0_fd(input_file_fd):
     first_nyble = COMPAT_TRUE
     accumulator = 0
@@ -44,6 +51,16 @@ def int_bytes_from_hex0_fd(input_file_fd):
         # else: pass # ignore everything that's not a hexdigit
         character = input_file_fd.read(1)
 
+# the same bytes as int_bytes_from_hex0_fd, from the whole contents of a
+# hex0 file read in binary mode, with the comments and everything else
+# that's not a hex digit stripped out by regular expressions instead of
+# going through it one character at a time
+def bytes_from_hex0_bytes(hex0_bytes):
+    hex_digits = HEX0_NOT_HEXDIGIT_BYTES.sub(
+        NO_BYTES, HEX0_COMMENT_BYTES.sub(NO_BYTES, hex0_bytes) )
+    # a trailing half byte is dropped like int_bytes_from_hex0_fd does
+    return unhexlify(hex_digits[0:len(hex_digits)//2*2])
+
 def write_binary_filefd_from_hex0_filefd(input_file_fd, output_file_fd):
     for output_byte in int_bytes_from_hex0_fd(input_file_fd):
         write_byte(output_file_fd, output_byte)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# run_batch runs many (rom, input tapes) jobs across a multiprocessing pool
+# and yields a result for each as soon as it's done, in whatever order they
+# finish. Jobs are made by make_batch_job, the tapes are
+# knighttape.MemoryTapeBackend so nothing is written to disk and jobs don't
+# share tape files. Each worker process keeps the roms it has loaded in
+# ROM_CACHE, so a rom is only read (and for hex roms, converted) once per
+# worker no matter how many jobs use it.
+#
+# A result is a dict with
+#  index, where the job was in jobs
+#  name, the job's name
+#  stop_reason, one of the STOP_ constants or STOP_EXIT if the vm exited,
+#               like it does when it goes outside of the world
+#  exit_code, what the vm exited with for STOP_EXIT, otherwise None
+#  count, instructions run
+#  tapes, what was on tape_01 and tape_02 at the end, or with the job's
+#         hash_output, tape_hashes, their sha256 hex digests instead
+#  stdout, what the vm wrote to stdio
+#
+# As a command, runs one rom over each input file, tape_01 is the input
+# and tape_02 the output
+#
+# $ ./knightbatch.py $RomFile $InputFile... [--rom-hex] [--workers N]
+#   [--register-size N] [--memory-size N] [--max-steps N]
+#   [--output-dir $Dir]
+#
+# Needs python 2.6 or later, for multiprocessing and io, unlike the rest of
+# knightpies. run_batch's yield inside try/finally alone needs 2.5
+
+from __future__ import generators # for yield keyword in python 2.2
+
+from sys import stderr, exit
+from io import BytesIO
+from hashlib import sha256
+from os.path import basename, join as path_join
+
+from pythoncompat import print_func, COMPAT_TRUE, COMPAT_FALSE
+from constants import \
+    ENGINE_INTERPRETER, STOP_HALTED, EXIT_SUCCESS, EXIT_FAILURE
+from knightdecode import create_vm
+from knighttape import MemoryTapeBackend, flush_tapes
+from knightvm_minimal import \
+    load_rom_bytes, execute_vm, get_flag_values, get_list_flag, \
+    int_flag_value
+
+# the vm called exit instead of stopping, see outside_of_world_exit
+STOP_EXIT = "exit"
+
+# (rom filename, rom_hex) -> rom bytes, per process
+ROM_CACHE = {}
+
+def make_batch_job(rom, tape1=None, tape2=None, tape1_path=None,
+                   rom_hex=COMPAT_FALSE, registersize=32,
+                   memory_size=1<<21, engine=ENGINE_INTERPRETER,
+                   max_steps=None, hash_output=COMPAT_FALSE, name=None):
+    # tape1 and tape2 are the bytes the tapes start with, empty if None.
+    # tape1_path is a file the worker reads tape1 from instead, so big
+    # inputs aren't sent through the pool
+    return {
+        'rom': rom, 'rom_hex': rom_hex,
+        'tape1': tape1, 'tape2': tape2, 'tape1_path': tape1_path,
+        'registersize': registersize, 'memory_size': memory_size,
+        'engine': engine, 'max_steps': max_steps,
+        'hash_output': hash_output, 'name': name,
+    }
+
+def get_rom_bytes(rom, rom_hex):
+    key = (rom, rom_hex)
+    rom_bytes = ROM_CACHE.get(key)
+    if rom_bytes==None:
+        f = open(rom, 'rb')
+        rom_bytes = f.read()
+        f.close()
+        if rom_hex:
+            # deferred like in knightvm_minimal.load_hex_program
+            from hex0tobin import bytes_from_hex0_bytes
+            rom_bytes = bytes_from_hex0_bytes(rom_bytes)
+        ROM_CACHE[key] = rom_bytes
+    return rom_bytes
+
+def get_tape1_bytes(job):
+    if job['tape1_path']!=None:
+        f = open(job['tape1_path'], 'rb')
+        tape1 = f.read()
+        f.close()
+        return tape1
+    return job['tape1']
+
+def run_batch_job(index_and_job):
+    index, job = index_and_job
+    tapes = (MemoryTapeBackend(get_tape1_bytes(job)),
+             MemoryTapeBackend(job['tape2']) )
+    stdout = BytesIO()
+    vm = create_vm(size=job['memory_size'],
+                   registersize=job['registersize'],
+                   tapefile1=tapes[0], tapefile2=tapes[1],
+                   stdin=BytesIO(), stdout=stdout)
+    load_rom_bytes(vm, get_rom_bytes(job['rom'], job['rom_hex']))
+    exit_code = None
+    try:
+        stop_reason, count = execute_vm(
+            vm, halt_print=COMPAT_FALSE, engine=job['engine'],
+            max_steps=job['max_steps'])
+    except SystemExit:
+        from sys import exc_info
+        exit_code = exc_info()[1].code
+        stop_reason, count = STOP_EXIT, vm.perf_count
+    flush_tapes(vm) # what's been written when stopped by max_steps
+    result = {
+        'index': index, 'name': job['name'],
+        'stop_reason': stop_reason, 'exit_code': exit_code,
+        'count': count, 'stdout': stdout.getvalue(),
+    }
+    if job['hash_output']:
+        result['tape_hashes'] = [ sha256(tape.getvalue()).hexdigest()
+                                  for tape in tapes ]
+    else:
+        result['tapes'] = [ tape.getvalue() for tape in tapes ]
+    return result
+
+def run_batch(jobs, workers=None, chunksize=1):
+    # a generator of results as jobs finish, workers is the number of
+    # processes, None for one per cpu, 1 runs the jobs in this process
+    indexed_jobs = list(enumerate(jobs))
+    if workers==1:
+        for index_and_job in indexed_jobs:
+            yield run_batch_job(index_and_job)
+        return
+
+    from multiprocessing import Pool
+    pool = Pool(workers)
+    try:
+        for result in pool.imap_unordered(
+                run_batch_job, indexed_jobs, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+# flags followed by a value, everything else not starting with -- is an
+# input file
+FLAGS_WITH_VALUE = ("--workers", "--register-size", "--memory-size",
+                    "--max-steps", "--output-dir")
+
+def get_input_paths(flags):
+    paths = []
+    i = 0
+    while i<len(flags):
+        if flags[i] in FLAGS_WITH_VALUE:
+            i += 2
+        else:
+            if not flags[i].startswith("--"):
+                paths.append(flags[i])
+            i += 1
+    return paths
+
+def main(args):
+    if len(args)<3:
+        print_func("Usage: %s $RomFile $InputFile... [--rom-hex] "
+                   "[--workers N] [--register-size N] [--memory-size N] "
+                   "[--max-steps N] [--output-dir $Dir]" % args[0],
+                   file=stderr)
+        print_func("Runs the rom once for each $InputFile on tape_01, "
+                   "printing the stop reason, instruction count and "
+                   "sha256 of tape_02", file=stderr)
+        exit(EXIT_FAILURE)
+    rom = args[1]
+    flags = args[2:]
+    output_dir = get_flag_values(flags, "--output-dir", 1)
+    jobs = [ make_batch_job(
+        rom, tape1_path=input_path, rom_hex="--rom-hex" in flags,
+        registersize=get_list_flag(flags, "--register-size", [32],
+                                   int_flag_value)[0],
+        memory_size=get_list_flag(flags, "--memory-size", [1<<21],
+                                  int_flag_value)[0],
+        max_steps=get_list_flag(flags, "--max-steps", [None],
+                                int_flag_value)[0],
+        hash_output=output_dir==None, name=input_path)
+             for input_path in get_input_paths(flags) ]
+
+    failed = COMPAT_FALSE
+    workers = get_list_flag(flags, "--workers", [None], int_flag_value)[0]
+    for result in run_batch(jobs, workers=workers):
+        if output_dir==None:
+            output_hash = result['tape_hashes'][1]
+        else:
+            output = result['tapes'][1]
+            f = open(path_join(output_dir[0], basename(result['name'])),
+                     'wb')
+            f.write(output)
+            f.close()
+            output_hash = sha256(output).hexdigest()
+        print_func("%s %s %d %s" % (result['name'], result['stop_reason'],
+                                    result['count'], output_hash) )
+        if result['stop_reason']!=STOP_HALTED:
+            failed = COMPAT_TRUE
+    if failed:
+        exit(EXIT_FAILURE)
+    exit(EXIT_SUCCESS)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
@@ -0,0 +1,711 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_BLOCKS, an execution engine that translates straight-line runs of
+# Knight instructions (basic blocks) into python source, compiles them once
+# and caches the resulting functions by start address.
+#
+# A block runs until a jump, CALLI, RET, HAL code or an instruction that
+# can't be translated, so the dictionary lookups and decoding done by
+# the interpreter for every instruction are only done once per block.
+# Commonly used instructions are written out as python with the register
+# size masks as constants, the rest call the functions from the
+# knightinstructions modules. A CMPSKIPI followed by something that can
+# be skipped becomes an if statement in the middle of a block.
+#
+# Blocks are forgotten when an instruction writes over them, see
+# BlockCache.invalidate. Like with ENGINE_DECODE_CACHE, anything else that
+# modifies vm.mem after instructions have run should call
+# knightdecode.forget_decoded_instructions(vm)
+#
+# If an instruction in a block raises an exception (such as
+# OutsideOfWorldException), vm.ip and vm.perf_count are fixed up to match
+# what the interpreter would have left behind, see
+# restore_vm_after_block_exception
+
+from sys import exc_info
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from constants import \
+    RAW, CURIP, NEXTIP, RAW_IMMEDIATE, I_REGISTERS, HAL_CODE_OP, \
+    CONDITION_BIT_C, CONDITION_BIT_B, CONDITION_BIT_O, \
+    CONDITION_BIT_GT, CONDITION_BIT_EQ, CONDITION_BIT_LT
+from knightdecode import \
+    read_and_decode_instruction, lookup_instruction_str, \
+    get_instruction_module_for_registersize_bits, \
+    get_read_and_eval_for_register_size, get_run_for_register_size, \
+    outside_of_world_exit, instruction_not_implemented, \
+    check_run_stop_conditions, get_run_stop_perf_count, run_stop_reason
+from knightdecodeutil import OutsideOfWorldException
+from knightinstructions import \
+    read_word8, read_word16, read_word32, read_word64, read_signed_word32, \
+    write_word8, write_word16, write_word32, write_word64, \
+    get_instruction_size, \
+    interpret_sixteenbits_as_signed, get_instruction_operands, \
+    MEMORY_WRITE_TABLE
+import knightinstructions
+
+# keeps the time spent compiling a block that is only partly used down
+MAX_BLOCK_INSTRUCTIONS = 64
+
+# blocks are found by the 256 byte pages they cover when a write happens
+BLOCK_PAGE_BITS = 8
+
+# indexes into the tuples in BlockCache.blocks
+(BLOCK_FUNC, BLOCK_START, BLOCK_END, BLOCK_FILENAME,
+ BLOCK_LINE_INSTRUCTIONS, BLOCK_INSTRUCTION_IPS) = range(6)
+
+BLOCK_FILENAME_FORMAT = "<knight block 0x%X>"
+
+class BlockCache(object):
+    __slots__ = ('blocks', 'pages', 'translations')
+
+    def __init__(self):
+        self.clear()
+        self.translations = 0
+
+    def clear(self):
+        # start address -> block tuple, see BLOCK_FUNC and friends
+        self.blocks = {}
+        # page number -> dictionary with the start addresses of blocks
+        # with bytes in that page as keys
+        self.pages = {}
+
+    def add(self, block):
+        start = block[BLOCK_START]
+        self.blocks[start] = block
+        for page in range(start >> BLOCK_PAGE_BITS,
+                          ((block[BLOCK_END]-1) >> BLOCK_PAGE_BITS) + 1):
+            if page not in self.pages:
+                self.pages[page] = {}
+            self.pages[page][start] = None
+
+    def remove(self, start):
+        block = self.blocks[start]
+        del self.blocks[start]
+        for page in range(start >> BLOCK_PAGE_BITS,
+                          ((block[BLOCK_END]-1) >> BLOCK_PAGE_BITS) + 1):
+            del self.pages[page][start]
+            if len(self.pages[page])==0:
+                del self.pages[page]
+
+    # returns true if a block was forgotten, a running block checks this
+    # after each write in case it just wrote over itself
+    def invalidate(self, address, byte_count):
+        removed = COMPAT_FALSE
+        pages = self.pages
+        end = address + byte_count
+        for page in range(address >> BLOCK_PAGE_BITS,
+                          ((end-1) >> BLOCK_PAGE_BITS) + 1):
+            if page in pages:
+                for start in list(pages[page].keys()):
+                    if (start < end and
+                        address < self.blocks[start][BLOCK_END]):
+                        self.remove(start)
+                        removed = COMPAT_TRUE
+        return removed
+
+def get_block_cache(vm):
+    if vm.block_cache==None:
+        vm.block_cache = BlockCache()
+    return vm.block_cache
+
+# Block translation
+#
+# Each template function takes a decoded instruction and a RegisterWidth
+# and returns lines of python source. A line of the form "EXIT target" is
+# replaced with the statements that leave the block with vm.ip = target.
+# In the generated source, mem, reg and cache are vm.mem, vm.reg and
+# vm.block_cache and s counts the instructions skipped by CMPSKIPI.
+
+class RegisterWidth(object):
+    __slots__ = ('size', 'bits', 'mask', 'sign')
+
+    def __init__(self, size):
+        self.size = size
+        self.bits = size*8
+        self.mask = (1<<self.bits)-1
+        self.sign = 1<<(self.bits-1)
+
+    def signed(self, register_index):
+        return "((reg[%d] ^ 0x%X) - 0x%X)" % (
+            register_index, self.sign, self.sign)
+
+def registers(c):
+    return c[I_REGISTERS]
+
+def signed_immediate(c):
+    return interpret_sixteenbits_as_signed(c[RAW_IMMEDIATE])
+
+def write_lines(c, address_expr, value_expr, byte_count):
+    return ["w = %s" % address_expr,
+            "write_word%d(mem, w, %s)" % (byte_count*8, value_expr),
+            "if cache.invalidate(w, %d):" % byte_count,
+            "    EXIT %d" % c[NEXTIP],
+    ]
+
+def comparison_lines(tmp1, tmp2, reg0):
+    return ["if %s > %s:" % (tmp1, tmp2),
+            "    reg[%d] = %d" % (reg0, CONDITION_BIT_GT),
+            "elif %s == %s:" % (tmp1, tmp2),
+            "    reg[%d] = %d" % (reg0, CONDITION_BIT_EQ),
+            "else:",
+            "    reg[%d] = %d" % (reg0, CONDITION_BIT_LT),
+    ]
+
+def conditional_exit_lines(condition, taken, not_taken):
+    return ["if %s:" % condition,
+            "    EXIT %s" % taken,
+            "EXIT %s" % not_taken,
+    ]
+
+def make_3OP_template(expression):
+    def template_3OP(c, width):
+        reg0, reg1, reg2 = registers(c)
+        return ["reg[%d] = %s" % (
+            reg0, expression % {'a': "reg[%d]" % reg1,
+                                'b': "reg[%d]" % reg2,
+                                'mask': width.mask} )]
+    return template_3OP
+
+def template_SUB(c, width):
+    reg0, reg1, reg2 = registers(c)
+    return ["reg[%d] = (%s - %s) & 0x%X" % (
+        reg0, width.signed(reg1), width.signed(reg2), width.mask)]
+
+def template_CMP(c, width):
+    reg0, reg1, reg2 = registers(c)
+    return ["t1 = %s" % width.signed(reg1),
+            "t2 = %s" % width.signed(reg2),
+            ] + comparison_lines("t1", "t2", reg0)
+
+def template_CMPU(c, width):
+    reg0, reg1, reg2 = registers(c)
+    return comparison_lines("reg[%d]" % reg1, "reg[%d]" % reg2, reg0)
+
+def template_NEG(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = (-%s) & 0x%X" % (reg0, width.signed(reg1), width.mask)]
+
+def template_SWAP(c, width):
+    reg0, reg1 = registers(c)
+    return ["t1 = reg[%d]" % reg1,
+            "reg[%d] = reg[%d]" % (reg1, reg0),
+            "reg[%d] = t1" % reg0,
+    ]
+
+def template_COPY(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = reg[%d]" % (reg0, reg1)]
+
+def template_MOVE(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = reg[%d]" % (reg0, reg1),
+            "reg[%d] = 0" % reg1,
+    ]
+
+def template_NOT(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = (~reg[%d]) & 0x%X" % (reg0, reg1, width.mask)]
+
+def template_PUSHR(c, width):
+    reg0, reg1 = registers(c)
+    return ["w = reg[%d]" % reg1,
+            "write_word%d(mem, w, reg[%d])" % (width.bits, reg0),
+            "reg[%d] = w + %d" % (reg1, width.size),
+            "if cache.invalidate(w, %d):" % width.size,
+            "    EXIT %d" % c[NEXTIP],
+    ]
+
+def template_POPR(c, width):
+    reg0, reg1 = registers(c)
+    return ["w = reg[%d] - %d" % (reg1, width.size),
+            "reg[%d] = w" % reg1,
+            "t1 = read_word%d(mem, w)" % width.bits,
+            "write_word%d(mem, w, 0)" % width.bits,
+            "reg[%d] = t1" % reg0,
+            "if cache.invalidate(w, %d):" % width.size,
+            "    EXIT %d" % c[NEXTIP],
+    ]
+
+def template_FALSE(c, width):
+    return ["reg[%d] = 0" % registers(c)[0]]
+
+def template_TRUE(c, width):
+    return ["reg[%d] = 0x%X" % (registers(c)[0], width.mask)]
+
+def template_JSR_COROUTINE(c, width):
+    return ["EXIT reg[%d]" % registers(c)[0]]
+
+def template_RET(c, width):
+    reg0 = registers(c)[0]
+    return ["w = reg[%d] - %d" % (reg0, width.size),
+            "reg[%d] = w" % reg0,
+            "t1 = read_word%d(mem, w)" % width.bits,
+            "write_word%d(mem, w, 0)" % width.bits,
+            "cache.invalidate(w, %d)" % width.size,
+            "EXIT t1",
+    ]
+
+def make_2OPI_arithmetic_template(expression, signed=COMPAT_TRUE):
+    def template_2OPI(c, width):
+        reg0, reg1 = registers(c)
+        if signed:
+            immediate = signed_immediate(c)
+        else:
+            immediate = c[RAW_IMMEDIATE]
+        return ["reg[%d] = %s" % (
+            reg0, expression % {'a': "reg[%d]" % reg1,
+                                'i': immediate,
+                                'mask': width.mask} )]
+    return template_2OPI
+
+def template_LOAD(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = read_word%d(mem, reg[%d] + %d)" % (
+        reg0, width.bits, reg1, signed_immediate(c))]
+
+def template_LOAD8(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = ((mem[(reg[%d] + %d) & 0x%X] ^ 0x80) - 0x80) & 0x%X" % (
+        reg0, reg1, signed_immediate(c), width.mask, width.mask)]
+
+def template_LOADU8(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = mem[(reg[%d] + %d) & 0x%X]" % (
+        reg0, reg1, c[RAW_IMMEDIATE], width.mask)]
+
+def template_LOAD32(c, width):
+    reg0, reg1 = registers(c)
+    return ["reg[%d] = read_signed_word32(mem, (reg[%d] + %d) & 0x%X)"
+            " & 0x%X" % (
+                reg0, reg1, signed_immediate(c), width.mask, width.mask)]
+
+def template_CMPUI(c, width):
+    reg0, reg1 = registers(c)
+    return comparison_lines("reg[%d]" % reg1, "%d" % c[RAW_IMMEDIATE], reg0)
+
+def make_store_template(byte_count):
+    def template_STORE(c, width):
+        reg0, reg1 = registers(c)
+        return write_lines(c, "reg[%d] + %d" % (reg1, signed_immediate(c)),
+                           "reg[%d]" % reg0, byte_count or width.size)
+    return template_STORE
+
+def make_CMPJUMPI_template(operator, signed):
+    def template_CMPJUMPI(c, width):
+        reg0, reg1 = registers(c)
+        if signed:
+            condition = "%s %s %s" % (
+                width.signed(reg0), operator, width.signed(reg1))
+        else:
+            condition = "reg[%d] %s reg[%d]" % (reg0, operator, reg1)
+        return conditional_exit_lines(
+            condition,
+            "%d" % ((c[NEXTIP] + signed_immediate(c)) & width.mask),
+            "%d" % c[NEXTIP] )
+    return template_CMPJUMPI
+
+def make_1OPI_jump_template(condition_format):
+    def template_1OPI_jump(c, width):
+        return conditional_exit_lines(
+            condition_format % {'r': "reg[%d]" % registers(c)[0],
+                                'bits': width.bits-1},
+            "%d" % (c[NEXTIP] + signed_immediate(c)),
+            "%d" % c[NEXTIP] )
+    return template_1OPI_jump
+
+def template_CALLI(c, width):
+    reg0 = registers(c)[0]
+    return ["w = reg[%d]" % reg0,
+            "write_word%d(mem, w, %d)" % (width.bits, c[NEXTIP]),
+            "reg[%d] = w + %d" % (reg0, width.size),
+            "cache.invalidate(w, %d)" % width.size,
+            "EXIT %d" % (c[NEXTIP] + signed_immediate(c)),
+    ]
+
+def template_LOADI(c, width):
+    return ["reg[%d] = %d" % (registers(c)[0],
+                              signed_immediate(c) & width.mask)]
+
+def template_LOADUI(c, width):
+    return ["reg[%d] = %d" % (registers(c)[0], c[RAW_IMMEDIATE])]
+
+def template_SR0I(c, width):
+    reg0 = registers(c)[0]
+    return ["reg[%d] = reg[%d] >> %d" % (reg0, reg0, c[RAW_IMMEDIATE])]
+
+def template_SL0I(c, width):
+    reg0 = registers(c)[0]
+    return ["reg[%d] = (reg[%d] << %d) & 0x%X" % (
+        reg0, reg0, c[RAW_IMMEDIATE], width.mask)]
+
+def template_JUMP(c, width):
+    return ["EXIT %d" % (c[NEXTIP] + signed_immediate(c))]
+
+def template_NOP(c, width):
+    return []
+
+# CMPSKIPI conditions, see the compare_immediate_to_register functions in
+# knightinstructions.py, E and NE use the unsigned immediate
+CMPSKIPI_CONDITIONS = {
+    "CMPSKIPI_G": (">", COMPAT_TRUE),
+    "CMPSKIPI_GE": (">=", COMPAT_TRUE),
+    "CMPSKIPI_E": ("==", COMPAT_FALSE),
+    "CMPSKIPI_NE": ("!=", COMPAT_FALSE),
+    "CMPSKIPI_LE": ("<=", COMPAT_TRUE),
+    "CMPSKIPI_L": ("<", COMPAT_TRUE),
+}
+
+def cmpskipi_condition(c, width, instruction_str):
+    operator, signed = CMPSKIPI_CONDITIONS[instruction_str]
+    reg0 = registers(c)[0]
+    if signed:
+        return "%s %s %d" % (width.signed(reg0), operator, signed_immediate(c))
+    else:
+        return "reg[%d] %s %d" % (reg0, operator, c[RAW_IMMEDIATE])
+
+# instruction name -> template function, for instructions that never
+# leave the block early except to stop running code that was overwritten.
+# Only instructions implemented in knightinstructions.py belong in these,
+# others are left to raise InstructionNotImplemented
+INSTRUCTION_TEMPLATES = {
+    "ADD": make_3OP_template("(%(a)s + %(b)s) & 0x%(mask)X"),
+    "ADDU": make_3OP_template("(%(a)s + %(b)s) & 0x%(mask)X"),
+    "SUB": template_SUB,
+    "CMP": template_CMP,
+    "CMPU": template_CMPU,
+    "AND": make_3OP_template("%(a)s & %(b)s"),
+    "NEG": template_NEG,
+    "SWAP": template_SWAP,
+    "COPY": template_COPY,
+    "MOVE": template_MOVE,
+    "NOT": template_NOT,
+    "PUSHR": template_PUSHR,
+    "POPR": template_POPR,
+    "FALSE": template_FALSE,
+    "TRUE": template_TRUE,
+    "ADDUI": make_2OPI_arithmetic_template("(%(a)s + %(i)d) & 0x%(mask)X"),
+    "SUBI": make_2OPI_arithmetic_template("(%(a)s - %(i)d) & 0x%(mask)X"),
+    "SUBUI": make_2OPI_arithmetic_template("(%(a)s - %(i)d) & 0x%(mask)X"),
+    "ANDI": make_2OPI_arithmetic_template("%(a)s & %(i)d"),
+    "LOAD": template_LOAD,
+    "LOAD8": template_LOAD8,
+    "LOADU8": template_LOADU8,
+    "LOAD32": template_LOAD32,
+    "CMPUI": template_CMPUI,
+    "STORE": make_store_template(0),
+    "STORE8": make_store_template(1),
+    "STORE32": make_store_template(4),
+    "LOADI": template_LOADI,
+    "LOADUI": template_LOADUI,
+    "SARI": template_SR0I,
+    "SR0I": template_SR0I,
+    "SL0I": template_SL0I,
+    "NOP": template_NOP,
+}
+
+# instruction name -> template function, for instructions that end a block
+TERMINATOR_TEMPLATES = {
+    "JSR_COROUTINE": template_JSR_COROUTINE,
+    "RET": template_RET,
+    "CMPJUMPI_G": make_CMPJUMPI_template(">", COMPAT_TRUE),
+    "CMPJUMPI_GE": make_CMPJUMPI_template(">=", COMPAT_TRUE),
+    "CMPJUMPI_E": make_CMPJUMPI_template("==", COMPAT_FALSE),
+    "CMPJUMPI_NE": make_CMPJUMPI_template("!=", COMPAT_FALSE),
+    "CMPJUMPI_LE": make_CMPJUMPI_template("<=", COMPAT_TRUE),
+    "CMPJUMPI_L": make_CMPJUMPI_template("<", COMPAT_TRUE),
+    "JUMP_C": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_C),
+    "JUMP_B": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_B),
+    "JUMP_O": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_O),
+    "JUMP_G": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_GT),
+    "JUMP_GE": make_1OPI_jump_template(
+        "%%(r)s & %d" % (CONDITION_BIT_GT | CONDITION_BIT_EQ) ),
+    "JUMP_E": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_EQ),
+    "JUMP_NE": make_1OPI_jump_template(
+        "not (%%(r)s & %d)" % CONDITION_BIT_EQ ),
+    "JUMP_LE": make_1OPI_jump_template(
+        "%%(r)s & %d" % (CONDITION_BIT_LT | CONDITION_BIT_EQ) ),
+    "JUMP_L": make_1OPI_jump_template("%%(r)s & %d" % CONDITION_BIT_LT),
+    "JUMP_Z": make_1OPI_jump_template("0 == %(r)s"),
+    "JUMP_NZ": make_1OPI_jump_template("0 != %(r)s"),
+    "JUMP_P": make_1OPI_jump_template("not (%(r)s >> %(bits)d)"),
+    "JUMP_NP": make_1OPI_jump_template("%(r)s >> %(bits)d"),
+    "CALLI": template_CALLI,
+    "JUMP": template_JUMP,
+}
+
+# instructions without a template that change the instruction pointer,
+# they are called and end the block
+def is_untemplated_terminator(instruction_str):
+    for prefix in ("JUMP", "CMPJUMP", "CMPSKIP", "BRANCH", "CALL", "RET",
+                   "JSR", "PUSHPC", "POPPC"):
+        if instruction_str.startswith(prefix):
+            return COMPAT_TRUE
+    return COMPAT_FALSE
+
+def fallback_lines(k, instruction_str, c, namespace, knightmodule):
+    # call the function from knightmodule, H%d in the namespace is the
+    # instruction function, its operands are written out as literals and
+    # C%d is the decoded instruction for not_implemented
+    namespace["C%d" % k] = c
+    lines = []
+    if c[RAW][0] == HAL_CODE_OP:
+        namespace["H%d" % k] = getattr(knightinstructions,
+                                       "vm_" + instruction_str)
+        lines.append("H%d(vm)" % k)
+        lines.append("EXIT %d" % c[NEXTIP])
+        return lines
+
+    args = ", ".join(
+        ["vm", "mem", "reg"] +
+        ["%d" % operand
+         for operand in get_instruction_operands(c, instruction_str)] )
+    if instruction_str in MEMORY_WRITE_TABLE:
+        namespace["W%d" % k] = MEMORY_WRITE_TABLE[instruction_str]
+        lines.append("w, n = W%d(%s)" % (k, args))
+
+    namespace["H%d" % k] = getattr(knightmodule, instruction_str)
+    lines.extend(["ip = H%d(%s)" % (k, args),
+                  "if ip == None:",
+                  "    not_implemented(vm, C%d)" % k,
+    ])
+    if instruction_str in MEMORY_WRITE_TABLE:
+        lines.extend(["if cache.invalidate(w, n):",
+                      "    EXIT ip"])
+    if is_untemplated_terminator(instruction_str):
+        lines.append("EXIT ip")
+    return lines
+
+def instruction_lines(k, instruction_str, c, width, namespace, knightmodule):
+    # returns the lines for instruction and whether it ends the block
+    if instruction_str in INSTRUCTION_TEMPLATES:
+        return INSTRUCTION_TEMPLATES[instruction_str](c, width), COMPAT_FALSE
+    elif instruction_str in TERMINATOR_TEMPLATES:
+        return TERMINATOR_TEMPLATES[instruction_str](c, width), COMPAT_TRUE
+    else:
+        return (fallback_lines(k, instruction_str, c, namespace, knightmodule),
+                c[RAW][0] == HAL_CODE_OP or
+                is_untemplated_terminator(instruction_str) )
+
+def translatable(instruction_str):
+    return not (instruction_str == None or instruction_str == "HALT")
+
+def find_block_instructions(vm, start):
+    # a list of (instruction_str, decoded instruction) that make up the
+    # block starting at start, ending when a terminator is found
+    instructions = []
+    address = start
+    while len(instructions) < MAX_BLOCK_INSTRUCTIONS:
+        c = read_and_decode_instruction(vm, address)
+        if c==None:
+            break
+        instruction_str = lookup_instruction_str(c)
+        if not translatable(instruction_str):
+            break
+        instructions.append( (instruction_str, c) )
+        address = c[NEXTIP]
+
+        if instruction_str in CMPSKIPI_CONDITIONS:
+            skipped = read_and_decode_instruction(vm, address)
+            if skipped == None:
+                break
+            skipped_str = lookup_instruction_str(skipped)
+            if (not translatable(skipped_str) or
+                skipped_str in CMPSKIPI_CONDITIONS):
+                break
+            instructions.append( (skipped_str, skipped) )
+            address = skipped[NEXTIP]
+        elif (instruction_str in TERMINATOR_TEMPLATES or
+              is_untemplated_terminator(instruction_str) or
+              c[RAW][0] == HAL_CODE_OP):
+            break
+    return instructions
+
+def make_exit_lines(indent, k, skipping, target):
+    if skipping:
+        perf_count = "vm.perf_count = vm.perf_count + %d - s" % (k+1)
+    else:
+        perf_count = "vm.perf_count = vm.perf_count + %d" % (k+1)
+    return [indent + perf_count,
+            indent + "vm.ip = %s" % target,
+            indent + "return"]
+
+def translate_block(vm, cache, registersizebits):
+    start = vm.ip
+    instructions = find_block_instructions(vm, start)
+    if len(instructions)==0:
+        return None
+
+    width = RegisterWidth(vm.reg.itemsize)
+    knightmodule = get_instruction_module_for_registersize_bits(
+        registersizebits)
+    namespace = {
+        'read_word8': read_word8,
+        'read_word16': read_word16,
+        'read_word32': read_word32,
+        'read_word64': read_word64,
+        'read_signed_word32': read_signed_word32,
+        'write_word8': write_word8,
+        'write_word16': write_word16,
+        'write_word32': write_word32,
+        'write_word64': write_word64,
+        'get_instruction_size': get_instruction_size,
+        'not_implemented': instruction_not_implemented,
+    }
+    # (source line, instruction index) pairs, line numbers start at 1
+    lines = [ ("def block(vm, mem, reg, cache):", 0),
+              ("    s = 0", 0) ]
+    skipping = COMPAT_FALSE # true once a CMPSKIPI has been translated
+    indent = "    "
+    k = 0
+    while k < len(instructions):
+        instruction_str, c = instructions[k]
+        if instruction_str in CMPSKIPI_CONDITIONS and k+1==len(instructions):
+            # the instruction to skip couldn't be included in the block
+            lines.append( (indent + "if %s:" % cmpskipi_condition(
+                c, width, instruction_str), k) )
+            instruction_lines_k = [
+                "    EXIT %d + get_instruction_size(vm, %d)" % (
+                    c[NEXTIP], c[NEXTIP]),
+                "EXIT %d" % c[NEXTIP] ]
+            terminator = COMPAT_TRUE
+        elif instruction_str in CMPSKIPI_CONDITIONS:
+            lines.append( (indent + "if %s:" % cmpskipi_condition(
+                c, width, instruction_str), k) )
+            lines.append( (indent + "    s = s + 1", k) )
+            lines.append( (indent + "else:", k) )
+            skipping = COMPAT_TRUE
+            indent = indent + "    "
+            k+=1
+            instruction_str, c = instructions[k]
+            instruction_lines_k, terminator = instruction_lines(
+                k, instruction_str, c, width, namespace, knightmodule)
+            if len(instruction_lines_k)==0:
+                instruction_lines_k = ["pass"]
+            # the skipped instruction doesn't end the block, either way
+            # execution continues after it if it doesn't leave the block
+            terminator = COMPAT_FALSE
+        else:
+            instruction_lines_k, terminator = instruction_lines(
+                k, instruction_str, c, width, namespace, knightmodule)
+
+        for line in instruction_lines_k:
+            stripped = line.lstrip()
+            line_indent = indent + line[0:len(line)-len(stripped)]
+            if stripped.startswith("EXIT "):
+                for exit_line in make_exit_lines(
+                    line_indent, k, skipping, stripped[len("EXIT "):]):
+                    lines.append( (exit_line, k) )
+            else:
+                lines.append( (line_indent + stripped, k) )
+        indent = "    "
+        k+=1
+
+    last_c = instructions[-1][1]
+    if not terminator:
+        for exit_line in make_exit_lines(
+            indent, len(instructions)-1, skipping, "%d" % last_c[NEXTIP]):
+            lines.append( (exit_line, len(instructions)-1) )
+
+    filename = BLOCK_FILENAME_FORMAT % start
+    source = "\n".join([line for line, k in lines]) + "\n"
+    exec(compile(source, filename, "exec"), namespace)
+    block = (namespace['block'],
+             start,
+             last_c[NEXTIP], # BLOCK_END
+             filename,
+             tuple([k for line, k in lines]), # BLOCK_LINE_INSTRUCTIONS
+             tuple([c[CURIP] for instruction_str, c in instructions]),
+    )
+    cache.add(block)
+    cache.translations += 1
+    return block
+
+def restore_vm_after_block_exception(vm, block, tb):
+    # to be called from an except: block with the traceback of the
+    # exception raised by the block, puts vm.ip and vm.perf_count where
+    # the interpreter would have left them
+    while tb!=None:
+        frame = tb.tb_frame
+        if frame.f_code.co_filename == block[BLOCK_FILENAME]:
+            k = block[BLOCK_LINE_INSTRUCTIONS][tb.tb_lineno-1]
+            vm.perf_count = vm.perf_count + k + 1 - frame.f_locals['s']
+            vm.ip = block[BLOCK_INSTRUCTION_IPS][k]
+            return
+        tb = tb.tb_next
+
+def make_read_and_eval_for_registersize(registersizebits):
+    # HALT, illegal instructions and instructions that can't be read
+    # aren't translated and go through here
+    interpreter_read_and_eval = get_read_and_eval_for_register_size(
+        registersizebits//8)
+
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        cache = get_block_cache(vm)
+        block = cache.blocks.get(vm.ip)
+        if block==None:
+            block = translate_block(vm, cache, registersizebits)
+            if block==None:
+                return interpreter_read_and_eval(vm, halt_print=halt_print)
+        try:
+            try:
+                block[BLOCK_FUNC](vm, vm.mem, vm.reg, cache)
+            except:
+                restore_vm_after_block_exception(vm, block, exc_info()[2])
+                raise
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        return vm
+    return read_and_eval
+
+def make_run_for_registersize(registersizebits):
+    # steps through the interpreter when a whole block would run past
+    # max_steps or until_ip, as well as for what read_and_eval does
+    interpreter_run = get_run_for_register_size(registersizebits//8)
+
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        cache = get_block_cache(vm)
+        blocks = cache.blocks
+        try:
+            while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                   not (until_halt and vm.halted) ):
+                block = blocks.get(vm.ip)
+                if block==None:
+                    block = translate_block(vm, cache, registersizebits)
+                if ( block==None or
+                     ( stop_perf_count!=None and
+                       stop_perf_count-vm.perf_count <
+                       len(block[BLOCK_INSTRUCTION_IPS]) ) or
+                     ( until_ip!=None and
+                       block[BLOCK_START] < until_ip < block[BLOCK_END] ) ):
+                    interpreter_run(vm, max_steps=1, until_halt=COMPAT_FALSE,
+                                    halt_print=halt_print)
+                    continue
+                try:
+                    block[BLOCK_FUNC](vm, vm.mem, vm.reg, cache)
+                except:
+                    restore_vm_after_block_exception(vm, block, exc_info()[2])
+                    raise
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
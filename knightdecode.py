@@ -25,21 +25,35 @@ from sys import stderr, stdin, stdout, exc_info, exit
 from time import sleep
 from array import array
 
-import knightinstructions
 from pythoncompat import print_func, init_array_itemsize_8, \
     get_binary_mode_stdout, COMPAT_FALSE, COMPAT_TRUE
 from constants import \
-    EXIT_FAILURE, \
-    IP, REG, MEM, HALTED, EXCEPT, PERF_COUNT, TAPE1FILENAME, TAPE2FILENAME, \
+    EXIT_FAILURE, TAPEFD, \
     OP, RAW, CURIP, NEXTIP, RESTOF, INVALID, \
     RAW_XOP, XOP, RAW_IMMEDIATE, IMMEDIATE, I_REGISTERS, HAL_CODE, \
     ARRAY_TYPE_UNSIGNED_CHAR, ARRAY_TYPE_UNSIGNED_SHORT, \
     ARRAY_TYPE_UNSIGNED_INT, ARRAY_TYPE_UNSIGNED_INT_LONG, \
     ARRAY_TYPE_UNSIGNED_LONG_LONG, \
     HALT_OP, HAL_CODE_OP, \
-    HAL_CODE_FGETC, HAL_CODE_FPUTC, HAL_CODE_FOPEN_WRITE, HAL_CODE_FCLOSE
+    HAL_CODE_FGETC, HAL_CODE_FPUTC, HAL_CODE_FOPEN_WRITE, HAL_CODE_FCLOSE, \
+    ENGINE_INTERPRETER, ENGINE_DECODE_CACHE, ENGINE_BLOCKS, ENGINE_FUSION, \
+    ENGINE_PROFILE, ENGINE_TRACE, ENGINE_TRUSTED, \
+    STOP_HALTED, STOP_MAX_STEPS, STOP_UNTIL_IP
 
 from knightdecodeutil import outside_of_world, OutsideOfWorldException
+from knighttape import flush_tapes
+
+# set from knightinstructions by import_instruction_helpers when the eval
+# tables are first built, not at import, so short lived commands that never
+# run an instruction don't pay for importing knightinstructions
+call_instruction = None
+UNSIGNED_IMMEDIATE_INSTRUCTIONS = None
+
+def import_instruction_helpers():
+    global call_instruction, UNSIGNED_IMMEDIATE_INSTRUCTIONS
+    if call_instruction==None:
+        from knightinstructions import \
+            call_instruction, UNSIGNED_IMMEDIATE_INSTRUCTIONS
 
 NUM_REGISTERS = 16
 
@@ -56,13 +70,80 @@ OUTSIDE_WORLD_ERROR = "READ Instruction outside of World"
 class InstructionNotImplemented(Exception):
     pass
 
+# attribute names of KnightVM in the same order as the vm tuple indexes
+# found in constants.py (IP, REG, MEM, HALTED...)
+VM_SLOTS = ('ip', 'reg', 'mem', 'halted', 'exception', 'perf_count',
+            'tape1filename', 'tape2filename', 'tapefd')
+assert len(VM_SLOTS) == TAPEFD+1
+
+# The vm used to be a tuple that was re-built every time the instruction
+# pointer, performance counter or halted flag changed, which meant several
+# throw away tuples for every instruction executed. Now those are updated in
+# place, but indexing with the vm tuple indexes from constants.py
+# (vm[IP], vm[MEM], ...) still works for compatibility
+class KnightVM(object):
+    # decode_cache is used by ENGINE_DECODE_CACHE, see knightdecodecache.py
+    # block_cache is used by ENGINE_BLOCKS, see knightblocks.py
+    # profile is used by ENGINE_PROFILE, see knightprofile.py
+    # trace is used by ENGINE_TRACE, see knighttrace.py
+    __slots__ = VM_SLOTS + ('decode_cache', 'block_cache', 'profile',
+                            'trace')
+
+    def __init__(self, ip, reg, mem, halted, exception, perf_count,
+                 tape1filename, tape2filename, tapefd):
+        self.ip = ip
+        self.reg = reg
+        self.mem = mem
+        self.halted = halted
+        self.exception = exception
+        self.perf_count = perf_count
+        self.tape1filename = tape1filename
+        self.tape2filename = tape2filename
+        self.tapefd = tapefd
+        self.decode_cache = None
+        self.block_cache = None
+        self.profile = None
+        self.trace = None
+
+    def __getitem__(self, index):
+        return getattr(self, VM_SLOTS[index])
+
+    def __setitem__(self, index, value):
+        setattr(self, VM_SLOTS[index], value)
+
+    def __len__(self):
+        return len(VM_SLOTS)
+
+def forget_decoded_instructions(vm):
+    # for use after vm.mem is modified by something other than instructions
+    # so engines that keep decoded instructions around don't use stale ones
+    if vm.decode_cache!=None:
+        vm.decode_cache.clear()
+    if vm.block_cache!=None:
+        vm.block_cache.clear()
+
 def grow_memory(vm, size):
-    while len(vm[MEM])<size:
-        vm[MEM].append(0)
+    # zero filled in one go, repeating a one element array and extending
+    # with it are both done in C
+    mem = vm.mem
+    if len(mem)<size:
+        if isinstance(mem, array):
+            mem.extend(array(ARRAY_TYPE_UNSIGNED_CHAR, (0,))*(size-len(mem)))
+        else: # a knightpagedmemory.PagedMemory, see create_vm
+            mem.grow(size)
 
 def create_vm(size, registersize=32,
               tapefile1="tape_01", tapefile2="tape_02",
-              stdin=stdin, stdout=None):
+              stdin=stdin, stdout=None, paged_memory=COMPAT_FALSE,
+              dirty_tracking=COMPAT_FALSE):
+    # with paged_memory, vm.mem is a knightpagedmemory.PagedMemory that
+    # only allocates the parts of memory that get written to
+    #
+    # with dirty_tracking, vm.mem keeps track of the pages written to,
+    # see knightdirtymemory.get_dirty_pages
+    #
+    # tapefile1 and tapefile2 are filenames or tape backends like
+    # knighttape.MemoryTapeBackend for tapes that never touch the disk
     if stdout==None:
         stdout = get_binary_mode_stdout()
     instruction_pointer = 0
@@ -88,18 +169,30 @@ def create_vm(size, registersize=32,
 
     amount_of_ram = size
 
-    # allocate memory, assert unsigned char is the size we think it is
-    memory = array(ARRAY_TYPE_UNSIGNED_CHAR)
-    assert memory.itemsize == SIZE_UNSIGNED_CHAR # 1
+    # the memory backends are only imported when asked for
+    if paged_memory and dirty_tracking:
+        from knightdirtymemory import DirtyTrackingPagedMemory
+        memory = DirtyTrackingPagedMemory()
+    elif paged_memory:
+        from knightpagedmemory import PagedMemory
+        memory = PagedMemory()
+    else:
+        # allocate memory, assert unsigned char is the size we think it is
+        if dirty_tracking:
+            from knightdirtymemory import DirtyTrackingMemory
+            memory = DirtyTrackingMemory(ARRAY_TYPE_UNSIGNED_CHAR)
+        else:
+            memory = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        assert memory.itemsize == SIZE_UNSIGNED_CHAR # 1
 
 
     halted = COMPAT_FALSE
     exception = COMPAT_FALSE
     performance_counter = 0
 
-    vm = (instruction_pointer, registers, memory,
-          halted, exception, performance_counter,
-          tapefile1, tapefile2, [None,None, stdin, stdout])
+    vm = KnightVM(instruction_pointer, registers, memory,
+                  halted, exception, performance_counter,
+                  tapefile1, tapefile2, [None,None, stdin, stdout])
     grow_memory(vm, size)
     return vm
 
@@ -109,32 +202,72 @@ def unpack_byte(a):
     assert len(table)==16
     return (table[a // 16], table[a % 16])
 
-def read_instruction(vm):
-    current_ip = vm[IP]
+# The _fast read_instruction and decode functions only produce the integer
+# fields of an instruction, leaving OP, RESTOF, XOP and IMMEDIATE as None.
+# with_instruction_strings() fills those in when a message needs them.
+def read_instruction_fast(vm, current_ip=None):
+    if current_ip==None:
+        current_ip = vm.ip
     next_ip = current_ip+MIN_INSTRUCTION_LEN
 
     # Why current_ip+MIN_INSTRUCTION_LEN-1 and not just current_ip ?
     # If the end of memory isn't MIN_INSTRUCTION_LEN byte aligned, than
     # current_ip may be in bounds but the last byte of it might not be
-    outside_of_world(vm[MEM], next_ip-1, OUTSIDE_WORLD_ERROR)
-    
-    instruction_bytes = vm[MEM][current_ip:current_ip+MIN_INSTRUCTION_LEN]
-    opcode = unpack_byte(instruction_bytes[0])
+    outside_of_world(vm.mem, next_ip-1, OUTSIDE_WORLD_ERROR)
 
-    return (opcode, # OP
-            instruction_bytes, # RAW
+    return (None, # OP
+            vm.mem[current_ip:next_ip], # RAW
             current_ip, # CURIP
             next_ip, # NEXTIP
-            [unpack_byte(a) for a in instruction_bytes[1:]], # RESTOF
+            None, # RESTOF
             COMPAT_FALSE # INVALID
     )
 
+def read_instruction(vm, current_ip=None):
+    return with_instruction_strings(read_instruction_fast(vm, current_ip))
+
+# for decoded instructions, (start, end) of the XOP and IMMEDIATE hex digits
+# within the hex digits of RESTOF, None where the field is None
+INSTRUCTION_STRING_DIGITS = {
+    0x01: ( (0, 2), (0, 0) ), # 4OP
+    0x05: ( (0, 3), (0, 0) ), # 3OP
+    0x09: ( (0, 4), (0, 0) ), # 2OP
+    0x0D: ( (0, 5), (0, 0) ), # 1OP
+    0xE1: ( None, (2, 6) ), # 2OPI
+    0xE0: ( (5, 6), (2, 6) ), # 1OPI
+    0x3C: ( (0, 2), (2, 6) ), # 0OPI
+    HAL_CODE_OP: ( None, None ),
+}
+
+def digits_or_none(digits, start_end):
+    if start_end==None:
+        return None
+    return digits[start_end[0]:start_end[1]]
+
+def with_instruction_strings(c):
+    instruction_bytes = c[RAW]
+    restof = [unpack_byte(a) for a in instruction_bytes[1:]]
+    c = ( (unpack_byte(instruction_bytes[0]),) + # OP
+          c[RAW:RESTOF] + (restof,) + c[RESTOF+1:] )
+    if len(c)<=XOP or instruction_bytes[0] not in INSTRUCTION_STRING_DIGITS:
+        return c # not decoded
+    xop_digits, immediate_digits = \
+        INSTRUCTION_STRING_DIGITS[instruction_bytes[0]]
+    digits = tuple([x
+                    for r in restof
+                    for x in r])
+    return ( c[0:XOP] + (digits_or_none(digits, xop_digits),) +
+             c[XOP+1:IMMEDIATE] +
+             (digits_or_none(digits, immediate_digits),) + c[IMMEDIATE+1:] )
+
 def halt_vm(vm):
-    # recontruct vm tuple with vm[HALTED] = COMPAT_TRUE
-    return vm[0:HALTED] + (COMPAT_TRUE,) + vm[HALTED+1:]
+    vm.halted = COMPAT_TRUE
+    flush_tapes(vm)
+    return vm
 
 def increment_vm_perf_count(vm):
-    return vm[0:PERF_COUNT] + (vm[PERF_COUNT]+1,) + vm[PERF_COUNT+1:]
+    vm.perf_count += 1
+    return vm
         
 def invalidate_instruction(i):
     return i[0:INVALID] + (COMPAT_TRUE,) + i[INVALID+1:]
@@ -143,7 +276,7 @@ def illegal_instruction(vm, current_instruction):
     print_func("Invalid instruction was recieved at address:%08X" %
                current_instruction[CURIP],
                file=stderr)
-    print_func("After %d instructions" % vm[PERF_COUNT], file=stderr)
+    print_func("After %d instructions" % vm.perf_count, file=stderr)
     print_func("Unable to execute the following instruction:\n\t%s" %
                string_unpacked_instruction(current_instruction),
                file=stderr)
@@ -154,199 +287,168 @@ def illegal_instruction(vm, current_instruction):
     if DEBUG:
         print_func("Computer Program has Halted", file=stderr)
 
-    #if TRACE: # TODO
-    #    record_trace("HALT") # TODO
-    #    print_traces() # TODO
-
+    # ENGINE_TRACE writes out the instructions leading up to this as
+    # the exit passes through it, see knighttrace.py
     exit(EXIT_FAILURE)
 
 def string_unpacked_instruction(i):
+    if i[OP]==None:
+        i = with_instruction_strings(i)
     return (''.join(i[OP]) +
             ''.join(''.join(rpair)
                     for rpair in i[RESTOF]) )
 
 def vm_with_new_ip(vm, new_ip):
-    return vm[0:IP] + (new_ip,) + vm[IP+1:]
+    vm.ip = new_ip
+    return vm
 
-def make_eval_instruction_for_registersize(registersizebits):
-    EVAL_TABLE = make_eval_tables_for_register_size(registersizebits)
+def eval_nop_halt_or_illegal(vm, current_instruction, halt_print=COMPAT_TRUE):
+    # for opcodes without an entry in DECODE_TABLE, vm.perf_count
+    # has already been incremented
+    raw0 = current_instruction[RAW][0]
 
-    def eval_instruction(vm, current_instruction, halt_print=COMPAT_TRUE):
-        vm = increment_vm_perf_count(vm)
-        if DEBUG:
-            print_func("Executing: %s" %
-                       string_unpacked_instruction(current_instruction),
-                       file=stderr)
-            sleep(1)
-
-        raw0 = current_instruction[RAW][0]
-
-        if raw0 == 0: # Deal with NOPs
-            if [0,0,0,0]==current_instruction[RAW].tolist():
-                #if TRACE: # TODO
-                #    record_trace("NOP") # TODO
-                return vm_with_new_ip(vm, current_instruction[NEXTIP])
-            illegal_instruction(vm, current_instruction)
-
-        elif raw0 in DECODE_TABLE:
-            assert raw0 in EVAL_TABLE
-            current_instruction = DECODE_TABLE[raw0](vm, current_instruction)
-            return vm_with_new_ip(vm,
-                                  EVAL_TABLE[raw0](vm, current_instruction) )
-        elif raw0 == HALT_OP:  # Deal with HALT
-            vm = halt_vm(vm)
-            if halt_print:
-                print_func(
-                    "Computer Program has Halted\nAfter Executing %d "
-                    "instructions" % vm[PERF_COUNT],
-                    file=stderr)
-            # if TRACE: # TODO
-            #    record_trace("HALT") # TODO
-            #    print_traces() # TODO
-            return vm
-        else:
-            illegal_instruction(vm, current_instruction)
+    if raw0 == 0: # Deal with NOPs
+        if [0,0,0,0]==current_instruction[RAW].tolist():
+            return vm_with_new_ip(vm, current_instruction[NEXTIP])
+        illegal_instruction(vm, current_instruction)
 
-        # we shouldn't make it this far, other branches call exit()
-        assert COMPAT_FALSE
-        return None
+    elif raw0 == HALT_OP:  # Deal with HALT
+        vm = halt_vm(vm)
+        if halt_print:
+            print_func(
+                "Computer Program has Halted\nAfter Executing %d "
+                "instructions" % vm.perf_count,
+                file=stderr)
+        return vm
+    else:
+        illegal_instruction(vm, current_instruction)
+
+    # we shouldn't make it this far, other branches call exit()
+    assert COMPAT_FALSE
+    return None
+
+def make_decode_and_eval(decode_func, eval_func):
+    def decode_and_eval(vm, c):
+        return eval_func(vm, decode_func(vm, c))
+    return decode_and_eval
+
+# a list with an entry for each of the 256 possible first bytes of an
+# instruction, a function that decodes and evaluates the instruction
+# or None for the NOP, HALT and illegal instructions left to
+# eval_nop_halt_or_illegal
+def make_opcode_dispatch_list(EVAL_TABLE):
+    opcode_dispatch_list = [None]*0x100
+    for raw0, decode_func in FAST_DECODE_TABLE.items():
+        opcode_dispatch_list[raw0] = make_decode_and_eval(
+            decode_func, EVAL_TABLE[raw0])
+    return opcode_dispatch_list
+
+# dispatch_lists=COMPAT_FALSE builds the older dictionary based tables
+# instead of the list based ones, for comparison in benchmarks/dispatch.py
+def make_eval_instruction_for_registersize(registersizebits,
+                                           dispatch_lists=COMPAT_TRUE):
+    OPCODE_DISPATCH = make_opcode_dispatch_list(
+        make_eval_tables_for_register_size(
+            registersizebits, dispatch_lists=dispatch_lists) )
 
-    return eval_instruction
-
-def decode_4OP(vm, c):
-    raw_xop = c[RAW][1]
-    xop = (c[RESTOF][0][0], c[RESTOF][0][1])
-    raw_immediate = 0
-    i_registers = (
-        c[RAW][2]//16,
-        c[RAW][2]%16,
-        c[RAW][3]//16,
-        c[RAW][3]%16,
-    )
-    return c + (raw_xop, # RAW_XOP
-                xop, # XOP
-                raw_immediate, # RAW_IMMEDIATE
-                (), # IMMEDIATE
-                i_registers, # I_REGISTERS
+    def eval_instruction(vm, current_instruction, halt_print=COMPAT_TRUE):
+        vm.perf_count += 1
+        decode_and_eval = OPCODE_DISPATCH[current_instruction[RAW][0]]
+        if decode_and_eval==None:
+            return eval_nop_halt_or_illegal(
+                vm, current_instruction, halt_print=halt_print)
+        vm.ip = decode_and_eval(vm, current_instruction)
+        return vm
+
+    if not DEBUG:
+        return eval_instruction
+
+    def eval_instruction_debug(vm, current_instruction,
+                               halt_print=COMPAT_TRUE):
+        print_func("Executing: %s" %
+                   string_unpacked_instruction(current_instruction),
+                   file=stderr)
+        sleep(1)
+        return eval_instruction(vm, current_instruction,
+                                halt_print=halt_print)
+    return eval_instruction_debug
+
+def decode_4OP_fast(vm, c):
+    raw = c[RAW]
+    return c + (raw[1], # RAW_XOP
+                None, # XOP
+                0, # RAW_IMMEDIATE
+                None, # IMMEDIATE
+                (raw[2]//16, raw[2]%16, raw[3]//16, raw[3]%16), # I_REGISTERS
                 None, # HAL_CODE
     )
 
-def decode_3OP(vm, c):
-    raw_xop = c[RAW][1]*0x10 + c[RAW][2]//16
-    xop = (c[RESTOF][0][0], c[RESTOF][0][1], c[RESTOF][1][0])
-    assert len(xop) == 3
-    raw_immediate = 0
-    i_registers = (
-        c[RAW][2]%16,
-        c[RAW][3]//16,
-        c[RAW][3]%16,
-    )
-    return c + (raw_xop, # RAW_XOP
-                xop, # XOP
-                raw_immediate, # RAW_IMMEDIATE
-                (), # IMMEDIATE
-                i_registers, # I_REGISTERS
+def decode_3OP_fast(vm, c):
+    raw = c[RAW]
+    return c + (raw[1]*0x10 + raw[2]//16, # RAW_XOP
+                None, # XOP
+                0, # RAW_IMMEDIATE
+                None, # IMMEDIATE
+                (raw[2]%16, raw[3]//16, raw[3]%16), # I_REGISTERS
                 None, # HAL_CODE
     )
 
-def decode_2OP(vm, c):
-    raw_xop = c[RAW][1]*0x100 + c[RAW][2]
-    xop = tuple([x
-                 for r in c[RESTOF][0:2]
-                 for x in r ])
-    assert len(xop) == 4
-    raw_immediate = 0
-    i_registers = (
-        c[RAW][3]//16,
-        c[RAW][3]%16,
-    )
-    return c + (raw_xop, # RAW_XOP
-                xop, # XOP
-                raw_immediate, # RAW_IMMEDIATE
-                (), # IMMEDIATE
-                i_registers, # I_REGISTERS
+def decode_2OP_fast(vm, c):
+    raw = c[RAW]
+    return c + (raw[1]*0x100 + raw[2], # RAW_XOP
+                None, # XOP
+                0, # RAW_IMMEDIATE
+                None, # IMMEDIATE
+                (raw[3]//16, raw[3]%16), # I_REGISTERS
                 None, # HAL_CODE
     )
 
-def decode_1OP(vm, c):
-    raw_xop = c[RAW][1]*0x1000 + c[RAW][2]*0x10 + c[RAW][3]//16
-    xop = tuple([x
-                 for r in c[RESTOF][0:2]
-                 for x in r ]) + (c[RESTOF][2][0],)
-    assert len(xop) == 5
-    raw_immediate = 0
-    i_registers = (c[RAW][3]%16,)
-    return c + (raw_xop, # RAW_XOP
-                xop, # XOP
-                raw_immediate, # RAW_IMMEDIATE
-                (), # IMMEDIATE
-                i_registers, # I_REGISTERS
+def decode_1OP_fast(vm, c):
+    raw = c[RAW]
+    return c + (raw[1]*0x1000 + raw[2]*0x10 + raw[3]//16, # RAW_XOP
+                None, # XOP
+                0, # RAW_IMMEDIATE
+                None, # IMMEDIATE
+                (raw[3]%16,), # I_REGISTERS
                 None, # HAL_CODE
     )
 
-def decode_2OPI(vm, c):
+def decode_2OPI_fast(vm, c):
     next_ip = c[NEXTIP]
-    raw_immediate = vm[MEM][next_ip]
-    next_ip+=1
-    hold = vm[MEM][next_ip]
-    next_ip+=1
-    raw_immediate = raw_immediate*0x100 + hold
-    immediate = tuple([x
-                       for r in c[RESTOF][1:]
-                       for x in r] )
-    assert len(immediate) == 4
-    i_registers = (c[RAW][3]//16, c[RAW][3]%16)
-    return c[0:NEXTIP] + (next_ip,) + c[NEXTIP+1:] + (
+    mem = vm.mem
+    raw = c[RAW]
+    return c[0:NEXTIP] + (next_ip+2,) + c[NEXTIP+1:] + (
         None, # RAW_XOP
         None, # XOP
-        raw_immediate, # RAW_IMMEDIATE
-        immediate, # IMMEDIATE
-        i_registers, # I_REGISTERS
+        mem[next_ip]*0x100 + mem[next_ip+1], # RAW_IMMEDIATE
+        None, # IMMEDIATE
+        (raw[3]//16, raw[3]%16), # I_REGISTERS
         None, # HAL_CODE
     )
 
-def decode_1OPI(vm, c):
+def decode_1OPI_fast(vm, c):
     next_ip = c[NEXTIP]
-    outside_of_world(vm[MEM], next_ip+2-1, OUTSIDE_WORLD_ERROR)
-    raw_immediate = vm[MEM][next_ip]
-    next_ip+=1
-    hold = vm[MEM][next_ip]
-    next_ip+=1
-    raw_immediate = raw_immediate*0x100 + hold
-    immediate = tuple([x
-                       for r in c[RESTOF][1:]
-                       for x in r] )
-    assert len(immediate) == 4
-    hal_code = 0
-    raw_xop = c[RAW][3]//16
-    xop = (c[RESTOF][2][1],)
-    i_registers = (c[RAW][3]%16,)
-    return c[0:NEXTIP] + (next_ip,) + c[NEXTIP+1:] + (
-        raw_xop, # RAW_XOP
-        xop,
-        raw_immediate, # RAW_IMMEDIATE
-        immediate, # IMMEDIATE
-        i_registers, # I_REGISTERS
-        hal_code, # HAL_CODE
+    mem = vm.mem
+    raw = c[RAW]
+    outside_of_world(mem, next_ip+2-1, OUTSIDE_WORLD_ERROR)
+    return c[0:NEXTIP] + (next_ip+2,) + c[NEXTIP+1:] + (
+        raw[3]//16, # RAW_XOP
+        None, # XOP
+        mem[next_ip]*0x100 + mem[next_ip+1], # RAW_IMMEDIATE
+        None, # IMMEDIATE
+        (raw[3]%16,), # I_REGISTERS
+        0, # HAL_CODE
     )
 
-def decode_0OPI(vm, c):
-    raw_immediate = c[RAW][2]*0x100 + c[RAW][3]
-    immediate = tuple([x
-                       for r in c[RESTOF][1:]
-                       for x in r] )
-    assert len(immediate)==4
-    hal_code = 0
-    raw_xop = c[RAW][1]
-    xop = c[RESTOF][0]
-    assert len(xop)==2
+def decode_0OPI_fast(vm, c):
+    raw = c[RAW]
     return c + (
-        raw_xop, # RAW_XOP
-        xop, # XOP
-        raw_immediate, # RAW_IMMEDIATE
-        immediate, # IMMEDIATE
+        raw[1], # RAW_XOP
+        None, # XOP
+        raw[2]*0x100 + raw[3], # RAW_IMMEDIATE
+        None, # IMMEDIATE
         (), # I_REGISTERS
-        hal_code, # HAL_CODE
+        0, # HAL_CODE
     )
 
 def decode_HALCODE(vm, c):
@@ -359,6 +461,21 @@ def decode_HALCODE(vm, c):
         c[RAW][1]*0x10000 + c[RAW][2]*0x100 + c[RAW][3] # HAL_CODE
         )
 
+decode_HALCODE_fast = decode_HALCODE
+
+def make_decode_with_strings(decode_fast_func):
+    def decode_with_strings(vm, c):
+        return with_instruction_strings(decode_fast_func(vm, c))
+    return decode_with_strings
+
+decode_4OP = make_decode_with_strings(decode_4OP_fast)
+decode_3OP = make_decode_with_strings(decode_3OP_fast)
+decode_2OP = make_decode_with_strings(decode_2OP_fast)
+decode_1OP = make_decode_with_strings(decode_1OP_fast)
+decode_2OPI = make_decode_with_strings(decode_2OPI_fast)
+decode_1OPI = make_decode_with_strings(decode_1OPI_fast)
+decode_0OPI = make_decode_with_strings(decode_0OPI_fast)
+
 EVAL_4OP_INT_TABLE_STRING = {
     0x00: "ADD_CI",
     0x01: "ADD_CO",
@@ -588,12 +705,11 @@ def eval_N_OP_int(vm, c, n, lookup_val, lookup_table,
     else:
         name = "ILLEGAL_%dOP" % n
     if lookup_val in lookup_table:
-        instruction_func, instruction_str = lookup_table[lookup_val]
+        instruction_func, instruction_str_debug, instruction_str = \
+            lookup_table[lookup_val]
         if DEBUG:
-            name = instruction_str
-        #elif TRACE: # TODO
-        #    record_trace(instruction_str) # TODO
-        next_ip = instruction_func(vm, c)
+            name = instruction_str_debug
+        next_ip = call_instruction(instruction_func, instruction_str, vm, c)
 
     # not sure why zome XOP are matched explicitly for illegal whereas
     # others fall into default when the handling is the same
@@ -629,11 +745,197 @@ def get_instruction_module_for_registersize_bits(registersizebits):
         import knightinstructions16
         return knightinstructions16
     else:
+        import knightinstructions
         return knightinstructions
 
-def make_eval_tables_for_register_size(registersizebits):
-    knightmodule = get_instruction_module_for_registersize_bits(
-        registersizebits)
+# Dispatch lists
+#
+# The EVAL_*_INT_TABLE_STRING tables are turned into lists indexed by the
+# xop bits, so an instruction function is found with a list index instead
+# of a dictionary lookup and a call to eval_N_OP_int. Xops wider than
+# 12 bits (2OP, 1OP) are split, the high bits index a list of lists and
+# the high bits without any instructions share one list of illegal_xop.
+#
+# The class dispatchers unpack the operands each instruction function is
+# called with, see "Instruction functions" in knightinstructions.py, for
+# the immediate classes a parallel list says whether the immediate is
+# signed
+
+def make_illegal_xop(instruction_size):
+    # illegal_xop only gets the operands, the instruction is read again
+    # from the address before next_ip
+    def illegal_xop(vm, mem, register_file, *operands):
+        illegal_instruction(
+            vm, read_instruction_fast(vm, operands[-1]-instruction_size) )
+    return illegal_xop
+
+illegal_xop = make_illegal_xop(MIN_INSTRUCTION_LEN)
+illegal_xop_immediate = make_illegal_xop(MIN_INSTRUCTION_LEN+2)
+
+def make_dispatch_list(table_string, lookup_instruction, size,
+                       illegal=illegal_xop):
+    dispatch_list = [illegal]*size
+    for table_key, instruction_str in table_string.items():
+        dispatch_list[table_key] = lookup_instruction(instruction_str)
+    return dispatch_list
+
+def make_signed_immediate_list(table_string, size):
+    signed_list = [COMPAT_TRUE]*size
+    for table_key, instruction_str in table_string.items():
+        if instruction_str in UNSIGNED_IMMEDIATE_INSTRUCTIONS:
+            signed_list[table_key] = COMPAT_FALSE
+    return signed_list
+
+def make_two_level_dispatch_list(table_string, lookup_instruction,
+                                 low_bits, size):
+    low_mask = (1<<low_bits)-1
+    illegal_list = [illegal_xop]*(1<<low_bits)
+    dispatch_list = [illegal_list]*size
+    for table_key, instruction_str in table_string.items():
+        high = table_key >> low_bits
+        if dispatch_list[high] is illegal_list:
+            dispatch_list[high] = list(illegal_list)
+        dispatch_list[high][table_key & low_mask] = \
+            lookup_instruction(instruction_str)
+    return dispatch_list
+
+def make_dispatch_list_eval_tables(lookup_instruction):
+    EVAL_4OP_INT_LIST = make_dispatch_list(
+        EVAL_4OP_INT_TABLE_STRING, lookup_instruction, 0x100)
+    EVAL_3OP_INT_LIST = make_dispatch_list(
+        EVAL_3OP_INT_TABLE_STRING, lookup_instruction, 0x1000)
+    EVAL_2OP_INT_LIST = make_two_level_dispatch_list(
+        EVAL_2OP_INT_TABLE_STRING, lookup_instruction, 8, 0x100)
+    EVAL_1OP_INT_LIST = make_two_level_dispatch_list(
+        EVAL_1OP_INT_TABLE_STRING, lookup_instruction, 12, 0x100)
+    EVAL_2OPI_INT_LIST = make_dispatch_list(
+        EVAL_2OPI_INT_TABLE_STRING, lookup_instruction, 0x100,
+        illegal_xop_immediate)
+    EVAL_2OPI_SIGNED_LIST = make_signed_immediate_list(
+        EVAL_2OPI_INT_TABLE_STRING, 0x100)
+    EVAL_1OPI_INT_LIST = make_dispatch_list(
+        EVAL_1OPI_INT_TABLE_STRING, lookup_instruction, 0x1000,
+        illegal_xop_immediate)
+    EVAL_1OPI_SIGNED_LIST = make_signed_immediate_list(
+        EVAL_1OPI_INT_TABLE_STRING, 0x1000)
+    EVAL_0OPI_INT_LIST = make_dispatch_list(
+        {0x00: "JUMP"}, lookup_instruction, 0x100, illegal_xop_immediate)
+
+    def eval_4OP_Int(vm, c):
+        i_registers = c[I_REGISTERS]
+        return EVAL_4OP_INT_LIST[c[RAW_XOP]](
+            vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+            i_registers[2], i_registers[3], c[NEXTIP])
+
+    def eval_3OP_Int(vm, c):
+        i_registers = c[I_REGISTERS]
+        return EVAL_3OP_INT_LIST[c[RAW_XOP]](
+            vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+            i_registers[2], c[NEXTIP])
+
+    def eval_2OP_Int(vm, c):
+        raw_xop = c[RAW_XOP]
+        i_registers = c[I_REGISTERS]
+        return EVAL_2OP_INT_LIST[raw_xop>>8][raw_xop & 0xFF](
+            vm, vm.mem, vm.reg, i_registers[0], i_registers[1], c[NEXTIP])
+
+    def eval_1OP_Int(vm, c):
+        raw_xop = c[RAW_XOP]
+        return EVAL_1OP_INT_LIST[raw_xop>>12][raw_xop & 0xFFF](
+            vm, vm.mem, vm.reg, c[I_REGISTERS][0], c[NEXTIP])
+
+    def eval_2OPI_Int(vm, c):
+        key = c[RAW][2]
+        immediate = c[RAW_IMMEDIATE]
+        if immediate & 0x8000 and EVAL_2OPI_SIGNED_LIST[key]:
+            immediate -= 0x10000
+        i_registers = c[I_REGISTERS]
+        return EVAL_2OPI_INT_LIST[key](
+            vm, vm.mem, vm.reg, i_registers[0], i_registers[1], immediate,
+            c[NEXTIP])
+
+    def eval_Integer_1OPI(vm, c):
+        key = c[RAW][2]*16 + c[RAW_XOP]
+        immediate = c[RAW_IMMEDIATE]
+        if immediate & 0x8000 and EVAL_1OPI_SIGNED_LIST[key]:
+            immediate -= 0x10000
+        return EVAL_1OPI_INT_LIST[key](
+            vm, vm.mem, vm.reg, c[I_REGISTERS][0], immediate, c[NEXTIP])
+
+    def eval_Integer_0OPI(vm, c):
+        immediate = c[RAW_IMMEDIATE]
+        if immediate & 0x8000:
+            immediate -= 0x10000
+        return EVAL_0OPI_INT_LIST[c[RAW_XOP]](
+            vm, vm.mem, vm.reg, immediate, c[NEXTIP])
+
+    return {
+        0x01: eval_4OP_Int,
+        0x05: eval_3OP_Int,
+        0x09: eval_2OP_Int,
+        0x0D: eval_1OP_Int,
+        0xE1: eval_2OPI_Int,
+        0xE0: eval_Integer_1OPI,
+        0x3C: eval_Integer_0OPI,
+        HAL_CODE_OP: eval_HALCODE,
+    }
+
+# for calling a single instruction function with a decoded instruction
+# without going through the class dispatchers, raw0 is the opcode of the
+# instructions instruction_str is called for
+def make_decoded_instruction_caller(instruction_func, instruction_str, raw0):
+    import_instruction_helpers()
+    signed = instruction_str not in UNSIGNED_IMMEDIATE_INSTRUCTIONS
+    if raw0==0x01: # 4 OP
+        def call_decoded_instruction(vm, c):
+            i_registers = c[I_REGISTERS]
+            return instruction_func(
+                vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+                i_registers[2], i_registers[3], c[NEXTIP])
+    elif raw0==0x05: # 3 OP
+        def call_decoded_instruction(vm, c):
+            i_registers = c[I_REGISTERS]
+            return instruction_func(
+                vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+                i_registers[2], c[NEXTIP])
+    elif raw0==0x09: # 2 OP
+        def call_decoded_instruction(vm, c):
+            i_registers = c[I_REGISTERS]
+            return instruction_func(
+                vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+                c[NEXTIP])
+    elif raw0==0x0D: # 1 OP
+        def call_decoded_instruction(vm, c):
+            return instruction_func(
+                vm, vm.mem, vm.reg, c[I_REGISTERS][0], c[NEXTIP])
+    elif raw0==0xE1: # 2 OP immediate
+        def call_decoded_instruction(vm, c):
+            immediate = c[RAW_IMMEDIATE]
+            if immediate & 0x8000 and signed:
+                immediate -= 0x10000
+            i_registers = c[I_REGISTERS]
+            return instruction_func(
+                vm, vm.mem, vm.reg, i_registers[0], i_registers[1],
+                immediate, c[NEXTIP])
+    elif raw0==0xE0: # 1 OP immediate
+        def call_decoded_instruction(vm, c):
+            immediate = c[RAW_IMMEDIATE]
+            if immediate & 0x8000 and signed:
+                immediate -= 0x10000
+            return instruction_func(
+                vm, vm.mem, vm.reg, c[I_REGISTERS][0], immediate, c[NEXTIP])
+    else: # 0 OP immediate
+        assert raw0==0x3C
+        def call_decoded_instruction(vm, c):
+            immediate = c[RAW_IMMEDIATE]
+            if immediate & 0x8000:
+                immediate -= 0x10000
+            return instruction_func(vm, vm.mem, vm.reg, immediate, c[NEXTIP])
+    return call_decoded_instruction
+
+# the dictionary tables and eval_N_OP_int, which print each instruction
+# when DEBUG is on
+def make_lookup_eval_tables(lookup_instruction):
     def lookup_instruction_and_debug_str(x, replace_underscore=COMPAT_TRUE):
         table_key, instruction_str = x
         if replace_underscore:
@@ -642,8 +944,9 @@ def make_eval_tables_for_register_size(registersizebits):
             instruction_str_debug = instruction_str
 
         return (table_key,
-                (getattr(knightmodule, instruction_str),
-                 instruction_str_debug
+                (lookup_instruction(instruction_str),
+                 instruction_str_debug,
+                 instruction_str,
                 ) # inner tuple
         ) # outer tuple
 
@@ -704,15 +1007,15 @@ def make_eval_tables_for_register_size(registersizebits):
                              c[RAW][2]*16 + c[RAW_XOP], EVAL_1OPI_INT_TABLE,
                              immediate=COMPAT_TRUE)
 
+    JUMP = lookup_instruction("JUMP")
+
     def eval_Integer_0OPI(vm, c):
         next_ip = None
         name = "ILLEGAL_0OPI"
         if c[RAW_XOP] == 0x00: # JUMP
             if DEBUG:
                 name = "JUMP"
-            #elif TRACE: # TODO
-            #    record_trace("JUMP") # TODO
-            next_ip = knightmodule.JUMP(vm, c)
+            next_ip = call_instruction(JUMP, "JUMP", vm, c)
         else:
             illegal_instruction(vm, c)
 
@@ -731,7 +1034,30 @@ def make_eval_tables_for_register_size(registersizebits):
         HAL_CODE_OP: eval_HALCODE,
     }
     return EVAL_TABLE
-    
+
+# instruction_wrapper, if provided, is called with each instruction name and
+# function and can return a replacement function to put in the tables
+#
+# dispatch_lists=COMPAT_FALSE, or DEBUG, gives the dictionary based tables
+# built by make_lookup_eval_tables
+def make_eval_tables_for_register_size(registersizebits,
+                                       instruction_wrapper=None,
+                                       dispatch_lists=COMPAT_TRUE):
+    import_instruction_helpers()
+    knightmodule = get_instruction_module_for_registersize_bits(
+        registersizebits)
+    def lookup_instruction(instruction_str):
+        instruction_func = getattr(knightmodule, instruction_str)
+        if instruction_wrapper!=None:
+            instruction_func = instruction_wrapper(
+                instruction_str, instruction_func)
+        return instruction_func
+
+    if dispatch_lists and not DEBUG:
+        return make_dispatch_list_eval_tables(lookup_instruction)
+    else:
+        return make_lookup_eval_tables(lookup_instruction)
+
 HAL_CODES_TABLE_STRING = {
     0x100000: "FOPEN_READ",
     0x100001: "FOPEN_WRITE",
@@ -745,6 +1071,7 @@ HAL_CODES_TABLE_STRING = {
     }
 
 def hal_code_table_entry(x):
+    import knightinstructions # deferred, see get_hal_codes_table
     table_key, instruction_str = x
 
     return (table_key,
@@ -753,9 +1080,17 @@ def hal_code_table_entry(x):
             ) # inner tuple
     ) # outer tuple
 
-HAL_CODES_TABLE = dict( map( hal_code_table_entry,
-                             HAL_CODES_TABLE_STRING.items() ) # map
-) # dict
+# built by get_hal_codes_table the first time a HAL code is run, not at
+# import, so short lived commands that never get that far don't pay for it
+HAL_CODES_TABLE = None
+
+def get_hal_codes_table():
+    global HAL_CODES_TABLE
+    if HAL_CODES_TABLE==None:
+        HAL_CODES_TABLE = dict( map( hal_code_table_entry,
+                                     HAL_CODES_TABLE_STRING.items() ) # map
+        ) # dict
+    return HAL_CODES_TABLE
 
 def eval_HALCODE(vm, c):
     next_ip = None
@@ -763,12 +1098,11 @@ def eval_HALCODE(vm, c):
 
     # POSIX MODE instructions not implemented
 
-    if c[HAL_CODE] in HAL_CODES_TABLE:
-        instruction_func, instruction_str = HAL_CODES_TABLE[c[HAL_CODE]]
+    hal_codes_table = get_hal_codes_table()
+    if c[HAL_CODE] in hal_codes_table:
+        instruction_func, instruction_str = hal_codes_table[c[HAL_CODE]]
         if DEBUG:
             name = instruction_str
-        #elif TRACE: # TODO
-        #    record_trace(instruction_str) # TODO
         instruction_func(vm)
         next_ip = c[NEXTIP]
     else:
@@ -791,10 +1125,55 @@ DECODE_TABLE = {
     0x42: decode_HALCODE,
 }
 
-assert \
-    (tuple(sorted(DECODE_TABLE.keys())) ==
-     tuple(sorted(make_eval_tables_for_register_size(0).keys()))
-     ) # end expression
+FAST_DECODE_TABLE = {
+    0x01: decode_4OP_fast,
+    0x05: decode_3OP_fast,
+    0x09: decode_2OP_fast,
+    0x0D: decode_1OP_fast,
+    0xE1: decode_2OPI_fast,
+    0xE0: decode_1OPI_fast,
+    0x3C: decode_0OPI_fast,
+    0x42: decode_HALCODE_fast,
+}
+
+# The name of a decoded instruction as found in the EVAL_*_TABLE_STRING
+# and HAL_CODES_TABLE_STRING tables, "NOP", "HALT", or None if illegal
+def read_and_decode_instruction(vm, address):
+    # returns None instead of raising if the instruction can't be read,
+    # leaving that for the interpreter to report if it's ever reached
+    try:
+        c = read_instruction_fast(vm, address)
+        raw0 = c[RAW][0]
+        if raw0 in FAST_DECODE_TABLE:
+            c = FAST_DECODE_TABLE[raw0](vm, c)
+    except (OutsideOfWorldException, IndexError):
+        return None
+    return c
+
+def lookup_instruction_str(c):
+    raw0 = c[RAW][0]
+    if raw0 == 0x01:
+        return EVAL_4OP_INT_TABLE_STRING.get(c[RAW_XOP])
+    elif raw0 == 0x05:
+        return EVAL_3OP_INT_TABLE_STRING.get(c[RAW_XOP])
+    elif raw0 == 0x09:
+        return EVAL_2OP_INT_TABLE_STRING.get(c[RAW_XOP])
+    elif raw0 == 0x0D:
+        return EVAL_1OP_INT_TABLE_STRING.get(c[RAW_XOP])
+    elif raw0 == 0xE1:
+        return EVAL_2OPI_INT_TABLE_STRING.get(c[RAW][2])
+    elif raw0 == 0xE0:
+        return EVAL_1OPI_INT_TABLE_STRING.get(c[RAW][2]*16 + c[RAW_XOP])
+    elif raw0 == 0x3C:
+        if c[RAW_XOP] == 0x00:
+            return "JUMP"
+    elif raw0 == HAL_CODE_OP:
+        return HAL_CODES_TABLE_STRING.get(c[HAL_CODE])
+    elif raw0 == HALT_OP:
+        return "HALT"
+    elif raw0 == 0 and [0,0,0,0]==c[RAW].tolist():
+        return "NOP"
+    return None
 
 EVAL_INSTRUCTION_FOR_REGISTER_SIZES = {}
 
@@ -809,56 +1188,165 @@ def eval_instruction(vm, current_instruction,
                      optimize=COMPAT_TRUE, halt_print=COMPAT_TRUE):
     if optimize:
         return get_eval_instruction_for_register_size(
-            vm[REG].itemsize)(vm, current_instruction, halt_print=halt_print)
+            vm.reg.itemsize)(vm, current_instruction, halt_print=halt_print)
     else:
         return get_eval_instruction_for_register_size(0)(
             vm, current_instruction, halt_print=halt_print)
 
+def outside_of_world_exit(vm):
+    # to be called from an except OutsideOfWorldException: block
+    e = exc_info()[1] # to remain backwards and forwards compatible
+    flush_tapes(vm)
+    print_func(
+        "Invalid state reached after: %d instructions" % vm.perf_count,
+        file=stderr)
+    print_func(
+        "%d: %s" % (e.args[1], e.args[0]),
+        file=stderr )
+    exit(EXIT_FAILURE)
+
+def instruction_not_implemented(vm, c):
+    # leave the vm where it was before the unimplemented
+    # instruction, like it was when vm tuples were immutable
+    vm.ip = c[CURIP]
+    raise InstructionNotImplemented(c)
+
 def make_read_and_eval_for_registersize(registersizebits):
     global EVAL_INSTRUCTION_FOR_REGISTER_SIZES
     eval_instruction_specific_bit = get_eval_instruction_for_register_size(
         registersizebits//8)
     def read_and_eval(vm, halt_print=COMPAT_TRUE):
         try:
-            c = read_instruction(vm)
+            c = read_instruction_fast(vm)
             vm = eval_instruction_specific_bit(vm, c, halt_print=halt_print)
-            if vm==None or vm[IP]==None:
+            if vm==None:
                 raise InstructionNotImplemented(c)
+            elif vm.ip==None:
+                instruction_not_implemented(vm, c)
             return vm
         except OutsideOfWorldException:
-            e = exc_info()[1] # to remain backwards and forwards compatible
-            print_func(
-                "Invalid state reached after: %d instructions" % vm[PERF_COUNT],
-                file=stderr)
-            print_func(
-                "%d: %s" % (e.args[1], e.args[0]),
-                file=stderr )
-            # if TRACE: TODO
-            #    pass # TODO
-            exit(EXIT_FAILURE)
+            outside_of_world_exit(vm)
     return read_and_eval
 
+# Batched execution
+#
+# The run functions made by make_run_for_registersize and the other engines
+# execute instructions until the vm is halted (if until_halt), max_steps
+# instructions have run or vm.ip is until_ip, stopping before the
+# instruction at until_ip runs. They return a tuple with the reason they
+# stopped (STOP_HALTED, STOP_MAX_STEPS, STOP_UNTIL_IP) and the number of
+# instructions run. Exceptions are caught once per batch instead of once
+# per instruction.
+
+def check_run_stop_conditions(max_steps, until_ip, until_halt):
+    if max_steps==None and until_ip==None and not until_halt:
+        raise Exception("run needs at least one of max_steps, until_ip "
+                        "and until_halt to know when to stop")
+
+def get_run_stop_perf_count(vm, max_steps):
+    if max_steps==None:
+        return None
+    return vm.perf_count + max_steps
+
+def run_stop_reason(vm, until_ip, until_halt):
+    if until_halt and vm.halted:
+        return STOP_HALTED
+    elif until_ip!=None and vm.ip==until_ip:
+        return STOP_UNTIL_IP
+    else:
+        return STOP_MAX_STEPS
+
+def make_run_for_registersize(registersizebits):
+    eval_instruction_specific_bit = get_eval_instruction_for_register_size(
+        registersizebits//8)
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        try:
+            while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                   not (until_halt and vm.halted) ):
+                c = read_instruction_fast(vm)
+                if eval_instruction_specific_bit(
+                        vm, c, halt_print=halt_print)==None:
+                    raise InstructionNotImplemented(c)
+                elif vm.ip==None:
+                    instruction_not_implemented(vm, c)
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
+
+def import_engine_module(engine):
+    # defer the imports to here to only import the engines that are used
+    if engine==ENGINE_DECODE_CACHE:
+        import knightdecodecache
+        return knightdecodecache
+    elif engine==ENGINE_BLOCKS:
+        import knightblocks
+        return knightblocks
+    elif engine==ENGINE_FUSION:
+        import knightfusion
+        return knightfusion
+    elif engine==ENGINE_PROFILE:
+        import knightprofile
+        return knightprofile
+    elif engine==ENGINE_TRACE:
+        import knighttrace
+        return knighttrace
+    elif engine==ENGINE_TRUSTED:
+        import knighttrusted
+        return knighttrusted
+    else:
+        raise Exception("no execution engine named %s" % engine)
+
+def get_make_read_and_eval_for_engine(engine):
+    if engine==ENGINE_INTERPRETER:
+        return make_read_and_eval_for_registersize
+    else:
+        return import_engine_module(engine).make_read_and_eval_for_registersize
+
+def get_make_run_for_engine(engine):
+    if engine==ENGINE_INTERPRETER:
+        return make_run_for_registersize
+    else:
+        return import_engine_module(engine).make_run_for_registersize
+
 READ_AND_EVAL_TABLE = {}
 
-def get_read_and_eval_for_register_size(regsize_bytes):
+def get_read_and_eval_for_register_size(regsize_bytes,
+                                        engine=ENGINE_INTERPRETER):
     global READ_AND_EVAL_TABLE
-    if regsize_bytes not in READ_AND_EVAL_TABLE:
-        READ_AND_EVAL_TABLE[regsize_bytes] = \
-            make_read_and_eval_for_registersize(regsize_bytes*8)
-    return READ_AND_EVAL_TABLE[regsize_bytes]
-
-def read_and_eval(vm, optimize=COMPAT_TRUE, halt_print=COMPAT_TRUE):
+    key = (engine, regsize_bytes)
+    if key not in READ_AND_EVAL_TABLE:
+        READ_AND_EVAL_TABLE[key] = \
+            get_make_read_and_eval_for_engine(engine)(regsize_bytes*8)
+    return READ_AND_EVAL_TABLE[key]
+
+RUN_TABLE = {}
+
+def get_run_for_register_size(regsize_bytes, engine=ENGINE_INTERPRETER):
+    global RUN_TABLE
+    key = (engine, regsize_bytes)
+    if key not in RUN_TABLE:
+        RUN_TABLE[key] = get_make_run_for_engine(engine)(regsize_bytes*8)
+    return RUN_TABLE[key]
+
+def read_and_eval(vm, optimize=COMPAT_TRUE, halt_print=COMPAT_TRUE,
+                  engine=ENGINE_INTERPRETER):
     if optimize:
-        return get_read_and_eval_for_register_size(vm[REG].itemsize)(
-            vm, halt_print=halt_print)
+        return get_read_and_eval_for_register_size(
+            vm.reg.itemsize, engine=engine)(vm, halt_print=halt_print)
     else:
         # this forces the generic version
-        return get_read_and_eval_for_register_size(0)(
+        return get_read_and_eval_for_register_size(0, engine=engine)(
             vm, halt_print=halt_print)
 
 if __name__ == "__main__":
     vm = create_vm(2**16) # (64*1024)
-    print_func( "vm created %d bytes" %  len(vm[MEM]) )
+    print_func( "vm created %d bytes" %  len(vm.mem) )
     instruction = read_instruction(vm)
     print_func( "instruction opcode unpacked (0x0%s, 0x0%s)" % 
                 instruction[OP] )
@@ -0,0 +1,261 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_DECODE_CACHE, an execution engine that remembers decoded
+# instructions by address so loop bodies are only read and decoded once.
+#
+# Cached instructions are forgotten when an instruction in
+# knightinstructions.MEMORY_WRITE_TABLE writes over them. Anything else that
+# modifies vm.mem after instructions have run should call
+# vm.decode_cache.invalidate(address, byte_count) or
+# knightdecode.forget_decoded_instructions(vm)
+# and the other engines don't do that, so running a vm with this engine
+# and then another one and then back to this one isn't a good idea.
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from constants import RAW, CURIP, NEXTIP
+from knightdecode import \
+    read_instruction_fast, read_and_decode_instruction, \
+    lookup_instruction_str, make_eval_tables_for_register_size, \
+    get_instruction_module_for_registersize_bits, get_hal_codes_table, \
+    get_eval_instruction_for_register_size, \
+    make_decoded_instruction_caller, \
+    outside_of_world_exit, instruction_not_implemented, \
+    check_run_stop_conditions, get_run_stop_perf_count, run_stop_reason, \
+    InstructionNotImplemented, FAST_DECODE_TABLE, MIN_INSTRUCTION_LEN
+from knightdecodeutil import OutsideOfWorldException
+from knightinstructions import MEMORY_WRITE_TABLE
+
+# 4 byte instruction plus a 16 bit immediate for 2OPI and 1OPI
+MAX_INSTRUCTION_LEN = MIN_INSTRUCTION_LEN + 2
+
+# an entry for a fused pair of instructions, see knightfusion.py
+MAX_FUSED_LEN = MAX_INSTRUCTION_LEN*2
+
+class DecodeCache(object):
+    __slots__ = ('entries', 'hits', 'misses', 'low', 'high', 'entry_len')
+
+    def __init__(self):
+        # the most bytes of memory an entry was decoded from
+        self.entry_len = MAX_INSTRUCTION_LEN
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        # address -> (eval function, decoded instruction, unfused entry)
+        # where unfused entry is None unless the first two are a fused
+        # pair of instructions
+        self.entries = {}
+        # lowest and highest address of a cached instruction, so writes
+        # nowhere near code (stack, heap) are dismissed quickly, this starts
+        # out so that no write is ever in range
+        self.low = 0
+        self.high = -MAX_INSTRUCTION_LEN
+
+    def add(self, address, entry):
+        self.entries[address] = entry
+        if address < self.low or self.high < 0:
+            self.low = address
+        if address > self.high:
+            self.high = address
+
+    def invalidate(self, address, byte_count):
+        entry_len = self.entry_len
+        if (address+byte_count > self.low and
+            address < self.high+entry_len):
+            entries = self.entries
+            # an instruction that started up to entry_len-1 bytes
+            # before the write may have its immediate overwritten
+            for a in range(address-entry_len+1, address+byte_count):
+                if a in entries:
+                    del entries[a]
+
+def get_decode_cache(vm, entry_len=MAX_INSTRUCTION_LEN):
+    if vm.decode_cache==None:
+        vm.decode_cache = DecodeCache()
+    if vm.decode_cache.entry_len < entry_len:
+        vm.decode_cache.entry_len = entry_len
+    return vm.decode_cache
+
+def wrap_memory_writing_instruction(instruction_str, instruction_func):
+    if instruction_str not in MEMORY_WRITE_TABLE:
+        return instruction_func
+    get_write = MEMORY_WRITE_TABLE[instruction_str]
+    def invalidating_instruction(vm, mem, register_file, *operands):
+        address, byte_count = get_write(vm, mem, register_file, *operands)
+        next_ip = instruction_func(vm, mem, register_file, *operands)
+        vm.decode_cache.invalidate(address, byte_count)
+        return next_ip
+    return invalidating_instruction
+
+def make_fused_eval(first_func, second_func):
+    # runs the second instruction right after the first unless the first
+    # jumped or skipped over it, vm.ip and vm.perf_count are kept like the
+    # interpreter would have them if the second raises an exception
+    def fused_eval(vm, c):
+        c1, c2 = c
+        next_ip = first_func(vm, c1)
+        if next_ip==None:
+            instruction_not_implemented(vm, c1)
+        elif next_ip!=c2[CURIP]:
+            return next_ip
+        vm.ip = next_ip
+        vm.perf_count += 1
+        next_ip = second_func(vm, c2)
+        if next_ip==None:
+            instruction_not_implemented(vm, c2)
+        return next_ip
+    return fused_eval
+
+def make_hal_instruction(hal_func):
+    def hal_instruction(vm, c):
+        hal_func(vm)
+        return c[NEXTIP]
+    return hal_instruction
+
+def make_lookup_fusable_instruction(registersizebits):
+    # fused pairs call the instruction functions directly instead of
+    # going through the eval tables, with a (vm, c) -> next ip caller
+    # made for each of them and HAL functions
+    knightmodule = get_instruction_module_for_registersize_bits(
+        registersizebits)
+    hal_funcs = {}
+    for hal_func, instruction_str in get_hal_codes_table().values():
+        hal_funcs[instruction_str] = hal_func
+    instruction_funcs = {}
+    def lookup_fusable_instruction(instruction_str, c):
+        if instruction_str not in instruction_funcs:
+            if instruction_str in hal_funcs:
+                instruction_funcs[instruction_str] = make_hal_instruction(
+                    hal_funcs[instruction_str])
+            else:
+                instruction_funcs[instruction_str] = \
+                    make_decoded_instruction_caller(
+                        wrap_memory_writing_instruction(
+                            instruction_str,
+                            getattr(knightmodule, instruction_str) ),
+                        instruction_str, c[RAW][0] )
+        return instruction_funcs[instruction_str]
+    return lookup_fusable_instruction
+
+def make_fused_pairs_table(fused_pairs):
+    # first instruction string -> second instruction strings
+    fused_pairs_table = {}
+    for first_str, second_str in fused_pairs:
+        if first_str in MEMORY_WRITE_TABLE:
+            # the second instruction would already be decoded when the
+            # first writes over it
+            raise Exception("%s writes to memory and can't be fused "
+                            "with the instruction after it" % first_str)
+        if first_str not in fused_pairs_table:
+            fused_pairs_table[first_str] = {}
+        fused_pairs_table[first_str][second_str] = COMPAT_TRUE
+    return fused_pairs_table
+
+def make_run_for_registersize(registersizebits, fused_pairs=()):
+    EVAL_TABLE = make_eval_tables_for_register_size(
+        registersizebits,
+        instruction_wrapper=wrap_memory_writing_instruction)
+    fused_pairs_table = make_fused_pairs_table(fused_pairs)
+    lookup_fusable_instruction = make_lookup_fusable_instruction(
+        registersizebits)
+    # (first instruction string, second instruction string) ->
+    # fused eval function
+    fused_evals = {}
+    if len(fused_pairs)>0:
+        entry_len = MAX_FUSED_LEN
+    else:
+        entry_len = MAX_INSTRUCTION_LEN
+
+    def make_entry(vm, c):
+        if len(fused_pairs_table)==0:
+            return (EVAL_TABLE[c[RAW][0]], c, None)
+        # with fusion on, instructions that aren't fused skip the eval
+        # tables too
+        first_str = lookup_instruction_str(c)
+        if first_str==None:
+            entry = (EVAL_TABLE[c[RAW][0]], c, None)
+        else:
+            entry = (lookup_fusable_instruction(first_str, c), c, None)
+        if first_str not in fused_pairs_table:
+            return entry
+        c2 = read_and_decode_instruction(vm, c[NEXTIP])
+        if c2==None or c2[RAW][0] not in FAST_DECODE_TABLE:
+            return entry
+        second_str = lookup_instruction_str(c2)
+        if second_str not in fused_pairs_table[first_str]:
+            return entry
+        key = (first_str, second_str)
+        if key not in fused_evals:
+            fused_evals[key] = make_fused_eval(
+                lookup_fusable_instruction(first_str, c),
+                lookup_fusable_instruction(second_str, c2) )
+        return (fused_evals[key], (c, c2), entry)
+
+    # NOP, HALT and illegal instructions aren't cached and go through here
+    eval_instruction_specific_bit = get_eval_instruction_for_register_size(
+        registersizebits//8)
+
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        cache = get_decode_cache(vm, entry_len)
+        entries = cache.entries
+        try:
+            while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                   not (until_halt and vm.halted) ):
+                entry = entries.get(vm.ip)
+                if entry==None:
+                    cache.misses += 1
+                    c = read_instruction_fast(vm)
+                    raw0 = c[RAW][0]
+                    if raw0 not in FAST_DECODE_TABLE:
+                        if eval_instruction_specific_bit(
+                                vm, c, halt_print=halt_print)==None:
+                            raise InstructionNotImplemented(c)
+                        continue
+                    c = FAST_DECODE_TABLE[raw0](vm, c)
+                    entry = make_entry(vm, c)
+                    cache.add(c[CURIP], entry)
+                else:
+                    cache.hits += 1
+
+                eval_func, c, unfused_entry = entry
+                # a fused pair would run past max_steps or until_ip
+                if unfused_entry!=None and (
+                        vm.perf_count+1==stop_perf_count or
+                        c[1][CURIP]==until_ip):
+                    eval_func, c, unfused_entry = unfused_entry
+                vm.perf_count += 1
+                next_ip = eval_func(vm, c)
+                if next_ip==None:
+                    instruction_not_implemented(vm, c)
+                vm.ip = next_ip
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
+
+def make_read_and_eval_for_registersize(registersizebits):
+    run = make_run_for_registersize(registersizebits)
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        run(vm, max_steps=1, until_halt=COMPAT_FALSE, halt_print=halt_print)
+        return vm
+    return read_and_eval
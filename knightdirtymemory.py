@@ -0,0 +1,100 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Dirty page tracking, what vm.mem is with create_vm(dirty_tracking=...).
+# DirtyTrackingMemory is the usual array of bytes and
+# DirtyTrackingPagedMemory a knightpagedmemory.PagedMemory, both keep track
+# of which DIRTY_PAGE_SIZE byte pages have been written to since they were
+# last cleared.
+#
+# Every write to memory, STORE, PUSH, CALLI, writeout_bytes, the word
+# accessors like write_word32, the blocks engine and loading a rom goes
+# through __setitem__, that's where pages are marked dirty. Reads are left
+# alone, on DirtyTrackingMemory they're still done by array in C.
+#
+# Without dirty_tracking vm.mem is a plain array and none of this code runs,
+# so it costs nothing when it's off.
+
+from array import array
+
+from pythoncompat import COMPAT_TRUE
+from knightpagedmemory import PagedMemory
+
+DIRTY_PAGE_SHIFT = 8
+DIRTY_PAGE_SIZE = 1<<DIRTY_PAGE_SHIFT
+
+def mark_dirty(mem, index):
+    if isinstance(index, slice):
+        start, stop, step = index.indices(len(mem))
+        if start<stop:
+            for page_number in range(start>>DIRTY_PAGE_SHIFT,
+                                     ((stop-1)>>DIRTY_PAGE_SHIFT) + 1):
+                mem.dirty_pages[page_number] = COMPAT_TRUE
+    else:
+        if index<0:
+            index += len(mem)
+        mem.dirty_pages[index>>DIRTY_PAGE_SHIFT] = COMPAT_TRUE
+
+class DirtyTrackingMemory(array):
+    __slots__ = ('dirty_pages',)
+
+    def __new__(cls, *args):
+        mem = array.__new__(cls, *args)
+        # page number -> COMPAT_TRUE
+        mem.dirty_pages = {}
+        return mem
+
+    def __setitem__(self, index, value):
+        # written first so an IndexError leaves no page marked
+        array.__setitem__(self, index, value)
+        mark_dirty(self, index)
+
+class DirtyTrackingPagedMemory(PagedMemory):
+    __slots__ = ('dirty_pages',)
+
+    def __init__(self, size=0):
+        PagedMemory.__init__(self, size)
+        self.dirty_pages = {}
+
+    def __setitem__(self, index, value):
+        PagedMemory.__setitem__(self, index, value)
+        mark_dirty(self, index)
+
+def is_dirty_tracking(mem):
+    return isinstance(mem, (DirtyTrackingMemory, DirtyTrackingPagedMemory))
+
+def get_dirty_pages(vm):
+    # sorted page numbers, page n is the DIRTY_PAGE_SIZE bytes from
+    # n*DIRTY_PAGE_SIZE
+    pages = list(vm.mem.dirty_pages.keys())
+    pages.sort()
+    return pages
+
+def get_dirty_ranges(vm):
+    # (start, end) addresses of the runs of dirty pages, end isn't included
+    # and is never past the end of memory
+    ranges = []
+    for page_number in get_dirty_pages(vm):
+        start = page_number<<DIRTY_PAGE_SHIFT
+        end = min(start + DIRTY_PAGE_SIZE, len(vm.mem))
+        if len(ranges)>0 and ranges[-1][1]==start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append( (start, end) )
+    return ranges
+
+def clear_dirty_pages(vm):
+    vm.mem.dirty_pages.clear()
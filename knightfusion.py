@@ -0,0 +1,62 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_FUSION, ENGINE_DECODE_CACHE with superinstructions. When a pair of
+# instructions listed in FUSED_PAIRS is decoded the cache entry for the
+# first one runs both, saving a trip around the run loop and a cache lookup
+# for the second.
+#
+# The pairs are instruction strings as found in the knightdecode
+# EVAL_*_TABLE_STRING tables and HAL_CODES_TABLE_STRING. Add to FUSED_PAIRS
+# (it is a list) before the engine is first used, or call
+# make_run_for_registersize with your own. Instructions that write to
+# memory can't come first in a pair.
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from knightdecode import EVAL_1OPI_INT_TABLE_STRING
+import knightdecodecache
+
+CMPSKIPI_STRS = [
+    instruction_str
+    for instruction_str in EVAL_1OPI_INT_TABLE_STRING.values()
+    if instruction_str.startswith("CMPSKIP") ]
+CMPSKIPI_STRS.sort()
+
+# the pairs the stage0 monitor and stage1 assemblers spend most of their
+# time in
+FUSED_PAIRS = (
+    # reading a character and checking for end of file or a delimiter
+    [ ("FGETC", cmpskipi_str) for cmpskipi_str in CMPSKIPI_STRS ] +
+    # loading a function address and calling it
+    [ ("LOADUI", "CALLI") ] +
+    # skipping over or taking a jump out of a loop
+    [ (cmpskipi_str, "JUMP") for cmpskipi_str in CMPSKIPI_STRS ] +
+    # loop counters
+    [ ("ADDUI", "JUMP_NZ"), ("SUBUI", "JUMP_NZ") ]
+    )
+
+def make_run_for_registersize(registersizebits, fused_pairs=None):
+    if fused_pairs==None:
+        fused_pairs = FUSED_PAIRS
+    return knightdecodecache.make_run_for_registersize(
+        registersizebits, fused_pairs=fused_pairs)
+
+def make_read_and_eval_for_registersize(registersizebits, fused_pairs=None):
+    run = make_run_for_registersize(registersizebits, fused_pairs)
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        run(vm, max_steps=1, until_halt=COMPAT_FALSE, halt_print=halt_print)
+        return vm
+    return read_and_eval
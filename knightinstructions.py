@@ -18,12 +18,10 @@
 # along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
 
 from array import array
-from os.path import exists
 from sys import stderr, exit
 
 from constants import \
-    IP, REG, MEM, HALTED, EXCEPT, PERF_COUNT, \
-    TAPE1FILENAME, TAPE2FILENAME, TAPEFD, TAPEFD_I_STDIN, TAPEFD_I_STDOUT, \
+    TAPE1FILENAME, TAPE2FILENAME, TAPEFD_I_STDIN, TAPEFD_I_STDOUT, \
     OP, RAW, CURIP, NEXTIP, RESTOF, INVALID, \
     RAW_XOP, XOP, RAW_IMMEDIATE, IMMEDIATE, I_REGISTERS, HAL_CODE, \
     CONDITION_BIT_C, CONDITION_BIT_B, CONDITION_BIT_O, \
@@ -32,6 +30,7 @@ from constants import \
 
 from pythoncompat import write_byte, COMPAT_TRUE, COMPAT_FALSE
 from knightdecodeutil import outside_of_world
+from knighttape import TapeDevice, TAPE_INDEXES, get_tape_backend
 
 BITS_PER_BYTE = 8
 def prove_8_bits_per_array_byte():
@@ -54,7 +53,7 @@ def prove_8_bits_per_array_byte():
     except OverflowError:
         return COMPAT_TRUE
     return COMPAT_FALSE
-assert prove_8_bits_per_array_byte()
+# checked by knighttests/test_word_accessors.py rather than at every import
 
 MAX_16_SIGNED = (2**15)-1
 MAX_16_UNSIGNED = (2**16)-1
@@ -108,7 +107,7 @@ def sign_extend_if_negative_and_unsign_bits(value, num_bits):
     return value & mask
 
 def get_instruction_size(vm, address):
-    c = vm[MEM][address]
+    c = vm.mem[address]
     if c==0xE0 or c==0xE1:
         return 6
     else:
@@ -199,92 +198,238 @@ def readin_bytes(mem, pointer, signed, byte_count):
     else:
         return value_sum
 
-# 4 OP integer instructions
+# Word accessors
+#
+# readin_bytes and writeout_bytes for each word size, with the bytes of
+# the (big endian) word unrolled and one bounds check instead of two. If
+# the last byte of a word is inside of the world the first one is as well,
+# so only when it's outside does word_outside_of_world work out which of
+# the two messages readin_bytes or writeout_bytes would have given.
+#
+# The read_signed_word functions sign extend like readin_bytes with signed
+# set, returning a negative python int for the caller to mask to the
+# register size. The write_word functions keep just the bits of value
+# that fit in the word.
+
+READIN_BYTES_MESSAGE = "READIN bytes"
+WRITEOUT_BYTES_MESSAGE = "Writeout bytes"
+
+def word_outside_of_world(mem, pointer, byte_count, message_start):
+    outside_of_world(mem, pointer,
+                     message_start + " Address_1 is outside of World")
+    outside_of_world(mem, pointer+byte_count-1,
+                     message_start + " Address_2 is outside of World")
+
+def read_word8(mem, pointer):
+    if len(mem) <= pointer:
+        word_outside_of_world(mem, pointer, 1, READIN_BYTES_MESSAGE)
+    return mem[pointer]
+
+def read_word16(mem, pointer):
+    if len(mem) <= pointer+1:
+        word_outside_of_world(mem, pointer, 2, READIN_BYTES_MESSAGE)
+    return (mem[pointer]<<8) | mem[pointer+1]
+
+def read_word32(mem, pointer):
+    if len(mem) <= pointer+3:
+        word_outside_of_world(mem, pointer, 4, READIN_BYTES_MESSAGE)
+    return ( (mem[pointer  ]<<24) | (mem[pointer+1]<<16) |
+             (mem[pointer+2]<<8)  |  mem[pointer+3] )
+
+def read_word64(mem, pointer):
+    if len(mem) <= pointer+7:
+        word_outside_of_world(mem, pointer, 8, READIN_BYTES_MESSAGE)
+    return ( (mem[pointer  ]<<56) | (mem[pointer+1]<<48) |
+             (mem[pointer+2]<<40) | (mem[pointer+3]<<32) |
+             (mem[pointer+4]<<24) | (mem[pointer+5]<<16) |
+             (mem[pointer+6]<<8)  |  mem[pointer+7] )
+
+def read_signed_word8(mem, pointer):
+    if len(mem) <= pointer:
+        word_outside_of_world(mem, pointer, 1, READIN_BYTES_MESSAGE)
+    return (mem[pointer] ^ 0x80) - 0x80
+
+def read_signed_word16(mem, pointer):
+    if len(mem) <= pointer+1:
+        word_outside_of_world(mem, pointer, 2, READIN_BYTES_MESSAGE)
+    return ( ((mem[pointer]<<8) | mem[pointer+1]) ^ 0x8000 ) - 0x8000
+
+def read_signed_word32(mem, pointer):
+    if len(mem) <= pointer+3:
+        word_outside_of_world(mem, pointer, 4, READIN_BYTES_MESSAGE)
+    return ( ( (mem[pointer  ]<<24) | (mem[pointer+1]<<16) |
+               (mem[pointer+2]<<8)  |  mem[pointer+3] ) ^ 0x80000000
+             ) - 0x80000000
+
+def read_signed_word64(mem, pointer):
+    if len(mem) <= pointer+7:
+        word_outside_of_world(mem, pointer, 8, READIN_BYTES_MESSAGE)
+    return ( ( (mem[pointer  ]<<56) | (mem[pointer+1]<<48) |
+               (mem[pointer+2]<<40) | (mem[pointer+3]<<32) |
+               (mem[pointer+4]<<24) | (mem[pointer+5]<<16) |
+               (mem[pointer+6]<<8)  |  mem[pointer+7] ) ^ 0x8000000000000000
+             ) - 0x8000000000000000
+
+def write_word8(mem, pointer, value):
+    if len(mem) <= pointer:
+        word_outside_of_world(mem, pointer, 1, WRITEOUT_BYTES_MESSAGE)
+    mem[pointer] = value & 0xFF
+
+def write_word16(mem, pointer, value):
+    if len(mem) <= pointer+1:
+        word_outside_of_world(mem, pointer, 2, WRITEOUT_BYTES_MESSAGE)
+    mem[pointer  ] = (value>>8) & 0xFF
+    mem[pointer+1] = value & 0xFF
+
+def write_word32(mem, pointer, value):
+    if len(mem) <= pointer+3:
+        word_outside_of_world(mem, pointer, 4, WRITEOUT_BYTES_MESSAGE)
+    mem[pointer  ] = (value>>24) & 0xFF
+    mem[pointer+1] = (value>>16) & 0xFF
+    mem[pointer+2] = (value>>8) & 0xFF
+    mem[pointer+3] = value & 0xFF
+
+def write_word64(mem, pointer, value):
+    if len(mem) <= pointer+7:
+        word_outside_of_world(mem, pointer, 8, WRITEOUT_BYTES_MESSAGE)
+    mem[pointer  ] = (value>>56) & 0xFF
+    mem[pointer+1] = (value>>48) & 0xFF
+    mem[pointer+2] = (value>>40) & 0xFF
+    mem[pointer+3] = (value>>32) & 0xFF
+    mem[pointer+4] = (value>>24) & 0xFF
+    mem[pointer+5] = (value>>16) & 0xFF
+    mem[pointer+6] = (value>>8) & 0xFF
+    mem[pointer+7] = value & 0xFF
+
+# byte count -> accessor
+READ_WORD_FUNCTIONS = {
+    1: read_word8, 2: read_word16, 4: read_word32, 8: read_word64,
+}
+READ_SIGNED_WORD_FUNCTIONS = {
+    1: read_signed_word8, 2: read_signed_word16,
+    4: read_signed_word32, 8: read_signed_word64,
+}
+WRITE_WORD_FUNCTIONS = {
+    1: write_word8, 2: write_word16, 4: write_word32, 8: write_word64,
+}
+
+# Instruction functions
+#
+# Instead of the decoded instruction, instruction functions are called with
+# the vm, vm.mem, vm.reg and then the operands of the instruction, which
+# depend on its kind:
+#
+# 4 OP: reg0, reg1, reg2, reg3, next_ip
+# 3 OP: reg0, reg1, reg2, next_ip
+# 2 OP: reg0, reg1, next_ip
+# 1 OP: reg0, next_ip
+# 2 OP immediate: reg0, reg1, immediate, next_ip
+# 1 OP immediate: reg0, immediate, next_ip
+# 0 OP immediate: immediate, next_ip
+#
+# where the reg arguments are register indexes and immediate has been
+# interpreted as a signed 16 bit value, except for the instructions in
+# UNSIGNED_IMMEDIATE_INSTRUCTIONS. They return the address of the next
+# instruction, or None if they're not implemented yet.
+#
+# Unpacking the operands is left to the caller (the eval tables in
+# knightdecode.py, which do it with no further function calls) so that
+# no tuple has to be built and unpacked for every instruction.
+# call_instruction is for places where speed doesn't matter
+
+UNSIGNED_IMMEDIATE_INSTRUCTIONS = (
+    'CMPUI', 'LOADU8', # 2 OP immediate
+    'LOADUI', 'SARI', 'SL0I', 'SR0I', 'CMPSKIPI_E', 'CMPSKIPI_NE', # 1 OP imm.
+)
+
+# 2 OP immediate, 1 OP immediate, 0 OP immediate
+IMMEDIATE_OPCODES = (0xE1, 0xE0, 0x3C)
+
+def get_instruction_operands(c, instruction_str):
+    # the operands instruction_str is called with after vm, mem, registerfile
+    raw_immediate = c[RAW_IMMEDIATE]
+    if c[RAW][0] not in IMMEDIATE_OPCODES:
+        return c[I_REGISTERS] + (c[NEXTIP],)
+    elif instruction_str in UNSIGNED_IMMEDIATE_INSTRUCTIONS:
+        return c[I_REGISTERS] + (raw_immediate, c[NEXTIP])
+    else:
+        return c[I_REGISTERS] + (
+            interpret_sixteenbits_as_signed(raw_immediate), c[NEXTIP])
+
+def call_instruction(instruction_func, instruction_str, vm, c):
+    return instruction_func(
+        vm, vm.mem, vm.reg, *get_instruction_operands(c, instruction_str))
 
-def get_args_for_4OP(vm, c):
-    return (vm[MEM],
-            vm[REG],
-            c[I_REGISTERS][0], c[I_REGISTERS][1],
-            c[I_REGISTERS][2], c[I_REGISTERS][3],
-            c[NEXTIP])
+# 4 OP integer instructions
 
-def ADD_CI(vm, c):
+def ADD_CI(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def ADD_CO(vm, c):
+def ADD_CO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def ADD_CIO(vm, c):
+def ADD_CIO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def ADDU_CI(vm, c):
+def ADDU_CI(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def ADDU_CO(vm, c):
+def ADDU_CO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def ADDU_CIO(vm, c):
+def ADDU_CIO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUB_BI(vm, c):
+def SUB_BI(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUB_BO(vm, c):
+def SUB_BO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUB_BIO(vm, c):
+def SUB_BIO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUBU_BI(vm, c):
+def SUBU_BI(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUBU_BO(vm, c):
+def SUBU_BO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SUBU_BIO(vm, c):
+def SUBU_BIO(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def MULTIPLY(vm, c):
+def MULTIPLY(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def MULTIPLYU(vm, c):
+def MULTIPLYU(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def DIVIDE(vm, c):
+def DIVIDE(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def DIVIDEU(vm, c):
+def DIVIDEU(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def MUX(vm, c):
-    mem, registerfile, reg0, reg1, reg2, reg3, next_ip = \
-        get_args_for_4OP(vm, c)
+def MUX(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     registerfile[reg0] = (
         ( registerfile[reg2] & ~(registerfile[reg1]) ) |
 	( registerfile[reg3] & registerfile[reg1] )
     )
     return next_ip
 
-def NMUX(vm, c):
+def NMUX(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SORT(vm, c):
+def SORT(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
-def SORTU(vm, c):
+def SORTU(vm, mem, registerfile, reg0, reg1, reg2, reg3, next_ip):
     pass
 
 
 # 3 OP integer instructions
 
-def get_args_for_3OP(vm, c):
-    return (vm[MEM],
-            vm[REG],
-            c[I_REGISTERS][0], c[I_REGISTERS][1], c[I_REGISTERS][2],
-            c[NEXTIP])
-
-def ADDU(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def ADDU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     mask = (1<<(registerfile.itemsize*8)) -1
     assert(mask == (2**(registerfile.itemsize*8))-1 )
     registerfile[reg0] = (registerfile[reg1] + registerfile[reg2]) & mask
@@ -299,8 +444,7 @@ def ADDU(vm, c):
 # testing needed to validate
 ADD = ADDU
 
-def SUB(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def SUB(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     tmp1 = interpret_nbits_as_signed(registerfile[reg1], N_BITS)
@@ -308,25 +452,22 @@ def SUB(vm, c):
     registerfile[reg0] = (tmp1-tmp2) & mask
     return next_ip
 
-def SUBU(vm, c):
+def SUBU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMP(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def CMP(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     tmp1 = interpret_nbits_as_signed(registerfile[reg1], N_BITS)
     tmp2 = interpret_nbits_as_signed(registerfile[reg2], N_BITS)
     set_comparison_flags(tmp1, tmp2, registerfile, reg0)
     return next_ip
 
-def CMPU(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def CMPU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     set_comparison_flags(
         registerfile[reg1], registerfile[reg2], registerfile, reg0)
     return next_ip
 
-def MUL(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def MUL(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = 2**N_BITS-1
     tmp1 = interpret_nbits_as_signed(registerfile[reg1], N_BITS)
@@ -339,188 +480,171 @@ def MUL(vm, c):
     registerfile[reg0] = ( (tmp1*tmp2) % 0x100000000 ) & mask
     return next_ip
 
-def MULH(vm, c):
+def MULH(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MULU(vm, c):
+def MULU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MULUH(vm, c):
+def MULUH(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def DIV(vm, c):
+def DIV(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MOD(vm, c):
+def MOD(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def DIVU(vm, c):
+def DIVU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MODU(vm, c):
+def MODU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MAX(vm, c):
+def MAX(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MAXU(vm, c):
+def MAXU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MIN(vm, c):
+def MIN(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MINU(vm, c):
+def MINU(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def AND(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def AND(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     registerfile[reg0] = registerfile[reg1] & registerfile[reg2]
     return next_ip
 
-def OR(vm, c):
+def OR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def XOR(vm, c):
+def XOR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def NAND(vm, c):
+def NAND(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def NOR(vm, c):
+def NOR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def XNOR(vm, c):
+def XNOR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def MPQ(vm, c):
+def MPQ(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def LPQ(vm, c):
+def LPQ(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CPQ(vm, c):
+def CPQ(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def BPQ(vm, c):
+def BPQ(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def SAL(vm, c):
+def SAL(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def SAR(vm, c):
+def SAR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def SL0(vm, c):
-    mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def SL0(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     mask = (1<<(registerfile.itemsize*8)) -1
     registerfile[reg0] = (registerfile[reg1]<<registerfile[reg2]) & mask
     return next_ip
 
-def SR0(vm, c):
+def SR0(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def SL1(vm, c):
+def SL1(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def SR1(vm, c):
+def SR1(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def ROL(vm, c):
+def ROL(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def ROR(vm, c):
+def ROR(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def LOADX(vm, c):
-    mem, register_file, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
-    register_file[reg0] = \
-        readin_bytes(mem, register_file[reg1] + register_file[reg2],
-                     COMPAT_TRUE, register_file.itemsize)
+def LOADX(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+    # sign extending to the full register size leaves the bits as they are
+    register_file[reg0] = READ_WORD_FUNCTIONS[register_file.itemsize](
+        mem, register_file[reg1] + register_file[reg2])
     return next_ip
 
-def LOADXU8(vm, c):
-    mem, register_file, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def LOADXU8(vm, mem, register_file, reg0, reg1, reg2, next_ip):
     register_file[reg0] = \
-        readin_bytes(mem, register_file[reg1] + register_file[reg2],
-                     COMPAT_FALSE, 1)
+        read_word8(mem, register_file[reg1] + register_file[reg2])
     return next_ip
 
-def LOADX16(vm, c):
+def LOADX16(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def LOADXU16(vm, c):
-    mem, register_file, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+def LOADXU16(vm, mem, register_file, reg0, reg1, reg2, next_ip):
     register_file[reg0] = \
-        readin_bytes(mem, register_file[reg1] + register_file[reg2],
-                     COMPAT_FALSE, 2)
+        read_word16(mem, register_file[reg1] + register_file[reg2])
     return next_ip
 
-def LOADX32(vm, c):
+def LOADX32(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def LOADXU32(vm, c):
+def LOADXU32(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def STOREX(vm, c):
-    mem, register_file, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
-    writeout_bytes(mem,
-                   register_file[reg1]+register_file[reg2],
-                   register_file[reg0],
-                   register_file.itemsize)
+def STOREX(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+    WRITE_WORD_FUNCTIONS[register_file.itemsize](
+        mem, register_file[reg1]+register_file[reg2], register_file[reg0])
     return next_ip
 
-def STOREX8(vm, c):
+def STOREX8(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def STOREX16(vm, c):
-    mem, register_file, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
-    writeout_bytes(mem,
-                   register_file[reg1]+register_file[reg2],
-                   register_file[reg0],
-                   2)
+def STOREX16(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+    write_word16(mem, register_file[reg1]+register_file[reg2],
+                 register_file[reg0])
     return next_ip
 
-def STOREX32(vm, c):
+def STOREX32(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_G(vm, c):
+def CMPJUMP_G(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_GE(vm, c):
+def CMPJUMP_GE(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_E(vm, c):
+def CMPJUMP_E(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_NE(vm, c):
+def CMPJUMP_NE(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_LE(vm, c):
+def CMPJUMP_LE(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMP_L(vm, c):
+def CMPJUMP_L(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMPU_G(vm, c):
+def CMPJUMPU_G(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMPU_GE(vm, c):
+def CMPJUMPU_GE(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMPU_LE(vm, c):
+def CMPJUMPU_LE(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
-def CMPJUMPU_L(vm, c):
+def CMPJUMPU_L(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
     pass
 
 
 # 2 OP integer instructions
 
-def get_args_for_2OP(vm, c):
-    return vm[MEM], vm[REG], c[I_REGISTERS][0], c[I_REGISTERS][1], c[NEXTIP]
-
-def NEG(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def NEG(vm, mem, register_file, reg0, reg1, next_ip):
     N_BITS = register_file.itemsize*8
     mask = (1<<N_BITS) -1 # (2**N_BITS)-1
     register_file[reg0] = (
@@ -528,122 +652,114 @@ def NEG(vm, c):
         interpret_nbits_as_signed(register_file[reg1], N_BITS) ) & mask
     return next_ip
 
-def ABS(vm, c):
+def ABS(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def NABS(vm, c):
+def NABS(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def SWAP(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def SWAP(vm, mem, register_file, reg0, reg1, next_ip):
     utmp1 = register_file[reg1]
     register_file[reg1] = register_file[reg0]
     register_file[reg0] = utmp1
     return next_ip
 
-def COPY(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def COPY(vm, mem, register_file, reg0, reg1, next_ip):
     register_file[reg0] = register_file[reg1]
     return next_ip
 
-def MOVE(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def MOVE(vm, mem, register_file, reg0, reg1, next_ip):
     register_file[reg0] = register_file[reg1]
     register_file[reg1] = 0
     return next_ip
 
-def NOT(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def NOT(vm, mem, register_file, reg0, reg1, next_ip):
     mask = (1<<(register_file.itemsize*8)) -1
     register_file[reg0] = (~register_file[reg1]) & mask
     return next_ip
 
-def BRANCH(vm, c):
+def BRANCH(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CALL(vm, c):
+def CALL(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def PUSHR(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def PUSHR(vm, mem, register_file, reg0, reg1, next_ip):
     reg_size = register_file.itemsize
-    writeout_bytes(mem, register_file[reg1], register_file[reg0], reg_size)
+    WRITE_WORD_FUNCTIONS[reg_size](
+        mem, register_file[reg1], register_file[reg0])
     register_file[reg1] += reg_size
     return next_ip
 
-def PUSH8(vm, c):
+def PUSH8(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def PUSH16(vm, c):
+def PUSH16(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def PUSH32(vm, c):
+def PUSH32(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POPR(vm, c):
-    mem, register_file, reg0, reg1, next_ip = get_args_for_2OP(vm, c)
+def POPR(vm, mem, register_file, reg0, reg1, next_ip):
     reg_size = register_file.itemsize
     register_file[reg1] -= reg_size
-    tmp = readin_bytes(mem, register_file[reg1], COMPAT_FALSE, reg_size)
-    writeout_bytes(mem, register_file[reg1], 0, reg_size)
+    tmp = READ_WORD_FUNCTIONS[reg_size](mem, register_file[reg1])
+    WRITE_WORD_FUNCTIONS[reg_size](mem, register_file[reg1], 0)
     register_file[reg0] = tmp
     return next_ip
 
-def POP8(vm, c):
+def POP8(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POPU8(vm, c):
+def POPU8(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POP16(vm, c):
+def POP16(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POPU16(vm, c):
+def POPU16(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POP32(vm, c):
+def POP32(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def POPU32(vm, c):
+def POPU32(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_G(vm, c):
+def CMPSKIP_G(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_GE(vm, c):
+def CMPSKIP_GE(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_E(vm, c):
+def CMPSKIP_E(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_NE(vm, c):
+def CMPSKIP_NE(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_LE(vm, c):
+def CMPSKIP_LE(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIP_L(vm, c):
+def CMPSKIP_L(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIPU_G(vm, c):
+def CMPSKIPU_G(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIPU_GE(vm, c):
+def CMPSKIPU_GE(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIPU_LE(vm, c):
+def CMPSKIPU_LE(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
-def CMPSKIPU_L(vm, c):
+def CMPSKIPU_L(vm, mem, register_file, reg0, reg1, next_ip):
     pass
 
 
 # 1 OP integer instructions
 
-def get_args_for_1OP(vm, c):
-    return vm[MEM], vm[REG], c[I_REGISTERS][0], c[NEXTIP]
-
-def READPC(vm, c):
+def READPC(vm, mem, register_file, reg0, next_ip):
     pass
 
 READSCID_TABLE = {
@@ -654,31 +770,26 @@ READSCID_TABLE = {
 }
 READSCID_DEFAULT = 1
 
-def READSCID(vm, c):
-    mem, register_file, reg0, next_ip = get_args_for_1OP(vm, c)
+def READSCID(vm, mem, register_file, reg0, next_ip):
     register_file[reg0] = READSCID_TABLE.get(
         register_file.itemsize, READSCID_DEFAULT)
     return next_ip
 
-def FALSE(vm, c):
-    mem, register_file, reg0, next_ip = get_args_for_1OP(vm, c)
+def FALSE(vm, mem, register_file, reg0, next_ip):
     register_file[reg0] = 0
     return next_ip
 
-def TRUE(vm, c):
+def TRUE(vm, mem, register_file, reg0, next_ip):
     # Don't sweat the inefficiency of calculating the maximum value for the
     # register size, seperate implementations exist in
     # knightinstructions64, knightinstructions32, knightinstructions16
-    mem, register_file, reg0, next_ip = get_args_for_1OP(vm, c)
-    register_file[reg0] = 2**(vm[REG].itemsize*BITS_PER_BYTE)-1
+    register_file[reg0] = 2**(register_file.itemsize*BITS_PER_BYTE)-1
     return next_ip
 
-def JSR_COROUTINE(vm, c):
-    mem, register_file, reg0, next_ip = get_args_for_1OP(vm, c)
+def JSR_COROUTINE(vm, mem, register_file, reg0, next_ip):
     return register_file[reg0]
 
-def RET(vm, c):
-    mem, register_file, reg0, next_ip_discard = get_args_for_1OP(vm, c)
+def RET(vm, mem, register_file, reg0, next_ip_discard):
     reg_size = register_file.itemsize
 
     # Update our index
@@ -686,45 +797,31 @@ def RET(vm, c):
     register_file[reg0] = address_of_pc_on_stack
 
     # Read in the new PC
-    next_ip = readin_bytes(mem, address_of_pc_on_stack, COMPAT_FALSE, reg_size)
+    next_ip = READ_WORD_FUNCTIONS[reg_size](mem, address_of_pc_on_stack)
 
     # Clear Stack Values
-    writeout_bytes(mem, address_of_pc_on_stack, 0, reg_size)
+    WRITE_WORD_FUNCTIONS[reg_size](mem, address_of_pc_on_stack, 0)
 
     return next_ip
 
-def PUSHPC(vm, c):
+def PUSHPC(vm, mem, register_file, reg0, next_ip):
     pass
 
-def POPPC(vm, c):
+def POPPC(vm, mem, register_file, reg0, next_ip):
     pass
 
 
 # 2 OP integer immediate
 
-def get_args_for_2OPI(vm, c, signed_immediate=COMPAT_TRUE):
-    raw_immediate = c[RAW_IMMEDIATE]
-    return (
-        vm[MEM], vm[REG],
-        c[I_REGISTERS][0], c[I_REGISTERS][1],
-        ( raw_immediate if not signed_immediate
-          else interpret_sixteenbits_as_signed(raw_immediate) ),
-        c[NEXTIP],
-    )
-
-def ADDI(vm, c):
+def ADDI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def ADDUI(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def ADDUI(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     mask = (1<<(register_file.itemsize*8))-1
     register_file[reg0] = (register_file[reg1] + signed_immediate) & mask
     return next_ip
 
-def SUBI(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def SUBI(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     N_BITS = register_file.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     register_file[reg0] = (
@@ -732,9 +829,7 @@ def SUBI(vm, c):
         signed_immediate ) & mask
     return next_ip
 
-def SUBUI(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def SUBUI(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     # subtract and use a bitmask for register_file.itemsize*8 bits
     # to match the register size. A negative result from the subtraction
     # is no problem as negative numbers of type long (2.x) or int (3.x)
@@ -749,114 +844,91 @@ def SUBUI(vm, c):
     register_file[reg0] = (register_file[reg1] - signed_immediate) & mask
     return next_ip
 
-def CMPI(vm, c):
+def CMPI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def LOAD(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
-    register_file[reg0] = \
-        readin_bytes(mem, register_file[reg1] + signed_immediate,
-                     COMPAT_FALSE, register_file.itemsize)
+def LOAD(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
+    register_file[reg0] = READ_WORD_FUNCTIONS[register_file.itemsize](
+        mem, register_file[reg1] + signed_immediate)
     return next_ip
 
-def LOAD8(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def LOAD8(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     mask = (2**(register_file.itemsize*BITS_PER_BYTE))-1
     register_file[reg0] = interpret_nbits_as_signed(
         mem[ (register_file[reg1]+signed_immediate) & mask ],
         BITS_PER_BYTE) & mask
     return next_ip
 
-def LOADU8(vm, c):
-    mem, register_file, reg0, reg1, unsigned_immediate, next_ip = \
-        get_args_for_2OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def LOADU8(vm, mem, register_file, reg0, reg1, unsigned_immediate, next_ip):
     mask = 2**(register_file.itemsize * 8)-1
     register_file[reg0] = \
         mem[ (register_file[reg1]+unsigned_immediate) & mask ] & mask
     return next_ip
 
-def LOAD16(vm, c):
+def LOAD16(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def LOADU16(vm, c):
+def LOADU16(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def LOAD32(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def LOAD32(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     mask = 2**(register_file.itemsize * 8)-1
     # all that we need when doing a LOAD32 to sign extend to a 64bit
     # register bitwise and against a bitmask with 64 bits
     # this has no negative effect on 32 bit registers
     # and cuts things off on 16 bit registers
-    register_file[reg0]= readin_bytes(
+    register_file[reg0]= read_signed_word32(
         mem,
-        (register_file[reg1] + signed_immediate ) & mask, # memory address
-        COMPAT_TRUE, 4) & mask
+        (register_file[reg1] + signed_immediate ) & mask # memory address
+        ) & mask
     return next_ip
 
-def LOADU32(vm, c):
+def LOADU32(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def CMPUI(vm, c):
-    mem, register_file, reg0, reg1, unsigned_immediate, next_ip = \
-        get_args_for_2OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def CMPUI(vm, mem, register_file, reg0, reg1, unsigned_immediate, next_ip):
     set_comparison_flags(
         register_file[reg1], unsigned_immediate, register_file, reg0)
     return next_ip
 
-def STORE(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
-    writeout_bytes(mem,
-                   register_file[reg1]+signed_immediate,
-                   register_file[reg0],
-                   register_file.itemsize)
+def STORE(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
+    WRITE_WORD_FUNCTIONS[register_file.itemsize](
+        mem, register_file[reg1]+signed_immediate, register_file[reg0])
     return next_ip
 
-def STORE8(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
-    writeout_bytes(mem, register_file[reg1] + signed_immediate,
-                   register_file[reg0], 1);
+def STORE8(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
+    write_word8(mem, register_file[reg1] + signed_immediate,
+                register_file[reg0])
     return next_ip
 
-def STORE16(vm, c):
+def STORE16(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def STORE32(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
-    writeout_bytes(mem, register_file[reg1] + signed_immediate,
-                   register_file[reg0], 4)
+def STORE32(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
+    write_word32(mem, register_file[reg1] + signed_immediate,
+                 register_file[reg0])
     return next_ip
 
-def ANDI(vm, c):
-    mem, register_file, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def ANDI(vm, mem, register_file, reg0, reg1, signed_immediate, next_ip):
     register_file[reg0] = register_file[reg1] & signed_immediate
     return next_ip
 
-def ORI(vm, c):
+def ORI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def XORI(vm, c):
+def XORI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def NANDI(vm, c):
+def NANDI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def NORI(vm, c):
+def NORI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def XNORI(vm, c):
+def XNORI(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def CMPJUMPI_G(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_G(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if (interpret_nbits_as_signed(registerfile[reg0], N_BITS) >
@@ -865,9 +937,7 @@ def CMPJUMPI_G(vm, c):
     else:
         return next_ip
 
-def CMPJUMPI_GE(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_GE(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if (interpret_nbits_as_signed(registerfile[reg0], N_BITS) >=
@@ -876,9 +946,7 @@ def CMPJUMPI_GE(vm, c):
     else:
         return next_ip
 
-def CMPJUMPI_E(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_E(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if registerfile[reg0] == registerfile[reg1]:
@@ -886,9 +954,7 @@ def CMPJUMPI_E(vm, c):
     else:
         return next_ip
 
-def CMPJUMPI_NE(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_NE(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if registerfile[reg0] != registerfile[reg1]:
@@ -896,9 +962,7 @@ def CMPJUMPI_NE(vm, c):
     else:
         return next_ip
 
-def CMPJUMPI_LE(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_LE(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if (interpret_nbits_as_signed(registerfile[reg0], N_BITS) <=
@@ -907,9 +971,7 @@ def CMPJUMPI_LE(vm, c):
     else:
         return next_ip
 
-def CMPJUMPI_L(vm, c):
-    mem, registerfile, reg0, reg1, signed_immediate, next_ip = \
-        get_args_for_2OPI(vm, c)
+def CMPJUMPI_L(vm, mem, registerfile, reg0, reg1, signed_immediate, next_ip):
     N_BITS = registerfile.itemsize*BITS_PER_BYTE
     mask = (1<<N_BITS)-1
     if (interpret_nbits_as_signed(registerfile[reg0], N_BITS) <
@@ -918,34 +980,24 @@ def CMPJUMPI_L(vm, c):
     else:
         return next_ip
 
-def CMPJUMPUI_G(vm, c):
+def CMPJUMPUI_G(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def CMPJUMPUI_GE(vm, c):
+def CMPJUMPUI_GE(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def CMPJUMPUI_LE(vm, c):
+def CMPJUMPUI_LE(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
-def CMPJUMPUI_L(vm, c):
+def CMPJUMPUI_L(vm, mem, register_file, reg0, reg1, immediate, next_ip):
     pass
 
 
 # 1 OP integer immediate
 
-def get_args_for_1OPI(vm, c, signed_immediate=COMPAT_TRUE):
-    raw_immediate = c[RAW_IMMEDIATE]
-    return (
-        vm[MEM], vm[REG], c[I_REGISTERS][0],
-        (raw_immediate if not signed_immediate
-         else interpret_sixteenbits_as_signed(raw_immediate) ),
-        c[NEXTIP]
-        )
-
 def make_condition_bit_jump(condition_mask):
-    def JUMP_condition(vm, c):
-        mem, register_file, reg0, signed_immediate, next_ip = \
-            get_args_for_1OPI(vm, c)
+    def JUMP_condition(vm, mem, register_file, reg0,
+                       signed_immediate, next_ip):
         if register_file[reg0] & condition_mask:
             return next_ip + signed_immediate
         else:
@@ -961,9 +1013,8 @@ JUMP_L = make_condition_bit_jump(CONDITION_BIT_LT)
 
 def make_two_either_condition_bit_jump(condition_mask1, condition_mask2):
     combined_mask = condition_mask1 | condition_mask2
-    def JUMP_two_condition(vm, c):
-        mem, register_file, reg0, signed_immediate, next_ip = \
-            get_args_for_1OPI(vm, c)
+    def JUMP_two_condition(vm, mem, register_file, reg0,
+                           signed_immediate, next_ip):
         # how vm_instructions.c (stage0) does this
         # if (register_file[reg0] & condition_mask1 or
         #     register_file[reg0] & condition_mask2):
@@ -981,58 +1032,46 @@ def make_two_either_condition_bit_jump(condition_mask1, condition_mask2):
 JUMP_GE = make_two_either_condition_bit_jump(CONDITION_BIT_GT, CONDITION_BIT_EQ)
 JUMP_LE = make_two_either_condition_bit_jump(CONDITION_BIT_LT, CONDITION_BIT_EQ)
 
-def JUMP_NE(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def JUMP_NE(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if register_file[reg0] & CONDITION_BIT_EQ:
         return next_ip
     else: # CONDITION_BIT_EQ not set
         return next_ip + signed_immediate
 
-def JUMP_Z(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def JUMP_Z(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if 0==register_file[reg0]:
         return next_ip + signed_immediate
     else:
         return next_ip
 
-def JUMP_NZ(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def JUMP_NZ(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if 0!=register_file[reg0]:
         return next_ip + signed_immediate
     else:
         return next_ip
 
-def JUMP_P(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def JUMP_P(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if register_negative(register_file, reg0):
         return next_ip
     else:
         return next_ip + signed_immediate
 
-def JUMP_NP(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def JUMP_NP(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if register_negative(register_file, reg0):
         return next_ip + signed_immediate
     else:
         return next_ip
 
-def CALLI(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def CALLI(vm, mem, register_file, reg0, signed_immediate, next_ip):
     reg_size = register_file.itemsize
     # Write out the PC
-    writeout_bytes(mem, register_file[reg0], next_ip, reg_size)
+    WRITE_WORD_FUNCTIONS[reg_size](mem, register_file[reg0], next_ip)
 
     register_file[reg0] += reg_size # Update our index
 
     return next_ip + signed_immediate # Update PC
 
-def LOADI(vm, c):
+def LOADI(vm, mem, register_file, reg0, signed_immediate, next_ip):
     # FIXME, this can be gotten rid of by just generating the mask and
     # masking value in LOADI, this has become the style elsewhere in
     # the code
@@ -1042,31 +1081,22 @@ def LOADI(vm, c):
             value, # already signed
             register_file.itemsize*8)
 
-    # 16 bit version just uses LOADUI
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
     stuff_int_as_signed_16bit_value_into_register(
         signed_immediate, register_file, reg0)
     return next_ip
 
-def LOADUI(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def LOADUI(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     register_file[reg0] = unsigned_immediate
     return next_ip
 
-def SALI(vm, c):
+def SALI(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def SARI(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def SARI(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     register_file[reg0] = register_file[reg0]>>unsigned_immediate
     return next_ip
 
-def SL0I(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def SL0I(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     mask = (1<<(register_file.itemsize*8))-1 # (2**itemsize*8)-1, max unsigned
     assert( (2**(register_file.itemsize*8))-1 == mask )
     
@@ -1074,128 +1104,168 @@ def SL0I(vm, c):
 
     return next_ip
 
-def SR0I(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def SR0I(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     register_file[reg0] = register_file[reg0]>>unsigned_immediate
     return next_ip
 
-def SL1I(vm, c):
+def SL1I(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def SR1I(vm, c):
+def SR1I(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADR(vm, c):
+def LOADR(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADR8(vm, c):
+def LOADR8(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADRU8(vm, c):
+def LOADRU8(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADR16(vm, c):
+def LOADR16(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADRU16(vm, c):
+def LOADRU16(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADR32(vm, c):
+def LOADR32(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def LOADRU32(vm, c):
+def LOADRU32(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def STORER(vm, c):
+def STORER(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def STORER8(vm, c):
+def STORER8(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def STORER16(vm, c):
+def STORER16(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def STORER32(vm, c):
+def STORER32(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def CMPSKIPI_G(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def CMPSKIPI_G(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if compare_immediate_to_register_g_signed(
             register_file, reg0, signed_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPI_GE(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def CMPSKIPI_GE(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if compare_immediate_to_register_ge_signed(
             register_file, reg0, signed_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPI_E(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def CMPSKIPI_E(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     if compare_immediate_to_register_e(
             register_file, reg0, unsigned_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPI_NE(vm, c):
-    mem, register_file, reg0, unsigned_immediate, next_ip = \
-        get_args_for_1OPI(vm, c, signed_immediate=COMPAT_FALSE)
+def CMPSKIPI_NE(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
     if compare_immediate_to_register_ne(
             register_file, reg0, unsigned_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPI_LE(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def CMPSKIPI_LE(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if compare_immediate_to_register_le_signed(
             register_file, reg0, signed_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPI_L(vm, c):
-    mem, register_file, reg0, signed_immediate, next_ip = \
-        get_args_for_1OPI(vm, c)
+def CMPSKIPI_L(vm, mem, register_file, reg0, signed_immediate, next_ip):
     if compare_immediate_to_register_l_signed(
             register_file, reg0, signed_immediate):
         return next_ip + get_instruction_size(vm, next_ip)
     else:
         return next_ip
 
-def CMPSKIPUI_G(vm, c):
+def CMPSKIPUI_G(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def CMPSKIPUI_GE(vm, c):
+def CMPSKIPUI_GE(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def CMPSKIPUI_LE(vm, c):
+def CMPSKIPUI_LE(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
-def CMPSKIPUI_L(vm, c):
+def CMPSKIPUI_L(vm, mem, register_file, reg0, immediate, next_ip):
     pass
 
 
 # 0 OP integer immediate
 
-def JUMP(vm, c):
-    return c[NEXTIP]+interpret_sixteenbits_as_signed(c[RAW_IMMEDIATE])
+def JUMP(vm, mem, register_file, signed_immediate, next_ip):
+    return next_ip + signed_immediate
+
+
+# Memory writes
+#
+# For each implemented instruction that writes to memory, a function that
+# computes (address, byte_count) of the write from the same arguments as
+# the instruction function. These are called before the instruction runs, as some
+# instructions (PUSHR, CALLI..) change the registers the address came from.
+# Used by things that need to notice memory changes, such as the decode
+# cache in knightdecodecache.py. New instructions that write memory need
+# an entry here.
+
+def make_2OPI_write(byte_count):
+    def write_2OPI(vm, mem, register_file, reg0, reg1, signed_immediate,
+                   next_ip):
+        return ( register_file[reg1] + signed_immediate,
+                 byte_count or register_file.itemsize )
+    return write_2OPI
+
+def make_3OP_write(byte_count):
+    def write_3OP(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
+        return ( registerfile[reg1] + registerfile[reg2],
+                 byte_count or registerfile.itemsize )
+    return write_3OP
+
+def write_push(vm, mem, register_file, reg0, reg1, next_ip): # PUSHR
+    return register_file[reg1], register_file.itemsize
+
+# POPR clears the stack value
+def write_pop(vm, mem, register_file, reg0, reg1, next_ip):
+    return ( register_file[reg1] - register_file.itemsize,
+             register_file.itemsize )
+
+# CALLI
+def write_call(vm, mem, register_file, reg0, signed_immediate, next_ip):
+    return register_file[reg0], register_file.itemsize
+
+# RET clears the stack value
+def write_ret(vm, mem, register_file, reg0, next_ip):
+    return ( register_file[reg0] - register_file.itemsize,
+             register_file.itemsize )
+
+# a byte_count of 0 means register size
+MEMORY_WRITE_TABLE = {
+    "STORE": make_2OPI_write(0),
+    "STORE8": make_2OPI_write(1),
+    "STORE32": make_2OPI_write(4),
+    "STOREX": make_3OP_write(0),
+    "STOREX16": make_3OP_write(2),
+    "PUSHR": write_push,
+    "POPR": write_pop,
+    "CALLI": write_call,
+    "RET": write_ret,
+}
 
 
 # HAL_CODES
 
 def lookup_tapeindex_and_filename(vm, io_device_register=0):
-    io_device = vm[REG][io_device_register]
+    io_device = vm.reg[io_device_register]
     if 0x00001100 == io_device:
         return 0, TAPE1FILENAME, io_device
     elif 0x00001101 == io_device:
@@ -1210,11 +1280,11 @@ def lookup_fd(vm, io_device_register=0, write_context=COMPAT_FALSE):
         vm, io_device_register=io_device_register)
     if None==tapeindex and io_device==HAL_IO_DEVICE_STDIO:
         if write_context:
-            return vm[TAPEFD][TAPEFD_I_STDOUT]
+            return vm.tapefd[TAPEFD_I_STDOUT]
         else:
-            return vm[TAPEFD][TAPEFD_I_STDIN]
+            return vm.tapefd[TAPEFD_I_STDIN]
     elif not (None in (tapeindex, tapefilenameindex)):
-        return vm[TAPEFD][tapeindex]
+        return vm.tapefd[tapeindex]
     else:
         exit("Error looking up relevant tape device")
 
@@ -1222,11 +1292,15 @@ def tapeopen(vm, flags, do_exists=COMPAT_FALSE):
     tapeindex, tapefilenameindex, io_device = lookup_tapeindex_and_filename(vm)
     if None in (tapeindex, tapefilenameindex):
         exit("no tape device selected for read/write")
-    filename = vm[tapefilenameindex]
+    tape_backend = get_tape_backend(vm[tapefilenameindex])
     if do_exists:
-        if not exists(filename):
-            exit("File named %s does not exist -- python-tapeopen" %  filename)
-    vm[TAPEFD][tapeindex] = open(filename, flags)
+        if not tape_backend.exists():
+            exit("File named %s does not exist -- python-tapeopen" %
+                 tape_backend.get_name() )
+    previous_tape = vm.tapefd[tapeindex]
+    if previous_tape!=None and not previous_tape.closed:
+        previous_tape.flush() # opened again without FCLOSE
+    vm.tapefd[tapeindex] = TapeDevice(tape_backend.open_tape(flags), flags)
 
 def vm_FOPEN_READ(vm):
     tapeopen(vm, 'rb', do_exists=COMPAT_TRUE)
@@ -1241,27 +1315,52 @@ def vm_REWIND(vm):
     lookup_fd(vm).seek(0)
 
 def vm_FSEEK(vm):
-    SEEK_CUR = 1 # wence=1 means relative to current pos 
-    lookup_fd(vm).seek(VM[REG][HAL_IO_DEVICE_REGISTER], wence=SEEK_CUR)
+    SEEK_CUR = 1 # whence=1 means relative to current pos
+    # like FOPEN and FCLOSE the tape is picked by register 0, the offset,
+    # signed, is in register 1
+    lookup_fd(vm).seek(
+        interpret_nbits_as_signed(vm.reg[1], vm.reg.itemsize*8), SEEK_CUR)
 
-def vm_FGETC(vm):
+# FGETC and FPUTC go straight to the knighttape.TapeDevice for the two
+# tapes, only stdio goes through lookup_fd
+
+def read_stdio_byte(vm):
+    # the next byte or -1 at the end
     byte_read = lookup_fd(
         vm, write_context=COMPAT_FALSE,
         io_device_register=HAL_IO_DEVICE_REGISTER).read(1)
     if len(byte_read)==0:
-        vm[REG][HAL_IO_DATA_REGISTER] = \
-            sign_extend_if_negative_and_unsign_bits(-1, vm[REG].itemsize*8)
-        assert register_negative(vm[REG], HAL_IO_DATA_REGISTER)
+        return -1
+    return ord(byte_read)
+
+def vm_FGETC(vm):
+    if vm_FGETC_trusted(vm)<0:
+        assert register_negative(vm.reg, HAL_IO_DATA_REGISTER)
+
+def vm_FGETC_trusted(vm):
+    # vm_FGETC without the asserts, for knighttrusted.py,
+    # returns the byte read or -1 at the end
+    tapeindex = TAPE_INDEXES.get(vm.reg[HAL_IO_DEVICE_REGISTER])
+    if tapeindex==None:
+        byte_read = read_stdio_byte(vm)
     else:
-        assert(len(byte_read)==1)
-        vm[REG][HAL_IO_DATA_REGISTER] = ord(byte_read)
+        byte_read = vm.tapefd[tapeindex].getc()
+    if byte_read<0:
+        vm.reg[HAL_IO_DATA_REGISTER] = \
+            sign_extend_if_negative_and_unsign_bits(-1, vm.reg.itemsize*8)
+    else:
+        vm.reg[HAL_IO_DATA_REGISTER] = byte_read
+    return byte_read
 
 def vm_FPUTC(vm):
-    output_byte = vm[REG][HAL_IO_DATA_REGISTER] & 0xFF
-    fd = lookup_fd(
-        vm, write_context=COMPAT_TRUE,
-        io_device_register=HAL_IO_DEVICE_REGISTER)
-    write_byte(fd, output_byte)
+    output_byte = vm.reg[HAL_IO_DATA_REGISTER] & 0xFF
+    tapeindex = TAPE_INDEXES.get(vm.reg[HAL_IO_DEVICE_REGISTER])
+    if tapeindex!=None:
+        vm.tapefd[tapeindex].putc(output_byte)
+    else:
+        write_byte(lookup_fd(vm, write_context=COMPAT_TRUE,
+                             io_device_register=HAL_IO_DEVICE_REGISTER),
+                   output_byte)
 
 def vm_HAL_MEM(vm):
     pass
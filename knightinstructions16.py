@@ -20,57 +20,33 @@
 from __future__ import division # prevent use of "/" in the old way
 
 from knightinstructions import *
-from knightinstructions_bit_optimized import make_nbit_optimized_functions
+from knightinstructions_bit_optimized import import_nbit_optimized_functions
 
-nbit_optimized_dict = make_nbit_optimized_functions(16)
+# replaces the generic versions of everything listed in
+# knightinstructions_bit_optimized.NBIT_OPTIMIZED_INSTRUCTIONS
+nbit_optimized_dict = import_nbit_optimized_functions(globals(), 16)
 
 # 1 OP
 
-# We don't need to mess around with sign extension for 16 bit LOADI,
-# when copying a signed 16 bit value stored as a 16 bit unsigned into a
-# 16 bit unsigned register, we just copy the bits like generic LOADUI does
-LOADI = LOADUI
-
-TRUE = nbit_optimized_dict['TRUE_16']
-
-def RET(vm, c):
-    mem, register_file, reg0, next_ip_discard = get_args_for_1OP(vm, c)
-    reg_size = register_file.itemsize
-
+def RET(vm, mem, register_file, reg0, next_ip_discard):
     # Update our index
-    address_of_pc_on_stack = register_file[reg0] - reg_size
+    address_of_pc_on_stack = register_file[reg0] - 2
     register_file[reg0] = address_of_pc_on_stack
 
     # Read in the new PC
-    # big endian, least significant byte is most significant bits
-    next_ip = ( (mem[address_of_pc_on_stack]<<8) |
-                mem[address_of_pc_on_stack+1] )
+    next_ip = read_word16(mem, address_of_pc_on_stack)
 
     # Clear Stack Values
-    mem[address_of_pc_on_stack], mem[address_of_pc_on_stack+1] = 0,0
+    write_word16(mem, address_of_pc_on_stack, 0)
 
     return next_ip
 
-# 3 OP
-CMP = nbit_optimized_dict['CMP_16']
-
-
 # 1 OP immediate
-JUMP_P = nbit_optimized_dict['JUMP_P_16']
-JUMP_NP = nbit_optimized_dict['JUMP_NP_16']
 
-def CALLI(vm, c):
-    mem, register_file, reg0, raw_immediate, next_ip = get_args_for_1OPI(vm, c)
-    mem_address = register_file[reg0]
-    # big endian
-    mem[mem_address] = next_ip>>8 # most significant byte
-    mem[mem_address+1] = next_ip & 0xFF # least significant byte
+def CALLI(vm, mem, register_file, reg0, raw_immediate, next_ip):
+    # Write out the PC
+    write_word16(mem, register_file[reg0], next_ip)
 
-    register_file[reg0] += register_file.itemsize # Update our index
+    register_file[reg0] += 2 # Update our index
 
     return next_ip + raw_immediate # Update PC
-
-def SL0I(vm, c):
-    mem, register_file, reg0, raw_immediate, next_ip = get_args_for_1OPI(vm, c)
-    register_file[reg0] = (register_file[reg0]<<raw_immediate) & 0xFFFF
-    return next_ip
@@ -22,10 +22,36 @@ from __future__ import division # prevent use of "/" in the old way
 from knightinstructions import \
     make_twos_complement_converter, sixteenbit_twos_complement, \
     set_comparison_flags, \
-    MAX_16_SIGNED, MAX_16_UNSIGNED, \
-    get_args_for_1OP, get_args_for_3OP, get_args_for_1OPI
+    READ_WORD_FUNCTIONS, READ_SIGNED_WORD_FUNCTIONS, WRITE_WORD_FUNCTIONS, \
+    get_instruction_size, \
+    MAX_16_SIGNED, MAX_16_UNSIGNED, BITS_PER_BYTE, \
+    READSCID_TABLE, READSCID_DEFAULT
 
-def make_nbit_optimized_functions(nbits):
+# every instruction make_nbit_optimized_functions makes a version of,
+# the knightinstructions16, 32 and 64 modules import these as
+# nbit_optimized_dict['%s_%d' % (instruction_str, nbits)]
+NBIT_OPTIMIZED_INSTRUCTIONS = (
+    # 3 OP
+    'ADDU', 'ADD', 'SUB', 'CMP', 'MUL', 'SL0', 'LOADX', 'STOREX',
+    # 2 OP
+    'NEG', 'NOT', 'PUSHR', 'POPR',
+    # 1 OP
+    'READSCID', 'TRUE',
+    # 2 OP immediate
+    'ADDUI', 'SUBI', 'SUBUI', 'LOAD', 'LOAD8', 'LOADU8', 'LOAD32', 'STORE',
+    'CMPJUMPI_G', 'CMPJUMPI_GE', 'CMPJUMPI_E', 'CMPJUMPI_NE',
+    'CMPJUMPI_LE', 'CMPJUMPI_L',
+    # 1 OP immediate
+    'JUMP_P', 'JUMP_NP', 'LOADI', 'SL0I',
+    'CMPSKIPI_G', 'CMPSKIPI_GE', 'CMPSKIPI_LE', 'CMPSKIPI_L',
+)
+
+# the word accessor tables are arguments so knighttrusted.py can make
+# versions of these with its own
+def make_nbit_optimized_functions(
+        nbits, read_word_functions=READ_WORD_FUNCTIONS,
+        read_signed_word_functions=READ_SIGNED_WORD_FUNCTIONS,
+        write_word_functions=WRITE_WORD_FUNCTIONS):
     if nbits==16:
         MAX_N_SIGNED = MAX_16_SIGNED
         MAX_N_UNSIGNED = MAX_16_UNSIGNED
@@ -36,6 +62,22 @@ def make_nbit_optimized_functions(nbits):
         nbit_twos_complement = make_twos_complement_converter(nbits)
 
     SIGN_BIT_MASK = MAX_N_SIGNED+1
+    # bytes pushed and popped for a register
+    REG_SIZE = nbits//BITS_PER_BYTE
+    # MUL keeps the bottom 32 bits and MULH is meant for the rest,
+    # see knightinstructions.MUL
+    MUL_MASK = MAX_N_UNSIGNED & 0xFFFFFFFF
+    READSCID_VALUE = READSCID_TABLE.get(REG_SIZE, READSCID_DEFAULT)
+    # the word accessors for a register
+    read_register_word = read_word_functions[REG_SIZE]
+    write_register_word = write_word_functions[REG_SIZE]
+    read_signed_word32 = read_signed_word_functions[4]
+
+    # Flipping the sign bit of two unsigned register values gives numbers
+    # that compare (<, >) the same way as the signed numbers they
+    # represent, and (value ^ SIGN_BIT_MASK) - SIGN_BIT_MASK is the signed
+    # value, both without the function calls and branching of
+    # interpret_nbits_as_signed
 
     def interpret_nbits_as_signed(value):
         # does this perform better than value > MAX_N_SIGNED?
@@ -51,45 +93,276 @@ def make_nbit_optimized_functions(nbits):
         return not (register_file[reg0] & SIGN_BIT_MASK)
 
 
-    # 1 OP
+    # 3 OP
 
-    def TRUE_N_BITS(vm, c):
-        mem, register_file, reg0, next_ip = get_args_for_1OP(vm, c)
-        register_file[reg0] = MAX_N_UNSIGNED
+    def ADDU_N_BITS(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
+        registerfile[reg0] = \
+            (registerfile[reg1] + registerfile[reg2]) & MAX_N_UNSIGNED
         return next_ip
 
+    def SUB_N_BITS(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
+        # the same bits come out whether the operands are interpreted
+        # as signed or not
+        registerfile[reg0] = \
+            (registerfile[reg1] - registerfile[reg2]) & MAX_N_UNSIGNED
+        return next_ip
 
-    # 3 OP
-
-    def CMP_N_BITS(vm, c):
-        mem, registerfile, reg0, reg1, reg2, next_ip = get_args_for_3OP(vm, c)
+    def CMP_N_BITS(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
         tmp1 = interpret_nbits_as_signed(registerfile[reg1])
         tmp2 = interpret_nbits_as_signed(registerfile[reg2])
         set_comparison_flags(tmp1, tmp2, registerfile, reg0)
         return next_ip
 
+    def MUL_N_BITS(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
+        registerfile[reg0] = \
+            (registerfile[reg1] * registerfile[reg2]) & MUL_MASK
+        return next_ip
+
+    def SL0_N_BITS(vm, mem, registerfile, reg0, reg1, reg2, next_ip):
+        registerfile[reg0] = \
+            (registerfile[reg1]<<registerfile[reg2]) & MAX_N_UNSIGNED
+        return next_ip
+
+    def LOADX_N_BITS(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+        # sign extending to the register size leaves the bits as they are
+        register_file[reg0] = \
+            read_register_word(mem, register_file[reg1] + register_file[reg2])
+        return next_ip
+
+    def STOREX_N_BITS(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+        write_register_word(mem, register_file[reg1]+register_file[reg2],
+                            register_file[reg0])
+        return next_ip
+
+
+    # 2 OP
+
+    def NEG_N_BITS(vm, mem, register_file, reg0, reg1, next_ip):
+        register_file[reg0] = (-register_file[reg1]) & MAX_N_UNSIGNED
+        return next_ip
+
+    def NOT_N_BITS(vm, mem, register_file, reg0, reg1, next_ip):
+        register_file[reg0] = (~register_file[reg1]) & MAX_N_UNSIGNED
+        return next_ip
+
+    def PUSHR_N_BITS(vm, mem, register_file, reg0, reg1, next_ip):
+        write_register_word(mem, register_file[reg1], register_file[reg0])
+        register_file[reg1] += REG_SIZE
+        return next_ip
+
+    def POPR_N_BITS(vm, mem, register_file, reg0, reg1, next_ip):
+        register_file[reg1] -= REG_SIZE
+        tmp = read_register_word(mem, register_file[reg1])
+        write_register_word(mem, register_file[reg1], 0)
+        register_file[reg0] = tmp
+        return next_ip
+
+
+    # 1 OP
+
+    def READSCID_N_BITS(vm, mem, register_file, reg0, next_ip):
+        register_file[reg0] = READSCID_VALUE
+        return next_ip
+
+    def TRUE_N_BITS(vm, mem, register_file, reg0, next_ip):
+        register_file[reg0] = MAX_N_UNSIGNED
+        return next_ip
+
+
+    # 2 OP immediate
+
+    def ADDUI_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                     next_ip):
+        register_file[reg0] = \
+            (register_file[reg1] + signed_immediate) & MAX_N_UNSIGNED
+        return next_ip
+
+    # like SUB, SUBI comes out the same as SUBUI
+    def SUBUI_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                     next_ip):
+        register_file[reg0] = \
+            (register_file[reg1] - signed_immediate) & MAX_N_UNSIGNED
+        return next_ip
+
+    def LOAD_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                    next_ip):
+        register_file[reg0] = \
+            read_register_word(mem, register_file[reg1] + signed_immediate)
+        return next_ip
+
+    def LOAD8_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                     next_ip):
+        register_file[reg0] = (
+            (mem[ (register_file[reg1]+signed_immediate) & MAX_N_UNSIGNED ]
+             ^ 0x80) - 0x80 ) & MAX_N_UNSIGNED
+        return next_ip
+
+    def LOADU8_N_BITS(vm, mem, register_file, reg0, reg1, unsigned_immediate,
+                      next_ip):
+        register_file[reg0] = \
+            mem[ (register_file[reg1]+unsigned_immediate) & MAX_N_UNSIGNED ]
+        return next_ip
+
+    def LOAD32_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                      next_ip):
+        register_file[reg0]= read_signed_word32(
+            mem,
+            (register_file[reg1] + signed_immediate ) & MAX_N_UNSIGNED
+            ) & MAX_N_UNSIGNED
+        return next_ip
+
+    def STORE_N_BITS(vm, mem, register_file, reg0, reg1, signed_immediate,
+                     next_ip):
+        write_register_word(mem, register_file[reg1]+signed_immediate,
+                            register_file[reg0])
+        return next_ip
+
+    def CMPJUMPI_G_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                          next_ip):
+        if ( (registerfile[reg0] ^ SIGN_BIT_MASK) >
+             (registerfile[reg1] ^ SIGN_BIT_MASK) ):
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
+    def CMPJUMPI_GE_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                           next_ip):
+        if ( (registerfile[reg0] ^ SIGN_BIT_MASK) >=
+             (registerfile[reg1] ^ SIGN_BIT_MASK) ):
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
+    def CMPJUMPI_E_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                          next_ip):
+        if registerfile[reg0] == registerfile[reg1]:
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
+    def CMPJUMPI_NE_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                           next_ip):
+        if registerfile[reg0] != registerfile[reg1]:
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
+    def CMPJUMPI_LE_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                           next_ip):
+        if ( (registerfile[reg0] ^ SIGN_BIT_MASK) <=
+             (registerfile[reg1] ^ SIGN_BIT_MASK) ):
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
+    def CMPJUMPI_L_N_BITS(vm, mem, registerfile, reg0, reg1, signed_immediate,
+                          next_ip):
+        if ( (registerfile[reg0] ^ SIGN_BIT_MASK) <
+             (registerfile[reg1] ^ SIGN_BIT_MASK) ):
+            return (next_ip + signed_immediate) & MAX_N_UNSIGNED
+        else:
+            return next_ip
+
 
     # 1 OP immediate
 
-    def JUMP_P_N_BITS(vm, c):
-        mem, register_file, reg0, raw_immediate, next_ip = \
-            get_args_for_1OPI(vm, c)
+    def JUMP_P_N_BITS(vm, mem, register_file, reg0, raw_immediate, next_ip):
         if register_nbit_negative(register_file, reg0):
             return next_ip
         else: # positive
             return next_ip + raw_immediate
 
-    def JUMP_NP_N_BITS(vm, c):
-        mem, register_file, reg0, raw_immediate, next_ip = \
-            get_args_for_1OPI(vm, c)
+    def JUMP_NP_N_BITS(vm, mem, register_file, reg0, raw_immediate, next_ip):
         if register_nbit_negative(register_file, reg0):
             return next_ip + raw_immediate
         else: # positive
             return next_ip
 
+    def LOADI_N_BITS(vm, mem, register_file, reg0, signed_immediate, next_ip):
+        register_file[reg0] = signed_immediate & MAX_N_UNSIGNED
+        return next_ip
+
+    def SL0I_N_BITS(vm, mem, register_file, reg0, unsigned_immediate, next_ip):
+        register_file[reg0] = \
+            (register_file[reg0]<<unsigned_immediate) & MAX_N_UNSIGNED
+        return next_ip
+
+    def CMPSKIPI_G_N_BITS(vm, mem, register_file, reg0, signed_immediate,
+                          next_ip):
+        if ( (register_file[reg0] ^ SIGN_BIT_MASK) - SIGN_BIT_MASK >
+             signed_immediate ):
+            return next_ip + get_instruction_size(vm, next_ip)
+        else:
+            return next_ip
+
+    def CMPSKIPI_GE_N_BITS(vm, mem, register_file, reg0, signed_immediate,
+                           next_ip):
+        if ( (register_file[reg0] ^ SIGN_BIT_MASK) - SIGN_BIT_MASK >=
+             signed_immediate ):
+            return next_ip + get_instruction_size(vm, next_ip)
+        else:
+            return next_ip
+
+    def CMPSKIPI_LE_N_BITS(vm, mem, register_file, reg0, signed_immediate,
+                           next_ip):
+        if ( (register_file[reg0] ^ SIGN_BIT_MASK) - SIGN_BIT_MASK <=
+             signed_immediate ):
+            return next_ip + get_instruction_size(vm, next_ip)
+        else:
+            return next_ip
+
+    def CMPSKIPI_L_N_BITS(vm, mem, register_file, reg0, signed_immediate,
+                          next_ip):
+        if ( (register_file[reg0] ^ SIGN_BIT_MASK) - SIGN_BIT_MASK <
+             signed_immediate ):
+            return next_ip + get_instruction_size(vm, next_ip)
+        else:
+            return next_ip
+
     return {
-        ('TRUE_%d' % nbits): TRUE_N_BITS,
+        ('ADDU_%d' % nbits): ADDU_N_BITS,
+        ('ADD_%d' % nbits): ADDU_N_BITS, # see knightinstructions.ADD
+        ('SUB_%d' % nbits): SUB_N_BITS,
         ('CMP_%d' % nbits): CMP_N_BITS,
+        ('MUL_%d' % nbits): MUL_N_BITS,
+        ('SL0_%d' % nbits): SL0_N_BITS,
+        ('LOADX_%d' % nbits): LOADX_N_BITS,
+        ('STOREX_%d' % nbits): STOREX_N_BITS,
+        ('NEG_%d' % nbits): NEG_N_BITS,
+        ('NOT_%d' % nbits): NOT_N_BITS,
+        ('PUSHR_%d' % nbits): PUSHR_N_BITS,
+        ('POPR_%d' % nbits): POPR_N_BITS,
+        ('READSCID_%d' % nbits): READSCID_N_BITS,
+        ('TRUE_%d' % nbits): TRUE_N_BITS,
+        ('ADDUI_%d' % nbits): ADDUI_N_BITS,
+        ('SUBI_%d' % nbits): SUBUI_N_BITS,
+        ('SUBUI_%d' % nbits): SUBUI_N_BITS,
+        ('LOAD_%d' % nbits): LOAD_N_BITS,
+        ('LOAD8_%d' % nbits): LOAD8_N_BITS,
+        ('LOADU8_%d' % nbits): LOADU8_N_BITS,
+        ('LOAD32_%d' % nbits): LOAD32_N_BITS,
+        ('STORE_%d' % nbits): STORE_N_BITS,
+        ('CMPJUMPI_G_%d' % nbits): CMPJUMPI_G_N_BITS,
+        ('CMPJUMPI_GE_%d' % nbits): CMPJUMPI_GE_N_BITS,
+        ('CMPJUMPI_E_%d' % nbits): CMPJUMPI_E_N_BITS,
+        ('CMPJUMPI_NE_%d' % nbits): CMPJUMPI_NE_N_BITS,
+        ('CMPJUMPI_LE_%d' % nbits): CMPJUMPI_LE_N_BITS,
+        ('CMPJUMPI_L_%d' % nbits): CMPJUMPI_L_N_BITS,
         ('JUMP_P_%d' % nbits): JUMP_P_N_BITS,
         ('JUMP_NP_%d' % nbits): JUMP_NP_N_BITS,
+        ('LOADI_%d' % nbits): LOADI_N_BITS,
+        ('SL0I_%d' % nbits): SL0I_N_BITS,
+        ('CMPSKIPI_G_%d' % nbits): CMPSKIPI_G_N_BITS,
+        ('CMPSKIPI_GE_%d' % nbits): CMPSKIPI_GE_N_BITS,
+        ('CMPSKIPI_LE_%d' % nbits): CMPSKIPI_LE_N_BITS,
+        ('CMPSKIPI_L_%d' % nbits): CMPSKIPI_L_N_BITS,
     }
+
+def import_nbit_optimized_functions(module_globals, nbits):
+    # for knightinstructions16, 32 and 64 to replace the generic
+    # knightinstructions functions they import with these
+    nbit_optimized_dict = make_nbit_optimized_functions(nbits)
+    for instruction_str in NBIT_OPTIMIZED_INSTRUCTIONS:
+        module_globals[instruction_str] = \
+            nbit_optimized_dict['%s_%d' % (instruction_str, nbits)]
+    return nbit_optimized_dict
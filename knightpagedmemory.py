@@ -0,0 +1,156 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# PagedMemory, a stand in for the flat array vm.mem normally is, made with
+# create_vm(paged_memory=COMPAT_TRUE). Memory is split into PAGE_SIZE byte
+# pages that are only allocated when something non-zero is written to them,
+# until then they read as zero from the shared ZERO_PAGE. So a vm that only
+# touches its code, a stack and a heap only costs those pages no matter how
+# large its memory is.
+#
+# Indexing and slicing (step 1) work like they do on the array, including
+# IndexError past the end and negative indexes counting back from it, so
+# outside_of_world, readin_bytes, writeout_bytes, the word accessors like
+# read_word32 and the LOAD and STORE instructions work unchanged. Every
+# access goes through a python method call though, so a vm with paged
+# memory runs slower than one without.
+
+from array import array
+
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+
+PAGE_SHIFT = 12
+PAGE_SIZE = 1<<PAGE_SHIFT
+PAGE_MASK = PAGE_SIZE-1
+
+# read from by every page that hasn't been written to, never written to
+ZERO_PAGE = array(ARRAY_TYPE_UNSIGNED_CHAR, (0,))*PAGE_SIZE
+
+class PagedMemory(object):
+    __slots__ = ('size', 'pages')
+
+    def __init__(self, size=0):
+        self.size = size
+        # page number -> array of PAGE_SIZE bytes
+        self.pages = {}
+
+    def __len__(self):
+        return self.size
+
+    def check_index(self, index):
+        if index<0:
+            index += self.size
+        if index<0 or index>=self.size:
+            raise IndexError("array index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.get_slice(index)
+        index = self.check_index(index)
+        page = self.pages.get(index>>PAGE_SHIFT)
+        if page==None:
+            return 0
+        return page[index & PAGE_MASK]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.set_slice(index, value)
+            return
+        index = self.check_index(index)
+        page_number = index>>PAGE_SHIFT
+        page = self.pages.get(page_number)
+        if page==None:
+            if value==0:
+                return
+            page = self.allocate_page(page_number)
+        page[index & PAGE_MASK] = value
+
+    def allocate_page(self, page_number):
+        page = ZERO_PAGE[:]
+        self.pages[page_number] = page
+        return page
+
+    def page_chunks(self, start, stop):
+        # (page number, start in page, end in page) covering start to stop
+        chunks = []
+        while start<stop:
+            page_number = start>>PAGE_SHIFT
+            page_start = start & PAGE_MASK
+            page_end = min(PAGE_SIZE, page_start + stop - start)
+            chunks.append( (page_number, page_start, page_end) )
+            start += page_end - page_start
+        return chunks
+
+    def get_slice(self, index):
+        start, stop, step = index.indices(self.size)
+        if step!=1:
+            return array(ARRAY_TYPE_UNSIGNED_CHAR,
+                         [ self[i] for i in range(start, stop, step) ] )
+        page_start = start & PAGE_MASK
+        if start<stop and page_start + stop - start <= PAGE_SIZE:
+            # all in one page, like the instructions read_instruction_fast
+            # slices out
+            return self.pages.get(start>>PAGE_SHIFT, ZERO_PAGE)[
+                page_start:page_start + stop - start]
+        result = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        for page_number, page_start, page_end in \
+                self.page_chunks(start, stop):
+            result.extend(
+                self.pages.get(page_number, ZERO_PAGE)[page_start:page_end])
+        return result
+
+    def set_slice(self, index, values):
+        start, stop, step = index.indices(self.size)
+        if not isinstance(values, array):
+            values = array(ARRAY_TYPE_UNSIGNED_CHAR, values)
+        if step!=1:
+            positions = range(start, stop, step)
+            if len(values)!=len(positions):
+                raise ValueError(
+                    "attempt to assign array of size %d to extended slice "
+                    "of size %d" % (len(values), len(positions)) )
+            for i, value in zip(positions, values):
+                self[i] = value
+            return
+        if len(values)!=max(stop-start, 0):
+            raise ValueError("paged memory can't be resized by assigning "
+                             "to a slice of it")
+        position = 0
+        for page_number, page_start, page_end in \
+                self.page_chunks(start, stop):
+            chunk = values[position:position + page_end - page_start]
+            position += page_end - page_start
+            page = self.pages.get(page_number)
+            if page==None:
+                if chunk==ZERO_PAGE[page_start:page_end]:
+                    continue
+                page = self.allocate_page(page_number)
+            page[page_start:page_end] = chunk
+
+    def grow(self, size):
+        # nothing is allocated, the new pages read as zero
+        if self.size<size:
+            self.size = size
+
+    def tofile(self, fd):
+        for page_number, page_start, page_end in \
+                self.page_chunks(0, self.size):
+            page = self.pages.get(page_number, ZERO_PAGE)
+            page[page_start:page_end].tofile(fd)
+
+    def allocated_size(self):
+        return len(self.pages)*PAGE_SIZE
@@ -0,0 +1,209 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_PROFILE, the interpreter with every instruction function wrapped to
+# count how many times it runs and how long it takes, by the instruction
+# strings found in the knightdecode EVAL_*_TABLE_STRING tables and
+# HAL_CODES_TABLE_STRING. HAL calls also count the bytes read and written
+# on each tape.
+#
+# The counting is done by the eval tables this engine builds for itself,
+# so the other engines don't pay anything for it. Results are kept in
+# vm.profile (a Profile) across runs, and profile_report_lines or
+# profile_as_json make something to print from them, like
+# knightvm_minimal.py --profile does.
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE, perf_timer
+from constants import \
+    RAW, NEXTIP, HAL_CODE, HAL_CODE_OP, HAL_CODE_FGETC, HAL_CODE_FPUTC, \
+    HAL_IO_DATA_REGISTER, HAL_IO_DEVICE_REGISTER, HAL_IO_DEVICE_STDIO
+from knightdecode import \
+    read_instruction_fast, lookup_instruction_str, \
+    make_eval_tables_for_register_size, make_opcode_dispatch_list, \
+    eval_nop_halt_or_illegal, eval_HALCODE, get_hal_codes_table, \
+    outside_of_world_exit, instruction_not_implemented, \
+    check_run_stop_conditions, get_run_stop_perf_count, run_stop_reason
+from knightdecodeutil import OutsideOfWorldException
+
+TAPE_NAMES = {
+    0x00001100: "tape_01",
+    0x00001101: "tape_02",
+    HAL_IO_DEVICE_STDIO: "stdio",
+}
+
+class Profile(object):
+    __slots__ = ('counts', 'times', 'tape_reads', 'tape_writes', 'run_time')
+
+    def __init__(self):
+        # instruction string -> times run
+        self.counts = {}
+        # instruction string -> seconds spent in the instruction function
+        self.times = {}
+        # tape name -> bytes read or written by FGETC and FPUTC
+        self.tape_reads = {}
+        self.tape_writes = {}
+        # seconds spent in run, including decoding and dispatch
+        self.run_time = 0.0
+
+    def record(self, instruction_str, elapsed):
+        self.counts[instruction_str] = self.counts.get(instruction_str, 0) + 1
+        self.times[instruction_str] = \
+            self.times.get(instruction_str, 0.0) + elapsed
+
+def get_profile(vm):
+    if vm.profile==None:
+        vm.profile = Profile()
+    return vm.profile
+
+def get_tape_name(io_device):
+    return TAPE_NAMES.get(io_device, "0x%X" % io_device)
+
+def make_profiled_instruction(instruction_str, instruction_func):
+    # an instruction_wrapper for make_eval_tables_for_register_size
+    def profiled_instruction(vm, mem, register_file, *operands):
+        start_time = perf_timer()
+        next_ip = instruction_func(vm, mem, register_file, *operands)
+        vm.profile.record(instruction_str, perf_timer() - start_time)
+        return next_ip
+    return profiled_instruction
+
+def profiled_eval_HALCODE(vm, c):
+    hal_codes_table = get_hal_codes_table()
+    if c[HAL_CODE] not in hal_codes_table:
+        return eval_HALCODE(vm, c) # reports the illegal HAL code
+    hal_func, instruction_str = hal_codes_table[c[HAL_CODE]]
+    profile = vm.profile
+    start_time = perf_timer()
+    hal_func(vm)
+    profile.record(instruction_str, perf_timer() - start_time)
+
+    if c[HAL_CODE] == HAL_CODE_FGETC:
+        # FGETC leaves -1 in the data register at end of file
+        if not vm.reg[HAL_IO_DATA_REGISTER] >> (vm.reg.itemsize*8-1):
+            tape_name = get_tape_name(vm.reg[HAL_IO_DEVICE_REGISTER])
+            profile.tape_reads[tape_name] = \
+                profile.tape_reads.get(tape_name, 0) + 1
+    elif c[HAL_CODE] == HAL_CODE_FPUTC:
+        tape_name = get_tape_name(vm.reg[HAL_IO_DEVICE_REGISTER])
+        profile.tape_writes[tape_name] = \
+            profile.tape_writes.get(tape_name, 0) + 1
+    return c[NEXTIP]
+
+def make_run_for_registersize(registersizebits):
+    EVAL_TABLE = make_eval_tables_for_register_size(
+        registersizebits, instruction_wrapper=make_profiled_instruction)
+    EVAL_TABLE[HAL_CODE_OP] = profiled_eval_HALCODE
+    OPCODE_DISPATCH = make_opcode_dispatch_list(EVAL_TABLE)
+
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        profile = get_profile(vm)
+        run_start_time = perf_timer()
+        try:
+            while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                   not (until_halt and vm.halted) ):
+                c = read_instruction_fast(vm)
+                vm.perf_count += 1
+                decode_and_eval = OPCODE_DISPATCH[c[RAW][0]]
+                if decode_and_eval==None:
+                    # NOP and HALT, illegal instructions exit
+                    instruction_str = lookup_instruction_str(c)
+                    start_time = perf_timer()
+                    eval_nop_halt_or_illegal(vm, c, halt_print=halt_print)
+                    profile.record(instruction_str,
+                                   perf_timer() - start_time)
+                else:
+                    next_ip = decode_and_eval(vm, c)
+                    if next_ip==None:
+                        instruction_not_implemented(vm, c)
+                    vm.ip = next_ip
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        profile.run_time += perf_timer() - run_start_time
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
+
+def make_read_and_eval_for_registersize(registersizebits):
+    run = make_run_for_registersize(registersizebits)
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        run(vm, max_steps=1, until_halt=COMPAT_FALSE, halt_print=halt_print)
+        return vm
+    return read_and_eval
+
+# Reports
+
+def profile_items(profile):
+    # (instruction string, count, seconds) tuples, most time first, then
+    # most runs. Sorted decorated rather than with sort(key=), which needs
+    # python 2.4
+    decorated = [ (-profile.times[instruction_str], -count, instruction_str)
+                  for instruction_str, count in profile.counts.items() ]
+    decorated.sort()
+    return [ (instruction_str, -negative_count, -negative_elapsed)
+             for negative_elapsed, negative_count, instruction_str
+             in decorated ]
+
+def profile_report_lines(profile):
+    items = profile_items(profile)
+    instruction_time = 0.0
+    instruction_count = 0
+    for instruction_str, count, elapsed in items:
+        instruction_time += elapsed
+        instruction_count += count
+
+    lines = ["%-14s %12s %12s %10s %7s" % (
+        "instruction", "count", "total ms", "ns each", "% time")]
+    for instruction_str, count, elapsed in items:
+        if instruction_time > 0:
+            percent = 100*elapsed/instruction_time
+        else:
+            percent = 0.0
+        lines.append("%-14s %12d %12.3f %10.0f %7.2f" % (
+            instruction_str, count, elapsed*1000, elapsed*1e9/count,
+            percent) )
+    lines.append(
+        "%d instructions in %.3fs, %.3fs of that in instruction functions" %
+        (instruction_count, profile.run_time, instruction_time) )
+
+    tape_names = list(profile.tape_reads.keys())
+    for tape_name in profile.tape_writes.keys():
+        if tape_name not in profile.tape_reads:
+            tape_names.append(tape_name)
+    tape_names.sort()
+    for tape_name in tape_names:
+        lines.append("%s: %d bytes read, %d bytes written" % (
+            tape_name, profile.tape_reads.get(tape_name, 0),
+            profile.tape_writes.get(tape_name, 0) ) )
+    return lines
+
+def profile_as_dict(profile):
+    return {
+        "run_time": profile.run_time,
+        "instructions": [
+            {"instruction": instruction_str, "count": count,
+             "time": elapsed}
+            for instruction_str, count, elapsed in profile_items(profile) ],
+        "tape_reads": profile.tape_reads,
+        "tape_writes": profile.tape_writes,
+    }
+
+def profile_as_json(profile):
+    from json import dumps # python 2.6 and later
+    return dumps(profile_as_dict(profile), indent=2, sort_keys=COMPAT_TRUE)
@@ -0,0 +1,182 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Saving a vm made by knightdecode.create_vm to a file and making a new one
+# from it later, so a rom doesn't have to be run all the way up to an
+# interesting point again.
+#
+# A snapshot file starts with SNAPSHOT_MAGIC, a one byte version and a
+# 4 byte big endian length of the JSON header that follows it. The header
+# has the registers, ip, perf count, halted and exception flags, tape
+# filenames and, for tapes that are open, their mode and position. The
+# memory image comes after, starting at a multiple of
+# mmap.ALLOCATIONGRANULARITY so restore(path, mmap_memory=COMPAT_TRUE) can
+# map it (copy on write) instead of reading it in.
+#
+# stdin and stdout aren't saved, restore takes them like create_vm does.
+# Decoded instruction caches, profiles and traces aren't saved either.
+#
+# snapshot and restore need python 2.6 or later for the json module, the
+# rest of this module imports on older pythons
+
+from array import array
+from struct import pack, unpack, calcsize
+from sys import stdin
+from os.path import exists
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+from knightdecode import create_vm, grow_memory
+from knightpagedmemory import PAGE_SIZE
+from knighttape import TapeDevice, get_tape_filename
+
+SNAPSHOT_MAGIC = "KSNP".encode('ascii')
+ZERO_BYTE = "\0".encode('ascii')
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PREFIX_FORMAT = ">4sBI"
+
+# tape indexes in vm.tapefd and the vm attributes with their filenames
+SNAPSHOT_TAPES = ( (0, 'tape1filename'), (1, 'tape2filename') )
+
+def get_memory_offset(header_end):
+    # the first multiple of mmap.ALLOCATIONGRANULARITY at or after
+    # the end of the header
+    from mmap import ALLOCATIONGRANULARITY
+    return header_end + (
+        (ALLOCATIONGRANULARITY - header_end % ALLOCATIONGRANULARITY) %
+        ALLOCATIONGRANULARITY)
+
+def get_tape_state(tape_fd):
+    # None for a tape that isn't open, otherwise [mode, position]
+    if tape_fd==None or tape_fd.closed:
+        return None
+    if 'r' in tape_fd.mode and '+' not in tape_fd.mode:
+        return ['rb', tape_fd.tell()]
+    # make sure what was written so far is in the file the snapshot
+    # refers to
+    tape_fd.flush()
+    return ['wb', tape_fd.tell()]
+
+def get_snapshot_tape_filename(vm, filename_attr):
+    # only tapes on disk can be found again by restore
+    filename = get_tape_filename(getattr(vm, filename_attr))
+    if filename==None:
+        raise Exception("only tapes that are files can be in a snapshot")
+    return filename
+
+def snapshot(vm, path):
+    from json import dumps # python 2.6 and later
+    header = {
+        'registersize': vm.reg.itemsize*8,
+        'registers': vm.reg.tolist(),
+        'ip': vm.ip,
+        'perf_count': vm.perf_count,
+        'halted': bool(vm.halted),
+        'exception': bool(vm.exception),
+        'tapes': [ [get_snapshot_tape_filename(vm, filename_attr),
+                    get_tape_state(vm.tapefd[tapeindex])]
+                   for tapeindex, filename_attr in SNAPSHOT_TAPES ],
+        'memory_size': len(vm.mem),
+    }
+    header_bytes = dumps(header, sort_keys=COMPAT_TRUE).encode('ascii')
+    prefix = pack(SNAPSHOT_PREFIX_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                  len(header_bytes) )
+    header_end = len(prefix) + len(header_bytes)
+    padding = get_memory_offset(header_end) - header_end
+
+    fd = open(path, 'wb')
+    fd.write(prefix)
+    fd.write(header_bytes)
+    fd.write(ZERO_BYTE*padding)
+    if isinstance(vm.mem, memoryview):
+        # memory from restore(mmap_memory=COMPAT_TRUE)
+        fd.write(vm.mem)
+    else: # an array or a knightpagedmemory.PagedMemory
+        vm.mem.tofile(fd)
+    fd.close()
+
+def read_snapshot_header(fd):
+    # returns the header and the offset of the memory image
+    from json import loads # python 2.6 and later
+    prefix_size = calcsize(SNAPSHOT_PREFIX_FORMAT)
+    magic, version, header_length = unpack(
+        SNAPSHOT_PREFIX_FORMAT, fd.read(prefix_size) )
+    if magic!=SNAPSHOT_MAGIC or version!=SNAPSHOT_VERSION:
+        raise Exception("not a version %d knightpies snapshot" %
+                        SNAPSHOT_VERSION)
+    header = loads(fd.read(header_length).decode('ascii'))
+    return header, get_memory_offset(prefix_size + header_length)
+
+def reopen_tape(filename, tape_state):
+    # a knighttape.TapeDevice like FOPEN_READ and FOPEN_WRITE make
+    mode, position = tape_state
+    if mode=='rb':
+        tape_fd = open(filename, 'rb')
+    elif exists(filename):
+        # anything written after the snapshot was taken is thrown out
+        tape_fd = open(filename, 'r+b')
+        tape_fd.seek(position)
+        tape_fd.truncate()
+    else:
+        tape_fd = open(filename, 'wb')
+        tape_fd.write(ZERO_BYTE*position)
+    tape_fd.seek(position)
+    return TapeDevice(tape_fd, mode)
+
+def restore(path, stdin=stdin, stdout=None, mmap_memory=COMPAT_FALSE,
+            paged_memory=COMPAT_FALSE):
+    # with mmap_memory, vm.mem is a memoryview of a copy on write mapping
+    # of the snapshot file, it can't be grown with grow_memory
+    #
+    # with paged_memory, vm.mem is a knightpagedmemory.PagedMemory like
+    # create_vm(paged_memory=COMPAT_TRUE) makes, only pages of the image
+    # that aren't all zero are allocated
+    fd = open(path, 'rb')
+    header, memory_offset = read_snapshot_header(fd)
+    tapes = header['tapes']
+    vm = create_vm(size=0, registersize=header['registersize'],
+                   tapefile1=tapes[0][0], tapefile2=tapes[1][0],
+                   stdin=stdin, stdout=stdout, paged_memory=paged_memory)
+    for i, register_value in enumerate(header['registers']):
+        vm.reg[i] = register_value
+    vm.ip = header['ip']
+    vm.perf_count = header['perf_count']
+    vm.halted = header['halted'] and COMPAT_TRUE or COMPAT_FALSE
+    vm.exception = header['exception'] and COMPAT_TRUE or COMPAT_FALSE
+    for tapeindex, filename_attr in SNAPSHOT_TAPES:
+        tape_state = tapes[tapeindex][1]
+        if tape_state!=None:
+            vm.tapefd[tapeindex] = reopen_tape(
+                getattr(vm, filename_attr), tape_state)
+
+    memory_size = header['memory_size']
+    if mmap_memory and memory_size>0:
+        from mmap import mmap, ACCESS_COPY
+        vm.mem = memoryview(mmap(fd.fileno(), memory_size,
+                                 offset=memory_offset, access=ACCESS_COPY))
+    elif paged_memory:
+        fd.seek(memory_offset)
+        grow_memory(vm, memory_size)
+        for page_start in range(0, memory_size, PAGE_SIZE):
+            page = array(ARRAY_TYPE_UNSIGNED_CHAR)
+            page.fromfile(fd, min(PAGE_SIZE, memory_size-page_start))
+            vm.mem[page_start:page_start+len(page)] = page
+    else:
+        fd.seek(memory_offset)
+        vm.mem = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        vm.mem.fromfile(fd, memory_size)
+    fd.close()
+    return vm
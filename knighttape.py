@@ -0,0 +1,308 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# TapeDevice, what FOPEN_READ and FOPEN_WRITE put in vm.tapefd for the two
+# tapes instead of the file they get from the tape's backend. FGETC takes bytes from a
+# TAPE_READ_BUFFER_SIZE buffer refilled with one read of the file and FPUTC
+# adds them to a buffer written out in one go once it's
+# TAPE_WRITE_BUFFER_SIZE bytes, or on FCLOSE, REWIND, FSEEK and HALT, so a
+# rom going through a tape a byte at a time doesn't cost a file read or
+# write call per byte.
+#
+# The parts of the file object interface used outside of the HAL code
+# (mode, closed, tell, seek, flush, close) work like they do on the file,
+# taking the buffered bytes into account.
+#
+# The tapefile1 and tapefile2 arguments of create_vm can be a filename or
+# one of the tape backends below, each has an open_tape(mode) that
+# FOPEN_READ ('rb') and FOPEN_WRITE ('wb') call for the file like object
+# (read, write, seek, tell, flush, close and closed) the TapeDevice uses
+#
+# FileTapeBackend, a file on disk, what a filename is turned into
+# MemoryTapeBackend, bytes in memory, getvalue() has what was written
+# CallbackTapeBackend, read and write functions the bytes go through
+
+from array import array
+
+from os.path import exists
+
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+from pythoncompat import \
+    array_frombytes, array_tobytes, COMPAT_TRUE, COMPAT_FALSE
+
+TAPE_READ_BUFFER_SIZE = 1<<16
+TAPE_WRITE_BUFFER_SIZE = 1<<16
+
+# the tape io devices and their indexes in vm.tapefd
+TAPE_INDEXES = {
+    0x00001100: 0,
+    0x00001101: 1,
+}
+
+class TapeDevice(object):
+    __slots__ = ('fd', 'mode', 'read_buffer', 'read_position',
+                 'write_buffer')
+
+    def __init__(self, fd, mode):
+        self.fd = fd
+        self.mode = mode
+        self.read_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        # index of the next byte getc returns in read_buffer
+        self.read_position = 0
+        self.write_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+
+    def getc(self):
+        # the next byte or -1 at the end of the tape
+        read_position = self.read_position
+        if read_position==len(self.read_buffer):
+            if not self.fill_read_buffer():
+                return -1
+            read_position = 0
+        self.read_position = read_position + 1
+        return self.read_buffer[read_position]
+
+    def fill_read_buffer(self):
+        self.flush_write_buffer()
+        read_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        array_frombytes(read_buffer, self.fd.read(TAPE_READ_BUFFER_SIZE))
+        self.read_buffer = read_buffer
+        self.read_position = 0
+        return len(read_buffer)>0
+
+    def putc(self, byte):
+        if self.read_position!=len(self.read_buffer):
+            self.discard_read_buffer()
+        write_buffer = self.write_buffer
+        write_buffer.append(byte)
+        if len(write_buffer)>=TAPE_WRITE_BUFFER_SIZE:
+            self.flush_write_buffer()
+
+    def discard_read_buffer(self):
+        # put the file back where the next byte getc would have returned is
+        unread = len(self.read_buffer) - self.read_position
+        if unread>0:
+            self.fd.seek(-unread, 1)
+        self.read_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        self.read_position = 0
+
+    def flush_write_buffer(self):
+        if len(self.write_buffer)>0:
+            self.fd.write(array_tobytes(self.write_buffer))
+            self.write_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+
+    def flush(self):
+        self.flush_write_buffer()
+        self.fd.flush()
+
+    def tell(self):
+        return (self.fd.tell() - (len(self.read_buffer)-self.read_position)
+                + len(self.write_buffer) )
+
+    def seek(self, offset, whence=0):
+        self.flush_write_buffer()
+        self.discard_read_buffer()
+        self.fd.seek(offset, whence)
+
+    def close(self):
+        self.flush_write_buffer()
+        # like discard_read_buffer without the seek, so getc reads from the
+        # closed file rather than returning what was left buffered
+        self.read_buffer = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        self.read_position = 0
+        self.fd.close()
+
+    def get_closed(self):
+        return self.fd.closed
+    closed = property(get_closed)
+
+def flush_tapes(vm):
+    # write out what FPUTC has buffered for the tapes
+    for tapeindex in TAPE_INDEXES.values():
+        tape = vm.tapefd[tapeindex]
+        if tape!=None and not tape.closed:
+            tape.flush()
+
+class TapeBackend(object):
+    # subclasses provide open_tape(mode), the rest can be left as is
+    def open_tape(self, mode):
+        raise Exception("%s must provide open_tape" % self.get_name())
+
+    def exists(self):
+        # FOPEN_READ exits the vm when this is false
+        return COMPAT_TRUE
+
+    def get_name(self):
+        # for error messages
+        return self.__class__.__name__
+
+class FileTapeBackend(TapeBackend):
+    def __init__(self, filename):
+        self.filename = filename
+
+    def open_tape(self, mode):
+        return open(self.filename, mode)
+
+    def exists(self):
+        return exists(self.filename)
+
+    def get_name(self):
+        return self.filename
+
+class MemoryTapeFile(object):
+    # what MemoryTapeBackend.open_tape returns, everything written goes
+    # straight into the backend's data
+    def __init__(self, backend, position=0):
+        self.backend = backend
+        self.position = position
+        self.closed = COMPAT_FALSE
+
+    def check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed tape")
+
+    def read(self, size=-1):
+        self.check_closed()
+        data = self.backend.data
+        if size<0:
+            end = len(data)
+        else:
+            end = min(len(data), self.position + size)
+        result = array_tobytes(data[self.position:end])
+        self.position = max(self.position, end)
+        return result
+
+    def write(self, data_bytes):
+        self.check_closed()
+        data = self.backend.data
+        if self.position>len(data): # seeked past the end
+            data.extend(array(ARRAY_TYPE_UNSIGNED_CHAR, (0,))*
+                        (self.position-len(data)) )
+        written = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        array_frombytes(written, data_bytes)
+        data[self.position:self.position+len(written)] = written
+        self.position += len(written)
+
+    def seek(self, offset, whence=0):
+        self.check_closed()
+        if whence==1:
+            offset += self.position
+        elif whence==2:
+            offset += len(self.backend.data)
+        if offset<0:
+            raise IOError("seek before the start of a memory tape")
+        self.position = offset
+
+    def tell(self):
+        self.check_closed()
+        return self.position
+
+    def truncate(self, size=None):
+        self.check_closed()
+        if size==None:
+            size = self.position
+        del self.backend.data[size:]
+
+    def flush(self):
+        self.check_closed()
+
+    def close(self):
+        self.closed = COMPAT_TRUE
+
+class MemoryTapeBackend(TapeBackend):
+    # data can be a bytes, bytearray or memoryview, FOPEN_WRITE starts it
+    # over empty
+    def __init__(self, data=None):
+        self.data = array(ARRAY_TYPE_UNSIGNED_CHAR)
+        if data!=None:
+            array_frombytes(self.data, data)
+
+    def open_tape(self, mode):
+        if 'w' in mode:
+            del self.data[:]
+        return MemoryTapeFile(self)
+
+    def getvalue(self):
+        # what's on the tape, write buffers in the TapeDevice are flushed
+        # when the vm halts or the tape is closed
+        return array_tobytes(self.data)
+
+class CallbackTapeFile(object):
+    # what CallbackTapeBackend.open_tape returns
+    def __init__(self, backend):
+        self.backend = backend
+        self.position = 0
+        self.closed = COMPAT_FALSE
+
+    def read(self, size=-1):
+        if self.backend.read_func==None:
+            raise IOError("tape has no read callback")
+        data = self.backend.read_func(size)
+        self.position += len(data)
+        return data
+
+    def write(self, data):
+        if self.backend.write_func==None:
+            raise IOError("tape has no write callback")
+        self.backend.write_func(data)
+        self.position += len(data)
+
+    def seek(self, offset, whence=0):
+        if self.backend.seek_func==None:
+            raise IOError("tape has no seek callback")
+        self.position = self.backend.seek_func(offset, whence)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.backend.close_func!=None:
+            self.backend.close_func()
+        self.closed = COMPAT_TRUE
+
+class CallbackTapeBackend(TapeBackend):
+    # read_func(size) returns up to size bytes (all that are left for a
+    # negative size) and an empty bytes at the end, write_func(data) takes
+    # the bytes written
+    #
+    # seek_func(offset, whence) is optional, it returns the new position
+    # like tell would, without it REWIND and FSEEK raise IOError.
+    # close_func() is called on FCLOSE
+    def __init__(self, read_func=None, write_func=None, seek_func=None,
+                 close_func=None):
+        self.read_func = read_func
+        self.write_func = write_func
+        self.seek_func = seek_func
+        self.close_func = close_func
+
+    def open_tape(self, mode):
+        return CallbackTapeFile(self)
+
+def get_tape_backend(tape):
+    # tape is a filename or a TapeBackend
+    if isinstance(tape, TapeBackend):
+        return tape
+    return FileTapeBackend(tape)
+
+def get_tape_filename(tape):
+    # the filename of a tape on disk, None for any other tape
+    if isinstance(tape, FileTapeBackend):
+        return tape.filename
+    elif isinstance(tape, TapeBackend):
+        return None
+    return tape
@@ -22,6 +22,7 @@ from io import StringIO, BytesIO
 from hex0tobin import write_binary_filefd_from_hex0_filefd
 from knightdecode import create_vm
 from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from knighttape import MemoryTapeBackend
 from constants import MEM
 
 from .stage0 import STAGE_0_MONITOR_HEX_FILEPATH
@@ -46,10 +47,7 @@ class CommonHexFuzzTest(TestHexKnightExecuteCommonSetup):
     test_size = 1024*256
 
     def setUp(self):
-        # TestHexKnightExecuteCommonSetup does not provide setUp()
-        self.setup_stack_and_tmp_files()
-
-        self.random_source = copy(self.random_source_orig)
+        self.setup_fuzz( copy(self.random_source_orig) )
 
         self.input_bytes = StringIO()
         self.python_output_bytes = BytesIO()
@@ -60,9 +58,13 @@ class CommonHexFuzzTest(TestHexKnightExecuteCommonSetup):
         self.encode_input_bytes_w_python_implementation()
         self.input_bytes.seek(0)
 
-    def tearDown(self):
-        # TestHexKnightExecuteCommonSetup does not provide tearDown()
-        self.remove_tmp_files()
+    def setup_fuzz(self, random_source):
+        # the part of setUp before the input is generated, knighttests/
+        # parallelfuzz.py calls this on its own with a random_source for
+        # each shard
+        # TestHexKnightExecuteCommonSetup does not provide setUp()
+        self.setup_stack_and_tapes()
+        self.random_source = random_source
 
     def get_end_of_memory(self):
         return self.stack_end
@@ -71,42 +73,36 @@ class CommonHexFuzzTest(TestHexKnightExecuteCommonSetup):
         self.input_encode_python_implementation(
             self.input_bytes, self.python_output_bytes)
 
-    def write_random_input_to_file(self, filename):
-        with open(filename, 'w') as randominputfile:
-            self.input_bytes.seek(0)
-            for c in self.input_bytes:
-                randominputfile.write(c)
-            self.input_bytes.seek(0)
+    def get_random_input_tape(self):
+        return MemoryTapeBackend(self.input_bytes.getvalue().encode('ascii'))
 
     def execute_fuzz_test(self):
         vm = create_vm(
             size=0, registersize=self.registersize,
-            tapefile1=self.get_tape1_file_path(),
-            tapefile2=self.tape_02_temp_file_path,
+            tapefile1=self.get_tape1(),
+            tapefile2=self.tape_02,
             stdin=self.get_stdin_for_vm(self.input_bytes),
             stdout=BytesIO(),
         )
         self.load_encoding_rom(vm)
         grow_memory(vm, self.get_end_of_memory())
-        execute_vm(vm, optimize=self.optimize, halt_print=False)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=self.engine)
 
     def test_output_match(self):
         self.execute_fuzz_test()
-        with open(self.get_output_file_path(), 'rb') as tape_file:
-            tape_out = tape_file.read()
-            py_out = self.python_output_bytes.getvalue()
-            self.assertEqual(
-                tape_out,
-                py_out,
-            )
+        self.assertEqual(
+            self.get_output_tape().getvalue(),
+            self.python_output_bytes.getvalue(),
+        )
 
-    def get_tape1_file_path(self):
-        return self.tape_01_temp_file_path
+    def get_tape1(self):
+        return self.tape_01
 
 class CommonStage1Fuzz(CommonHexFuzzTest, CommonStage1HexEncode):
     def setUp(self):
         CommonHexFuzzTest.setUp(self)
-        self.write_random_input_to_file(self.tape_01_temp_file_path)
+        self.tape_01 = self.get_random_input_tape()
 
-    def get_tape1_file_path(self):
-        return CommonHexFuzzTest.get_tape1_file_path(self)
+    def get_tape1(self):
+        return CommonHexFuzzTest.get_tape1(self)
@@ -17,18 +17,17 @@
 from unittest import TestCase
 from io import BytesIO
 from hashlib import sha256
-from os import unlink
 
 from knightdecode import create_vm
+from knighttape import MemoryTapeBackend
 from knightvm_minimal import load_hex_program, grow_memory, execute_vm
 from stage0dir import get_stage0_file, get_stage0_test_sha256sum
-from constants import MEM
+from constants import MEM, ENGINE_INTERPRETER
 
 from .stage0 import (
     STAGE_0_MONITOR_HEX_FILEPATH, STAGE_0_MONITOR_RELATIVE_PATH,
     STAGE_0_HEX0_ASSEMBLER_RELATIVE_PATH, STAGE_0_HEX0_ASSEMBLER_FILEPATH,
     )
-from .util import get_closed_named_temp_file
 
 STACK_START = 0x600
 STACK_SIZE = 8
@@ -76,15 +75,12 @@ class TestHexKnightExecuteCommonSetup:
     registersize = 32
     stack_size_multiplier = 1
     optimize = False
+    engine = ENGINE_INTERPRETER
 
-    def setup_stack_and_tmp_files(self):
+    def setup_stack_and_tapes(self):
         self.stack_end = STACK_START+STACK_SIZE*self.stack_size_multiplier
-        self.tape_01_temp_file_path = get_closed_named_temp_file()
-        self.tape_02_temp_file_path = get_closed_named_temp_file()
-
-    def remove_tmp_files(self):
-        unlink(self.tape_01_temp_file_path)
-        unlink(self.tape_02_temp_file_path)
+        self.tape_01 = MemoryTapeBackend()
+        self.tape_02 = MemoryTapeBackend()
 
     def load_encoding_rom(self, vm):
         with open(self.encoding_rom_filename) as encoding_rom_file:
@@ -95,11 +91,10 @@ class TestHexKnightExecuteCommonSetup:
 class TestHexKnightExecuteCommon(HexCommon, TestHexKnightExecuteCommonSetup):
     def setUp(self):
         HexCommon.setUp(self)
-        self.setup_stack_and_tmp_files()
+        self.setup_stack_and_tapes()
 
     def tearDown(self):
         HexCommon.tearDown(self)
-        self.remove_tmp_files()
 
     def get_end_of_memory(self):
         return self.stack_end
@@ -108,9 +103,7 @@ class TestHexKnightExecuteCommon(HexCommon, TestHexKnightExecuteCommonSetup):
         return open(primary_input_file_path, 'rb')
 
     def generate_bytes_from_output(self):
-        with open(self.get_output_file_path(), 'rb') as output_file_fd:
-            output_bytes = output_file_fd.read()
-        return output_bytes
+        return self.get_output_tape().getvalue()
 
     def execute_test_hex_load(self, stage0hexfile, sha256hex):
         output_mem_buffer = BytesIO()
@@ -119,8 +112,8 @@ class TestHexKnightExecuteCommon(HexCommon, TestHexKnightExecuteCommonSetup):
 
             vm = create_vm(
                 size=0, registersize=self.registersize,
-                tapefile1=self.get_tape1_file_path(input_file_fd),
-                tapefile2=self.tape_02_temp_file_path,
+                tapefile1=self.get_tape1(input_file_fd),
+                tapefile2=self.tape_02,
                 stdin=self.get_stdin_for_vm(input_file_fd),
                 stdout=output_mem_buffer,
             )
@@ -128,7 +121,8 @@ class TestHexKnightExecuteCommon(HexCommon, TestHexKnightExecuteCommonSetup):
             self.assertEqual( self.encoding_rom_binary.getbuffer(),
                               vm[MEM].tobytes() )
             grow_memory(vm, self.get_end_of_memory())
-            execute_vm(vm, optimize=self.optimize, halt_print=False)
+            execute_vm(vm, optimize=self.optimize, halt_print=False,
+                       engine=self.engine)
 
         checksum_hex = sha256(
             self.generate_bytes_from_output() ).hexdigest()
@@ -147,11 +141,11 @@ class TestHexKnightExecuteCommon(HexCommon, TestHexKnightExecuteCommonSetup):
         
 class CommonStage1HexEncode:
     encoding_rom_filename = STAGE_0_HEX0_ASSEMBLER_FILEPATH
-    def get_tape1_file_path(self, input_file_fd):
+    def get_tape1(self, input_file_fd):
         return input_file_fd.name
 
     def get_stdin_for_vm(self, input_file_fd):
         return BytesIO()
 
-    def get_output_file_path(self):
-        return self.tape_02_temp_file_path
+    def get_output_tape(self):
+        return self.tape_02
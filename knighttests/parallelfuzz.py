@@ -0,0 +1,226 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs the fuzz tests (test_hex0_fuzz, test_hex1_fuzz, test_hex2_fuzz)
+# split into many shards across a multiprocessing pool instead of one big
+# corpus run serially. Each shard's input comes from its own Random seeded
+# from (seed, shard index), so any shard can be run again on its own with
+# run_fuzz_shard or regenerated with get_fuzz_shard_input. Tapes are
+# knighttape.MemoryTapeBackend and roms are decoded once per worker.
+#
+# run_fuzz returns the failing shards, the input of the first (lowest
+# index) is written to failure_dir along with what the vm and the python
+# implementation made of it.
+#
+# to invoke, run
+# $ python3 -m knighttests.parallelfuzz $Kind [--seed $Seed] [--shards N]
+#   [--shard-size N] [--workers N] [--failure-dir $Dir]
+#   [--register-size N] [--engine $Engine]
+# where $Kind is one of the FUZZ_KINDS
+
+from sys import stderr, exit
+from io import StringIO, BytesIO
+from os.path import join as path_join
+from array import array
+
+from pythoncompat import print_func, COMPAT_TRUE, COMPAT_FALSE
+from constants import \
+    ARRAY_TYPE_UNSIGNED_CHAR, ENGINE_INTERPRETER, EXIT_SUCCESS, EXIT_FAILURE
+from knightdecode import create_vm
+from knighttape import MemoryTapeBackend, flush_tapes
+from knightvm_minimal import \
+    load_rom_bytes, grow_memory, execute_vm, get_flag_values, \
+    get_list_flag, int_flag_value
+
+from .fuzzcommon import get_random_for_str, CommonStage1Fuzz
+from .test_hex0_fuzz import \
+    Hex0FuzzTest, Hex0FuzzTestAssembler1, TapeHex0FuzzTest
+from .test_hex1_fuzz import Hex1FuzzTest
+from .test_hex2_fuzz import Hex2FuzzTest
+
+# the fuzz test classes are only used for their input generators, roms and
+# python implementations, their tests aren't run
+FUZZ_KINDS = {
+    'hex0-monitor': Hex0FuzzTest,
+    'hex0': Hex0FuzzTestAssembler1,
+    'hex1': Hex1FuzzTest,
+    'hex2': Hex2FuzzTest,
+    'tape-hex0': TapeHex0FuzzTest,
+}
+
+DEFAULT_SEED = "What's GNU? Gnu's Not Unix!"
+DEFAULT_SHARD_COUNT = 64
+
+# fuzz kind -> rom bytes, per process
+FUZZ_ROM_CACHE = {}
+
+def get_fuzz_test(kind, seed, shard):
+    fuzz_test = FUZZ_KINDS[kind]('test_output_match')
+    fuzz_test.setup_fuzz( get_random_for_str("%s/%d" % (seed, shard)) )
+    return fuzz_test
+
+def get_default_shard_size(kind):
+    # hex1 and hex2 can't go past their test_size because of the 16 bit
+    # relative offsets, see test_hex1_fuzz
+    return FUZZ_KINDS[kind].test_size
+
+def get_fuzz_shard_input(kind, seed, shard, shard_size=None):
+    if shard_size==None:
+        shard_size = get_default_shard_size(kind)
+    fuzz_test = get_fuzz_test(kind, seed, shard)
+    return fuzz_test.get_n_representative_tokens_byte_encoded(
+        shard_size) + '\n'
+
+def get_fuzz_rom(kind, fuzz_test):
+    rom = FUZZ_ROM_CACHE.get(kind)
+    if rom==None:
+        rom_file = open(fuzz_test.encoding_rom_filename)
+        rom = array(ARRAY_TYPE_UNSIGNED_CHAR,
+                    fuzz_test.int_bytes_from_rom_encode_file(rom_file) )
+        rom_file.close()
+        FUZZ_ROM_CACHE[kind] = rom
+    return rom
+
+def run_fuzz_shard(kind, seed, shard, shard_size=None, registersize=32,
+                   engine=ENGINE_INTERPRETER, optimize=COMPAT_TRUE):
+    # returns (shard, passed, vm output, python implementation output)
+    if shard_size==None:
+        shard_size = get_default_shard_size(kind)
+    fuzz_test = get_fuzz_test(kind, seed, shard)
+    input_text = fuzz_test.get_n_representative_tokens_byte_encoded(
+        shard_size) + '\n'
+    python_output = BytesIO()
+    fuzz_test.input_encode_python_implementation(
+        StringIO(input_text), python_output)
+
+    input_bytes = input_text.encode('ascii')
+    if isinstance(fuzz_test, CommonStage1Fuzz):
+        # input on tape_01, output on tape_02
+        tapes = (MemoryTapeBackend(input_bytes), MemoryTapeBackend())
+        stdin, output_tape = BytesIO(), tapes[1]
+    else: # the monitor reads stdin and writes tape_01
+        tapes = (MemoryTapeBackend(), MemoryTapeBackend())
+        stdin, output_tape = BytesIO(input_bytes), tapes[0]
+    vm = create_vm(size=0, registersize=registersize,
+                   tapefile1=tapes[0], tapefile2=tapes[1],
+                   stdin=stdin, stdout=BytesIO())
+    load_rom_bytes(vm, get_fuzz_rom(kind, fuzz_test))
+    grow_memory(vm, fuzz_test.get_end_of_memory())
+    try:
+        execute_vm(vm, optimize=optimize, halt_print=COMPAT_FALSE,
+                   engine=engine)
+    except SystemExit: # outside of the world
+        pass
+    flush_tapes(vm)
+    vm_output = output_tape.getvalue()
+    return (shard, vm_output==python_output.getvalue(),
+            vm_output, python_output.getvalue())
+
+def run_fuzz_shard_star(args):
+    return run_fuzz_shard(*args)
+
+def write_failure(failure_dir, kind, seed, shard, shard_size,
+                  vm_output, python_output):
+    # returns the path the input was written to
+    prefix = path_join(failure_dir, "%s-shard%d" % (kind, shard))
+    input_path = prefix + ".input"
+    for path, content in (
+            (input_path,
+             get_fuzz_shard_input(kind, seed, shard, shard_size).encode(
+                 'ascii') ),
+            (prefix + ".vm_output", vm_output),
+            (prefix + ".python_output", python_output) ):
+        f = open(path, 'wb')
+        f.write(content)
+        f.close()
+    return input_path
+
+def run_fuzz(kind, seed=DEFAULT_SEED, shards=DEFAULT_SHARD_COUNT,
+             shard_size=None, workers=None, failure_dir=None,
+             registersize=32, engine=ENGINE_INTERPRETER,
+             optimize=COMPAT_TRUE):
+    # returns the sorted failing shard indexes and the path the first
+    # failing shard's input was written to (None without failure_dir or
+    # failures), workers like knightbatch.run_batch
+    shard_args = [ (kind, seed, shard, shard_size, registersize, engine,
+                    optimize)
+                   for shard in range(shards) ]
+    if workers==1:
+        results = map(run_fuzz_shard_star, shard_args)
+        pool = None
+    else:
+        from multiprocessing import Pool
+        pool = Pool(workers)
+        results = pool.imap_unordered(run_fuzz_shard_star, shard_args)
+
+    try:
+        failures = {}
+        for shard, passed, vm_output, python_output in results:
+            if not passed:
+                failures[shard] = (vm_output, python_output)
+    finally:
+        if pool!=None:
+            pool.terminate()
+            pool.join()
+
+    failed_shards = sorted(failures.keys())
+    failure_path = None
+    if failure_dir!=None and len(failed_shards)>0:
+        first_shard = failed_shards[0]
+        vm_output, python_output = failures[first_shard]
+        failure_path = write_failure(failure_dir, kind, seed, first_shard,
+                                     shard_size, vm_output, python_output)
+    return failed_shards, failure_path
+
+def main(args):
+    if len(args)<2 or args[1] not in FUZZ_KINDS:
+        print_func("Usage: %s $Kind [--seed $Seed] [--shards N] "
+                   "[--shard-size N] [--workers N] [--failure-dir $Dir] "
+                   "[--register-size N] [--engine $Engine]" % args[0],
+                   file=stderr)
+        print_func("Where $Kind is one of %s" %
+                   ", ".join(sorted(FUZZ_KINDS.keys())), file=stderr)
+        exit(EXIT_FAILURE)
+    kind = args[1]
+    flags = args[2:]
+    seed = get_flag_values(flags, "--seed", 1)
+    engine = get_flag_values(flags, "--engine", 1)
+    failure_dir = get_flag_values(flags, "--failure-dir", 1)
+    failed_shards, failure_path = run_fuzz(
+        kind,
+        seed=seed==None and DEFAULT_SEED or seed[0],
+        shards=get_list_flag(flags, "--shards", [DEFAULT_SHARD_COUNT],
+                             int_flag_value)[0],
+        shard_size=get_list_flag(flags, "--shard-size", [None],
+                                 int_flag_value)[0],
+        workers=get_list_flag(flags, "--workers", [None], int_flag_value)[0],
+        failure_dir=failure_dir==None and "." or failure_dir[0],
+        registersize=get_list_flag(flags, "--register-size", [32],
+                                   int_flag_value)[0],
+        engine=engine==None and ENGINE_INTERPRETER or engine[0])
+    if len(failed_shards)==0:
+        print_func("all shards passed")
+        exit(EXIT_SUCCESS)
+    print_func("%d shard(s) failed: %s" %
+               (len(failed_shards),
+                " ".join(str(shard) for shard in failed_shards) ) )
+    print_func("input of shard %d written to %s" %
+               (failed_shards[0], failure_path) )
+    exit(EXIT_FAILURE)
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
@@ -0,0 +1,55 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# programs and engines shared by the tests
+
+from os.path import dirname, join as path_join
+
+from constants import \
+    MEM, ENGINE_INTERPRETER, ENGINE_DECODE_CACHE, ENGINE_BLOCKS, \
+    ENGINE_FUSION, ENGINE_PROFILE, ENGINE_TRACE, ENGINE_TRUSTED
+from knightdecode import create_vm
+
+TAPE_HEX0_ASSEMBLER_FILEPATH = path_join(
+    dirname(__file__), 'tape_hex0_assembler.hex0')
+TAPE_HEX0_ASSEMBLER_MEMORY = 0x240
+
+ENGINES = (ENGINE_INTERPRETER, ENGINE_DECODE_CACHE, ENGINE_BLOCKS,
+           ENGINE_FUSION, ENGINE_PROFILE, ENGINE_TRACE, ENGINE_TRUSTED)
+
+COUNT_DOWN_LOOP = (
+    'E0002D21000A' # LOADUI R1 10
+    'E10011110001' # :loop SUBUI R1 R1 1
+    'E0002CA1FFF4' # JUMP.NZ R1 @loop
+    'FFFFFFFF'     # HALT
+)
+
+SELF_MODIFYING = (
+    '0D000022'     # FALSE R2
+    'E1000F000001' # :loop ADDUI R0 R0 1
+    'E0002CA20014' # JUMP.NZ R2 @done
+    '0D000032'     # TRUE R2
+    'E0002D230005' # LOADUI R3 5
+    'E10021340009' # STORE8 R3 R4 9 ; the immediate of ADDUI above
+    '3C00FFE0'     # JUMP @loop
+    'FFFFFFFF'     # :done HALT
+)
+
+def make_vm_from_hex(program_hex, registersize=32):
+    # a vm with exactly the program in memory, no room to grow
+    vm = create_vm(size=0, registersize=registersize)
+    vm[MEM].frombytes( bytes.fromhex(program_hex) )
+    return vm
@@ -15,9 +15,8 @@
 # along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
 
 from unittest import TestCase, skipIf
-from io import BytesIO
+from io import BytesIO, StringIO
 from hashlib import sha256
-from tempfile import NamedTemporaryFile
 
 from knightvm_minimal import grow_memory, execute_vm
 from constants import MEM
@@ -30,6 +29,7 @@ from hex2tobin import (
     )
 from M1tobin import M1_files_objs_to_bin
 from pythoncompat import open_ascii
+from knighttape import MemoryTapeBackend
 
 from .hexcommon import (
     Hex256SumMatch, HexCommon, Encoding_rom_256_Common,
@@ -199,16 +199,6 @@ class TestStage1M0Assemble(CommonStage1HexEncode, TestHexKnightExecuteCommon):
     rom_encode_func = staticmethod(write_binary_filefd_from_hex2_filefd)
     int_bytes_from_rom_encode_file = staticmethod(int_bytes_from_hex2_fd)
 
-    def setUp(self):
-        # TestHexKnightExecuteCommon is the only superclass with setUp()
-        TestHexKnightExecuteCommon.setUp(self)
-        self.concat_input_file_fd = NamedTemporaryFile('wb', delete=True)
-
-    def tearDown(self):
-        # TestHexKnightExecuteCommon is the only superclass with tearDown()
-        TestHexKnightExecuteCommon.tearDown(self)
-        self.concat_input_file_fd.close()
-
     def get_end_of_memory(self):
         # start of heap seen in M0-macro.s
         start_of_heap = 0x4000
@@ -220,21 +210,22 @@ class TestStage1M0Assemble(CommonStage1HexEncode, TestHexKnightExecuteCommon):
         # pick the larger of the above two
         return max(start_of_heap+minimum_heap_size, end_of_memory)
 
-    def get_tape1_file_path(self, input_file_fd):
-        return self.concat_input_file_fd.name
+    def get_tape1(self, input_file_fd):
+        return MemoryTapeBackend(input_file_fd.getvalue())
 
     def generate_input_fd(self, primary_input_file_path):
+        concat_input_file_fd = BytesIO()
         with open(KNIGHT_DEFS_FILE, 'rb') as kdf:
-            self.concat_input_file_fd.write( kdf.read() )
+            concat_input_file_fd.write( kdf.read() )
 
         with open(primary_input_file_path, 'rb') as input_file_fd:
-            self.concat_input_file_fd.write( input_file_fd.read() )
-            self.concat_input_file_fd.seek(0)
-        return self.concat_input_file_fd
+            concat_input_file_fd.write( input_file_fd.read() )
+        return concat_input_file_fd
 
     def generate_bytes_from_output(self):
         outputbin = BytesIO()
-        with open(self.get_output_file_path(), 'r') as tape_file:
+        with StringIO(self.get_output_tape().getvalue().decode('ascii')) \
+             as tape_file:
             write_binary_filefd_from_hex2_filefd(tape_file,
                                                  outputbin)
             outputbin.flush()
@@ -0,0 +1,82 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from io import BytesIO, StringIO
+from hashlib import sha256
+from random import Random
+from string import hexdigits
+
+from hex0tobin import write_binary_filefd_from_hex0_filefd
+from constants import STOP_HALTED, STOP_MAX_STEPS
+from knightbatch import make_batch_job, run_batch, ROM_CACHE
+from .programs import TAPE_HEX0_ASSEMBLER_FILEPATH
+
+JOB_COUNT = 6
+
+def hex0_to_bytes(input_text):
+    output = BytesIO()
+    write_binary_filefd_from_hex0_filefd(StringIO(input_text), output)
+    return output.getvalue()
+
+class BatchTests(TestCase):
+    def setUp(self):
+        random_source = Random(JOB_COUNT)
+        self.inputs = [
+            ''.join( random_source.choice(hexdigits + " \n")
+                     for j in range(64*(i+1)) )
+            for i in range(JOB_COUNT) ]
+
+    def make_jobs(self, **kargs):
+        return [ make_batch_job(
+            TAPE_HEX0_ASSEMBLER_FILEPATH, rom_hex=True,
+            tape1=input_text.encode('ascii'), memory_size=0x240,
+            name=i, **kargs)
+                 for i, input_text in enumerate(self.inputs) ]
+
+    def check_results(self, results):
+        self.assertEqual(sorted(result['index'] for result in results),
+                         list(range(JOB_COUNT)) )
+        for result in results:
+            self.assertEqual(result['stop_reason'], STOP_HALTED)
+            self.assertEqual(result['name'], result['index'])
+            self.assertEqual(result['tapes'][1],
+                             hex0_to_bytes(self.inputs[result['index']]) )
+
+    def test_in_process(self):
+        ROM_CACHE.clear()
+        self.check_results(list(run_batch(self.make_jobs(), workers=1)))
+        self.assertEqual(len(ROM_CACHE), 1)
+
+    def test_pool(self):
+        self.check_results(list(run_batch(self.make_jobs(), workers=2)))
+
+    def test_hash_output_and_max_steps(self):
+        results = list(run_batch(
+            self.make_jobs(hash_output=True, max_steps=10), workers=1))
+        for result in results:
+            self.assertEqual(result['stop_reason'], STOP_MAX_STEPS)
+            self.assertEqual(result['count'], 10)
+            self.assertEqual(result['tape_hashes'][1],
+                             sha256(b"").hexdigest() )
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_batch
+    # or
+    # $ ./runtestmodule.py knighttests/test_batch.py
+    from unittest import main
+    main()
@@ -0,0 +1,189 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from os import unlink
+
+from array import array
+
+from constants import ENGINE_INTERPRETER, ARRAY_TYPE_UNSIGNED_CHAR
+from knightdecode import \
+    create_vm, read_and_decode_instruction, lookup_instruction_str
+from benchmarks.runner import \
+    run_case, run_benchmarks, compare_results, write_results, read_results
+from benchmarks.instructions import \
+    INSTRUCTION_ENCODINGS, encode_instruction, get_benchmark_operands, \
+    make_loop_rom, run_loop_rom, run_instruction_benchmarks, \
+    find_slower_optimized
+from benchmarks.dispatch import run_dispatch_benchmarks
+from benchmarks.startup import run_startup_benchmarks
+from benchmarks.importtime import \
+    parse_importtime, get_module_imports, time_import, \
+    compare_import_results
+from .util import get_closed_named_temp_file
+
+def make_result(instructions_per_second, peak_rss_kib, correct=True):
+    return {'name': 'tape_hex0_assembler', 'registersize': 32,
+            'optimize': True, 'engine': ENGINE_INTERPRETER,
+            'instructions_per_second': instructions_per_second,
+            'peak_rss_kib': peak_rss_kib, 'correct': correct}
+
+class BenchmarkTests(TestCase):
+    def test_run_case_correct(self):
+        result = run_case(
+            ('tape_hex0_assembler', 32, True, ENGINE_INTERPRETER, 1) )
+        self.assertTrue(result['correct'])
+        self.assertTrue(result['instructions']>0)
+        self.assertTrue(result['wall_time']>0)
+
+    def test_run_benchmarks(self):
+        results = list(run_benchmarks(case_names=['tape_hex0_assembler'],
+                                      register_sizes=(16,)))
+        self.assertEqual([ result['optimize'] for result in results ],
+                         [False, True])
+        self.assertTrue(all(result['correct'] for result in results))
+
+    def test_compare(self):
+        baseline = [make_result(1000.0, 100)]
+        self.assertEqual(
+            compare_results([make_result(950.0, 105)], baseline), [])
+        self.assertEqual(
+            len(compare_results([make_result(800.0, 100)], baseline)), 1)
+        self.assertEqual(
+            len(compare_results([make_result(1000.0, 200)], baseline)), 1)
+        self.assertEqual(
+            len(compare_results([make_result(1000.0, 100, False)],
+                                baseline)), 1)
+
+    def test_json_round_trip(self):
+        path = get_closed_named_temp_file()
+        try:
+            write_results([make_result(1000.0, None)], path)
+            self.assertEqual(read_results(path), [make_result(1000.0, None)])
+        finally:
+            unlink(path)
+
+class DispatchBenchmarkTests(TestCase):
+    def test_run_dispatch_benchmarks(self):
+        results = list(run_dispatch_benchmarks(
+            case_names=['tape_hex0_assembler'], register_sizes=(16,)))
+        self.assertEqual([ result['dispatch'] for result in results ],
+                         ['lookup tables', 'dispatch lists'])
+        self.assertTrue(all(result['correct'] for result in results))
+        self.assertEqual(results[0]['instructions'],
+                         results[1]['instructions'])
+
+class StartupBenchmarkTests(TestCase):
+    def test_run_startup_benchmarks(self):
+        results = list(run_startup_benchmarks(repeat=1))
+        self.assertEqual(
+            [ (result['memory'], result['startup'])
+              for result in results ],
+            [('64KiB', 'hex rom'), ('64KiB', 'binary rom'),
+             ('64KiB', 'append loop'),
+             ('2MiB', 'hex rom'), ('2MiB', 'binary rom'),
+             ('2MiB', 'append loop'),
+             ('64MiB', 'hex rom'), ('64MiB', 'binary rom')] )
+
+def make_instruction_result(name, optimize, ns_per_instruction):
+    return {'name': name, 'registersize': 32, 'optimize': optimize,
+            'engine': ENGINE_INTERPRETER, 'implemented': True,
+            'ns_per_instruction': ns_per_instruction}
+
+class InstructionBenchmarkTests(TestCase):
+    def test_encodings_decode(self):
+        for mnemonic in INSTRUCTION_ENCODINGS.keys():
+            registers, immediate = get_benchmark_operands(mnemonic)
+            vm = create_vm(size=0)
+            vm.mem.extend(array(ARRAY_TYPE_UNSIGNED_CHAR, encode_instruction(
+                mnemonic, registers, immediate) + [0, 0]) )
+            c = read_and_decode_instruction(vm, 0)
+            self.assertEqual(lookup_instruction_str(c), mnemonic)
+
+    def test_loop_rom_counts(self):
+        for mnemonic, copies_run in ( (None, 0), ('ADD', 8),
+                                      ('CMPSKIPI_E', 4), # skips every other
+                                      ('CMPSKIPI_NE', 8) ):
+            rom, end_of_memory = make_loop_rom(mnemonic, 3, 8)
+            for registersize in (16, 32, 64):
+                wall_time, instructions = run_loop_rom(
+                    rom, end_of_memory, registersize, True,
+                    ENGINE_INTERPRETER, 1)
+                # five LOADUI and HALT, LOADUI, SUBUI and JUMP.NZ a loop
+                self.assertEqual(instructions, 6 + 3*(3 + copies_run))
+
+    def test_run_instruction_benchmarks(self):
+        results = list(run_instruction_benchmarks(
+            ['ADD', 'OR'], register_sizes=(32,), loops=2,
+            copies_per_loop=4, repeat=1))
+        self.assertEqual(
+            [ (result['name'], result.get('optimize'), result['implemented'])
+              for result in results ],
+            [('ADD', False, True), ('ADD', True, True), ('OR', None, False)])
+        self.assertEqual(results[0]['instructions'], 8)
+
+    def test_find_slower_optimized(self):
+        results = [ make_instruction_result('ADD', False, 100.0),
+                    make_instruction_result('ADD', True, 105.0),
+                    make_instruction_result('SUB', False, 100.0),
+                    make_instruction_result('SUB', True, 150.0) ]
+        slower = find_slower_optimized(results)
+        self.assertEqual(len(slower), 1)
+        self.assertEqual(slower[0][0]['name'], 'SUB')
+
+IMPORTTIME_OUTPUT = '''import time: self [us] | cumulative | imported package
+import time:       100 |        100 | site
+import time:        20 |         20 |     constants
+import time:        30 |         50 |   pythoncompat
+import time:       200 |        250 | knightdecode
+'''
+
+def make_import_result(import_us, wall_time=0.02):
+    return {'name': 'knightdecode', 'import_us': import_us,
+            'wall_time': wall_time, 'slowest': []}
+
+class ImportTimeBenchmarkTests(TestCase):
+    def test_parse_importtime(self):
+        imports = parse_importtime(IMPORTTIME_OUTPUT)
+        self.assertEqual(imports[0], ('site', 100, 100, 1))
+        self.assertEqual(
+            [ name for name, self_us, cumulative_us, depth in
+              get_module_imports(imports, 'knightdecode') ],
+            ['constants', 'pythoncompat', 'knightdecode'])
+        self.assertEqual(get_module_imports(imports, 'knightbatch'), [])
+
+    def test_time_import(self):
+        result = time_import('knightdecode', 1)
+        self.assertEqual(result['name'], 'knightdecode')
+        self.assertTrue(result['wall_time']>0)
+
+    def test_compare(self):
+        baseline = [make_import_result(1000)]
+        self.assertEqual(compare_import_results(
+            [make_import_result(1050)], baseline), [])
+        self.assertEqual(len(compare_import_results(
+            [make_import_result(1500)], baseline)), 1)
+        self.assertEqual(len(compare_import_results(
+            [make_import_result(None, 0.05)],
+            [make_import_result(None, 0.02)])), 1)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_benchmarks
+    # or
+    # $ ./runtestmodule.py knighttests/test_benchmarks.py
+    from unittest import main
+    main()
@@ -0,0 +1,78 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import \
+    REG, IP, PERF_COUNT, ENGINE_INTERPRETER, ENGINE_BLOCKS
+from knightdecode import InstructionNotImplemented
+from knightvm_minimal import execute_vm
+from .programs import COUNT_DOWN_LOOP, SELF_MODIFYING, make_vm_from_hex
+from .util import make_optimize_and_register_size_variations
+
+NOT_IMPLEMENTED_AFTER_SKIP = (
+    'E0002D200001' # LOADUI R0 1
+    'E000A0200001' # CMPSKIPI.E R0 1
+    'E0002D200005' # LOADUI R0 5
+    '05021200'     # OR R2 R0 R0 ; not implemented
+    'FFFFFFFF'     # HALT
+)
+
+class BlockTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def run_program(self, program_hex, engine=ENGINE_BLOCKS):
+        self.vm = make_vm_from_hex(program_hex, self.registersize)
+        execute_vm(self.vm, optimize=self.optimize, halt_print=False,
+                   engine=engine)
+
+    def test_loop(self):
+        self.run_program(COUNT_DOWN_LOOP)
+        self.assertEqual(self.vm[REG][1], 0)
+        self.assertEqual(self.vm[PERF_COUNT], 22)
+        # the block at the start and the loop body, HALT isn't translated
+        self.assertEqual(self.vm.block_cache.translations, 2)
+
+    def test_write_invalidates(self):
+        self.run_program(SELF_MODIFYING)
+        # ADDUI R0 R0 1 the first time, ADDUI R0 R0 5 the second time
+        self.assertEqual(self.vm[REG][0], 6)
+
+    def test_exception_leaves_vm_like_interpreter(self):
+        for engine in (ENGINE_INTERPRETER, ENGINE_BLOCKS):
+            vm = make_vm_from_hex(NOT_IMPLEMENTED_AFTER_SKIP,
+                                  self.registersize)
+            with self.assertRaises(InstructionNotImplemented):
+                execute_vm(vm, optimize=self.optimize, halt_print=False,
+                           engine=engine)
+            self.assertEqual(vm[IP], 18, engine)
+            self.assertEqual(vm[PERF_COUNT], 3, engine)
+
+(BlockTests32Optimize,
+ BlockTests64,
+ BlockTests64Optimize,
+ BlockTests16,
+ BlockTests16Optimize,
+) = make_optimize_and_register_size_variations(BlockTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_blocks
+    # or
+    # $ ./runtestmodule.py knighttests/test_blocks.py
+    from unittest import main
+    main()
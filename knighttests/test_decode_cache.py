@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import REG, PERF_COUNT, ENGINE_DECODE_CACHE
+from knightvm_minimal import execute_vm
+from .programs import COUNT_DOWN_LOOP, SELF_MODIFYING, make_vm_from_hex
+from .util import make_optimize_and_register_size_variations
+
+class DecodeCacheTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def run_program(self, program_hex):
+        self.vm = make_vm_from_hex(program_hex, self.registersize)
+        execute_vm(self.vm, optimize=self.optimize, halt_print=False,
+                   engine=ENGINE_DECODE_CACHE)
+
+    def test_loop_hits(self):
+        self.run_program(COUNT_DOWN_LOOP)
+        self.assertEqual(self.vm[REG][1], 0)
+        self.assertEqual(self.vm[PERF_COUNT], 22)
+        # SUBUI and JUMP.NZ are decoded once, then re-used 9 times each
+        self.assertEqual(self.vm.decode_cache.hits, 18)
+        self.assertEqual(self.vm.decode_cache.misses, 4)
+
+    def test_write_invalidates(self):
+        self.run_program(SELF_MODIFYING)
+        # ADDUI R0 R0 1 the first time, ADDUI R0 R0 5 the second time
+        self.assertEqual(self.vm[REG][0], 6)
+
+(DecodeCacheTests32Optimize,
+ DecodeCacheTests64,
+ DecodeCacheTests64Optimize,
+ DecodeCacheTests16,
+ DecodeCacheTests16Optimize,
+) = make_optimize_and_register_size_variations(DecodeCacheTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_decode_cache
+    # or
+    # $ ./runtestmodule.py knighttests/test_decode_cache.py
+    from unittest import main
+    main()
@@ -0,0 +1,135 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from array import array
+
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+from knightdecode import create_vm
+from knightinstructions import writeout_bytes, write_word32
+from knightdirtymemory import \
+    DIRTY_PAGE_SIZE, DirtyTrackingMemory, DirtyTrackingPagedMemory, \
+    get_dirty_pages, get_dirty_ranges, clear_dirty_pages
+from knighttape import MemoryTapeBackend
+from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from .programs import \
+    ENGINES, TAPE_HEX0_ASSEMBLER_FILEPATH, TAPE_HEX0_ASSEMBLER_MEMORY
+from .util import make_optimize_and_register_size_variations
+
+INPUT_TEXT = b"41 42 # comment\n43 44\n45 ; another\n46 47 48\n"
+
+MEMORY_SIZE = DIRTY_PAGE_SIZE*8
+
+class DirtyMemoryTests(TestCase):
+    def make_vm(self, paged_memory=False):
+        return create_vm(size=MEMORY_SIZE, dirty_tracking=True,
+                         paged_memory=paged_memory)
+
+    def test_memory_types(self):
+        self.assertEqual(type(self.make_vm().mem), DirtyTrackingMemory)
+        self.assertEqual(type(self.make_vm(paged_memory=True).mem),
+                         DirtyTrackingPagedMemory)
+        self.assertEqual(type(create_vm(size=MEMORY_SIZE).mem), array)
+
+    def test_starts_clean(self):
+        for paged_memory in (False, True):
+            vm = self.make_vm(paged_memory)
+            self.assertEqual(len(vm.mem), MEMORY_SIZE)
+            self.assertEqual(get_dirty_pages(vm), [])
+
+    def test_writes_mark_pages(self):
+        for paged_memory in (False, True):
+            vm = self.make_vm(paged_memory)
+            vm.mem[5] = 1
+            # crosses from page 2 into page 3
+            write_word32(vm.mem, DIRTY_PAGE_SIZE*3-2, 0x01020304)
+            writeout_bytes(vm.mem, DIRTY_PAGE_SIZE*6, 0xFF, 2)
+            self.assertEqual(get_dirty_pages(vm), [0, 2, 3, 6])
+            self.assertEqual(
+                get_dirty_ranges(vm),
+                [(0, DIRTY_PAGE_SIZE),
+                 (DIRTY_PAGE_SIZE*2, DIRTY_PAGE_SIZE*4),
+                 (DIRTY_PAGE_SIZE*6, DIRTY_PAGE_SIZE*7)] )
+            clear_dirty_pages(vm)
+            self.assertEqual(get_dirty_pages(vm), [])
+            self.assertEqual(vm.mem[DIRTY_PAGE_SIZE*3+1], 0x04)
+
+    def test_slice_and_negative_index(self):
+        vm = self.make_vm()
+        vm.mem[DIRTY_PAGE_SIZE-1:DIRTY_PAGE_SIZE+1] = \
+            array(ARRAY_TYPE_UNSIGNED_CHAR, (1, 2))
+        vm.mem[-1] = 3
+        self.assertEqual(get_dirty_pages(vm), [0, 1, 7])
+
+    def test_out_of_range_write_marks_nothing(self):
+        vm = self.make_vm()
+        def write_past_end():
+            vm.mem[MEMORY_SIZE] = 1
+        self.assertRaises(IndexError, write_past_end)
+        self.assertEqual(get_dirty_pages(vm), [])
+
+class DirtyMemoryEngineTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def run_engine(self, engine, dirty_tracking):
+        # returns the vm and its memory before it ran
+        vm = create_vm(size=0, registersize=self.registersize,
+                       tapefile1=MemoryTapeBackend(INPUT_TEXT),
+                       tapefile2=MemoryTapeBackend(),
+                       dirty_tracking=dirty_tracking)
+        load_hex_program(vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(vm, TAPE_HEX0_ASSEMBLER_MEMORY)
+        memory_before = vm.mem.tobytes()
+        if dirty_tracking:
+            self.assertEqual(get_dirty_pages(vm), [0, 1]) # the rom
+            clear_dirty_pages(vm)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=engine)
+        return vm, memory_before
+
+    def test_engines_match_and_track_writes(self):
+        reference_vm, memory_before = self.run_engine(ENGINES[0], False)
+        changed_pages = sorted(set(
+            i//DIRTY_PAGE_SIZE
+            for i, (before, after) in enumerate(zip(
+                    bytearray(memory_before),
+                    bytearray(reference_vm.mem.tobytes())))
+            if before!=after ))
+        self.assertTrue(len(changed_pages)>0)
+        for engine in ENGINES:
+            vm, memory_before = self.run_engine(engine, True)
+            self.assertEqual(vm.mem.tobytes(), reference_vm.mem.tobytes(),
+                             engine)
+            dirty_pages = get_dirty_pages(vm)
+            self.assertTrue(set(changed_pages) <= set(dirty_pages), engine)
+            # the assembler only writes to its stack, after the rom
+            self.assertTrue(0 not in dirty_pages, engine)
+
+(DirtyMemoryEngineTests32Optimize,
+ DirtyMemoryEngineTests64,
+ DirtyMemoryEngineTests64Optimize,
+ DirtyMemoryEngineTests16,
+ DirtyMemoryEngineTests16Optimize,
+) = make_optimize_and_register_size_variations(DirtyMemoryEngineTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_dirty_memory
+    # or
+    # $ ./runtestmodule.py knighttests/test_dirty_memory.py
+    from unittest import main
+    main()
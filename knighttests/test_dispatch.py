@@ -0,0 +1,104 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import RAW
+from knightdecode import (
+    create_vm, read_instruction, make_eval_tables_for_register_size,
+    lookup_instruction_str, DECODE_TABLE,
+    EVAL_4OP_INT_TABLE_STRING, EVAL_3OP_INT_TABLE_STRING,
+    EVAL_2OP_INT_TABLE_STRING, EVAL_1OP_INT_TABLE_STRING,
+    EVAL_2OPI_INT_TABLE_STRING, EVAL_1OPI_INT_TABLE_STRING,
+    )
+
+# turn a table key back into instruction bytes, the registers and
+# immediate are arbitrary
+def encode_4OP(key):
+    return (0x01, key, 0x12, 0x34)
+
+def encode_3OP(key):
+    return (0x05, key>>4, ((key & 0xF)<<4) | 0x1, 0x23)
+
+def encode_2OP(key):
+    return (0x09, key>>8, key & 0xFF, 0x12)
+
+def encode_1OP(key):
+    return (0x0D, key>>12, (key>>4) & 0xFF, ((key & 0xF)<<4) | 0x1)
+
+def encode_2OPI(key):
+    return (0xE1, 0x00, key, 0x12, 0x00, 0x04)
+
+def encode_1OPI(key):
+    return (0xE0, 0x00, key>>4, ((key & 0xF)<<4) | 0x1, 0x00, 0x04)
+
+INSTRUCTION_CLASSES = (
+    (EVAL_4OP_INT_TABLE_STRING, encode_4OP),
+    (EVAL_3OP_INT_TABLE_STRING, encode_3OP),
+    (EVAL_2OP_INT_TABLE_STRING, encode_2OP),
+    (EVAL_1OP_INT_TABLE_STRING, encode_1OP),
+    (EVAL_2OPI_INT_TABLE_STRING, encode_2OPI),
+    (EVAL_1OPI_INT_TABLE_STRING, encode_1OPI),
+    ({0x00: "JUMP"}, lambda key: (0x3C, key, 0x00, 0x04) ),
+)
+
+def return_instruction_str(instruction_str, instruction_func):
+    def instruction_str_instead(vm, mem, register_file, *operands):
+        return instruction_str
+    return instruction_str_instead
+
+class DispatchTests(TestCase):
+    registersize = 32
+
+    def decode(self, instruction_bytes):
+        vm = create_vm(size=0, registersize=self.registersize)
+        vm.mem.fromlist(list(instruction_bytes))
+        c = read_instruction(vm)
+        return vm, DECODE_TABLE[c[RAW][0]](vm, c)
+
+    def check_every_instruction(self, dispatch_lists):
+        EVAL_TABLE = make_eval_tables_for_register_size(
+            self.registersize, instruction_wrapper=return_instruction_str,
+            dispatch_lists=dispatch_lists)
+        for table_string, encode in INSTRUCTION_CLASSES:
+            for key, instruction_str in table_string.items():
+                vm, c = self.decode(encode(key))
+                self.assertEqual(
+                    EVAL_TABLE[c[RAW][0]](vm, c), instruction_str)
+                self.assertEqual(lookup_instruction_str(c), instruction_str)
+
+    def test_dispatch_lists(self):
+        self.check_every_instruction(True)
+
+    def test_lookup_tables(self):
+        self.check_every_instruction(False)
+
+    def test_decode_table_matches_eval_tables(self):
+        # every opcode that decodes has an eval function, knightdecode
+        # used to check this at import
+        for registersizebits in (0, 16, 32, 64):
+            self.assertEqual(
+                sorted(DECODE_TABLE.keys()),
+                sorted(make_eval_tables_for_register_size(
+                    registersizebits).keys()) )
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_dispatch
+    # or
+    # $ ./runtestmodule.py knighttests/test_dispatch.py
+    from unittest import main
+    main()
@@ -0,0 +1,88 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from io import BytesIO, StringIO
+from random import Random
+from string import hexdigits, printable
+
+from hex0tobin import write_binary_filefd_from_hex0_filefd
+from knightdecode import create_vm
+from knighttape import MemoryTapeBackend
+from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from constants import ENGINE_INTERPRETER
+
+from .programs import \
+    ENGINES, TAPE_HEX0_ASSEMBLER_FILEPATH, TAPE_HEX0_ASSEMBLER_MEMORY
+from .util import make_optimize_and_register_size_variations
+
+class EngineTests(TestCase):
+    registersize = 32
+    optimize = False
+    input_size = 1024*2
+
+    def setUp(self):
+        random_source = Random(self.input_size)
+        self.input_text = ''.join(
+            random_source.choice(hexdigits*3 + printable)
+            for i in range(self.input_size) )
+
+    def run_engine(self, engine):
+        tape_02 = MemoryTapeBackend()
+        vm = create_vm(
+            size=0, registersize=self.registersize,
+            tapefile1=MemoryTapeBackend(self.input_text.encode('ascii')),
+            tapefile2=tape_02)
+        load_hex_program(vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(vm, TAPE_HEX0_ASSEMBLER_MEMORY)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=engine)
+        return vm, tape_02.getvalue()
+
+    def test_output_matches_hex0tobin(self):
+        expected_output = BytesIO()
+        write_binary_filefd_from_hex0_filefd(
+            StringIO(self.input_text), expected_output)
+        for engine in ENGINES:
+            vm, output_bytes = self.run_engine(engine)
+            self.assertEqual(output_bytes, expected_output.getvalue(),
+                             engine)
+
+    def test_engines_finish_in_same_state(self):
+        reference_vm, reference_output = self.run_engine(ENGINE_INTERPRETER)
+        for engine in ENGINES[1:]:
+            vm, output_bytes = self.run_engine(engine)
+            self.assertEqual(vm.ip, reference_vm.ip, engine)
+            self.assertEqual(vm.perf_count, reference_vm.perf_count, engine)
+            self.assertEqual(vm.reg.tolist(), reference_vm.reg.tolist(),
+                             engine)
+            self.assertEqual(vm.mem.tobytes(), reference_vm.mem.tobytes(),
+                             engine)
+
+(EngineTests32Optimize,
+ EngineTests64,
+ EngineTests64Optimize,
+ EngineTests16,
+ EngineTests16Optimize,
+) = make_optimize_and_register_size_variations(EngineTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_engines
+    # or
+    # $ ./runtestmodule.py knighttests/test_engines.py
+    from unittest import main
+    main()
@@ -0,0 +1,66 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import OP, RAW, RESTOF, XOP, IMMEDIATE
+from knightdecode import (
+    create_vm, read_instruction, read_instruction_fast,
+    with_instruction_strings, string_unpacked_instruction,
+    DECODE_TABLE, FAST_DECODE_TABLE,
+    )
+from .test_dispatch import INSTRUCTION_CLASSES
+
+class FastDecodeTests(TestCase):
+    def make_vm(self, instruction_bytes):
+        vm = create_vm(size=0)
+        vm.mem.fromlist(list(instruction_bytes))
+        return vm
+
+    def test_fast_read_has_no_strings(self):
+        vm = self.make_vm( (0x05, 0x00, 0x01, 0x23) )
+        c = read_instruction_fast(vm)
+        self.assertEqual(c[OP], None)
+        self.assertEqual(c[RESTOF], None)
+        self.assertEqual(with_instruction_strings(c), read_instruction(vm))
+
+    def test_strings_match_full_decode(self):
+        for table_string, encode in INSTRUCTION_CLASSES:
+            for key in table_string.keys():
+                vm = self.make_vm(encode(key))
+                c_full = read_instruction(vm)
+                c_full = DECODE_TABLE[c_full[RAW][0]](vm, c_full)
+                c_fast = read_instruction_fast(vm)
+                c_fast = FAST_DECODE_TABLE[c_fast[RAW][0]](vm, c_fast)
+                self.assertEqual(c_fast[XOP], None)
+                self.assertEqual(c_fast[IMMEDIATE], None)
+                self.assertEqual(with_instruction_strings(c_fast), c_full)
+                self.assertEqual(string_unpacked_instruction(c_fast),
+                                 string_unpacked_instruction(c_full) )
+
+    def test_string_unpacked_instruction(self):
+        vm = self.make_vm( (0xE0, 0x00, 0x2D, 0x21, 0x00, 0x0A) )
+        self.assertEqual(
+            string_unpacked_instruction(read_instruction_fast(vm)),
+            "E0002D21")
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_fast_decode
+    # or
+    # $ ./runtestmodule.py knighttests/test_fast_decode.py
+    from unittest import main
+    main()
@@ -0,0 +1,125 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import \
+    REG, IP, PERF_COUNT, ENGINE_INTERPRETER, ENGINE_FUSION
+from knightdecode import InstructionNotImplemented
+from knightvm_minimal import execute_vm
+import knightfusion
+from .programs import COUNT_DOWN_LOOP, make_vm_from_hex
+from .util import make_optimize_and_register_size_variations
+
+# the JUMP.NZ target is changed while ADDUI and JUMP.NZ are fused
+SECOND_MODIFIED = (
+    '0D000022'     # FALSE R2
+    'E1000F000001' # :loop ADDUI R0 R0 1
+    'E0002CA20014' # JUMP.NZ R2 @done
+    '0D000032'     # TRUE R2
+    'E0002D230018' # LOADUI R3 0x18 ; offset of @add
+    'E1002134000F' # STORE8 R3 R4 0xF ; the offset of JUMP.NZ above
+    '3C00FFE0'     # JUMP @loop
+    'FFFFFFFF'     # :done HALT
+    'E1000F000010' # :add ADDUI R0 R0 0x10
+    'FFFFFFFF'     # HALT
+)
+
+# the second instruction of a fused pair isn't implemented
+NOT_IMPLEMENTED_SECOND = (
+    'E0002D200005' # LOADUI R0 5
+    '05021200'     # OR R2 R0 R0 ; not implemented
+    'FFFFFFFF'     # HALT
+)
+
+# CMPSKIPI.E skips the JUMP it is fused with the first time around
+SKIPPED_JUMP = (
+    'E0002D210001' # :loop LOADUI R1 1
+    'E000A0200000' # CMPSKIPI.E R0 0
+    '3C00000A'     # JUMP @done
+    'E0002D200001' # LOADUI R0 1
+    '3C00FFE6'     # JUMP @loop
+    'FFFFFFFF'     # :done HALT
+)
+
+class FusionTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def check_same_as_interpreter(self, program_hex):
+        vms = []
+        for engine in (ENGINE_INTERPRETER, ENGINE_FUSION):
+            vm = make_vm_from_hex(program_hex, self.registersize)
+            execute_vm(vm, optimize=self.optimize, halt_print=False,
+                       engine=engine)
+            vms.append(vm)
+        reference_vm, vm = vms
+        self.assertEqual(vm[IP], reference_vm[IP])
+        self.assertEqual(vm[PERF_COUNT], reference_vm[PERF_COUNT])
+        self.assertEqual(vm[REG].tolist(), reference_vm[REG].tolist())
+        return vm
+
+    def test_loop_is_fused(self):
+        vm = self.check_same_as_interpreter(COUNT_DOWN_LOOP)
+        # SUBUI R1 R1 1 and JUMP.NZ R1 @loop
+        self.assertNotEqual(vm.decode_cache.entries[6][2], None)
+        self.assertEqual(vm.decode_cache.hits, 9)
+
+    def test_skipped_jump(self):
+        vm = self.check_same_as_interpreter(SKIPPED_JUMP)
+        self.assertEqual(vm[PERF_COUNT], 8)
+
+    def test_write_to_second_invalidates(self):
+        vm = self.check_same_as_interpreter(SECOND_MODIFIED)
+        self.assertEqual(vm[REG][0], 0x12)
+
+    def test_exception_in_second(self):
+        for engine in (ENGINE_INTERPRETER, ENGINE_FUSION):
+            vm = make_vm_from_hex(NOT_IMPLEMENTED_SECOND, self.registersize)
+            if engine==ENGINE_FUSION:
+                if self.optimize:
+                    registersizebits = self.registersize
+                else:
+                    registersizebits = 0
+                run = knightfusion.make_run_for_registersize(
+                    registersizebits, fused_pairs=[("LOADUI", "OR")] )
+            else:
+                run = lambda vm, halt_print: execute_vm(
+                    vm, optimize=self.optimize, halt_print=halt_print)
+            with self.assertRaises(InstructionNotImplemented):
+                run(vm, halt_print=False)
+            self.assertEqual(vm[IP], 6, engine)
+            self.assertEqual(vm[PERF_COUNT], 2, engine)
+
+    def test_memory_writes_cant_come_first(self):
+        with self.assertRaises(Exception):
+            knightfusion.make_run_for_registersize(
+                self.registersize, fused_pairs=[("STORE8", "JUMP")] )
+
+(FusionTests32Optimize,
+ FusionTests64,
+ FusionTests64Optimize,
+ FusionTests16,
+ FusionTests16Optimize,
+) = make_optimize_and_register_size_variations(FusionTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_fusion
+    # or
+    # $ ./runtestmodule.py knighttests/test_fusion.py
+    from unittest import main
+    main()
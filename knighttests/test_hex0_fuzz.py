@@ -21,6 +21,9 @@ from hex0tobin import (
     write_binary_filefd_from_hex0_filefd,
     int_bytes_from_hex0_fd,
     )
+from constants import ENGINE_BLOCKS
+from .programs import \
+    TAPE_HEX0_ASSEMBLER_FILEPATH, TAPE_HEX0_ASSEMBLER_MEMORY
 
 from .stage0 import (
     STAGE_0_MONITOR_HEX_FILEPATH,
@@ -70,14 +73,11 @@ class Hex0FuzzTest(Hex0FuzzCommon, CommonHexFuzzTest, TestCase):
     def setUp(self):
         CommonHexFuzzTest.setUp(self)
 
-    def tearDown(self):
-        CommonHexFuzzTest.tearDown(self)
-
     def get_stdin_for_vm(self, input_file_fd):
         return input_file_fd
 
-    def get_output_file_path(self):
-        return self.tape_01_temp_file_path
+    def get_output_tape(self):
+        return self.tape_01
 
     @staticmethod
     def get_top_level_char_set():
@@ -90,6 +90,9 @@ class Hex0FuzzTest(Hex0FuzzCommon, CommonHexFuzzTest, TestCase):
  Hex0FuzzTest16Optimize,
  ) = make_optimize_and_register_size_variations(Hex0FuzzTest)
 
+class Hex0FuzzTestBlocks(Hex0FuzzTest):
+    engine = ENGINE_BLOCKS
+
 class Hex0FuzzTestAssembler1(CommonStage1Fuzz, Hex0FuzzCommon, TestCase):
     encoding_rom_filename = STAGE_0_HEX0_ASSEMBLER_FILEPATH
 
@@ -98,9 +101,6 @@ class Hex0FuzzTestAssembler1(CommonStage1Fuzz, Hex0FuzzCommon, TestCase):
     def setUp(self):
         CommonStage1Fuzz.setUp(self)
 
-    def tearDown(self):
-        CommonStage1Fuzz.tearDown(self)
-
     @staticmethod
     def get_top_level_char_set():
         return hex_or_printable_without_cr
@@ -112,6 +112,22 @@ class Hex0FuzzTestAssembler1(CommonStage1Fuzz, Hex0FuzzCommon, TestCase):
  Hex0FuzzTestAssembler1_16Optimize,
 ) = make_optimize_and_register_size_variations(Hex0FuzzTestAssembler1)
 
+# the hex0 assembler in knighttests, doesn't need stage0
+class TapeHex0FuzzTest(CommonStage1Fuzz, Hex0FuzzCommon, TestCase):
+    encoding_rom_filename = TAPE_HEX0_ASSEMBLER_FILEPATH
+
+    test_size = 1024*16
+
+    def setUp(self):
+        CommonStage1Fuzz.setUp(self)
+
+    def get_end_of_memory(self):
+        return TAPE_HEX0_ASSEMBLER_MEMORY
+
+    @staticmethod
+    def get_top_level_char_set():
+        return hex_or_printable_without_cr
+
 if __name__ == '__main__':
     # to invoke, run
     # $ python3 -m knighttests.test_hex0tobin
@@ -21,6 +21,7 @@ from os.path import exists
 from stage0dir import get_stage0_file
 from hex0tobin import write_binary_filefd_from_hex0_filefd
 from knightvm_minimal import load_hex_program
+from constants import ENGINE_BLOCKS
 
 from .hexcommon import (
     Hex256SumMatch, HexCommon, Encoding_rom_256_Common,
@@ -75,7 +76,7 @@ class TestHex0KnightExecuteCommon(Hex0Common, TestHexKnightExecuteCommon):
     def setUp(self):
         # this does:
         #   HexCommon.setUp(self)
-        #   self.setup_stack_and_tmp_files()
+        #   self.setup_stack_and_tapes()
         TestHexKnightExecuteCommon.setUp(self)
 
     # necessary disambiguation because both Hex0Common and
@@ -83,20 +84,19 @@ class TestHex0KnightExecuteCommon(Hex0Common, TestHexKnightExecuteCommon):
     def tearDown(self):
         # this does
         #   HexCommon.tearDown(self)
-        #   self.remove_tmp_files()
         TestHexKnightExecuteCommon.tearDown(self)
 
     def load_encoding_rom(self, vm):
         load_hex_program(vm, self.encoding_rom_filename )
 
-    def get_tape1_file_path(self, input_file_fd):
-        return self.tape_01_temp_file_path
+    def get_tape1(self, input_file_fd):
+        return self.tape_01
 
     def get_stdin_for_vm(self, input_file_fd):
         return input_file_fd
 
-    def get_output_file_path(self):
-        return self.tape_01_temp_file_path
+    def get_output_tape(self):
+        return self.tape_01
 
     def execute_test_hex0_load_against_computed_SHA256SUM(self, filename):
         self.execute_test_hex0_load_against_computed_SHA256SUM_dict(
@@ -143,6 +143,9 @@ make_optimize_and_register_size_variations(TestStage0Monitorexecute)
 TestHex0ToBin64.stack_size_multiplier = 2
 assert( TestHex0ToBin64Optimize.stack_size_multiplier == 2 )
 
+class TestHex0ToBinBlocks(TestStage0Monitorexecute):
+    engine = ENGINE_BLOCKS
+
 class TestStage1Hex0Encode(CommonStage1HexEncode, TestHex0KnightExecuteCommon):
     def test_encode_stage1_hex0_encodes_self(self):
         self.execute_test_hex_load_published_sha256(
@@ -185,6 +188,9 @@ class TestStage1Hex0Encode(CommonStage1HexEncode, TestHex0KnightExecuteCommon):
 TestStage1Hex0ToBin64.stack_size_multiplier = 2
 assert( TestStage1Hex0ToBin64Optimize.stack_size_multiplier == 2 )
 
+class TestStage1Hex0ToBinBlocks(TestStage1Hex0Encode):
+    engine = ENGINE_BLOCKS
+
 if __name__ == '__main__':
     # to invoke, run
     # $ python3 -m knighttests.test_hex0tobin
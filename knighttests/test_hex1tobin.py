@@ -36,7 +36,7 @@ from .stage0 import (
     )
 from .util import make_optimize_and_register_size_variations
 
-from constants import MEM
+from constants import MEM, ENGINE_BLOCKS
 
 get_sha256sum_of_file_after_hex1_encode = \
     make_get_sha256sum_of_file_after_encode(
@@ -66,3 +66,6 @@ class TestStage1Hex1Encode(CommonStage1HexEncode, TestHexKnightExecuteCommon):
  TestStage1Hex1Encode16,
  TestStage1Hex1Encode16Optimize,
  ) = make_optimize_and_register_size_variations(TestStage1Hex1Encode)
+
+class TestStage1Hex1EncodeBlocks(TestStage1Hex1Encode):
+    engine = ENGINE_BLOCKS
@@ -55,9 +55,6 @@ class Hex2FuzzTest(CommonStage1Fuzz, TestCase):
     def setUp(self):
         CommonStage1Fuzz.setUp(self)
 
-    def tearDown(self):
-        CommonStage1Fuzz.tearDown(self)
-
     input_encode_python_implementation = \
         staticmethod(write_binary_filefd_from_hex2_filefd)
 
@@ -23,6 +23,7 @@ from hex1tobin import (
     int_bytes_from_hex1_fd,
     )
 from hex2tobin import write_binary_filefd_from_hex2_filefd
+from constants import ENGINE_BLOCKS
 
 from .hexcommon import (
     Hex256SumMatch, HexCommon, Encoding_rom_256_Common,
@@ -86,3 +87,6 @@ class TestStage1Hex2Encode(CommonStage1HexEncode, TestHexKnightExecuteCommon):
  TestStage1Hex2Encode16Optimise,
  ) = make_optimize_and_register_size_variations(TestStage1Hex2Encode)
 
+class TestStage1Hex2EncodeBlocks(TestStage1Hex2Encode):
+    engine = ENGINE_BLOCKS
+
@@ -0,0 +1,158 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from random import Random
+
+from constants import RAW
+from knightdecode import (
+    create_vm, read_instruction_fast,
+    get_instruction_module_for_registersize_bits, FAST_DECODE_TABLE,
+    )
+from knightinstructions_bit_optimized import NBIT_OPTIMIZED_INSTRUCTIONS
+from knightinstructions import call_instruction
+import knightinstructions
+from .test_dispatch import INSTRUCTION_CLASSES
+
+MEMORY_SIZE = 0x400
+# registers that hold addresses point somewhere in here, far enough from
+# both ends of memory that a push, pop or 8 byte read/write stays inside
+ADDRESS_LOW = 0x100
+ADDRESS_HIGH = 0x300
+RUNS_PER_INSTRUCTION = 100
+
+# shift amounts come from registers, keep them all small so a shift by a
+# huge register value doesn't eat all the memory
+SMALL_REGISTERS_ONLY = ('SL0',)
+
+class NbitOptimizedConformanceTests(TestCase):
+    registersize = 32
+
+    def setUp(self):
+        self.random_source = Random(self.registersize)
+        self.knightmodule = get_instruction_module_for_registersize_bits(
+            self.registersize)
+
+    def random_register_value(self, instruction_str):
+        r = self.random_source
+        max_unsigned = (1<<self.registersize)-1
+        if instruction_str in SMALL_REGISTERS_ONLY:
+            return r.randrange(0x100)
+        return r.choice( (
+            r.randrange(ADDRESS_LOW, ADDRESS_HIGH),
+            r.randrange(ADDRESS_LOW, ADDRESS_HIGH),
+            r.randrange(0x100),
+            r.randrange(max_unsigned+1),
+            max_unsigned,
+            max_unsigned>>1,
+            (max_unsigned>>1)+1,
+            0,
+            ) )
+
+    def make_vm_pair(self, instruction_str, instruction_bytes):
+        r = self.random_source
+        memory = bytes(instruction_bytes) + \
+            r.getrandbits(8*MEMORY_SIZE).to_bytes(MEMORY_SIZE, 'big')
+        registers = [ self.random_register_value(instruction_str)
+                      for i in range(16) ]
+        vms = []
+        for i in range(2):
+            vm = create_vm(size=0, registersize=self.registersize)
+            vm.mem.frombytes(memory)
+            for j, register_value in enumerate(registers):
+                vm.reg[j] = register_value
+            vms.append(vm)
+        return vms
+
+    def run_instruction(self, instruction_func, instruction_str, vm):
+        c = read_instruction_fast(vm)
+        c = FAST_DECODE_TABLE[c[RAW][0]](vm, c)
+        try:
+            return call_instruction(instruction_func, instruction_str, vm, c)
+        except Exception:
+            return 'raised'
+
+    def random_instruction_bytes(self, encode, key):
+        # the registers and immediate in the encoded bytes are replaced
+        # with random ones, the bits that select the instruction are kept
+        r = self.random_source
+        instruction_bytes = list(encode(key))
+        if instruction_bytes[0] in (0xE0, 0xE1):
+            instruction_bytes[4] = r.randrange(0x100)
+            instruction_bytes[5] = r.randrange(0x100)
+        if instruction_bytes[0] == 0xE1:
+            instruction_bytes[3] = r.randrange(0x100)
+        elif instruction_bytes[0] == 0x3C:
+            instruction_bytes[2] = r.randrange(0x100)
+            instruction_bytes[3] = r.randrange(0x100)
+        else:
+            register_bits = {0x01: 16, 0x05: 12, 0x09: 8, 0x0D: 4,
+                             0xE0: 4}[instruction_bytes[0]]
+            low_bytes = (instruction_bytes[2]<<8) | instruction_bytes[3]
+            low_bytes = ( (low_bytes & ~((1<<register_bits)-1)) |
+                          r.randrange(1<<register_bits) )
+            instruction_bytes[2] = low_bytes>>8
+            instruction_bytes[3] = low_bytes & 0xFF
+        return instruction_bytes
+
+    def check_instruction(self, instruction_str, encode, key):
+        generic_func = getattr(knightinstructions, instruction_str)
+        optimized_func = getattr(self.knightmodule, instruction_str)
+        if optimized_func is generic_func:
+            return
+        for i in range(RUNS_PER_INSTRUCTION):
+            instruction_bytes = self.random_instruction_bytes(encode, key)
+            generic_vm, optimized_vm = self.make_vm_pair(
+                instruction_str, instruction_bytes)
+            message = "%s %s registers %s" % (
+                instruction_str, bytes(instruction_bytes).hex(),
+                generic_vm.reg.tolist() )
+            self.assertEqual(
+                self.run_instruction(
+                    optimized_func, instruction_str, optimized_vm),
+                self.run_instruction(
+                    generic_func, instruction_str, generic_vm),
+                message)
+            self.assertEqual(optimized_vm.reg.tolist(),
+                             generic_vm.reg.tolist(), message)
+            self.assertEqual(optimized_vm.mem.tobytes(),
+                             generic_vm.mem.tobytes(), message)
+
+    def test_every_instruction_matches_generic(self):
+        for table_string, encode in INSTRUCTION_CLASSES:
+            for key, instruction_str in table_string.items():
+                self.check_instruction(instruction_str, encode, key)
+
+    def test_optimized_versions_replace_generic(self):
+        for instruction_str in NBIT_OPTIMIZED_INSTRUCTIONS:
+            self.assertIsNot(
+                getattr(self.knightmodule, instruction_str),
+                getattr(knightinstructions, instruction_str),
+                instruction_str)
+
+class NbitOptimizedConformanceTests64(NbitOptimizedConformanceTests):
+    registersize = 64
+
+class NbitOptimizedConformanceTests16(NbitOptimizedConformanceTests):
+    registersize = 16
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_nbit_optimized
+    # or
+    # $ ./runtestmodule.py knighttests/test_nbit_optimized.py
+    from unittest import main
+    main()
@@ -0,0 +1,188 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from io import BytesIO, StringIO
+from os import unlink
+from array import array
+
+from hex0tobin import write_binary_filefd_from_hex0_filefd
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+from knightdecode import create_vm
+from knightdecodeutil import outside_of_world, OutsideOfWorldException
+from knightinstructions import readin_bytes, writeout_bytes
+from knightpagedmemory import PagedMemory, PAGE_SIZE
+from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from knightsnapshot import snapshot, restore
+from .programs import \
+    ENGINES, TAPE_HEX0_ASSEMBLER_FILEPATH, TAPE_HEX0_ASSEMBLER_MEMORY
+from .test_snapshot import close_tapes
+from .util import (
+    get_closed_named_temp_file, make_optimize_and_register_size_variations,
+    )
+
+INPUT_TEXT = "41 42 # comment\n43 44\n45 ; another\n46 47 48\n"
+
+# far more than the hex0 assembler needs
+LARGE_MEMORY = 1<<26
+
+class PagedMemoryTests(TestCase):
+    def test_reads_zero_without_allocating(self):
+        mem = PagedMemory(LARGE_MEMORY)
+        self.assertEqual(len(mem), LARGE_MEMORY)
+        self.assertEqual(mem[0], 0)
+        self.assertEqual(mem[LARGE_MEMORY-1], 0)
+        self.assertEqual(mem[PAGE_SIZE:PAGE_SIZE+4].tolist(), [0,0,0,0])
+        mem[5] = 0
+        self.assertEqual(mem.allocated_size(), 0)
+
+    def test_write_allocates_one_page(self):
+        mem = PagedMemory(LARGE_MEMORY)
+        mem[PAGE_SIZE*3+7] = 0xAB
+        self.assertEqual(mem.allocated_size(), PAGE_SIZE)
+        self.assertEqual(mem[PAGE_SIZE*3+7], 0xAB)
+        self.assertEqual(mem[PAGE_SIZE*3+6], 0)
+        self.assertEqual(mem[7], 0)
+
+    def test_out_of_range(self):
+        mem = PagedMemory(PAGE_SIZE+1)
+        self.assertRaises(IndexError, mem.__getitem__, PAGE_SIZE+1)
+        self.assertRaises(IndexError, mem.__setitem__, PAGE_SIZE+1, 1)
+        self.assertRaises(OverflowError, mem.__setitem__, 0, 0x100)
+        mem[-1] = 9
+        self.assertEqual(mem[PAGE_SIZE], 9)
+        self.assertRaises(OutsideOfWorldException,
+                          outside_of_world, mem, PAGE_SIZE+1, "outside")
+
+    def test_slices_across_pages(self):
+        mem = PagedMemory(PAGE_SIZE*4)
+        flat = array(ARRAY_TYPE_UNSIGNED_CHAR, (0,))*(PAGE_SIZE*4)
+        values = array(ARRAY_TYPE_UNSIGNED_CHAR,
+                       [ i % 251 for i in range(PAGE_SIZE+10) ])
+        start = PAGE_SIZE-5
+        mem[start:start+len(values)] = values
+        flat[start:start+len(values)] = values
+        self.assertEqual(mem[0:len(flat)], flat)
+        self.assertEqual(mem[PAGE_SIZE-2:PAGE_SIZE+2],
+                         flat[PAGE_SIZE-2:PAGE_SIZE+2])
+        self.assertEqual(mem[1:30:3], flat[1:30:3])
+        self.assertEqual(mem.allocated_size(), PAGE_SIZE*3)
+
+    def test_zero_slice_doesnt_allocate(self):
+        mem = PagedMemory(PAGE_SIZE*4)
+        mem[0:PAGE_SIZE*4] = array(ARRAY_TYPE_UNSIGNED_CHAR,
+                                   (0,))*(PAGE_SIZE*4)
+        self.assertEqual(mem.allocated_size(), 0)
+
+    def test_slice_cant_resize(self):
+        mem = PagedMemory(PAGE_SIZE)
+        self.assertRaises(ValueError, mem.__setitem__, slice(0, 4),
+                          array(ARRAY_TYPE_UNSIGNED_CHAR, (1,2)))
+
+    def test_readin_writeout_bytes(self):
+        mem = PagedMemory(LARGE_MEMORY)
+        address = PAGE_SIZE*9-2 # straddles two pages
+        writeout_bytes(mem, address, 0x8123ABCD, 4)
+        self.assertEqual(readin_bytes(mem, address, False, 4), 0x8123ABCD)
+        self.assertEqual(readin_bytes(mem, address, True, 2), -0x7EDD)
+        self.assertRaises(OutsideOfWorldException,
+                          readin_bytes, mem, LARGE_MEMORY-1, False, 2)
+
+class PagedMemoryEngineTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def setUp(self):
+        self.tape_01_path = get_closed_named_temp_file()
+        self.tape_02_path = get_closed_named_temp_file()
+        with open(self.tape_01_path, 'w') as tape_01:
+            tape_01.write(INPUT_TEXT)
+        expected_output = BytesIO()
+        write_binary_filefd_from_hex0_filefd(
+            StringIO(INPUT_TEXT), expected_output)
+        self.expected_output = expected_output.getvalue()
+
+    def tearDown(self):
+        unlink(self.tape_01_path)
+        unlink(self.tape_02_path)
+
+    def make_vm(self, size):
+        vm = create_vm(size=0, registersize=self.registersize,
+                       tapefile1=self.tape_01_path,
+                       tapefile2=self.tape_02_path, paged_memory=True)
+        load_hex_program(vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(vm, size)
+        return vm
+
+    def read_output(self):
+        with open(self.tape_02_path, 'rb') as tape_02:
+            return tape_02.read()
+
+    def test_engines_with_large_paged_memory(self):
+        for engine in ENGINES:
+            vm = self.make_vm(LARGE_MEMORY)
+            execute_vm(vm, optimize=self.optimize, halt_print=False,
+                       engine=engine)
+            self.assertEqual(self.read_output(), self.expected_output,
+                             engine)
+            self.assertEqual(len(vm.mem), LARGE_MEMORY)
+            self.assertTrue(vm.mem.allocated_size() <= PAGE_SIZE, engine)
+
+    def test_matches_flat_memory(self):
+        vm = self.make_vm(TAPE_HEX0_ASSEMBLER_MEMORY)
+        execute_vm(vm, optimize=self.optimize, halt_print=False)
+        flat_vm = create_vm(size=0, registersize=self.registersize,
+                            tapefile1=self.tape_01_path,
+                            tapefile2=self.tape_02_path)
+        load_hex_program(flat_vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(flat_vm, TAPE_HEX0_ASSEMBLER_MEMORY)
+        execute_vm(flat_vm, optimize=self.optimize, halt_print=False)
+        self.assertEqual(vm.mem[0:len(vm.mem)], flat_vm.mem)
+        self.assertEqual(vm.reg, flat_vm.reg)
+
+    def test_snapshot_restore(self):
+        snapshot_path = get_closed_named_temp_file()
+        try:
+            vm = self.make_vm(LARGE_MEMORY)
+            execute_vm(vm, optimize=self.optimize, halt_print=False,
+                       max_steps=200)
+            snapshot(vm, snapshot_path)
+            close_tapes(vm)
+            restored_vm = restore(snapshot_path, paged_memory=True)
+            self.assertEqual(len(restored_vm.mem), LARGE_MEMORY)
+            self.assertEqual(restored_vm.mem.allocated_size(),
+                             vm.mem.allocated_size())
+            execute_vm(restored_vm, optimize=self.optimize,
+                       halt_print=False)
+            close_tapes(restored_vm)
+            self.assertEqual(self.read_output(), self.expected_output)
+        finally:
+            unlink(snapshot_path)
+
+(PagedMemoryEngineTests32Optimize,
+ PagedMemoryEngineTests64,
+ PagedMemoryEngineTests64Optimize,
+ PagedMemoryEngineTests16,
+ PagedMemoryEngineTests16Optimize,
+) = make_optimize_and_register_size_variations(PagedMemoryEngineTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_paged_memory
+    # or
+    # $ ./runtestmodule.py knighttests/test_paged_memory.py
+    from unittest import main
+    main()
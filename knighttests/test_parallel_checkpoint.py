@@ -0,0 +1,144 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# The checkpoint_every mode of test_parallel_execution.py run against a
+# stand in for stage0's C VM built on knightpies, so the stdin replay,
+# checkpoint restore and bisection are tested without stage0
+
+from io import BytesIO
+
+from knightdecode import create_vm
+from knighttape import MemoryTapeBackend
+from knightvm_minimal import load_program, grow_memory, execute_vm
+
+from .test_parallel_execution import (
+    ParallelExecutionTests,
+    LILITH_IP_REGISTER_INDEX, LILITH_PERF_COUNT_REGISTER_INDEX,
+    LILITH_REGISTER_SIZE,
+    )
+
+# adds up the bytes on stdin, keeping the sum at 0x100
+SUM_STDIN = (
+    'E0002D2C0100' # LOADUI R12 0x100
+    '0D00002D'     # FALSE R13
+    'E0002D210000' # :loop LOADUI R1 0 ; stdin
+    '42100100'     # FGETC
+    'E000A0100000' # CMPSKIPI.GE R0 0
+    '3C00000E'     # JUMP @done
+    '05000DD0'     # :add ADD R13 R13 R0
+    'E10023DC0000' # STORE32 R13 R12 0
+    '3C00FFDE'     # JUMP @loop
+    'FFFFFFFF'     # :done HALT
+)
+# the ADD is the fourth of the six instructions run for each byte read,
+# after LOADUI and FALSE, so the nth ADD is instruction 6*n
+SUM_STDIN_ADD_IP = 0x1E
+
+class StandInCVM(object):
+    # the part of stage0's User_Interface.vm the parallel tests use. Off by
+    # one in R13 after the diverge_on_add'th ADD when that isn't None
+    def __init__(self, diverge_on_add=None):
+        self.diverge_on_add = diverge_on_add
+
+    def initialize_lilith(self, size):
+        self.size = size
+
+    def load_lilith(self, rom_name_string_buffer):
+        self.vm = create_vm(size=0, registersize=LILITH_REGISTER_SIZE,
+                            tapefile1=MemoryTapeBackend(),
+                            tapefile2=MemoryTapeBackend(),
+                            stdin=BytesIO(), stdout=BytesIO())
+        load_program(self.vm, rom_name_string_buffer.value.decode('ascii'))
+        grow_memory(self.vm, self.size)
+        self.adds = 0
+
+    def get_register(self, i):
+        if i==LILITH_IP_REGISTER_INDEX:
+            return self.vm.ip
+        elif i==LILITH_PERF_COUNT_REGISTER_INDEX:
+            return self.vm.perf_count
+        return self.vm.reg[i]
+
+    def set_register(self, i, value):
+        if i==LILITH_IP_REGISTER_INDEX:
+            self.vm.ip = value
+        else:
+            self.vm.reg[i] = value
+
+    def get_byte(self, i):
+        return self.vm.mem[i]
+
+    def step_lilith(self):
+        ip = self.vm.ip
+        execute_vm(self.vm, optimize=False, halt_print=False, max_steps=1)
+        if ip==SUM_STDIN_ADD_IP:
+            self.adds += 1
+            if self.adds==self.diverge_on_add:
+                self.vm.reg[13] += 1
+
+class CheckpointedStandInCommon(ParallelExecutionTests):
+    stack_start = 0x100
+    stack_size = 8
+    checkpoint_every = 256
+    diverge_on_add = None
+
+    def setUp(self):
+        self.setup_with_c_vm(StandInCVM(self.diverge_on_add))
+
+    def run_sum_stdin(self, byte_count):
+        self.binary_rom.write( bytes.fromhex(SUM_STDIN) )
+        self.binary_rom.close()
+        self.finish_setup( BytesIO(bytes(bytearray(
+            i % 0x100 for i in range(byte_count) ))) )
+        self.run_both_vms()
+
+    def get_divergence_message(self, byte_count):
+        with self.assertRaises(self.failureException) as context:
+            self.run_sum_stdin(byte_count)
+        return str(context.exception)
+
+class CheckpointedStandInTests(CheckpointedStandInCommon):
+    def test_vms_match(self):
+        self.run_sum_stdin(1000)
+        self.assertTrue(self.halted())
+        self.assertEqual(self.py_vm.reg[13],
+                         sum( [ i % 0x100 for i in range(1000) ] ) )
+
+class CheckpointedStandInDivergeTests(CheckpointedStandInCommon):
+    # the 100th ADD is well past the first checkpoint, so finding it means
+    # going back to a checkpoint and replaying the C VM up to there
+    diverge_on_add = 100
+
+    def test_divergence_found(self):
+        self.assertIn("vms differ after instruction 600 at 1E ",
+                      self.get_divergence_message(1000) )
+
+class CheckpointedStandInLastBatchTests(CheckpointedStandInCommon):
+    # the whole run is shorter than checkpoint_every, the divergence is
+    # in the batch that halts
+    diverge_on_add = 10
+
+    def test_divergence_found(self):
+        self.assertIn("vms differ after instruction 60 at 1E ",
+                      self.get_divergence_message(10) )
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_parallel_checkpoint
+    # or
+    # $ ./runtestmodule.py knighttests/test_parallel_checkpoint.py
+    from unittest import main
+    main()
@@ -16,6 +16,8 @@
 
 from sys import path as sys_path
 from ctypes import create_string_buffer
+from struct import pack
+from hashlib import sha256
 from os import unlink
 from os.path import exists
 from unittest import TestCase, skipIf
@@ -24,7 +26,9 @@ from tempfile import NamedTemporaryFile
 from filecmp import cmp as file_compare
 
 from stage0dir import get_stage0_dir, get_stage0_file
-from knightvm_minimal import load_program
+from knightvm_minimal import load_program, execute_vm
+from knightsnapshot import snapshot, restore
+from knighttape import flush_tapes
 from knightdecode import (
     create_vm, grow_memory, read_instruction, eval_instruction,
     MIN_INSTRUCTION_LEN,
@@ -34,6 +38,7 @@ from constants import (
     RAW, HAL_CODE, # intruction tuple indexes
     HALT_OP, HAL_CODE_OP, HAL_CODE_FGETC, HAL_CODE_FPUTC,
     HAL_IO_DATA_REGISTER, HAL_IO_DEVICE_REGISTER, HAL_IO_DEVICE_STDIO,
+    TAPEFD_I_STDIN,
     )
 from hex0tobin import write_binary_filefd_from_hex0_filefd
 from .util import get_closed_named_temp_file
@@ -44,20 +49,47 @@ LILITH_TAPE_NAME_01, LILITH_TAPE_NAME_02 = ("tape_01", "tape_02")
 LILITH_IP_REGISTER_INDEX, LILITH_PERF_COUNT_REGISTER_INDEX = (16, 17)
 LILITH_REGISTER_SIZE = 32
 
+# what FGETC puts in the data register at the end of stdin
+LILITH_EOF = 0xFFFFFFFF
+
 def get_hal_code_from_raw(py_instruction):
     hal_code = ( (py_instruction[RAW][1]<<16) |
                  (py_instruction[RAW][2]<<8) |
                  (py_instruction[RAW][3]) )
     return hal_code
 
+class StdinReplay(object):
+    # stdin for the python vm when checkpoint_every is set, the c vm is fed
+    # the same bytes from its own position in data and the position of both
+    # can be put back to where they were at a checkpoint
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def read(self, size=-1):
+        if size<0:
+            end = len(self.data)
+        else:
+            end = min(len(self.data), self.position+size)
+        result = self.data[self.position:end]
+        self.position = end
+        return result
+
 class ParallelExecutionTests(TestCase):
     optimize = False
+    # None to single step both vms comparing their state after every
+    # instruction, or run both this many instructions at a time, comparing
+    # digests of their state and bisecting down to the first instruction
+    # they differ on when the digests don't match
+    checkpoint_every = None
     @skipIf(PARALLEL_SKIP, 'requested')
     def setUp(self):
         sys_path.append(get_stage0_dir())
         import User_Interface
-        self.c_vm = User_Interface.vm
+        self.setup_with_c_vm(User_Interface.vm)
 
+    def setup_with_c_vm(self, c_vm):
+        self.c_vm = c_vm
         self.vm_size = self.get_vm_size()
         self.c_vm.initialize_lilith(self.vm_size)
         self.output_mem_buffer = BytesIO()
@@ -221,6 +253,160 @@ class ParallelExecutionTests(TestCase):
             self.binary_rom_filename.encode('ascii') )
         self.c_vm.load_lilith(self.rom_name_string_buffer)
 
+    def run_both_vms(self):
+        if self.checkpoint_every!=None:
+            self.run_both_vms_checkpointed()
+            return
+
+        self.do_state_checks()
+        while True:
+            debug_tuple = self.advance_both_vms()
+            if self.halted():
+                break # don't bother with state checks after HALT
+            self.do_state_checks(debug_tuple)
+
+    # checkpoint_every mode
+    #
+    # The python vm runs checkpoint_every instructions with execute_vm and
+    # the c vm is stepped the same number, intercepting stdio FGETC, FPUTC
+    # and HALT like advance_both_vms does. Then a sha256 of the registers,
+    # IP and the memory check_memory_match looks at are compared instead of
+    # going through them one at a time after every instruction.
+    #
+    # The python vm is snapshot at every checkpoint where they match. The c
+    # vm can't be snapshot through its interface, so going back to a
+    # checkpoint for it means starting over and replaying up to there.
+
+    def get_digest_memory_range(self):
+        return range(self.stack_start, self.get_address_after_stack())
+
+    def py_vm_digest(self):
+        py_memory = self.py_vm[MEM]
+        digest = sha256(pack(">%dI" % (LILITH_IP_REGISTER_INDEX+1),
+                             *(self.py_vm[REG].tolist() + [self.py_vm[IP]])))
+        digest.update(bytes(bytearray(
+            py_memory[i] for i in self.get_digest_memory_range() ) ) )
+        return digest.hexdigest()
+
+    def c_vm_digest(self):
+        digest = sha256(pack(">%dI" % (LILITH_IP_REGISTER_INDEX+1),
+                             *[ self.c_vm.get_register(i)
+                                for i in range(LILITH_IP_REGISTER_INDEX+1)]))
+        digest.update(bytes(bytearray(
+            self.c_vm.get_byte(i) for i in self.get_digest_memory_range() )))
+        return digest.hexdigest()
+
+    def advance_c_vm(self, count):
+        get_byte = self.c_vm.get_byte
+        for i in range(count):
+            c_ip = self.c_vm.get_register(LILITH_IP_REGISTER_INDEX)
+            opcode = get_byte(c_ip)
+            if opcode == HALT_OP:
+                return # skip halt to avoid print output
+            elif ( opcode == HAL_CODE_OP and
+                   self.c_vm.get_register(HAL_IO_DEVICE_REGISTER)
+                   ==HAL_IO_DEVICE_STDIO ):
+                hal_code = ( (get_byte(c_ip+1)<<16) |
+                             (get_byte(c_ip+2)<<8) |
+                             get_byte(c_ip+3) )
+                if hal_code in (HAL_CODE_FGETC, HAL_CODE_FPUTC):
+                    if hal_code==HAL_CODE_FGETC:
+                        self.c_vm.set_register(
+                            HAL_IO_DATA_REGISTER, self.next_c_stdin_byte())
+                    self.c_vm.set_register(LILITH_IP_REGISTER_INDEX,
+                                           c_ip+MIN_INSTRUCTION_LEN)
+                    continue
+            self.c_vm.step_lilith()
+
+    def next_c_stdin_byte(self):
+        data = self.stdin_replay.data
+        if self.c_stdin_position>=len(data):
+            return LILITH_EOF
+        self.c_stdin_position += 1
+        return bytearray(data[self.c_stdin_position-1:
+                              self.c_stdin_position])[0]
+
+    def save_checkpoint(self):
+        snapshot(self.py_vm, self.checkpoint_filename)
+        self.checkpoint_stdin_position = self.stdin_replay.position
+
+    def restore_checkpoint(self, checkpoint_count):
+        # both vms back to the last checkpoint, checkpoint_count
+        # instructions in. The old python vm's tapes are closed first, the
+        # restored vm reopens and truncates the same files and the old
+        # handles could otherwise write stale bytes into them later
+        flush_tapes(self.py_vm)
+        for tape_fd in self.py_vm.tapefd[0:2]:
+            if tape_fd!=None and not tape_fd.closed:
+                tape_fd.close()
+        self.py_vm = restore(self.checkpoint_filename,
+                             stdin=self.stdin_replay,
+                             stdout=self.output_mem_buffer)
+        self.stdin_replay.position = self.checkpoint_stdin_position
+        self.c_vm.initialize_lilith(self.vm_size)
+        self.c_vm.load_lilith(self.rom_name_string_buffer)
+        self.c_stdin_position = 0
+        self.advance_c_vm(checkpoint_count)
+
+    def advance_both_vms_by(self, count):
+        # returns how many instructions the python vm ran, less than count
+        # if it halted
+        stop_reason, count_run = execute_vm(
+            self.py_vm, optimize=self.optimize, halt_print=False,
+            max_steps=count)
+        self.advance_c_vm(count_run)
+        return count_run
+
+    def find_divergence(self, checkpoint_count, window):
+        # the vms match checkpoint_count instructions in and don't
+        # window instructions later, bisect down to the first instruction
+        # they don't match after
+        matching, mismatching = 0, window
+        while mismatching-matching > 1:
+            middle = (matching+mismatching)//2
+            self.restore_checkpoint(checkpoint_count)
+            self.advance_both_vms_by(middle)
+            if self.py_vm_digest()==self.c_vm_digest():
+                matching = middle
+            else:
+                mismatching = middle
+        self.restore_checkpoint(checkpoint_count)
+        self.advance_both_vms_by(matching)
+        old_ip = self.py_vm[IP]
+        py_instruction = read_instruction(self.py_vm)
+        self.advance_both_vms_by(1)
+        return "vms differ after instruction %d at %.2X %s" % (
+            checkpoint_count+matching+1, old_ip, repr(py_instruction) )
+
+    def run_both_vms_checkpointed(self):
+        stdin_fd = self.py_vm.tapefd[TAPEFD_I_STDIN]
+        if stdin_fd==None:
+            stdin_data = b""
+        else:
+            stdin_data = stdin_fd.read()
+        self.stdin_replay = StdinReplay(stdin_data)
+        self.py_vm.tapefd[TAPEFD_I_STDIN] = self.stdin_replay
+        self.c_stdin_position = 0
+        self.checkpoint_filename = get_closed_named_temp_file()
+
+        try:
+            checkpoint_count = 0
+            self.save_checkpoint()
+            self.assertEqual(self.py_vm_digest(), self.c_vm_digest())
+            while True:
+                count_run = self.advance_both_vms_by(self.checkpoint_every)
+                # checked for the batch that halts too, neither vm moves
+                # its IP past the HALT
+                if self.py_vm_digest()!=self.c_vm_digest():
+                    self.fail(self.find_divergence(checkpoint_count,
+                                                   count_run) )
+                if self.halted():
+                    break
+                checkpoint_count += count_run
+                self.save_checkpoint()
+        finally:
+            unlink(self.checkpoint_filename)
+
     def run_execution_test(self, romfilename_hex, stdin_filename):
         with open(romfilename_hex, 'r') as romfile_hex:
                 write_binary_filefd_from_hex0_filefd(
@@ -229,13 +415,7 @@ class ParallelExecutionTests(TestCase):
         
         with open(stdin_filename, 'rb') as input_file_fd:
             self.finish_setup(input_file_fd)
-
-            self.do_state_checks()
-            while True:
-                debug_tuple = self.advance_both_vms()
-                if self.halted():
-                    break # don't bother with state checks after HALT
-                self.do_state_checks(debug_tuple)
+            self.run_both_vms()
 
         self.assertTrue(
             file_compare(self.tape_01_filename, LILITH_TAPE_NAME_01,
@@ -269,6 +449,9 @@ class Stage0MonitorTests(ParallelExecutionTests):
 class Stage0MonitorTestsOptimise(Stage0MonitorTests):
     optimize = True
 
+class Stage0MonitorTestsCheckpointed(Stage0MonitorTests):
+    checkpoint_every = 4096
+
 if __name__ == '__main__':
     # to invoke, run
     # $ python3 -m knighttests.test_parallel_execution
@@ -70,13 +70,7 @@ class Stage1(ParallelExecutionTests):
 
         with open(stdin_filename, 'rb') as input_file_fd:
             self.finish_setup(stdin_filename)
-
-            self.do_state_checks()
-            while True:
-                debug_tuple = self.advance_both_vms()
-                if self.halted():
-                    break # don't bother with state checks after HALT
-                self.do_state_checks(debug_tuple)
+            self.run_both_vms()
 
         self.assertTrue(
             file_compare(self.get_output_filename(), LILITH_TAPE_NAME_02,
@@ -93,3 +87,6 @@ class Stage1EncodeSet(Stage1):
     @staticmethod
     def get_tape_01_file():
         return get_stage0_file("stage1/SET.hex2")
+
+class Stage1EncodeSetCheckpointed(Stage1EncodeSet):
+    checkpoint_every = 4096
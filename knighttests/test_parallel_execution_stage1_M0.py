@@ -20,3 +20,6 @@ class Stage1EncodeM0(Stage1):
     @staticmethod
     def get_tape_01_file():
         return get_stage0_file("stage0/stage0_monitor.s")
+
+class Stage1EncodeM0Checkpointed(Stage1EncodeM0):
+    checkpoint_every = 1024*64
@@ -0,0 +1,51 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from .parallelfuzz import \
+    run_fuzz, run_fuzz_shard, get_fuzz_shard_input, DEFAULT_SEED
+
+SHARD_SIZE = 1024*2
+
+class ParallelFuzzTests(TestCase):
+    def test_shards_reproducible(self):
+        self.assertEqual(
+            get_fuzz_shard_input('tape-hex0', DEFAULT_SEED, 3, SHARD_SIZE),
+            get_fuzz_shard_input('tape-hex0', DEFAULT_SEED, 3, SHARD_SIZE) )
+        self.assertNotEqual(
+            get_fuzz_shard_input('tape-hex0', DEFAULT_SEED, 3, SHARD_SIZE),
+            get_fuzz_shard_input('tape-hex0', DEFAULT_SEED, 4, SHARD_SIZE) )
+
+    def test_shard_passes(self):
+        shard, passed, vm_output, python_output = run_fuzz_shard(
+            'tape-hex0', DEFAULT_SEED, 0, SHARD_SIZE)
+        self.assertTrue(passed)
+        self.assertTrue(len(vm_output)>0)
+
+    def test_run_fuzz_pool(self):
+        self.assertEqual(
+            run_fuzz('tape-hex0', shards=4, shard_size=SHARD_SIZE,
+                     workers=2),
+            ([], None) )
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_parallel_fuzz
+    # or
+    # $ ./runtestmodule.py knighttests/test_parallel_fuzz.py
+    from unittest import main
+    main()
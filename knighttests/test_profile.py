@@ -0,0 +1,83 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from json import loads
+from os import unlink
+
+from constants import ENGINE_PROFILE
+from knightdecode import create_vm
+from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from knightprofile import profile_report_lines, profile_as_json
+from .programs import \
+    COUNT_DOWN_LOOP, TAPE_HEX0_ASSEMBLER_FILEPATH, \
+    TAPE_HEX0_ASSEMBLER_MEMORY, make_vm_from_hex
+from .util import (
+    get_closed_named_temp_file, make_optimize_and_register_size_variations,
+    )
+
+class ProfileTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def test_counts(self):
+        vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=ENGINE_PROFILE)
+        self.assertEqual(vm.profile.counts,
+                         {"LOADUI": 1, "SUBUI": 10, "JUMP_NZ": 10,
+                          "HALT": 1} )
+        self.assertEqual(profile_report_lines(vm.profile)[-1],
+                         "22 instructions in %.3fs, %.3fs of that in "
+                         "instruction functions" % (
+                             vm.profile.run_time,
+                             sum(vm.profile.times.values()) ) )
+        profile_dict = loads(profile_as_json(vm.profile))
+        self.assertEqual(
+            sum(instruction["count"]
+                for instruction in profile_dict["instructions"]),
+            22)
+
+    def test_tape_bytes(self):
+        tape_01_path = get_closed_named_temp_file()
+        tape_02_path = get_closed_named_temp_file()
+        with open(tape_01_path, 'w') as tape_01:
+            tape_01.write("41 42 # comment\n43")
+        vm = create_vm(size=0, registersize=self.registersize,
+                       tapefile1=tape_01_path, tapefile2=tape_02_path)
+        load_hex_program(vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(vm, TAPE_HEX0_ASSEMBLER_MEMORY)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=ENGINE_PROFILE)
+        unlink(tape_01_path)
+        unlink(tape_02_path)
+        self.assertEqual(vm.profile.tape_reads, {"tape_01": 18})
+        self.assertEqual(vm.profile.tape_writes, {"tape_02": 3})
+
+(ProfileTests32Optimize,
+ ProfileTests64,
+ ProfileTests64Optimize,
+ ProfileTests16,
+ ProfileTests16Optimize,
+) = make_optimize_and_register_size_variations(ProfileTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_profile
+    # or
+    # $ ./runtestmodule.py knighttests/test_profile.py
+    from unittest import main
+    main()
@@ -0,0 +1,78 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from io import StringIO
+from os import unlink
+from random import Random
+from string import hexdigits, printable
+
+from hex0tobin import int_bytes_from_hex0_fd, bytes_from_hex0_bytes
+from knightdecode import create_vm, grow_memory
+from knightvm_minimal import load_program, load_hex_program
+from .util import get_closed_named_temp_file
+
+class RomLoadingTests(TestCase):
+    def test_hex0_bytes_match_hex0_fd(self):
+        r = Random(0x13)
+        for i in range(200):
+            text = ''.join(
+                r.choice(hexdigits*3 + printable + ';#\r\n')
+                for j in range(r.randrange(200)) )
+            self.assertEqual(
+                bytes_from_hex0_bytes(text.encode('ascii')),
+                bytes(int_bytes_from_hex0_fd(StringIO(text))),
+                repr(text) )
+
+    def test_grow_memory(self):
+        vm = create_vm(size=3)
+        vm.mem[2] = 0x42
+        grow_memory(vm, 0x1000)
+        self.assertEqual(len(vm.mem), 0x1000)
+        self.assertEqual(vm.mem[0:3].tolist(), [0, 0, 0x42])
+        self.assertEqual(vm.mem.count(0), 0x1000-1)
+        grow_memory(vm, 10)
+        self.assertEqual(len(vm.mem), 0x1000)
+
+    def test_load_program(self):
+        rom_path = get_closed_named_temp_file()
+        with open(rom_path, 'wb') as rom_file:
+            rom_file.write(bytes(range(1, 0x31)))
+        for size in (0, 0x10, 0x100):
+            vm = create_vm(size=size)
+            load_program(vm, rom_path)
+            self.assertEqual(len(vm.mem), max(size, 0x30))
+            self.assertEqual(vm.mem.tobytes(),
+                             bytes(range(1, 0x31)) + bytes(max(size-0x30, 0)) )
+        unlink(rom_path)
+
+    def test_load_hex_program(self):
+        rom_path = get_closed_named_temp_file()
+        with open(rom_path, 'w') as rom_file:
+            rom_file.write("01 02 ; comment 03\n0A0b # 05\n0c")
+        vm = create_vm(size=8)
+        vm.mem[7] = 0xFF
+        load_hex_program(vm, rom_path)
+        self.assertEqual(vm.mem.tolist(), [1, 2, 0xA, 0xB, 0xC, 0, 0, 0xFF])
+        unlink(rom_path)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_rom_loading
+    # or
+    # $ ./runtestmodule.py knighttests/test_rom_loading.py
+    from unittest import main
+    main()
@@ -0,0 +1,106 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import \
+    REG, IP, PERF_COUNT, HALTED, \
+    STOP_HALTED, STOP_MAX_STEPS, STOP_UNTIL_IP
+from knightvm_minimal import execute_vm
+from .programs import COUNT_DOWN_LOOP, ENGINES, make_vm_from_hex
+from .util import make_optimize_and_register_size_variations
+
+# address of the JUMP.NZ in the loop body of COUNT_DOWN_LOOP
+LOOP_JUMP_IP = 0xC
+
+class RunTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def run_vm(self, vm, engine, **kargs):
+        return execute_vm(vm, optimize=self.optimize, halt_print=False,
+                          engine=engine, **kargs)
+
+    def test_until_halt(self):
+        for engine in ENGINES:
+            vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+            self.assertEqual(self.run_vm(vm, engine), (STOP_HALTED, 22),
+                             engine)
+            self.assertTrue(vm[HALTED], engine)
+            self.assertEqual(vm[REG][1], 0, engine)
+
+    def test_max_steps(self):
+        for engine in ENGINES:
+            vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+            for steps in (1, 4, 5, 7):
+                self.assertEqual(
+                    self.run_vm(vm, engine, max_steps=steps),
+                    (STOP_MAX_STEPS, steps), engine)
+            self.assertEqual(vm[PERF_COUNT], 17, engine)
+            self.assertEqual(self.run_vm(vm, engine, max_steps=100),
+                             (STOP_HALTED, 5), engine)
+
+    def test_until_ip(self):
+        for engine in ENGINES:
+            vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+            reference_vm = make_vm_from_hex(COUNT_DOWN_LOOP,
+                                            self.registersize)
+            while not reference_vm[HALTED]:
+                reason, count = self.run_vm(vm, engine,
+                                            until_ip=LOOP_JUMP_IP)
+                self.run_vm(reference_vm, engine, max_steps=count)
+                self.assertEqual(vm[IP], reference_vm[IP], engine)
+                self.assertEqual(vm[PERF_COUNT], reference_vm[PERF_COUNT],
+                                 engine)
+                if reason==STOP_UNTIL_IP:
+                    self.assertEqual(vm[IP], LOOP_JUMP_IP, engine)
+                    # the instruction at until_ip runs on the next call
+                    self.run_vm(vm, engine, max_steps=1)
+                    self.run_vm(reference_vm, engine, max_steps=1)
+                else:
+                    self.assertEqual(reason, STOP_HALTED, engine)
+            self.assertTrue(vm[HALTED], engine)
+
+    def test_until_ip_stops(self):
+        for engine in ENGINES:
+            vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+            self.assertEqual(self.run_vm(vm, engine, until_ip=LOOP_JUMP_IP),
+                             (STOP_UNTIL_IP, 2), engine)
+            # already there, nothing runs
+            self.assertEqual(
+                self.run_vm(vm, engine, max_steps=1, until_ip=LOOP_JUMP_IP),
+                (STOP_UNTIL_IP, 0), engine)
+
+    def test_needs_stop_condition(self):
+        for engine in ENGINES:
+            vm = make_vm_from_hex(COUNT_DOWN_LOOP, self.registersize)
+            with self.assertRaises(Exception):
+                self.run_vm(vm, engine, until_halt=False)
+
+(RunTests32Optimize,
+ RunTests64,
+ RunTests64Optimize,
+ RunTests16,
+ RunTests16Optimize,
+) = make_optimize_and_register_size_variations(RunTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_run
+    # or
+    # $ ./runtestmodule.py knighttests/test_run.py
+    from unittest import main
+    main()
@@ -0,0 +1,123 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from os import unlink
+
+from knightdecode import create_vm
+from knightvm_minimal import load_hex_program, grow_memory, execute_vm
+from knightsnapshot import snapshot, restore
+from .programs import \
+    ENGINES, TAPE_HEX0_ASSEMBLER_FILEPATH, TAPE_HEX0_ASSEMBLER_MEMORY
+from .util import (
+    get_closed_named_temp_file, make_optimize_and_register_size_variations,
+    )
+
+INPUT_TEXT = "41 42 # comment\n43 44\n45 ; another\n46 47 48\n"
+EXPECTED_OUTPUT = b"ABCDEFGH"
+
+def close_tapes(vm):
+    for tape_fd in vm.tapefd[0:2]:
+        if tape_fd!=None:
+            tape_fd.close()
+
+class SnapshotTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def setUp(self):
+        self.tape_01_path = get_closed_named_temp_file()
+        self.tape_02_path = get_closed_named_temp_file()
+        self.snapshot_path = get_closed_named_temp_file()
+        with open(self.tape_01_path, 'w') as tape_01:
+            tape_01.write(INPUT_TEXT)
+
+    def tearDown(self):
+        unlink(self.tape_01_path)
+        unlink(self.tape_02_path)
+        unlink(self.snapshot_path)
+
+    def read_output(self):
+        with open(self.tape_02_path, 'rb') as tape_02:
+            return tape_02.read()
+
+    def make_snapshot(self, steps):
+        vm = create_vm(size=0, registersize=self.registersize,
+                       tapefile1=self.tape_01_path,
+                       tapefile2=self.tape_02_path)
+        load_hex_program(vm, TAPE_HEX0_ASSEMBLER_FILEPATH)
+        grow_memory(vm, TAPE_HEX0_ASSEMBLER_MEMORY)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   max_steps=steps)
+        snapshot(vm, self.snapshot_path)
+        return vm
+
+    def check_resume(self, steps, engine, mmap_memory):
+        message = "%s %d mmap %s" % (engine, steps, mmap_memory)
+        vm = self.make_snapshot(steps)
+        execute_vm(vm, optimize=self.optimize, halt_print=False)
+        close_tapes(vm)
+        self.assertEqual(self.read_output(), EXPECTED_OUTPUT, message)
+
+        restored_vm = restore(self.snapshot_path, mmap_memory=mmap_memory)
+        self.assertEqual(restored_vm.perf_count, steps, message)
+        execute_vm(restored_vm, optimize=self.optimize, halt_print=False,
+                   engine=engine)
+        close_tapes(restored_vm)
+        self.assertEqual(self.read_output(), EXPECTED_OUTPUT, message)
+        self.assertEqual(restored_vm.ip, vm.ip, message)
+        self.assertEqual(restored_vm.perf_count, vm.perf_count, message)
+        self.assertEqual(restored_vm.reg.tolist(), vm.reg.tolist(), message)
+        self.assertEqual(restored_vm.mem.tobytes(), vm.mem.tobytes(),
+                         message)
+
+    def test_resume_halfway(self):
+        # after the tapes are opened and some output has been written
+        for engine in ENGINES:
+            self.check_resume(200, engine, False)
+
+    def test_resume_mmap(self):
+        for engine in ENGINES:
+            self.check_resume(200, engine, True)
+
+    def test_resume_before_tapes_open(self):
+        self.check_resume(1, ENGINES[0], True)
+
+    def test_snapshot_of_restored_mmap(self):
+        close_tapes(self.make_snapshot(150))
+        restored_vm = restore(self.snapshot_path, mmap_memory=True)
+        second_path = get_closed_named_temp_file()
+        snapshot(restored_vm, second_path)
+        close_tapes(restored_vm)
+        with open(self.snapshot_path, 'rb') as first:
+            with open(second_path, 'rb') as second:
+                self.assertEqual(first.read(), second.read())
+        unlink(second_path)
+
+(SnapshotTests32Optimize,
+ SnapshotTests64,
+ SnapshotTests64Optimize,
+ SnapshotTests16,
+ SnapshotTests16Optimize,
+) = make_optimize_and_register_size_variations(SnapshotTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_snapshot
+    # or
+    # $ ./runtestmodule.py knighttests/test_snapshot.py
+    from unittest import main
+    main()
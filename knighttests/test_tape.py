@@ -0,0 +1,213 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from os import unlink
+
+from knightdecode import create_vm
+from knightinstructions import \
+    vm_FOPEN_READ, vm_FOPEN_WRITE, vm_FCLOSE, vm_REWIND, vm_FSEEK, \
+    vm_FGETC, vm_FPUTC
+from knighttape import \
+    TapeDevice, TAPE_READ_BUFFER_SIZE, flush_tapes, \
+    TapeBackend, MemoryTapeBackend, CallbackTapeBackend
+from .util import get_closed_named_temp_file
+
+TAPE_01, TAPE_02 = 0x1100, 0x1101
+
+class TapeDeviceTests(TestCase):
+    def setUp(self):
+        self.filename = get_closed_named_temp_file()
+
+    def tearDown(self):
+        unlink(self.filename)
+
+    def write_file(self, content):
+        f = open(self.filename, 'wb')
+        f.write(content)
+        f.close()
+
+    def read_file(self):
+        f = open(self.filename, 'rb')
+        content = f.read()
+        f.close()
+        return content
+
+    def test_getc_past_one_buffer(self):
+        content = bytes(bytearray(i & 0xFF
+                                  for i in range(TAPE_READ_BUFFER_SIZE+10)))
+        self.write_file(content)
+        tape = TapeDevice(open(self.filename, 'rb'), 'rb')
+        read = []
+        byte = tape.getc()
+        while byte>=0:
+            read.append(byte)
+            byte = tape.getc()
+        self.assertEqual(bytes(bytearray(read)), content)
+        self.assertEqual(tape.getc(), -1)
+        self.assertEqual(tape.tell(), len(content))
+        tape.close()
+        self.assertTrue(tape.closed)
+
+    def test_putc_written_on_close(self):
+        tape = TapeDevice(open(self.filename, 'wb'), 'wb')
+        for byte in bytearray(b"hello"):
+            tape.putc(byte)
+        self.assertEqual(tape.tell(), 5)
+        self.assertEqual(self.read_file(), b"")
+        tape.close()
+        self.assertEqual(self.read_file(), b"hello")
+
+    def test_seek_and_tell(self):
+        self.write_file(b"abcdef")
+        tape = TapeDevice(open(self.filename, 'rb'), 'rb')
+        self.assertEqual(tape.getc(), ord('a'))
+        self.assertEqual(tape.getc(), ord('b'))
+        self.assertEqual(tape.tell(), 2)
+        tape.seek(1, 1)
+        self.assertEqual(tape.getc(), ord('d'))
+        tape.seek(0)
+        self.assertEqual(tape.getc(), ord('a'))
+        tape.close()
+
+    def test_getc_after_close(self):
+        self.write_file(b"abc")
+        tape = TapeDevice(open(self.filename, 'rb'), 'rb')
+        self.assertEqual(tape.getc(), ord('a'))
+        tape.close()
+        # nothing left over from the read buffer, like reading a closed file
+        with self.assertRaises(ValueError):
+            tape.getc()
+
+    def test_interleaved_read_and_write(self):
+        self.write_file(b"abcdef")
+        tape = TapeDevice(open(self.filename, 'r+b'), 'r+b')
+        self.assertEqual(tape.getc(), ord('a'))
+        tape.putc(ord('X'))
+        self.assertEqual(tape.getc(), ord('c'))
+        tape.close()
+        self.assertEqual(self.read_file(), b"aXcdef")
+
+    def test_flush_tapes(self):
+        tape = TapeDevice(open(self.filename, 'wb'), 'wb')
+        tape.putc(ord('z'))
+
+        class FakeVM(object):
+            pass
+        vm = FakeVM()
+        vm.tapefd = [tape, None, None, None]
+        flush_tapes(vm)
+        self.assertEqual(self.read_file(), b"z")
+        tape.close()
+
+class TapeBackendTests(TestCase):
+    def make_vm(self, tape_01, tape_02=None):
+        if tape_02==None:
+            tape_02 = MemoryTapeBackend()
+        return create_vm(size=0, tapefile1=tape_01, tapefile2=tape_02)
+
+    def fopen(self, vm, tape, fopen_func):
+        vm.reg[0] = tape
+        fopen_func(vm)
+
+    def fgetc(self, vm, tape):
+        vm.reg[1] = tape
+        vm_FGETC(vm)
+        return vm.reg[0]
+
+    def fputc(self, vm, tape, byte):
+        vm.reg[0], vm.reg[1] = byte, tape
+        vm_FPUTC(vm)
+
+    def test_memory_tape_read(self):
+        for data in (b"xyz", bytearray(b"xyz"), memoryview(b"xyz")):
+            vm = self.make_vm(MemoryTapeBackend(data))
+            self.fopen(vm, TAPE_01, vm_FOPEN_READ)
+            self.assertEqual(
+                [self.fgetc(vm, TAPE_01) for i in range(3)],
+                [ord('x'), ord('y'), ord('z')] )
+            self.fgetc(vm, TAPE_01)
+            self.assertEqual(vm.reg[0], 0xFFFFFFFF)
+
+    def test_memory_tape_write(self):
+        tape_02 = MemoryTapeBackend(b"old contents")
+        vm = self.make_vm(MemoryTapeBackend(), tape_02)
+        self.fopen(vm, TAPE_02, vm_FOPEN_WRITE)
+        for byte in bytearray(b"new"):
+            self.fputc(vm, TAPE_02, byte)
+        vm.reg[0] = TAPE_02
+        vm_FCLOSE(vm)
+        self.assertEqual(tape_02.getvalue(), b"new")
+
+    def test_memory_tape_getc_after_close(self):
+        tape = TapeDevice(MemoryTapeBackend(b"abc").open_tape('rb'), 'rb')
+        self.assertEqual(tape.getc(), ord('a'))
+        tape.close()
+        with self.assertRaises(ValueError):
+            tape.getc()
+
+    def test_rewind_and_fseek(self):
+        vm = self.make_vm(MemoryTapeBackend(b"abcdef"))
+        self.fopen(vm, TAPE_01, vm_FOPEN_READ)
+        self.assertEqual(self.fgetc(vm, TAPE_01), ord('a'))
+        self.assertEqual(self.fgetc(vm, TAPE_01), ord('b'))
+        vm.reg[0], vm.reg[1] = TAPE_01, 2
+        vm_FSEEK(vm)
+        self.assertEqual(self.fgetc(vm, TAPE_01), ord('e'))
+        vm.reg[0], vm.reg[1] = TAPE_01, 0xFFFFFFFF # -1
+        vm_FSEEK(vm)
+        self.assertEqual(self.fgetc(vm, TAPE_01), ord('e'))
+        vm.reg[0] = TAPE_01
+        vm_REWIND(vm)
+        self.assertEqual(self.fgetc(vm, TAPE_01), ord('a'))
+
+    def test_backend_without_open_tape(self):
+        class IncompleteTapeBackend(TapeBackend):
+            pass
+        vm = self.make_vm(IncompleteTapeBackend())
+        with self.assertRaises(Exception) as context:
+            self.fopen(vm, TAPE_01, vm_FOPEN_READ)
+        self.assertEqual(str(context.exception),
+                         "IncompleteTapeBackend must provide open_tape")
+
+    def test_callback_tape(self):
+        source = [b"he", b"llo", b""]
+        written = []
+        closed = []
+        tape_01 = CallbackTapeBackend(
+            read_func=lambda size: source.pop(0))
+        tape_02 = CallbackTapeBackend(
+            write_func=written.append,
+            close_func=lambda: closed.append(True))
+        vm = self.make_vm(tape_01, tape_02)
+        self.fopen(vm, TAPE_01, vm_FOPEN_READ)
+        self.fopen(vm, TAPE_02, vm_FOPEN_WRITE)
+        byte = self.fgetc(vm, TAPE_01)
+        while byte!=0xFFFFFFFF:
+            self.fputc(vm, TAPE_02, byte)
+            byte = self.fgetc(vm, TAPE_01)
+        vm.reg[0] = TAPE_02
+        vm_FCLOSE(vm)
+        self.assertEqual(b"".join(written), b"hello")
+        self.assertEqual(closed, [True])
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_tape
+    # or
+    # $ ./runtestmodule.py knighttests/test_tape.py
+    from unittest import main
+    main()
@@ -0,0 +1,95 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from io import BytesIO
+from os import unlink
+
+from constants import ENGINE_TRACE
+from knightvm_minimal import execute_vm
+from knighttrace import \
+    TraceBuffer, write_trace_dump, read_trace_dump, trace_entry_line
+from .programs import COUNT_DOWN_LOOP, make_vm_from_hex
+from .util import (
+    get_closed_named_temp_file, make_optimize_and_register_size_variations,
+    )
+
+class TraceTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def run_program(self, program_hex, trace, **kargs):
+        vm = make_vm_from_hex(program_hex, self.registersize)
+        vm.trace = trace
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=ENGINE_TRACE, **kargs)
+        return vm
+
+    def test_ring_keeps_last_entries(self):
+        vm = self.run_program(COUNT_DOWN_LOOP, TraceBuffer(5))
+        self.assertEqual(vm.trace.total, 22)
+        self.assertEqual(
+            vm.trace.entries(),
+            [(17, 0x6, 0xE1001111, 1),
+             (18, 0xC, 0xE0002CA1, 0xFFF4),
+             (19, 0x6, 0xE1001111, 1),
+             (20, 0xC, 0xE0002CA1, 0xFFF4),
+             (21, 0x12, 0xFFFFFFFF, 0)] )
+
+    def test_batches_continue_ring(self):
+        trace = TraceBuffer(7)
+        vm = self.run_program(COUNT_DOWN_LOOP, trace, max_steps=3)
+        self.assertEqual(len(trace.entries()), 3)
+        execute_vm(vm, optimize=self.optimize, halt_print=False,
+                   engine=ENGINE_TRACE)
+        self.assertEqual([entry[0] for entry in trace.entries()],
+                         list(range(15, 22)) )
+
+    def test_dump(self):
+        trace = TraceBuffer(4)
+        trace.dump_path = get_closed_named_temp_file()
+        self.run_program(COUNT_DOWN_LOOP, trace)
+        with open(trace.dump_path, 'rb') as dump_file:
+            entries = read_trace_dump(dump_file)
+        unlink(trace.dump_path)
+        self.assertEqual(entries, trace.entries())
+        self.assertEqual(
+            [trace_entry_line(entry) for entry in entries],
+            ["18 0000000C: E0002CA1FFF4 # JUMP.NZ reg1 65524",
+             "19 00000006: E10011110001 # SUBUI reg1 reg1 1",
+             "20 0000000C: E0002CA1FFF4 # JUMP.NZ reg1 65524",
+             "21 00000012: FFFFFFFF     # HALT"] )
+
+    def test_dump_round_trip_empty(self):
+        dump = BytesIO()
+        write_trace_dump(TraceBuffer(3), dump)
+        dump.seek(0)
+        self.assertEqual(read_trace_dump(dump), [])
+
+(TraceTests32Optimize,
+ TraceTests64,
+ TraceTests64Optimize,
+ TraceTests16,
+ TraceTests16Optimize,
+) = make_optimize_and_register_size_variations(TraceTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_trace
+    # or
+    # $ ./runtestmodule.py knighttests/test_trace.py
+    from unittest import main
+    main()
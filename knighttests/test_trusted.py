@@ -0,0 +1,104 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from os import unlink
+from os.path import dirname, join as path_join
+from subprocess import Popen, PIPE
+from sys import executable
+
+from .util import get_closed_named_temp_file
+
+KNIGHTVM_MINIMAL = path_join(dirname(dirname(__file__)), 'knightvm_minimal.py')
+
+# knightvm_minimal.py gives the vm 2 MiB of memory
+MEMORY_END = 1<<21
+
+def load_r0(address):
+    return ["E0002D20 %04X # LOADUI R0 high bits" % (address>>16),
+            "E0002D50 0010 # SL0I R0 16",
+            "E0002D21 %04X # LOADUI R1 low bits" % (address & 0xFFFF),
+            "05000001 # ADD R0 R0 R1",
+    ]
+
+LOADUI_R1_E0 = "E0002D21 00E0 # LOADUI R1 0xE0"
+HALT = "FFFFFFFF # HALT"
+
+# name, rom lines, all of them get outside of the world
+OUTSIDE_OF_WORLD_ROMS = (
+    ("fetch", load_r0(MEMORY_END-2) + ["0D010000 # JSR_COROUTINE R0"]),
+    ("fetch far", load_r0(MEMORY_END+0x100) +
+     ["0D010000 # JSR_COROUTINE R0"]),
+    ("immediate", load_r0(MEMORY_END-4) +
+     [LOADUI_R1_E0, "E1002110 0000 # STORE8 R1 R0 0",
+      "0D010000 # JSR_COROUTINE R0"]),
+    ("LOAD", load_r0(MEMORY_END-2) + ["E1001310 0000 # LOAD R1 R0 0"]),
+    ("LOAD far", load_r0(MEMORY_END+0x100) +
+     ["E1001310 0000 # LOAD R1 R0 0"]),
+    ("LOAD32", load_r0(MEMORY_END-1) + ["E1001810 0000 # LOAD32 R1 R0 0"]),
+    ("LOADX", load_r0(MEMORY_END-3) + ["05038102 # LOADX R1 R0 R2"]),
+    ("STORE", load_r0(MEMORY_END-2) +
+     [LOADUI_R1_E0, "E1002010 0000 # STORE R1 R0 0"]),
+    ("STORE8", load_r0(MEMORY_END) +
+     [LOADUI_R1_E0, "E1002110 0000 # STORE8 R1 R0 0"]),
+    ("STOREX", load_r0(MEMORY_END-1) +
+     [LOADUI_R1_E0, "05048102 # STOREX R1 R0 R2"]),
+    ("PUSHR", load_r0(MEMORY_END-2) + ["09020010 # PUSHR R1 R0"]),
+    ("POPR", load_r0(MEMORY_END+2) + ["09028010 # POPR R1 R0"]),
+    ("RET", load_r0(MEMORY_END+2) + ["0D010010 # RET R0"]),
+    ("CALLI", load_r0(MEMORY_END-2) + ["E0002D00 0000 # CALLI R0 0"]),
+)
+
+class TrustedDiagnosticsTests(TestCase):
+    def setUp(self):
+        self.rom_path = get_closed_named_temp_file()
+
+    def tearDown(self):
+        unlink(self.rom_path)
+
+    def run_rom(self, rom_lines, flags):
+        with open(self.rom_path, 'w') as rom:
+            rom.write("\n".join(rom_lines + [HALT]) + "\n")
+        process = Popen(
+            [executable, KNIGHTVM_MINIMAL, self.rom_path, '--rom-hex'] +
+            flags,
+            stdout=PIPE, stderr=PIPE)
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout, stderr
+
+    def test_outside_of_world_diagnostics_match(self):
+        for name, rom_lines in OUTSIDE_OF_WORLD_ROMS:
+            checked = self.run_rom(rom_lines, [])
+            self.assertNotEqual(checked[0], 0, name)
+            self.assertTrue(b"outside of World" in checked[2], name)
+            self.assertEqual(self.run_rom(rom_lines, ['--trusted']),
+                             checked, name)
+
+    def test_halt_matches(self):
+        rom_lines = load_r0(MEMORY_END-4) + [
+            LOADUI_R1_E0, "E1002010 0000 # STORE R1 R0 0",
+            "E1001320 0000 # LOAD R2 R0 0"]
+        checked = self.run_rom(rom_lines, [])
+        self.assertEqual(checked[0], 0)
+        self.assertEqual(self.run_rom(rom_lines, ['--trusted']), checked)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_trusted
+    # or
+    # $ ./runtestmodule.py knighttests/test_trusted.py
+    from unittest import main
+    main()
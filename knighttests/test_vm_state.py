@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from constants import IP, REG, MEM, HALTED, PERF_COUNT, TAPE1FILENAME
+from knightdecode import create_vm, read_and_eval
+from .util import make_optimize_and_register_size_variations
+
+class VMStateTests(TestCase):
+    registersize = 32
+    optimize = False
+
+    def setUp(self):
+        self.vm = create_vm(size=0, registersize=self.registersize,
+                            tapefile1="tape_a")
+
+    def test_tuple_indexes(self):
+        self.assertIs(self.vm[MEM], self.vm.mem)
+        self.assertIs(self.vm[REG], self.vm.reg)
+        self.assertEqual(self.vm[IP], 0)
+        self.assertEqual(self.vm[TAPE1FILENAME], "tape_a")
+        self.vm[IP] = 4
+        self.assertEqual(self.vm.ip, 4)
+
+    def test_updated_in_place(self):
+        self.vm[MEM].frombytes( bytes.fromhex('00000000') ) # NOP
+        self.vm[MEM].frombytes( bytes.fromhex('FFFFFFFF') ) # HALT
+        vm_after = read_and_eval(self.vm, optimize=self.optimize)
+        self.assertIs(vm_after, self.vm)
+        self.assertEqual(self.vm[IP], 4)
+        self.assertEqual(self.vm[PERF_COUNT], 1)
+        self.assertFalse(self.vm[HALTED])
+        read_and_eval(self.vm, optimize=self.optimize, halt_print=False)
+        self.assertTrue(self.vm[HALTED])
+        self.assertEqual(self.vm[PERF_COUNT], 2)
+
+    def test_no_new_attributes(self):
+        self.assertRaises(AttributeError, setattr, self.vm, "regs", None)
+
+(VMStateTests32Optimize,
+ VMStateTests64,
+ VMStateTests64Optimize,
+ VMStateTests16,
+ VMStateTests16Optimize,
+) = make_optimize_and_register_size_variations(VMStateTests)
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_vm_state
+    # or
+    # $ ./runtestmodule.py knighttests/test_vm_state.py
+    from unittest import main
+    main()
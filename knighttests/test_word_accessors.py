@@ -0,0 +1,112 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from array import array
+from random import Random
+
+from constants import ARRAY_TYPE_UNSIGNED_CHAR
+from knightdecodeutil import OutsideOfWorldException
+from knightinstructions import \
+    prove_8_bits_per_array_byte, readin_bytes, writeout_bytes, \
+    READ_WORD_FUNCTIONS, READ_SIGNED_WORD_FUNCTIONS, WRITE_WORD_FUNCTIONS
+from knightpagedmemory import PagedMemory
+
+MEMORY_SIZE = 64
+
+def make_memory(random_source):
+    return array(ARRAY_TYPE_UNSIGNED_CHAR,
+                 [ random_source.randrange(256)
+                   for i in range(MEMORY_SIZE) ] )
+
+def get_outside_of_world_args(func, *args):
+    try:
+        func(*args)
+    except OutsideOfWorldException:
+        from sys import exc_info
+        return exc_info()[1].args
+    return None
+
+class WordAccessorTests(TestCase):
+    def setUp(self):
+        self.random_source = Random(MEMORY_SIZE)
+
+    def test_8_bits_per_array_byte(self):
+        # the word accessors assume it, this used to be checked at import
+        self.assertTrue(prove_8_bits_per_array_byte())
+
+    def test_reads_match_readin_bytes(self):
+        mem = make_memory(self.random_source)
+        for byte_count, read_word in READ_WORD_FUNCTIONS.items():
+            read_signed_word = READ_SIGNED_WORD_FUNCTIONS[byte_count]
+            for pointer in range(MEMORY_SIZE-byte_count+1):
+                self.assertEqual(read_word(mem, pointer),
+                                 readin_bytes(mem, pointer, False,
+                                              byte_count) )
+                self.assertEqual(read_signed_word(mem, pointer),
+                                 readin_bytes(mem, pointer, True,
+                                              byte_count) )
+
+    def test_writes_match_writeout_bytes(self):
+        for byte_count, write_word in WRITE_WORD_FUNCTIONS.items():
+            for pointer in range(MEMORY_SIZE-byte_count+1):
+                value = self.random_source.randrange(1<<64)
+                expected_mem = array(ARRAY_TYPE_UNSIGNED_CHAR,
+                                     (0,))*MEMORY_SIZE
+                writeout_bytes(expected_mem, pointer, value, byte_count)
+                mem = array(ARRAY_TYPE_UNSIGNED_CHAR, (0,))*MEMORY_SIZE
+                write_word(mem, pointer, value)
+                self.assertEqual(mem, expected_mem)
+
+    def test_paged_memory(self):
+        flat_mem = make_memory(self.random_source)
+        mem = PagedMemory(MEMORY_SIZE)
+        mem[0:MEMORY_SIZE] = flat_mem
+        for byte_count, read_word in READ_WORD_FUNCTIONS.items():
+            self.assertEqual(read_word(mem, 3), read_word(flat_mem, 3))
+            WRITE_WORD_FUNCTIONS[byte_count](mem, 9, 0x0102030405060708)
+            WRITE_WORD_FUNCTIONS[byte_count](flat_mem, 9, 0x0102030405060708)
+            self.assertEqual(mem[0:MEMORY_SIZE], flat_mem)
+
+    def test_outside_of_world_messages(self):
+        mem = make_memory(self.random_source)
+        for byte_count, read_word in READ_WORD_FUNCTIONS.items():
+            read_signed_word = READ_SIGNED_WORD_FUNCTIONS[byte_count]
+            write_word = WRITE_WORD_FUNCTIONS[byte_count]
+            # the last byte outside, then the first as well
+            for pointer in (MEMORY_SIZE-byte_count+1, MEMORY_SIZE):
+                expected_args = get_outside_of_world_args(
+                    readin_bytes, mem, pointer, False, byte_count)
+                self.assertNotEqual(expected_args, None)
+                self.assertEqual(
+                    get_outside_of_world_args(read_word, mem, pointer),
+                    expected_args)
+                self.assertEqual(
+                    get_outside_of_world_args(read_signed_word, mem,
+                                              pointer),
+                    expected_args)
+                self.assertEqual(
+                    get_outside_of_world_args(write_word, mem, pointer, 1),
+                    get_outside_of_world_args(
+                        writeout_bytes, mem, pointer, 1, byte_count) )
+
+if __name__ == '__main__':
+    # to invoke, run
+    # $ python3 -m knighttests.test_word_accessors
+    # or
+    # $ ./runtestmodule.py knighttests/test_word_accessors.py
+    from unittest import main
+    main()
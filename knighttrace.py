@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_TRACE, the interpreter keeping the last instructions it ran in a
+# ring buffer (vm.trace, a TraceBuffer) so that when something goes wrong
+# after a long run the instructions leading up to it are available without
+# running again.
+#
+# Each entry is the vm.perf_count before the instruction ran, its address,
+# its first four bytes as a 32 bit word and the 16 bit immediate that
+# follows for 2OPI and 1OPI instructions, stored in preallocated arrays.
+# If dump_path is set on the TraceBuffer the entries are written there
+# in the binary format described below when the vm halts or the run ends
+# with an exception or exit (illegal instruction, outside of world).
+#
+# To print a dump,
+# $ ./knighttrace.py dumpfile
+#
+# Dump format, all big endian:
+# header: the 4 bytes TRACE_MAGIC, a one byte format version and a 4 byte
+# entry count, followed by that many entries oldest first, each an 8 byte
+# perf count, 4 byte address, 4 byte instruction word and 2 byte immediate
+
+from array import array
+from struct import pack, unpack, calcsize
+
+from pythoncompat import \
+    print_func, init_array_itemsize_8, COMPAT_TRUE, COMPAT_FALSE
+from constants import \
+    RAW, RAW_IMMEDIATE, I_REGISTERS, \
+    ARRAY_TYPE_UNSIGNED_INT, ARRAY_TYPE_UNSIGNED_INT_LONG, \
+    ARRAY_TYPE_UNSIGNED_SHORT
+from knightdecode import \
+    create_vm, read_instruction_fast, read_and_decode_instruction, \
+    lookup_instruction_str, make_eval_tables_for_register_size, \
+    eval_nop_halt_or_illegal, outside_of_world_exit, \
+    instruction_not_implemented, \
+    check_run_stop_conditions, get_run_stop_perf_count, run_stop_reason, \
+    InstructionNotImplemented, FAST_DECODE_TABLE
+from knightdecodeutil import OutsideOfWorldException
+
+DEFAULT_TRACE_SIZE = 1<<16
+
+TRACE_MAGIC = "KTRC".encode('ascii')
+TRACE_VERSION = 1
+TRACE_HEADER_FORMAT = ">4sBI"
+TRACE_ENTRY_FORMAT = ">QIIH"
+
+# 2 OP immediate, 1 OP immediate
+TRACE_IMMEDIATE_OPCODES = (0xE1, 0xE0)
+
+class TraceBuffer(object):
+    __slots__ = ('size', 'perf_counts', 'ips', 'words', 'immediates',
+                 'position', 'total', 'dump_path')
+
+    def __init__(self, size=DEFAULT_TRACE_SIZE, dump_path=None):
+        self.size = size
+        self.perf_counts = init_array_itemsize_8()
+        if self.perf_counts==None:
+            self.perf_counts = array(ARRAY_TYPE_UNSIGNED_INT_LONG)
+        self.perf_counts.extend( (0,)*size )
+        self.ips = array(ARRAY_TYPE_UNSIGNED_INT, (0,)*size)
+        self.words = array(ARRAY_TYPE_UNSIGNED_INT, (0,)*size)
+        self.immediates = array(ARRAY_TYPE_UNSIGNED_SHORT, (0,)*size)
+        # where the next entry goes and how many have been recorded
+        self.position = 0
+        self.total = 0
+        self.dump_path = dump_path
+
+    def entries(self):
+        # (perf count, address, instruction word, immediate) tuples,
+        # oldest first
+        count = min(self.total, self.size)
+        start = (self.position - count) % self.size
+        return [ (self.perf_counts[i], self.ips[i], self.words[i],
+                  self.immediates[i])
+                 for i in [ (start+j) % self.size for j in range(count) ] ]
+
+def get_trace_buffer(vm, size=DEFAULT_TRACE_SIZE):
+    if vm.trace==None:
+        vm.trace = TraceBuffer(size)
+    return vm.trace
+
+def make_run_for_registersize(registersizebits):
+    EVAL_TABLE = make_eval_tables_for_register_size(registersizebits)
+
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        trace = get_trace_buffer(vm)
+        perf_counts = trace.perf_counts
+        ips = trace.ips
+        words = trace.words
+        immediates = trace.immediates
+        size = trace.size
+        position = trace.position
+        try:
+            try:
+                while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                       not (until_halt and vm.halted) ):
+                    c = read_instruction_fast(vm)
+                    raw = c[RAW]
+                    raw0 = raw[0]
+                    perf_counts[position] = vm.perf_count
+                    ips[position] = vm.ip
+                    words[position] = \
+                        (raw0<<24) | (raw[1]<<16) | (raw[2]<<8) | raw[3]
+                    immediates[position] = 0
+                    vm.perf_count += 1
+                    if raw0 in FAST_DECODE_TABLE:
+                        c = FAST_DECODE_TABLE[raw0](vm, c)
+                        if raw0 in TRACE_IMMEDIATE_OPCODES:
+                            immediates[position] = c[RAW_IMMEDIATE]
+                        position += 1
+                        if position==size:
+                            position = 0
+                        next_ip = EVAL_TABLE[raw0](vm, c)
+                        if next_ip==None:
+                            instruction_not_implemented(vm, c)
+                        vm.ip = next_ip
+                    else:
+                        position += 1
+                        if position==size:
+                            position = 0
+                        if eval_nop_halt_or_illegal(
+                                vm, c, halt_print=halt_print)==None:
+                            raise InstructionNotImplemented(c)
+            except OutsideOfWorldException:
+                outside_of_world_exit(vm)
+        except:
+            # exit() from an illegal instruction or outside_of_world_exit,
+            # or anything else
+            end_trace_batch(vm, trace, start_perf_count)
+            if trace.dump_path!=None:
+                write_trace_dump_file(trace, trace.dump_path)
+            raise
+        end_trace_batch(vm, trace, start_perf_count)
+        if vm.halted and trace.dump_path!=None:
+            write_trace_dump_file(trace, trace.dump_path)
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
+
+def end_trace_batch(vm, trace, start_perf_count):
+    # every instruction that got as far as incrementing vm.perf_count
+    # has an entry
+    recorded = vm.perf_count - start_perf_count
+    trace.position = (trace.position + recorded) % trace.size
+    trace.total += recorded
+
+def make_read_and_eval_for_registersize(registersizebits):
+    run = make_run_for_registersize(registersizebits)
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        run(vm, max_steps=1, until_halt=COMPAT_FALSE, halt_print=halt_print)
+        return vm
+    return read_and_eval
+
+# Dumps
+
+def write_trace_dump(trace, fd):
+    entries = trace.entries()
+    fd.write(pack(TRACE_HEADER_FORMAT, TRACE_MAGIC, TRACE_VERSION,
+                  len(entries)) )
+    for entry in entries:
+        fd.write(pack(TRACE_ENTRY_FORMAT, *entry))
+
+def write_trace_dump_file(trace, path):
+    fd = open(path, 'wb')
+    write_trace_dump(trace, fd)
+    fd.close()
+
+def read_trace_dump(fd):
+    header = fd.read(calcsize(TRACE_HEADER_FORMAT))
+    magic, version, count = unpack(TRACE_HEADER_FORMAT, header)
+    if magic!=TRACE_MAGIC or version!=TRACE_VERSION:
+        raise Exception("not a version %d knightpies trace dump" %
+                        TRACE_VERSION)
+    entry_size = calcsize(TRACE_ENTRY_FORMAT)
+    return [ unpack(TRACE_ENTRY_FORMAT, fd.read(entry_size))
+             for i in range(count) ]
+
+def trace_entry_line(entry):
+    # like the lines knightdecode prints with DEBUG on, with the
+    # perf count, address and instruction in front
+    perf_count, ip, word, immediate = entry
+    instruction_bytes = [ (word>>shift) & 0xFF for shift in (24, 16, 8, 0) ]
+    if instruction_bytes[0] in TRACE_IMMEDIATE_OPCODES:
+        instruction_bytes.extend( (immediate>>8, immediate & 0xFF) )
+    vm = create_vm(size=0)
+    vm.mem.fromlist(instruction_bytes)
+    c = read_and_decode_instruction(vm, 0)
+    instruction_hex = ''.join( ["%02X" % b for b in instruction_bytes] )
+    instruction_str = lookup_instruction_str(c)
+    if instruction_str==None:
+        description = "ILLEGAL"
+    else:
+        description = instruction_str.replace("_", ".")
+        if len(c)>I_REGISTERS and c[I_REGISTERS]!=None:
+            description += " reg%d"*len(c[I_REGISTERS]) % c[I_REGISTERS]
+        if instruction_bytes[0] in TRACE_IMMEDIATE_OPCODES + (0x3C,):
+            description += " %d" % c[RAW_IMMEDIATE]
+    return "%d %08X: %-12s # %s" % (
+        perf_count, ip, instruction_hex, description)
+
+def main(args):
+    fd = open(args[1], 'rb')
+    entries = read_trace_dump(fd)
+    fd.close()
+    for entry in entries:
+        print_func(trace_entry_line(entry))
+
+if __name__ == "__main__":
+    from sys import argv
+    main(argv)
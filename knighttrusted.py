@@ -0,0 +1,332 @@
+# Copyright (C) 2019 Mark Jenkins <mark@markjenkins.ca>
+# This file is part of knightpies
+#
+# knightpies is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# knightpies is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
+
+# ENGINE_TRUSTED, the interpreter for roms already known to behave. Instead
+# of comparing addresses to the size of memory before every instruction
+# fetch, immediate fetch and memory instruction, it leaves that to the
+# IndexError python raises when an array is indexed past its end, and only
+# then works out the "outside of World" message and address the checked
+# functions would have given. The asserts in vm_FGETC are left out too.
+#
+# So that the vm is left in the same state as with ENGINE_INTERPRETER when
+# that happens, words are written last byte first (if the last byte is
+# inside of the world, so are the others) and the fields of an instruction
+# are decoded before vm.perf_count is incremented.
+#
+# There's no register size independent version, when asked for one
+# (knightvm_minimal.execute_vm with optimize off) the version for the
+# vm's register size is used.
+
+from pythoncompat import COMPAT_TRUE, COMPAT_FALSE
+from constants import \
+    RAW, NEXTIP, HAL_CODE, HAL_CODE_OP, HAL_CODE_FGETC, ENGINE_TRUSTED
+from knightdecode import \
+    make_eval_tables_for_register_size, get_run_for_register_size, \
+    eval_nop_halt_or_illegal, eval_HALCODE, get_hal_codes_table, \
+    outside_of_world_exit, instruction_not_implemented, \
+    check_run_stop_conditions, get_run_stop_perf_count, run_stop_reason, \
+    InstructionNotImplemented, FAST_DECODE_TABLE, \
+    MIN_INSTRUCTION_LEN, OUTSIDE_WORLD_ERROR
+from knightdecodeutil import outside_of_world, OutsideOfWorldException
+from knightinstructions import \
+    word_outside_of_world, vm_FGETC_trusted, \
+    READIN_BYTES_MESSAGE, WRITEOUT_BYTES_MESSAGE
+from knightinstructions_bit_optimized import make_nbit_optimized_functions
+
+# Word accessors
+#
+# like the knightinstructions ones, an IndexError that isn't from going
+# past the end of memory is raised again as it is
+
+def trusted_read_word8(mem, pointer):
+    try:
+        return mem[pointer]
+    except IndexError:
+        word_outside_of_world(mem, pointer, 1, READIN_BYTES_MESSAGE)
+        raise
+
+def trusted_read_word16(mem, pointer):
+    try:
+        return (mem[pointer]<<8) | mem[pointer+1]
+    except IndexError:
+        word_outside_of_world(mem, pointer, 2, READIN_BYTES_MESSAGE)
+        raise
+
+def trusted_read_word32(mem, pointer):
+    try:
+        return ( (mem[pointer  ]<<24) | (mem[pointer+1]<<16) |
+                 (mem[pointer+2]<<8)  |  mem[pointer+3] )
+    except IndexError:
+        word_outside_of_world(mem, pointer, 4, READIN_BYTES_MESSAGE)
+        raise
+
+def trusted_read_word64(mem, pointer):
+    try:
+        return ( (mem[pointer  ]<<56) | (mem[pointer+1]<<48) |
+                 (mem[pointer+2]<<40) | (mem[pointer+3]<<32) |
+                 (mem[pointer+4]<<24) | (mem[pointer+5]<<16) |
+                 (mem[pointer+6]<<8)  |  mem[pointer+7] )
+    except IndexError:
+        word_outside_of_world(mem, pointer, 8, READIN_BYTES_MESSAGE)
+        raise
+
+def trusted_read_signed_word32(mem, pointer):
+    return (trusted_read_word32(mem, pointer) ^ 0x80000000) - 0x80000000
+
+def trusted_write_word8(mem, pointer, value):
+    try:
+        mem[pointer] = value & 0xFF
+    except IndexError:
+        word_outside_of_world(mem, pointer, 1, WRITEOUT_BYTES_MESSAGE)
+        raise
+
+def trusted_write_word16(mem, pointer, value):
+    try:
+        mem[pointer+1] = value & 0xFF
+    except IndexError:
+        word_outside_of_world(mem, pointer, 2, WRITEOUT_BYTES_MESSAGE)
+        raise
+    mem[pointer] = (value>>8) & 0xFF
+
+def trusted_write_word32(mem, pointer, value):
+    try:
+        mem[pointer+3] = value & 0xFF
+    except IndexError:
+        word_outside_of_world(mem, pointer, 4, WRITEOUT_BYTES_MESSAGE)
+        raise
+    mem[pointer+2] = (value>>8) & 0xFF
+    mem[pointer+1] = (value>>16) & 0xFF
+    mem[pointer  ] = (value>>24) & 0xFF
+
+def trusted_write_word64(mem, pointer, value):
+    try:
+        mem[pointer+7] = value & 0xFF
+    except IndexError:
+        word_outside_of_world(mem, pointer, 8, WRITEOUT_BYTES_MESSAGE)
+        raise
+    mem[pointer+6] = (value>>8) & 0xFF
+    mem[pointer+5] = (value>>16) & 0xFF
+    mem[pointer+4] = (value>>24) & 0xFF
+    mem[pointer+3] = (value>>32) & 0xFF
+    mem[pointer+2] = (value>>40) & 0xFF
+    mem[pointer+1] = (value>>48) & 0xFF
+    mem[pointer  ] = (value>>56) & 0xFF
+
+TRUSTED_READ_WORD_FUNCTIONS = {
+    1: trusted_read_word8, 2: trusted_read_word16,
+    4: trusted_read_word32, 8: trusted_read_word64,
+}
+# make_nbit_optimized_functions only uses the 32 bit one
+TRUSTED_READ_SIGNED_WORD_FUNCTIONS = {
+    4: trusted_read_signed_word32,
+}
+TRUSTED_WRITE_WORD_FUNCTIONS = {
+    1: trusted_write_word8, 2: trusted_write_word16,
+    4: trusted_write_word32, 8: trusted_write_word64,
+}
+
+# Instructions
+#
+# the ones that access memory, with the trusted word accessors
+
+# the knightinstructions_bit_optimized versions of these are used
+TRUSTED_NBIT_OPTIMIZED_INSTRUCTIONS = (
+    'LOADX', 'STOREX', 'PUSHR', 'POPR', 'LOAD', 'LOAD32', 'STORE',
+)
+
+def make_trusted_instructions(registersizebits):
+    # instruction string -> instruction function
+    reg_size = registersizebits//8
+    read_register_word = TRUSTED_READ_WORD_FUNCTIONS[reg_size]
+    write_register_word = TRUSTED_WRITE_WORD_FUNCTIONS[reg_size]
+
+    nbit_optimized_dict = make_nbit_optimized_functions(
+        registersizebits, TRUSTED_READ_WORD_FUNCTIONS,
+        TRUSTED_READ_SIGNED_WORD_FUNCTIONS, TRUSTED_WRITE_WORD_FUNCTIONS)
+    trusted_instructions = {}
+    for instruction_str in TRUSTED_NBIT_OPTIMIZED_INSTRUCTIONS:
+        trusted_instructions[instruction_str] = \
+            nbit_optimized_dict['%s_%d' % (instruction_str, registersizebits)]
+
+    def LOADXU8(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+        register_file[reg0] = trusted_read_word8(
+            mem, register_file[reg1] + register_file[reg2])
+        return next_ip
+
+    def LOADXU16(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+        register_file[reg0] = trusted_read_word16(
+            mem, register_file[reg1] + register_file[reg2])
+        return next_ip
+
+    def STOREX16(vm, mem, register_file, reg0, reg1, reg2, next_ip):
+        trusted_write_word16(mem, register_file[reg1]+register_file[reg2],
+                             register_file[reg0])
+        return next_ip
+
+    def RET(vm, mem, register_file, reg0, next_ip_discard):
+        address_of_pc_on_stack = register_file[reg0] - reg_size
+        register_file[reg0] = address_of_pc_on_stack
+        next_ip = read_register_word(mem, address_of_pc_on_stack)
+        write_register_word(mem, address_of_pc_on_stack, 0)
+        return next_ip
+
+    def STORE8(vm, mem, register_file, reg0, reg1, signed_immediate,
+               next_ip):
+        trusted_write_word8(mem, register_file[reg1] + signed_immediate,
+                            register_file[reg0])
+        return next_ip
+
+    def STORE32(vm, mem, register_file, reg0, reg1, signed_immediate,
+                next_ip):
+        trusted_write_word32(mem, register_file[reg1] + signed_immediate,
+                             register_file[reg0])
+        return next_ip
+
+    def CALLI(vm, mem, register_file, reg0, signed_immediate, next_ip):
+        write_register_word(mem, register_file[reg0], next_ip)
+        register_file[reg0] += reg_size
+        return next_ip + signed_immediate
+
+    trusted_instructions.update( {
+        'LOADXU8': LOADXU8, 'LOADXU16': LOADXU16, 'STOREX16': STOREX16,
+        'RET': RET, 'STORE8': STORE8, 'STORE32': STORE32, 'CALLI': CALLI,
+    } )
+    return trusted_instructions
+
+def make_trusted_eval_HALCODE():
+    TRUSTED_HAL_CODES_TABLE = dict(get_hal_codes_table())
+    TRUSTED_HAL_CODES_TABLE[HAL_CODE_FGETC] = (vm_FGETC_trusted, "FGETC")
+
+    def trusted_eval_HALCODE(vm, c):
+        if c[HAL_CODE] not in TRUSTED_HAL_CODES_TABLE:
+            return eval_HALCODE(vm, c) # reports the illegal HAL code
+        TRUSTED_HAL_CODES_TABLE[c[HAL_CODE]][0](vm)
+        return c[NEXTIP]
+    return trusted_eval_HALCODE
+
+# Decoding
+
+def decode_1OPI_trusted(vm, c):
+    # knightdecode.decode_1OPI_fast without the outside_of_world check
+    next_ip = c[NEXTIP]
+    mem = vm.mem
+    raw = c[RAW]
+    return c[0:NEXTIP] + (next_ip+2,) + c[NEXTIP+1:] + (
+        raw[3]//16, # RAW_XOP
+        None, # XOP
+        mem[next_ip]*0x100 + mem[next_ip+1], # RAW_IMMEDIATE
+        None, # IMMEDIATE
+        (raw[3]%16,), # I_REGISTERS
+        0, # HAL_CODE
+    )
+
+def decode_nop_halt_or_illegal(vm, c):
+    # nothing to decode, but it has to be all there like the other
+    # decoders make sure of by reading the last byte
+    c[RAW][MIN_INSTRUCTION_LEN-1]
+    return c
+
+def make_trusted_decode_list():
+    decode_list = [decode_nop_halt_or_illegal]*0x100
+    for raw0, decode_func in FAST_DECODE_TABLE.items():
+        decode_list[raw0] = decode_func
+    decode_list[0xE0] = decode_1OPI_trusted
+    return decode_list
+
+TRUSTED_DECODE_LIST = make_trusted_decode_list()
+
+def decode_outside_of_world(vm, ip, raw):
+    # called with the IndexError from reading or decoding the instruction
+    # at ip being handled, raises the OutsideOfWorldException that
+    # read_instruction_fast or decode_1OPI_fast would have, returns for the
+    # caller to raise the IndexError again if it wasn't either of those
+    outside_of_world(vm.mem, ip+MIN_INSTRUCTION_LEN-1, OUTSIDE_WORLD_ERROR)
+    # like knightdecode.make_eval_instruction_for_registersize, count the
+    # instruction before decoding it
+    vm.perf_count += 1
+    if raw[0]==0xE0:
+        outside_of_world(vm.mem, ip+MIN_INSTRUCTION_LEN+1,
+                         OUTSIDE_WORLD_ERROR)
+
+def run_for_vm_register_size(vm, max_steps=None, until_ip=None,
+                             until_halt=COMPAT_TRUE, halt_print=COMPAT_TRUE):
+    run = get_run_for_register_size(vm.reg.itemsize, engine=ENGINE_TRUSTED)
+    return run(vm, max_steps=max_steps, until_ip=until_ip,
+               until_halt=until_halt, halt_print=halt_print)
+
+def make_run_for_registersize(registersizebits):
+    if registersizebits==0:
+        return run_for_vm_register_size
+
+    TRUSTED_INSTRUCTIONS = make_trusted_instructions(registersizebits)
+    def trusted_instruction(instruction_str, instruction_func):
+        return TRUSTED_INSTRUCTIONS.get(instruction_str, instruction_func)
+    EVAL_TABLE = make_eval_tables_for_register_size(
+        registersizebits, instruction_wrapper=trusted_instruction)
+    EVAL_TABLE[HAL_CODE_OP] = make_trusted_eval_HALCODE()
+    # None for NOP, HALT and illegal instructions
+    EVAL_LIST = [None]*0x100
+    for raw0, eval_func in EVAL_TABLE.items():
+        EVAL_LIST[raw0] = eval_func
+
+    def run(vm, max_steps=None, until_ip=None, until_halt=COMPAT_TRUE,
+            halt_print=COMPAT_TRUE):
+        check_run_stop_conditions(max_steps, until_ip, until_halt)
+        start_perf_count = vm.perf_count
+        stop_perf_count = get_run_stop_perf_count(vm, max_steps)
+        mem = vm.mem
+        try:
+            while (vm.perf_count!=stop_perf_count and vm.ip!=until_ip and
+                   not (until_halt and vm.halted) ):
+                ip = vm.ip
+                # a short slice past the end of memory, not an IndexError
+                raw = mem[ip:ip+MIN_INSTRUCTION_LEN]
+                try:
+                    raw0 = raw[0]
+                    c = TRUSTED_DECODE_LIST[raw0](
+                        vm, (None, # OP
+                             raw, # RAW
+                             ip, # CURIP
+                             ip+MIN_INSTRUCTION_LEN, # NEXTIP
+                             None, # RESTOF
+                             COMPAT_FALSE # INVALID
+                        ) )
+                except IndexError:
+                    decode_outside_of_world(vm, ip, raw)
+                    raise
+                vm.perf_count += 1
+                eval_func = EVAL_LIST[raw0]
+                if eval_func==None:
+                    if eval_nop_halt_or_illegal(
+                            vm, c, halt_print=halt_print)==None:
+                        raise InstructionNotImplemented(c)
+                else:
+                    next_ip = eval_func(vm, c)
+                    if next_ip==None:
+                        instruction_not_implemented(vm, c)
+                    vm.ip = next_ip
+        except OutsideOfWorldException:
+            outside_of_world_exit(vm)
+        return (run_stop_reason(vm, until_ip, until_halt),
+                vm.perf_count - start_perf_count)
+    return run
+
+def make_read_and_eval_for_registersize(registersizebits):
+    run = make_run_for_registersize(registersizebits)
+    def read_and_eval(vm, halt_print=COMPAT_TRUE):
+        run(vm, max_steps=1, until_halt=COMPAT_FALSE, halt_print=halt_print)
+        return vm
+    return read_and_eval
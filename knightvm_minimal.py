@@ -20,16 +20,32 @@
 # along with knightpies.  If not, see <http://www.gnu.org/licenses/>.
 
 from sys import stderr, exit
-from string import hexdigits
+from array import array
 
 from pythoncompat import print_func, COMPAT_FALSE, COMPAT_TRUE
-from constants import REG, EXIT_SUCCESS, EXIT_FAILURE
+from constants import \
+    ARRAY_TYPE_UNSIGNED_CHAR, EXIT_SUCCESS, EXIT_FAILURE, \
+    ENGINE_INTERPRETER, ENGINE_PROFILE, ENGINE_TRACE, ENGINE_TRUSTED
 from knightdecode import \
-    MEM, HALTED, \
-    create_vm, grow_memory, \
-    get_read_and_eval_for_register_size
+    create_vm, grow_memory, forget_decoded_instructions, \
+    get_run_for_register_size
 
-from hex0tobin import int_bytes_from_hex0_fd
+# load_program and load_hex_program put the rom at the start of memory,
+# growing it if it's smaller than the rom
+
+def get_memory_view(vm):
+    # None on pythons without memoryview or arrays that support it, and for
+    # memory with dirty tracking as writes through a memoryview would get
+    # past it
+    if type(vm.mem) is not array:
+        # deferred, only paged or dirty tracking memory needs knightdirtymemory
+        from knightdirtymemory import is_dirty_tracking
+        if is_dirty_tracking(vm.mem):
+            return None
+    try:
+        return memoryview(vm.mem)
+    except (NameError, TypeError):
+        return None
 
 def load_program(vm, romfilename):
     # binary mode because we don't want python's opinion of encoding, newlines
@@ -37,55 +53,176 @@ def load_program(vm, romfilename):
     f.seek(0,2) # seek to end so we can find filesize
     filesize = f.tell()
     f.seek(0)
-    # this is intended to operate at the start of memory before allocation
-    assert len(vm[MEM])==0
-    vm[MEM].fromfile(f, filesize)
+    grow_memory(vm, filesize)
+    memory_view = get_memory_view(vm)
+    if memory_view==None:
+        vm.mem[0:filesize] = array(ARRAY_TYPE_UNSIGNED_CHAR, f.read(filesize))
+    else:
+        # straight from the file into memory, no copies in between
+        f.readinto(memory_view[0:filesize])
+        del memory_view # let the array be resized again
     f.close()
+    forget_decoded_instructions(vm)
 
 def load_hex_program(vm, hexromfilename):
-    # this is intended to operate at the start of memory before allocation
-    assert len(vm[MEM])==0
-    f = open(hexromfilename)
-    for input_byte in int_bytes_from_hex0_fd(f):
-        vm[MEM].append(input_byte)
+    # deferred, hex0tobin imports re which is slow to import and not
+    # needed for binary roms
+    from hex0tobin import bytes_from_hex0_bytes
+    f = open(hexromfilename, 'rb')
+    rom = bytes_from_hex0_bytes(f.read())
     f.close()
+    load_rom_bytes(vm, rom)
+
+def load_rom_bytes(vm, rom):
+    # rom is the program already in memory, as bytes
+    grow_memory(vm, len(rom))
+    memory_view = get_memory_view(vm)
+    if memory_view==None:
+        vm.mem[0:len(rom)] = array(ARRAY_TYPE_UNSIGNED_CHAR, rom)
+    else:
+        memory_view[0:len(rom)] = rom
+        del memory_view # let the array be resized again
+    forget_decoded_instructions(vm)
 
 
-def execute_vm(vm, optimize=COMPAT_TRUE, halt_print=COMPAT_TRUE):
+# returns the reason execution stopped and the number of instructions run,
+# see knightdecode.get_run_for_register_size
+def execute_vm(vm, optimize=COMPAT_TRUE, halt_print=COMPAT_TRUE,
+               engine=ENGINE_INTERPRETER,
+               max_steps=None, until_ip=None, until_halt=COMPAT_TRUE):
     if optimize:
-        read_and_eval_register_size_specific = \
-            get_read_and_eval_for_register_size(vm[REG].itemsize)
+        run = get_run_for_register_size(vm.reg.itemsize, engine=engine)
+    else:
+        run = get_run_for_register_size(0, engine=engine)
+    return run(vm, max_steps=max_steps, until_ip=until_ip,
+               until_halt=until_halt, halt_print=halt_print)
+
+# profile_format "text" or "json" runs the vm with ENGINE_PROFILE and
+# prints the profile to stderr at halt, see knightprofile.py
+#
+# trace_path runs the vm with ENGINE_TRACE instead and writes the last
+# instructions run there when it halts or exits, see knighttrace.py
+#
+# checkpoint_every, checkpoint_path snapshot the vm to checkpoint_path
+# every checkpoint_every instructions, resume treats romfile as one of
+# those snapshots to carry on from, see knightsnapshot.py
+#
+# trusted runs the vm with ENGINE_TRUSTED when it isn't being profiled or
+# traced, see knighttrusted.py
+def do_minimal_vm(romfile, romhex=COMPAT_FALSE, memory_size=1<<21,
+                  profile_format=None, trace_path=None,
+                  checkpoint_every=None, checkpoint_path=None,
+                  resume=COMPAT_FALSE, trusted=COMPAT_FALSE):
+    if resume:
+        from knightsnapshot import restore
+        vm = restore(romfile)
     else:
-        read_and_eval_register_size_specific = \
-            get_read_and_eval_for_register_size(0)
-    while not vm[HALTED]:
-        vm = read_and_eval_register_size_specific(
-            vm, halt_print=halt_print)
-
-def do_minimal_vm(romfile, romhex=COMPAT_FALSE, memory_size=1<<21):
-    vm = create_vm(size=0, registersize=32)
-    if romhex:
-        load_hex_program(vm, romfile)
+        vm = create_vm(size=memory_size, registersize=32)
+        if romhex:
+            load_hex_program(vm, romfile)
+        else:
+            load_program(vm, romfile)
+
+    if trace_path!=None:
+        from knighttrace import get_trace_buffer
+        get_trace_buffer(vm).dump_path = trace_path
+        engine = ENGINE_TRACE
+    elif profile_format!=None:
+        engine = ENGINE_PROFILE
+    elif trusted:
+        engine = ENGINE_TRUSTED
     else:
-        load_program(vm, romfile)
-    grow_memory(vm, memory_size)
-    execute_vm(vm)
+        engine = ENGINE_INTERPRETER
+
+    if checkpoint_every==None:
+        execute_vm(vm, engine=engine)
+    else:
+        while not vm.halted:
+            execute_vm(vm, engine=engine, max_steps=checkpoint_every)
+            if not vm.halted:
+                write_checkpoint(vm, checkpoint_path)
+
+    if profile_format!=None and trace_path==None:
+        print_profile(vm, profile_format)
+
+def write_checkpoint(vm, checkpoint_path):
+    # written beside checkpoint_path first so it isn't left half written
+    from knightsnapshot import snapshot
+    from os import rename, remove
+    from os.path import exists
+    snapshot(vm, checkpoint_path + ".tmp")
+    if exists(checkpoint_path):
+        remove(checkpoint_path) # rename can't replace a file on windows
+    rename(checkpoint_path + ".tmp", checkpoint_path)
+
+def print_profile(vm, profile_format):
+    from knightprofile import profile_report_lines, profile_as_json
+    if profile_format=="json":
+        print_func(profile_as_json(vm.profile), file=stderr)
+    else:
+        for line in profile_report_lines(vm.profile):
+            print_func(line, file=stderr)
+
+def get_flag_values(flags, flag, count):
+    # the count arguments after flag, or None if it isn't there
+    if flag not in flags:
+        return None
+    i = flags.index(flag)
+    if i+count >= len(flags):
+        print_func("%s needs %d argument(s)" % (flag, count), file=stderr)
+        exit(EXIT_FAILURE)
+    return flags[i+1:i+1+count]
+
+def get_list_flag(flags, flag, default, convert=str):
+    # the comma separated values of the argument after flag, each passed
+    # through convert, or default if flag isn't there. For a flag with a
+    # single value, pass [default] and take [0]
+    values = get_flag_values(flags, flag, 1)
+    if values==None:
+        return default
+    return [ convert(value) for value in values[0].split(',') ]
+
+def int_flag_value(value):
+    # a get_list_flag convert for ints, 0x and python's other prefixes
+    # are allowed
+    return int(value, 0)
 
 def main(args):
     if len(args)<2:
-        print_func("Usage: %s $FileName" % args[0], file=stderr)
+        print_func("Usage: %s $FileName [--rom-hex] [--profile] "
+                   "[--profile-json] [--trace $TraceFile] "
+                   "[--checkpoint $N $CheckpointFile] [--resume] "
+                   "[--trusted]" % args[0],
+                   file=stderr)
         print_func("Where $FileName is the name of the paper tape of the"
-                   "program being run", file=stderr)
+                   "program being run, or with --resume a checkpoint",
+                   file=stderr)
         exit(EXIT_FAILURE)
     else: # len(args)>=2
         filename = args[1]
-
-        if len(args)==2:
-            do_minimal_vm(filename)
+        flags = args[2:]
+        romhex = "--rom-hex" in flags # check for rom-hex flag, set romhex
+        if "--profile-json" in flags:
+            profile_format = "json"
+        elif "--profile" in flags:
+            profile_format = "text"
+        else:
+            profile_format = None
+        trace_path = get_flag_values(flags, "--trace", 1)
+        if trace_path!=None:
+            trace_path = trace_path[0]
+        checkpoint = get_flag_values(flags, "--checkpoint", 2)
+        if checkpoint==None:
+            checkpoint_every, checkpoint_path = None, None
         else:
-            assert len(args)>2
-            romhex = args[2]=="--rom-hex" # check for rom-hex flag, set romhex
-            do_minimal_vm(filename, romhex=romhex)
+            checkpoint_every, checkpoint_path = int(checkpoint[0]), \
+                checkpoint[1]
+        do_minimal_vm(filename, romhex=romhex, profile_format=profile_format,
+                      trace_path=trace_path,
+                      checkpoint_every=checkpoint_every,
+                      checkpoint_path=checkpoint_path,
+                      resume="--resume" in flags,
+                      trusted="--trusted" in flags)
         exit(EXIT_SUCCESS)
 
 if __name__ == "__main__":
@@ -108,6 +108,27 @@ else:
     from StringIO import StringIO
     open_in_memory_temp = StringIO
 
+# bytes in and out of arrays, array.fromfile and array.tofile only take
+# real files on python 2
+if sys.version_info[0:2] >= (3, 2):
+    def array_frombytes(a, data):
+        a.frombytes(data)
+
+    def array_tobytes(a):
+        return a.tobytes()
+else:
+    def array_frombytes(a, data):
+        a.fromstring(data)
+
+    def array_tobytes(a):
+        return a.tostring()
+
+# the most precise clock for timing short stretches of code
+if sys.version_info[0:2] >= (3, 3):
+    from time import perf_counter as perf_timer
+else:
+    from time import time as perf_timer
+
 def try_to_make_8_byte_long_int_array():
     a = array(ARRAY_TYPE_UNSIGNED_INT_LONG)
     if a.itemsize==8: # this works on x86_64 python2